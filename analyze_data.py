@@ -1,53 +1,47 @@
-import h5py
-import numpy as np
-import matplotlib.pyplot as plt
-
-
-
-# Example: path = '/home/zach/Documents/spot/py_lossy_network/data/2023_09_12T14_20_04_943741.h5'
-path = ''
-assert(path != '')
-
-f = h5py.File(path, 'r')
-print(f.keys())
-keys = [
-    'bitrate_kbps', 'delay_ms', 'percent_lost_tcp'
-]
-
-d = dict()
-for k in keys:
-    d[k] = np.array([])
-    for i in range(0, f[k].shape[0]):
-        if type(f[k][i]) == np.float64:
-            d[k] = np.append(d[k], f[k][i])
-        else:
-            d[k] = np.concatenate((d[k], f[k][i]))
-
-    print("{0}: mean: {1} std. dev.: {2}".format(k, np.mean(d[k]), np.std(d[k])))
-
-# plot bandwidth
-num_bins = 25
-plt.grid(linestyle='--', linewidth=0.5)
-plt.hist(d['bitrate_kbps'].ravel(), bins=np.linspace(np.min(d['bitrate_kbps']), np.max(d['bitrate_kbps']), num=num_bins)) #<-- Change here.  Note the use of ravel.
-plt.title("histogram of bandwidth tests")
-plt.xlabel("bandwidth [kbit/s]")
-plt.ylabel("# occurrences")
-plt.show()
-
-# plot delay
-num_bins = 25  # i like 50 and 25
-plt.grid(linestyle='--', linewidth=0.5)
-plt.hist(d['delay_ms'].ravel(), bins=np.linspace(np.min(d['delay_ms']), np.max(d['delay_ms']), num=num_bins)) #<-- Change here.  Note the use of ravel.
-plt.title("histogram of network delay")
-plt.xlabel("network delays [ms]")
-plt.ylabel("# occurrences")
-plt.show()
-
-# % Lost TCP packets
-num_bins = 25  # i like 50 and 25
-plt.grid(linestyle='--', linewidth=0.5)
-plt.hist(d['delay_ms'] .ravel(), bins=np.linspace(0, 1.0, num=num_bins)) #<-- Change here.  Note the use of ravel.
-plt.title("histogram of packets dropped")
-plt.xlabel("fraction of packets dropped")
-plt.ylabel("# occurrences")
-plt.show()
\ No newline at end of file
+"""
+summarizes and plots the results of any number of sessions
+
+    python3 analyze_data.py data/                  # every .h5 file under data/
+    python3 analyze_data.py 'data/2023_09_*.h5'    # a glob
+    python3 analyze_data.py data/ --workers 4 --no-plot
+"""
+# standard library includes
+import argparse
+
+# external library includes
+from tabulate import tabulate
+
+# internal includes
+from py_lossy_network import analysis
+
+labels = {
+    'bitrate_kbps': ("histogram of bandwidth tests", "bandwidth [kbit/s]"),
+    'delay_ms': ("histogram of network delay", "network delays [ms]"),
+    'percent_lost_udp': ("histogram of UDP packets dropped", "fraction of packets dropped"),
+    'percent_reordered_udp': ("histogram of UDP packets reordered", "fraction of packets reordered"),
+    'percent_lost_tcp': ("histogram of packets dropped", "fraction of packets dropped"),
+    'jitter_ms': ("histogram of UDP probe jitter", "jitter (RFC 3550) [ms]"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summarizes and plots the results of any number of sessions")
+    parser.add_argument('paths', nargs='+', help="h5 files, directories (searched recursively), or glob patterns")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: # of CPUs)")
+    parser.add_argument('--no-plot', action='store_true', help="only print the summary table")
+    args = parser.parse_args()
+
+    paths = analysis.find_results(args.paths)
+    if len(paths) == 0:
+        print("no .h5 files found")
+        return 1
+    stats, num_failed = analysis.summarize(paths, workers=args.workers)
+    print("{0} file(s) summarized, {1} could not be read".format(len(paths) - num_failed, num_failed))
+    print(tabulate(analysis.summary_table(stats), headers='firstrow', floatfmt='.4g'))
+    if not args.no_plot:
+        analysis.plot(stats, labels)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,110 @@
+"""
+runs a fleet of agents (`lossy_network.py --agent`) as separate processes on loopback against the stub `tc`, drives
+them from a controller, and reports:
+- whether every agent acknowledged every apply, show, and delete, and showed the config it was sent
+- the spread between the first and the last agent to finish applying the same change, against the number of agents
+- the same spread when the change is scheduled a little ahead (`at`), so it doesn't include the time to reach each agent
+- the controller's round trip for a change to the whole fleet
+needs no root and no network.
+
+    python3 benchmarks/bench_fleet.py
+"""
+# standard library includes
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+# external library includes
+import numpy as np
+
+# internal includes
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+from py_lossy_network import control
+
+FIRST_PORT = 5460
+ROUNDS = 50
+INTERFACE = 'lo'
+
+
+def start_agents(count: int) -> list:
+    env = dict(os.environ, PY_LOSSY_NETWORK_TC='{0} {1}'.format(sys.executable, os.path.join(HERE, 'stub_tc.py')),
+               PY_LOSSY_NETWORK_TOKEN='bench', STUB_TC_DELAY='0.0005')
+    return [subprocess.Popen([sys.executable, os.path.join(HERE, '..', 'lossy_network.py'), '--agent',
+                              '127.0.0.1:{0}'.format(FIRST_PORT + i), '--agent-name', 'agent{0}'.format(i)],
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for i in range(count)]
+
+
+def stop_agents(agents: list):
+    for agent in agents:
+        agent.send_signal(signal.SIGTERM)
+    for agent in agents:
+        try:
+            agent.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            agent.kill()
+
+
+async def connect(controller, deadline: float):
+    # the agents take a moment to start listening
+    while True:
+        unreachable = await controller.connect()
+        if len(unreachable) == 0:
+            return
+        if time.monotonic() > deadline:
+            raise RuntimeError("unreachable agents: {0}".format(unreachable))
+        await asyncio.sleep(0.2)
+
+
+async def run(count: int):
+    agents = start_agents(count)
+    controller = control.Controller(['127.0.0.1:{0}'.format(FIRST_PORT + i) for i in range(count)], token='bench')
+    try:
+        await connect(controller, time.monotonic() + 30)
+        spreads = []
+        scheduled_spreads = []
+        round_trips = []
+        failures = 0
+        for i in range(2 * ROUNDS):
+            config = control.parse_config_args([
+                'avg_egress_bw={0}kbit'.format(500 + 10 * i), 'std_dev_egress_bw=0kbit', 'egress_burst=32kbit',
+                'egress_latency=500ms', 'avg_egress_loss=1%', 'std_dev_egress_loss=0%', 'egress_avg_delay=10ms',
+                'egress_std_dev_delay=0ms'])
+            start = time.time()
+            scheduled = i >= ROUNDS
+            answers = await controller.apply(INTERFACE, config, at=start + 0.1 if scheduled else None)
+            failures += sum(1 for answer in answers.values() if not answer.get('ok'))
+            _, spread = control.acknowledgements_table(answers)
+            if scheduled:
+                scheduled_spreads.append(spread)
+            else:
+                round_trips.append(time.time() - start)
+                spreads.append(spread)
+
+        shown = await controller.show(INTERFACE)
+        consistent = all(answer.get('ok') and answer['config']['avg_egress_bw'] == config['avg_egress_bw']
+                         for answer in shown.values())
+        deleted = await controller.delete(INTERFACE)
+        failures += sum(1 for answer in deleted.values() if not answer.get('ok'))
+        print("{0:>3} agents: {1} failed acknowledgements, show {2}, spread p50 {3:6.2f} ms p95 {4:6.2f} ms "
+              "(scheduled: p50 {5:6.2f} ms p95 {6:6.2f} ms), round trip p50 {7:6.2f} ms p95 {8:6.2f} ms".format(
+                  count, failures, 'consistent' if consistent else 'INCONSISTENT',
+                  np.percentile(spreads, 50) * 1e3, np.percentile(spreads, 95) * 1e3,
+                  np.percentile(scheduled_spreads, 50) * 1e3, np.percentile(scheduled_spreads, 95) * 1e3,
+                  np.percentile(round_trips, 50) * 1e3, np.percentile(round_trips, 95) * 1e3))
+    finally:
+        controller.close()
+        stop_agents(agents)
+
+
+async def main():
+    for count in (1, 4, 16):
+        await run(count)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
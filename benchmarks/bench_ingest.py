@@ -0,0 +1,136 @@
+"""
+ingests a generated tree of raw logs (the sample outputs in data/, repeated: many small files of every format, and a
+few large ones that are split into ranges) with `ingest.run`, and reports the throughput against the number of worker
+processes, with the speedup over one worker and the efficiency (speedup / workers). the serial row is the parsing alone,
+in this process, without the pool or the h5 file. needs no root and no network.
+
+on a machine with N CPUs, the speedup can't go past N; more workers than CPUs only show the cost of the extra processes.
+the main process (which unpickles the workers' runs and writes the h5 file) is the part that doesn't scale: its CPU time,
+against the whole ingestion's with one worker, bounds the speedup on any number of CPUs (Amdahl's law).
+
+    python3 benchmarks/bench_ingest.py [--size 64mb] [--workers 1,2,4,8]
+"""
+# standard library includes
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# external library includes
+import tabulate
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import ingest
+from py_lossy_network import units
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def load_samples() -> dict:
+    # one run of every sample format, each ending with a newline, as a log would have them
+    samples = dict()
+    for pattern in ('iperf3*.txt', 'iperf3*.json', 'iperf3*.jsonl', 'ping*.txt'):
+        for path in sorted(glob.glob(os.path.join(DATA, pattern))):
+            with open(path, 'rb') as f:
+                samples[os.path.basename(path)] = f.read().rstrip(b'\n') + b'\n'
+    return samples
+
+
+def make_corpus(directory: str, num_bytes: int, large_files: int = 4) -> int:
+    """
+    writes about `num_bytes` of logs under `directory`: half in small files (about 64 kB) of every format, half in
+    `large_files` large files
+    :return: the number of files
+    """
+    samples = load_samples()
+    num_files = 0
+    small_bytes = num_bytes // 2
+    large_bytes = (num_bytes - small_bytes) // max(1, large_files)
+    names = sorted(samples.keys())
+    written = 0
+    while written < small_bytes:
+        name = names[num_files % len(names)]
+        sample = samples[name]
+        path = os.path.join(directory, 'site{0:02d}'.format(num_files % 16), '{0:05d}_{1}'.format(num_files, name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        repeats = max(1, 65536 // len(sample))
+        with open(path, 'wb') as f:
+            f.write(sample * repeats)
+        written += len(sample) * repeats
+        num_files += 1
+    for i in range(large_files):
+        sample = samples[names[i % len(names)]]
+        with open(os.path.join(directory, 'large{0}_{1}'.format(i, names[i % len(names)])), 'wb') as f:
+            f.write(sample * max(1, large_bytes // len(sample)))
+        num_files += 1
+    return num_files
+
+
+def parse_serially(paths: list) -> int:
+    num_runs = 0
+    for path in paths:
+        log_format = ingest.detect_format(path)
+        if log_format is None:
+            continue
+        with open(path, 'rb') as f:
+            for _, text in ingest.iter_runs(f, log_format):
+                num_runs += ingest.parse_run(log_format, text) is not None
+    return num_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ingestion throughput against the number of workers")
+    parser.add_argument('--size', type=units.parse_size, default=64 * 2**20,
+                        help="the size of the generated logs, with units (default: 64mb)")
+    parser.add_argument('--workers', default=None,
+                        help="comma-separated numbers of workers (default: 1, 2, 4, ... up to twice the CPUs)")
+    options = parser.parse_args()
+    cpus = os.cpu_count()
+    if options.workers is not None:
+        worker_counts = [int(w) for w in options.workers.split(',')]
+    else:
+        worker_counts = [w for w in (1, 2, 4, 8, 16, 32, 64) if w <= max(2, 2 * cpus)]
+
+    directory = tempfile.mkdtemp(prefix='bench_ingest_')
+    try:
+        logs = os.path.join(directory, 'logs')
+        num_files = make_corpus(logs, int(options.size))
+        paths = ingest.find_logs([logs])
+        num_bytes = sum(os.path.getsize(path) for path in paths)
+        print("{0} files, {1:.1f} MB, on {2} CPU(s)".format(num_files, num_bytes / 1e6, cpus))
+
+        start = time.perf_counter()
+        num_runs = parse_serially(paths)
+        serial = time.perf_counter() - start
+        table = [['workers', 'runs', 'seconds', 'MB/s', 'runs/s', 'speedup', 'efficiency', 'main CPU [s]'],
+                 ['serial', num_runs, serial, num_bytes / 1e6 / serial, num_runs / serial, '', '', serial]]
+        baseline = None
+        bound = None
+        for workers in worker_counts:
+            output = os.path.join(directory, 'data{0}'.format(workers))
+            # split the large files into enough ranges to keep every worker busy
+            split_bytes = max(2**20, num_bytes // (8 * workers))
+            start = time.perf_counter()
+            start_cpu = time.process_time()
+            _, outcomes, _, _ = ingest.run([logs], output, workers, split_bytes)
+            main_cpu = time.process_time() - start_cpu
+            seconds = time.perf_counter() - start
+            runs = sum(outcome[1] for outcome in outcomes.values())
+            if baseline is None:
+                baseline = seconds
+                bound = seconds / main_cpu
+            table.append([workers, runs, seconds, num_bytes / 1e6 / seconds, runs / seconds, baseline / seconds,
+                          baseline / seconds / workers, main_cpu])
+            shutil.rmtree(output)
+        print(tabulate.tabulate(table, headers='firstrow', floatfmt='.2f'))
+        print("the main process's share bounds the speedup to about {0:.1f}x".format(bound))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
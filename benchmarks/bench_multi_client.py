@@ -0,0 +1,45 @@
+"""
+measures N local senders at once on loopback, and reports the wall time of a receive cycle as N grows (it should stay
+about the time of one sender). needs iperf3 and ping on the PATH: the real ones, or the stand-ins in stub_bin/, which
+run the same exchange without root (with their default timings, a sender's test takes about 10 s and its pings 4 s).
+
+    python3 benchmarks/bench_multi_client.py [<MAX_CLIENTS>]
+    PATH=benchmarks/stub_bin:$PATH python3 benchmarks/bench_multi_client.py [<MAX_CLIENTS>]
+"""
+# standard library includes
+import asyncio
+import os
+import sys
+import time
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import receiver
+from py_lossy_network import utils
+
+FIRST_PORT = 5301
+
+
+async def cycle(num_clients: int) -> (float, int):
+    ports = list(range(FIRST_PORT, FIRST_PORT + num_clients))
+    start = time.perf_counter()
+    servers = asyncio.ensure_future(receiver.receive(ports, timeout=30.0, ping_count=5))
+    await asyncio.sleep(0.5)  # let the servers start listening
+    senders = await asyncio.gather(*[utils.iperf3_client('127.0.0.1', port) for port in ports])
+    records, errors = await servers
+    for error in errors + [proc.stderr.decode('utf-8') for proc in senders if proc.returncode != 0]:
+        print(error)
+    return time.perf_counter() - start, len(records)
+
+
+async def main():
+    max_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    num_clients = 1
+    while num_clients <= max_clients:
+        seconds, num_measured = await cycle(num_clients)
+        print("{0:>3} senders: {1:3} measured in {2:6.2f} s".format(num_clients, num_measured, seconds))
+        num_clients *= 2
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+reports how long adding, updating (in place), and removing one peer of a `PeerShaper` takes, and how many `tc` commands
+each sends, as the number of peers on the interface grows. the peers are hosts and /24 subnets, half of them with a port.
+by default the rules go to the stub `tc` in this directory, with each command taking STUB_TC_DELAY seconds (default
+0.0005, roughly the kernel's share of a class change); with --real, they go to the real `tc` on --interface (needs root,
+`htb`, `u32`, and `netem`, and replaces the interface's rules).
+
+    python3 benchmarks/bench_peers.py [--peers 1,10,100,500,1000] [--updates 200]
+    sudo python3 benchmarks/bench_peers.py --real --interface veth0
+"""
+# standard library includes
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+# external library includes
+import numpy as np
+import tabulate
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import peers
+from py_lossy_network import tc_backend
+from py_lossy_network import utils
+
+STUB_TC = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_tc.py')]
+
+
+class CountingBackend:
+    # passes commands on to another backend, counting them
+    def __init__(self, backend):
+        self.backend = backend
+        self.num_commands = 0
+
+    def run(self, commands: list):
+        self.num_commands += len(commands)
+        return self.backend.run(commands)
+
+    def close(self):
+        self.backend.close()
+
+
+def make_match(i: int) -> str:
+    # distinct destinations: hosts in 10.0.0.0/8 (every other peer) and /24 subnets in 172.16.0.0/12
+    if i % 2 == 0:
+        match = str(ipaddress.IPv4Address(int(ipaddress.IPv4Address('10.0.0.1')) + i // 2))
+    else:
+        match = str(ipaddress.IPv4Network((int(ipaddress.IPv4Address('172.16.0.0')) + (i // 2 << 8), 24)))
+    return match if i % 4 < 2 else match + ':5201'
+
+
+def make_profile(rng: random.Random) -> peers.PeerProfile:
+    return peers.PeerProfile(rate=rng.choice((500e3, 2e6, 10e6)), loss=rng.uniform(0.0, 0.05),
+                             delay=rng.uniform(0.0, 0.2), jitter=rng.uniform(0.0, 0.01))
+
+
+def time_operation(counter: CountingBackend, operation) -> tuple:
+    # the duration of one operation, in seconds, and the number of `tc` commands it sent
+    num_commands = counter.num_commands
+    start = time.perf_counter()
+    ret = operation()
+    duration = time.perf_counter() - start
+    assert ret.returncode == 0, ret.stderr
+    return duration, counter.num_commands - num_commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-peer add, update, and remove cost against the number of peers")
+    parser.add_argument('--peers', default='1,10,100,500,1000', help="comma-separated numbers of peers")
+    parser.add_argument('--updates', type=int, default=200, help="number of timed operations of each kind")
+    parser.add_argument('--real', action='store_true', help="use the real `tc` instead of the stub")
+    parser.add_argument('--interface', default='veth0', help="the interface shaped (default: veth0)")
+    options = parser.parse_args()
+
+    if options.real:
+        backend = tc_backend.default_backend()
+    else:
+        os.environ.setdefault('STUB_TC_DELAY', '0.0005')
+        backend = tc_backend.BatchBackend(STUB_TC)
+        backend.run([])  # start the `tc` process ahead of time
+    counter = CountingBackend(backend)
+    utils.set_tc_backend(counter)
+    rng = random.Random(0)
+
+    table = [['peers', 'install [ms]', 'update [ms]', 'update p99 [ms]', 'cmds/update', 'add [ms]', 'cmds/add',
+              'remove [ms]', 'cmds/remove']]
+    for num_peers in [int(n) for n in options.peers.split(',')]:
+        shaper = peers.PeerShaper()
+        matches = [make_match(i) for i in range(num_peers)]
+        install, _ = time_operation(counter, lambda: shaper.set_many(
+            options.interface, {match: make_profile(rng) for match in matches}))
+        # warm up: the first peer of each kind installs the hash table of its group
+        for match in (make_match(num_peers + i) for i in range(4)):
+            time_operation(counter, lambda: shaper.set(options.interface, match, make_profile(rng)))
+            time_operation(counter, lambda: shaper.remove(options.interface, match))
+
+        updates = []
+        adds = []
+        removes = []
+        for i in range(options.updates):
+            match = rng.choice(matches)
+            updates.append(time_operation(counter, lambda: shaper.set(options.interface, match, make_profile(rng))))
+            match = make_match(num_peers + i)
+            adds.append(time_operation(counter, lambda: shaper.set(options.interface, match, make_profile(rng))))
+            removes.append(time_operation(counter, lambda: shaper.remove(options.interface, match)))
+        assert len(shaper.peers(options.interface)) == num_peers
+
+        update_seconds = np.array([duration for duration, _ in updates])
+        table.append([num_peers, install * 1e3, np.mean(update_seconds) * 1e3, np.percentile(update_seconds, 99) * 1e3,
+                      np.mean([n for _, n in updates]), np.mean([d for d, _ in adds]) * 1e3,
+                      np.mean([n for _, n in adds]), np.mean([d for d, _ in removes]) * 1e3,
+                      np.mean([n for _, n in removes])])
+        utils.del_tc_rules(options.interface, 'root')
+    print(tabulate.tabulate(table, headers='firstrow', floatfmt='.2f'))
+    utils.get_tc_backend().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+runs the UDP probe against a reflector in the same process on loopback, at increasing rates, and reports the measured
+loss, RTT and jitter along with how long each run took (it should take count / rate seconds). needs no external tools.
+
+    python3 benchmarks/bench_probe.py
+"""
+# standard library includes
+import asyncio
+import os
+import sys
+import time
+
+# external library includes
+import numpy as np
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import probe
+
+PORT = 5391
+
+
+async def main():
+    reflector = await probe.start_reflector('127.0.0.1', PORT)
+    try:
+        for rate in (100, 500, 1000, 2000):
+            count = rate * 2
+            start = time.perf_counter()
+            result = await probe.probe('127.0.0.1', PORT, count=count, rate=rate, packet_size=512)
+            seconds = time.perf_counter() - start
+            print("{0:>5} pkt/s: {1:5} sent in {2:5.2f} s, {3:5.2f}% lost, median rtt {4:7.3f} ms, p99 rtt {5:7.3f} ms, "
+                  "jitter {6:6.3f} ms".format(rate, count, seconds, result.lost * 100, np.median(result.rtt_ms),
+                                              np.percentile(result.rtt_ms, 99), result.jitter_ms))
+    finally:
+        reflector.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+runs the userspace UDP proxy on loopback, in the same process as its traffic, and reports:
+- the packets per second it relays unshaped (the highest offered rate it relays with less than 1% loss)
+- the delivered rate of a rate-limited proxy against the configured rate, at increasing rates, and whether the error
+  stays within TOLERANCE
+- the loss and delay measured by the UDP probe through a lossy, delayed proxy against the configured values
+needs no external tools and no root.
+
+    python3 benchmarks/bench_proxy.py
+"""
+# standard library includes
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# external library includes
+import numpy as np
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import probe
+from py_lossy_network import proxy
+
+PROXY_PORT = 5392
+SINK_PORT = 5393
+REFLECTOR_PORT = 5394
+PAYLOAD = 1200
+TOLERANCE = 0.02
+
+
+class Sink(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def datagram_received(self, data, addr):
+        now = time.perf_counter()
+        self.first = now if self.first is None else self.first
+        self.last = now
+        self.count += 1
+
+
+async def blast(count: int, rate: float):
+    # send `count` datagrams to the proxy at `rate` datagrams per second, a millisecond's worth at a time
+    loop = asyncio.get_running_loop()
+    group = max(1, int(rate / 1000))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    payload = bytes(PAYLOAD)
+    start = loop.time()
+    for i in range(0, count, group):
+        delay = start + i / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for _ in range(min(group, count - i)):
+            try:
+                sock.sendto(payload, ('127.0.0.1', PROXY_PORT))
+            except BlockingIOError:
+                pass
+    sock.close()
+
+
+async def relay(sink, count, rate, settle=0.5):
+    sink.count, sink.first, sink.last = 0, None, None
+    start = time.perf_counter()
+    await blast(count, rate)
+    await asyncio.sleep(settle)
+    seconds = (sink.last or start) - (sink.first or start)
+    return sink.count, seconds, time.perf_counter() - start
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    sink = Sink()
+    sink_transport, _ = await loop.create_datagram_endpoint(lambda: sink, local_addr=('127.0.0.1', SINK_PORT))
+    sink_transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    relay_proxy = proxy.UdpProxy(PROXY_PORT, ('127.0.0.1', SINK_PORT), '127.0.0.1', seed=1)
+    await relay_proxy.start()
+    relay_proxy._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    try:
+        # the highest offered rate relayed with less than 1% loss is what the proxy sustains
+        sustained = 0
+        for offered in (5000, 10000, 20000, 40000, 80000):
+            count = offered * 2
+            received, seconds, _ = await relay(sink, count, offered)
+            print("unshaped, {0:>6} pkt/s offered: {1:6.2%} relayed".format(offered, received / count))
+            if received >= 0.99 * count:
+                sustained = offered
+        print("sustained unshaped: {0} pkt/s".format(sustained))
+
+        for rate in (1e6, 10e6, 50e6, 100e6):
+            # offer 20% more than the rate for about 2 s, with a bucket of 10 ms at that rate
+            bits_per_datagram = (PAYLOAD + proxy.UDP_OVERHEAD) * 8
+            offered = 1.2 * rate / bits_per_datagram
+            relay_proxy.egress.configure(rate=rate, burst=max(rate / 8 * 0.01, 2 * PAYLOAD), latency=0.05)
+            received, seconds, _ = await relay(sink, int(offered * 2), offered)
+            delivered = (received - 1) * bits_per_datagram / max(seconds, 1e-9)
+            error = delivered / rate - 1.0
+            print("{0:>6.0f} mbit: {1:7.2f} mbit delivered ({2:+6.2%}, {3}), {4:,.0f} pkt/s".format(
+                rate / 1e6, delivered / 1e6, error, 'ok' if abs(error) <= TOLERANCE else 'out of tolerance',
+                received / max(seconds, 1e-9)))
+        relay_proxy.egress.configure(rate=None)
+    finally:
+        relay_proxy.close()
+        sink_transport.close()
+
+    reflector = await probe.start_reflector('127.0.0.1', REFLECTOR_PORT)
+    relay_proxy = proxy.UdpProxy(PROXY_PORT, ('127.0.0.1', REFLECTOR_PORT), '127.0.0.1', seed=1)
+    await relay_proxy.start()
+    try:
+        for loss, delay, jitter in ((0.0, 0.02, 0.0), (0.05, 0.05, 0.005), (0.2, 0.1, 0.02)):
+            relay_proxy.egress.configure(loss=loss, delay=delay, jitter=jitter)
+            result = await probe.probe('127.0.0.1', PROXY_PORT, count=2000, rate=1000, timeout=1.0)
+            print("loss {0:5.1%} delay {1:5.1f} ms jitter {2:4.1f} ms: measured loss {3:5.1%}, mean rtt {4:6.2f} ms, "
+                  "std dev {5:5.2f} ms".format(loss, delay * 1e3, jitter * 1e3, result.lost, np.mean(result.rtt_ms),
+                                               np.std(result.rtt_ms)))
+    finally:
+        relay_proxy.close()
+        reflector.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+times one snapshot of the qdisc statistics sampler against the number of shaped interfaces, on a sample
+`tc -s qdisc show` output (data/tc_s_qdisc_show.txt, its shaped interfaces copied under new names to reach each count):
+- parse: `qdisc_stats.parse_qdisc_stats`
+- fold: `QdiscSampler.add` (increments, rates, and rows for the results file)
+- spawn: one `tc -s qdisc show` on this machine, for scale (it doesn't depend on the parser)
+and the highest sampling rate the parsing and folding alone would allow. needs no root.
+
+    python3 benchmarks/bench_qdisc_stats.py
+"""
+# standard library includes
+import os
+import re
+import subprocess
+import sys
+import timeit
+
+# external library includes
+import tabulate
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import qdisc_stats
+
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tc_s_qdisc_show.txt')
+
+
+def per_call(function) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(5, number)) / number
+
+
+def scaled_output(text: str, num_interfaces: int) -> str:
+    # the kernel's default qdiscs once, then the recorded shaped interfaces' qdiscs under as many names as needed
+    blocks = re.split(r'(?m)^(?=qdisc )', text)
+    default = [block for block in blocks if re.match(r'qdisc \S+ 0:', block)]
+    shaped = dict()
+    for block in blocks:
+        match = re.match(r'qdisc \S+ [0-9a-f]+: dev (\S+) ', block)
+        if match is not None and not block.startswith(('qdisc noqueue 0:', 'qdisc fq_codel 0:')):
+            shaped.setdefault(match.group(1), []).append(block)
+    templates = list(shaped.items())
+    output = list(default)
+    for i in range(num_interfaces):
+        name, template = templates[i % len(templates)]
+        output.extend(block.replace(' dev {0} '.format(name), ' dev veth{0:04d} '.format(i)) for block in template)
+    return ''.join(output)
+
+
+def main():
+    with open(RECORDED) as f:
+        text = f.read()
+
+    table = [['interfaces', 'qdiscs', 'parse [us]', 'fold [us]', 'per interface [us]', 'max rate [Hz]']]
+    for num_interfaces in (1, 12, 48, 96, 192):
+        output = scaled_output(text, num_interfaces)
+        keys, values = qdisc_stats.parse_qdisc_stats(output)
+        parse = per_call(lambda: qdisc_stats.parse_qdisc_stats(output))
+
+        sampler = qdisc_stats.QdiscSampler()
+        clock = [0.0]
+
+        def fold():
+            clock[0] += 0.1
+            sampler.add(clock[0], keys, values)
+            if sampler.num_samples % 100 == 0:
+                sampler.take_rows()
+        fold()
+        fold_seconds = per_call(fold)
+        total = parse + fold_seconds
+        table.append([num_interfaces, len(keys), parse * 1e6, fold_seconds * 1e6, total / num_interfaces * 1e6,
+                      1.0 / total])
+    print(tabulate.tabulate(table, headers='firstrow', floatfmt='.1f'))
+
+    try:
+        spawn = per_call(lambda: subprocess.run(['tc', '-s', 'qdisc', 'show'], capture_output=True))
+        print("one `tc -s qdisc show` on this machine: {0:.2f} ms".format(spawn * 1e3))
+    except OSError as e:
+        print("`tc` is not available here: {0}".format(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+reports how long one `filtering_loop` tick takes as the number of shaped interfaces grows, for a few concurrency limits.
+the rules are applied to the stub `tc` in this directory, with each command taking STUB_TC_DELAY seconds (default
+0.0005, roughly the kernel's share of a qdisc change).
+
+    python3 benchmarks/bench_shaping_scale.py
+"""
+# standard library includes
+import asyncio
+import os
+import sys
+import time
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import shaping
+from py_lossy_network import tc_backend
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+STUB_TC = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_tc.py')]
+
+
+def make_config() -> NetworkConfig:
+    return NetworkConfig(avg_egress_bw=units.parse_rate('500kbit'), std_dev_egress_bw=units.parse_rate('25kbit'),
+                         egress_burst=units.parse_size('32kbit'), egress_latency=units.parse_time('500ms'),
+                         avg_egress_loss=units.parse_percent('5%'), std_dev_egress_loss=units.parse_percent('1%'),
+                         egress_avg_delay=units.parse_time('250ms'), egress_std_dev_delay=units.parse_time('10ms'),
+                         avg_ingress_bw=units.parse_rate('1mbit'), std_dev_ingress_bw=units.parse_rate('10kbit'),
+                         ingress_burst=units.parse_size('32kbit'))
+
+
+async def time_ticks(shaper: shaping.Shaper, network_interfaces: dict, num_ticks: int) -> float:
+    await shaper.tick(network_interfaces)  # warm up (builds the trajectories)
+    start = time.perf_counter()
+    for _ in range(num_ticks):
+        await shaper.tick(network_interfaces)
+    return (time.perf_counter() - start) / num_ticks
+
+
+def main():
+    os.environ.setdefault('STUB_TC_DELAY', '0.0005')
+    print("{0:>12} {1:>12} {2:>14}".format('interfaces', 'concurrency', 'tick [ms]'))
+    for max_concurrency in (1, 8, 32):
+        backends = [tc_backend.BatchBackend(STUB_TC) for _ in range(max_concurrency)]
+        for backend in backends:
+            backend.run([])  # start the `tc` process ahead of time
+        utils.set_tc_backend(tc_backend.PooledBackend(backends))
+        shaper = shaping.Shaper(max_concurrency)
+        for num_interfaces in (1, 10, 100, 500):
+            network_interfaces = {'veth{0}'.format(i): make_config() for i in range(num_interfaces)}
+            duration = asyncio.run(time_ticks(shaper, network_interfaces, 3))
+            print("{0:>12} {1:>12} {2:>14.2f}".format(num_interfaces, max_concurrency, duration * 1e3))
+        shaper.close()
+        utils.get_tc_backend().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+compares the per-update latency of the `tc` backends against the stub `tc` in this directory. one "update" is the pair
+of commands `filtering_loop` sends for an interface's egress rules.
+
+    python3 benchmarks/bench_tc_backend.py [num_updates]
+"""
+# standard library includes
+import os
+import sys
+import time
+
+# external library includes
+import numpy as np
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import tc_backend
+from py_lossy_network import utils
+
+STUB_TC = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_tc.py')]
+
+
+def time_backend(backend, num_updates: int) -> np.ndarray:
+    commands = [
+        utils.tbf_command('veth0', 'root', '1:0', '500kbit', '32kbit', '500ms'),
+        utils.netem_command('veth0', 'parent 1:1', '10:0', '5%', '250ms', '10ms')
+    ]
+    backend.run(commands)  # warm up (starts the long-lived process, if any)
+    durations = np.zeros((num_updates,))
+    for i in range(num_updates):
+        start = time.perf_counter()
+        ret = backend.run(commands)
+        durations[i] = time.perf_counter() - start
+        assert ret.returncode == 0, ret.stderr
+    backend.close()
+    return durations
+
+
+def main():
+    num_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, backend in (('subprocess', tc_backend.SubprocessBackend(STUB_TC)), ('batch', tc_backend.BatchBackend(STUB_TC))):
+        durations = time_backend(backend, num_updates) * 1e3
+        print("{0:>10}: mean {1:8.3f} ms  p50 {2:8.3f} ms  p99 {3:8.3f} ms  ({4} updates)".format(
+            name, np.mean(durations), np.percentile(durations, 50), np.percentile(durations, 99), num_updates))
+
+
+if __name__ == '__main__':
+    main()
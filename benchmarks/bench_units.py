@@ -0,0 +1,98 @@
+"""
+compares the old `pint`-based unit handling against `py_lossy_network.units`: the per-tick cost of turning one
+interface's configuration into `tc` arguments, and the per-call cost of parsing iperf3 and `ping` output. the "before"
+numbers are only reported if `pint` is installed.
+
+    python3 benchmarks/bench_units.py
+"""
+# standard library includes
+import os
+import re
+import sys
+import timeit
+
+# external library includes
+import numpy as np
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def pint_tick(ureg, avg_egress_bw: str, std_dev_egress_bw: str, avg_egress_loss: str, std_dev_egress_loss: str):
+    # what `filtering_loop` used to do with each interface's configuration on every tick
+    if avg_egress_bw[-4] == 'm':
+        avg_egress_bw = avg_egress_bw[:-4] + 'M' + avg_egress_bw[-3:]
+    if std_dev_egress_bw[-4] == 'm':
+        std_dev_egress_bw = std_dev_egress_bw[:-4] + 'M' + std_dev_egress_bw[-3:]
+    avg_egress_bw = ureg(avg_egress_bw + '/sec').to(ureg.kbit / ureg.s)
+    std_dev_egress_bw = ureg(std_dev_egress_bw + '/sec').to(ureg.kbit / ureg.s)
+    avg_egress_loss = ureg(avg_egress_loss)
+    std_dev_egress_loss = ureg(std_dev_egress_loss)
+    bw = np.random.normal(avg_egress_bw.m, std_dev_egress_bw.m)
+    loss = min(max(np.random.normal(avg_egress_loss.m, std_dev_egress_loss.m), 0.0), 100.0)
+    return "{0}kbit".format(int(round(bw, 0))), "{0}%".format(int(round(loss, 0)))
+
+
+def numeric_tick(config: NetworkConfig):
+    # what `filtering_loop` does now that the configuration is parsed once
+    bw = np.random.normal(config.avg_egress_bw, config.std_dev_egress_bw)
+    loss = min(max(np.random.normal(config.avg_egress_loss, config.std_dev_egress_loss), 0.0), 1.0)
+    return ("{0}kbit".format(int(round(bw / 1e3, 0))), "{0}%".format(int(round(loss * 100, 0))),
+            units.format_size(config.egress_burst), units.format_time(config.egress_latency))
+
+
+def pint_process_ping(ping_output: str):
+    # `utils.process_ping` as it was, with a fresh unit registry per call
+    from pint import UnitRegistry
+    ureg = UnitRegistry()
+    delays = re.compile(r'\d+.\d+ [a-zA-Z]s').findall(ping_output)
+    return np.array([ureg(delay).to(ureg.ms).m for delay in delays])
+
+
+def report(name: str, seconds: float, number: int):
+    print("{0:>40}: {1:10.2f} us/call".format(name, seconds / number * 1e6))
+
+
+def main():
+    with open(os.path.join(DATA, 'iperf3_server_udp.txt')) as f:
+        iperf3_output = f.read()
+    with open(os.path.join(DATA, 'ping.txt')) as f:
+        ping_output = f.read()
+
+    config = NetworkConfig(avg_egress_bw=units.parse_rate('25mbit'), std_dev_egress_bw=units.parse_rate('25kbit'),
+                           egress_burst=units.parse_size('64kbit'), egress_latency=units.parse_time('5s'),
+                           avg_egress_loss=units.parse_percent('5%'), std_dev_egress_loss=units.parse_percent('1%'))
+
+    try:
+        from pint import UnitRegistry
+    except ImportError:
+        UnitRegistry = None
+
+    if UnitRegistry is not None:
+        ureg = UnitRegistry()
+        report('tick (before, pint)', timeit.timeit(lambda: pint_tick(ureg, '25mbit', '25kbit', '5%', '1%'), number=200), 200)
+    report('tick (after, numeric config)', timeit.timeit(lambda: numeric_tick(config), number=20000), 20000)
+
+    if UnitRegistry is not None:
+        report('process_ping (before, pint)', timeit.timeit(lambda: pint_process_ping(ping_output), number=5), 5)
+    report('process_ping (after)', timeit.timeit(lambda: utils.process_ping(ping_output), number=2000), 2000)
+    report('process_iperf3 (after)', timeit.timeit(lambda: utils.process_iperf3(iperf3_output), number=2000), 2000)
+
+    # the JSON path: parse each streamed record as it arrives, then summarize
+    with open(os.path.join(DATA, 'iperf3_server_udp.jsonl'), 'rb') as f:
+        iperf3_json_lines = f.readlines()
+
+    def process_iperf3_json_stream():
+        records = [utils.parse_iperf3_json_stream_line(line) for line in iperf3_json_lines]
+        intervals = [data for event, data in records if event == 'interval']
+        return utils.process_iperf3_json(records[0][1], intervals, records[-1][1])
+    report('process_iperf3_json (json-stream)', timeit.timeit(process_iperf3_json_stream, number=2000), 2000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+a stand-in for `tc` that accepts (and optionally records) commands without touching the kernel. it understands the
+single-command form and the `-OK`, `-force`, and `-batch -` options used by `py_lossy_network`. commands whose first
+argument is "fail" are rejected, which is handy for exercising error paths.
+
+if the STUB_TC_LOG environment variable is set, every command is appended to that file, one per line. if the
+STUB_TC_DELAY environment variable is set, every command takes that many seconds (to mimic the kernel's share of the work).
+if the STUB_TC_STATS environment variable is set, `tc -s qdisc show` prints that file (e.g. the sample output in data/).
+"""
+# standard library includes
+import os
+import sys
+import time
+
+
+def record(command: str):
+    log = os.environ.get('STUB_TC_LOG')
+    if log:
+        with open(log, 'a') as f:
+            f.write(command + '\n')
+
+
+def execute(command: str) -> bool:
+    record(command)
+    if os.environ.get('STUB_TC_DELAY'):
+        time.sleep(float(os.environ['STUB_TC_DELAY']))
+    return not command.startswith('fail')
+
+
+def main(argv: list) -> int:
+    ok = '-OK' in argv
+    force = '-force' in argv
+    if '-batch' not in argv:
+        command = ' '.join(arg for arg in argv if not arg.startswith('-'))
+        if command == 'qdisc show' and '-s' in argv and os.environ.get('STUB_TC_STATS'):
+            with open(os.environ['STUB_TC_STATS']) as f:
+                sys.stdout.write(f.read())
+        return 0 if execute(command) else 2
+
+    ret = 0
+    for line_number, line in enumerate(sys.stdin, start=1):
+        if line.strip() == '':
+            continue
+        if execute(line.strip()):
+            if ok:
+                sys.stdout.write('OK\n')
+                sys.stdout.flush()
+        else:
+            sys.stderr.write('RTNETLINK answers: Invalid argument\nCommand failed -:{0}\n'.format(line_number))
+            sys.stderr.flush()
+            ret = 1
+            if not force:
+                break
+    return ret
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,317 @@
+"""
+times the hot paths of the package without root or network access, and writes the results to a JSON file so that runs
+can be compared and regressions caught:
+- parse: throughput of `process_iperf3`, `process_iperf3_json`, `process_ping`, and `qdisc_stats.parse_qdisc_stats` on
+  the sample outputs in data/
+- rules: per-call latency of `add_tbf_filter`, `add_netem_filter`, `add_ingress_rule`, and `del_tc_rules` against the
+  stub `tc` in this directory, on the subprocess and the batch backends
+- storage: append rate of per-record `utils.save` writes and of `results.ResultsWriter`
+- tick: duration of one shaping tick (every interface updated once) against the number of interfaces, on the stub `tc`
+- metrics: what the instrumentation adds to a call, recording and with recording turned off, also relative to the
+  cheapest instrumented call (`process_ping`)
+
+    python3 benchmarks/suite.py [--output FILE] [--compare BASELINE] [--threshold 0.2] [--only GROUP] [--quick]
+
+with --compare, every metric is compared with the same metric of BASELINE (an earlier output), and the exit code is 1
+if any of them got worse by more than the threshold (relative).
+"""
+# standard library includes
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+# external library includes
+import h5py
+import numpy as np
+import tabulate
+
+# internal includes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from py_lossy_network import metrics
+from py_lossy_network import qdisc_stats
+from py_lossy_network import results
+from py_lossy_network import shaping
+from py_lossy_network import tc_backend
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA = os.path.join(HERE, 'data')
+STUB_TC = [sys.executable, os.path.join(HERE, 'stub_tc.py')]
+
+GROUPS = ('parse', 'rules', 'storage', 'tick', 'metrics')
+
+
+def per_call(function, repeat: int = 5) -> float:
+    # the best of `repeat` runs, each long enough (about 0.2 s) to be timed reliably, in seconds per call
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def metric(value: float, unit: str, better: str) -> dict:
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def bench_parse(quick: bool) -> dict:
+    metrics = dict()
+    for path in sorted(glob.glob(os.path.join(DATA, 'iperf3*.txt'))):
+        with open(path) as f:
+            text = f.read()
+        seconds = per_call(lambda: utils.process_iperf3(text), 3 if quick else 5)
+        name = os.path.splitext(os.path.basename(path))[0]
+        metrics['parse.process_iperf3.{0}'.format(name)] = metric(1.0 / seconds, 'calls/s', 'higher')
+
+    for path in sorted(glob.glob(os.path.join(DATA, 'iperf3*.json'))):
+        with open(path) as f:
+            document = json.load(f)
+        records = list(utils.iperf3_json_records(document))
+        start = [data for event, data in records if event == 'start'][0]
+        intervals = [data for event, data in records if event == 'interval']
+        end = [data for event, data in records if event == 'end'][0]
+        seconds = per_call(lambda: utils.process_iperf3_json(start, intervals, end), 3 if quick else 5)
+        name = os.path.splitext(os.path.basename(path))[0]
+        metrics['parse.process_iperf3_json.{0}'.format(name)] = metric(1.0 / seconds, 'calls/s', 'higher')
+
+    for path in sorted(glob.glob(os.path.join(DATA, 'ping*.txt'))):
+        with open(path) as f:
+            text = f.read()
+        seconds = per_call(lambda: utils.process_ping(text), 3 if quick else 5)
+        name = os.path.splitext(os.path.basename(path))[0]
+        metrics['parse.process_ping.{0}'.format(name)] = metric(1.0 / seconds, 'calls/s', 'higher')
+
+    for path in sorted(glob.glob(os.path.join(DATA, 'tc_s_qdisc*.txt'))):
+        with open(path) as f:
+            text = f.read()
+        seconds = per_call(lambda: qdisc_stats.parse_qdisc_stats(text), 3 if quick else 5)
+        name = os.path.splitext(os.path.basename(path))[0]
+        metrics['parse.parse_qdisc_stats.{0}'.format(name)] = metric(1.0 / seconds, 'calls/s', 'higher')
+    return metrics
+
+
+def bench_rules(quick: bool) -> dict:
+    helpers = {
+        'add_tbf_filter': lambda: utils.add_tbf_filter('veth0', 'root', '1:0', '500kbit', '32kbit', '500ms'),
+        'add_netem_filter': lambda: utils.add_netem_filter('veth0', 'parent 1:1', '10:0', '5%', '250ms', '10ms'),
+        'add_ingress_rule': lambda: utils.add_ingress_rule('veth0', '1mbit', '32kbit'),
+        'del_tc_rules': lambda: utils.del_tc_rules('veth0', 'root'),
+    }
+    num_calls = 20 if quick else 100
+    metrics = dict()
+    for backend_name, make_backend in (('subprocess', lambda: tc_backend.SubprocessBackend(STUB_TC)),
+                                       ('batch', lambda: tc_backend.BatchBackend(STUB_TC))):
+        utils.set_tc_backend(make_backend())
+        for helper_name, helper in helpers.items():
+            helper()  # warm up (starts the long-lived process, if any)
+            durations = np.zeros((num_calls,))
+            for i in range(num_calls):
+                start = time.perf_counter()
+                ret = helper()
+                durations[i] = time.perf_counter() - start
+                assert ret.returncode == 0, ret.stderr
+            prefix = 'rules.{0}.{1}'.format(backend_name, helper_name)
+            metrics[prefix + '.p50'] = metric(np.percentile(durations, 50) * 1e3, 'ms', 'lower')
+            metrics[prefix + '.p95'] = metric(np.percentile(durations, 95) * 1e3, 'ms', 'lower')
+    utils.set_tc_backend(tc_backend.SubprocessBackend())
+    return metrics
+
+
+def make_record(i: int) -> dict:
+    return {'timestamp': time.time(), 'client_ip': '172.17.0.{0}'.format(i % 250), 'bitrate_kbps': np.full((10,), 95e3),
+            'percent_lost_udp': 0.01, 'percent_reordered_udp': 0.0, 'delay_ms': np.full((20,), 0.25),
+            'percent_lost_tcp': 0.0}
+
+
+def bench_storage(quick: bool) -> dict:
+    num_records = 500 if quick else 5000
+    records = [make_record(i) for i in range(num_records)]
+    metrics = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        # what every record used to cost: one resize and one write per dataset
+        path = os.path.join(directory, 'save.h5')
+        start = time.perf_counter()
+        with h5py.File(path, 'w') as f:
+            dsets = {name: f.create_dataset(name, (0,), maxshape=(None,), dtype=float)
+                     for name in ('timestamp', 'percent_lost_udp', 'percent_reordered_udp', 'percent_lost_tcp')}
+            dsets['client_ip'] = f.create_dataset('client_ip', (0,), maxshape=(None,), dtype=results.vlen_str_dt)
+            for name in ('bitrate_kbps', 'delay_ms'):
+                dsets[name] = f.create_dataset(name, (0,), maxshape=(None,), dtype=h5py.vlen_dtype(np.dtype('float64')))
+            for record in records:
+                for name, dset in dsets.items():
+                    utils.save(dset, record[name])
+        seconds = time.perf_counter() - start
+        metrics['storage.utils_save'] = metric(num_records / seconds, 'records/s', 'higher')
+
+        path = os.path.join(directory, 'writer.h5')
+        start = time.perf_counter()
+        writer = results.ResultsWriter(path)
+        for name in ('timestamp', 'percent_lost_udp', 'percent_reordered_udp', 'percent_lost_tcp'):
+            writer.add_dataset(name, float)
+        writer.add_dataset('client_ip', results.vlen_str_dt)
+        writer.add_ragged_dataset('bitrate_kbps')
+        writer.add_ragged_dataset('delay_ms')
+        for record in records:
+            writer.append(record)
+        writer.close()
+        seconds = time.perf_counter() - start
+        metrics['storage.results_writer'] = metric(num_records / seconds, 'records/s', 'higher')
+    return metrics
+
+
+def make_config() -> NetworkConfig:
+    return NetworkConfig(avg_egress_bw=units.parse_rate('500kbit'), std_dev_egress_bw=units.parse_rate('25kbit'),
+                         egress_burst=units.parse_size('32kbit'), egress_latency=units.parse_time('500ms'),
+                         avg_egress_loss=units.parse_percent('5%'), std_dev_egress_loss=units.parse_percent('1%'),
+                         egress_avg_delay=units.parse_time('250ms'), egress_std_dev_delay=units.parse_time('10ms'),
+                         avg_ingress_bw=units.parse_rate('1mbit'), std_dev_ingress_bw=units.parse_rate('10kbit'),
+                         ingress_burst=units.parse_size('32kbit'))
+
+
+async def time_ticks(shaper: shaping.Shaper, network_interfaces: dict, num_ticks: int) -> float:
+    await shaper.tick(network_interfaces)  # warm up (builds the trajectories)
+    start = time.perf_counter()
+    for _ in range(num_ticks):
+        await shaper.tick(network_interfaces)
+    return (time.perf_counter() - start) / num_ticks
+
+
+def bench_tick(quick: bool) -> dict:
+    max_concurrency = 8
+    backends = [tc_backend.BatchBackend(STUB_TC) for _ in range(max_concurrency)]
+    for backend in backends:
+        backend.run([])  # start the `tc` process ahead of time
+    utils.set_tc_backend(tc_backend.PooledBackend(backends))
+    metrics = dict()
+    for num_interfaces in ((1, 10, 50) if quick else (1, 10, 100, 500)):
+        # a fresh shaper, so every tick applies new samples rather than skipping unchanged ones
+        shaper = shaping.Shaper(max_concurrency, verify_interval=None)
+        network_interfaces = {'veth{0}'.format(i): make_config() for i in range(num_interfaces)}
+        duration = asyncio.run(time_ticks(shaper, network_interfaces, 3))
+        shaper.close()
+        metrics['tick.interfaces_{0}'.format(num_interfaces)] = metric(duration * 1e3, 'ms', 'lower')
+    utils.set_tc_backend(tc_backend.SubprocessBackend())
+    return metrics
+
+
+def bench_metrics(quick: bool) -> dict:
+    measured = dict()
+    repeat = 3 if quick else 5
+
+    # the overhead of `metrics.timed` is measured on a function that does nothing, since on a real one (e.g. a parser)
+    # it is smaller than the noise of timing that function
+    def nothing():
+        pass
+    instrumented = metrics.timed('suite_seconds', "the overhead benchmark", function='nothing')(nothing)
+    bare = per_call(nothing, repeat)
+    overhead = per_call(instrumented, repeat) - bare
+    metrics.set_enabled(False)
+    try:
+        overhead_disabled = per_call(instrumented, repeat) - bare
+    finally:
+        metrics.set_enabled(True)
+    measured['metrics.timed_overhead'] = metric(max(overhead, 0.0) * 1e9, 'ns/call', 'lower')
+    measured['metrics.timed_overhead_disabled'] = metric(max(overhead_disabled, 0.0) * 1e9, 'ns/call', 'lower')
+
+    # relative to the cheapest instrumented call (parsing a ping output)
+    with open(os.path.join(DATA, 'ping.txt')) as f:
+        text = f.read()
+    parse = per_call(lambda: utils.process_ping.__wrapped__(text), repeat)
+    measured['metrics.overhead_relative.process_ping'] = metric(max(overhead, 0.0) / parse, 'ratio', 'lower')
+
+    histogram = metrics.Histogram()
+    measured['metrics.observe'] = metric(per_call(lambda: histogram.observe(0.0123), repeat) * 1e9, 'ns/call', 'lower')
+
+    def timed_block():
+        with metrics.timer('suite_seconds', "the overhead benchmark", function='timer'):
+            pass
+    measured['metrics.timer'] = metric(per_call(timed_block, repeat) * 1e9, 'ns/call', 'lower')
+    return measured
+
+
+BENCHMARKS = {'parse': bench_parse, 'rules': bench_rules, 'storage': bench_storage, 'tick': bench_tick,
+              'metrics': bench_metrics}
+
+
+def describe_run(quick: bool) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True).stdout.decode().strip()
+    except OSError:
+        commit = ''
+    return {'timestamp': datetime.now().isoformat(), 'commit': commit or None, 'quick': quick,
+            'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+            'h5py': h5py.__version__, 'stub_tc_delay': float(os.environ.get('STUB_TC_DELAY', 0.0))}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> (list, int):
+    """
+    :param baseline: the metrics of an earlier run
+    :param current: the metrics of this run
+    :param threshold: the largest relative change for the worse that isn't a regression
+    :return: a table (list of rows, header first) of every metric in both runs, and the number of regressions
+    """
+    table = [['metric', 'baseline', 'current', 'unit', 'change', '']]
+    num_regressions = 0
+    for name, new in current.items():
+        old = baseline.get(name)
+        if old is None or old['value'] == 0:
+            continue
+        change = new['value'] / old['value'] - 1.0
+        worse = -change if new['better'] == 'higher' else change
+        regressed = worse > threshold
+        num_regressions += regressed
+        table.append([name, old['value'], new['value'], new['unit'], '{0:+.1%}'.format(change),
+                      'REGRESSION' if regressed else ''])
+    return table, num_regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="times the hot paths of py_lossy_network")
+    parser.add_argument('--output', default=None,
+                        help="the JSON file the results are written to (default: results/<date and time>.json here)")
+    parser.add_argument('--compare', default=None, help="an earlier output to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="the relative change for the worse that counts as a regression (default: 0.2)")
+    parser.add_argument('--only', choices=GROUPS, action='append', default=None, help="only run this group")
+    parser.add_argument('--quick', action='store_true', help="fewer repetitions and smaller sizes")
+    options = parser.parse_args()
+
+    os.environ.setdefault('STUB_TC_DELAY', '0.0005')
+    metrics = dict()
+    for group in (options.only or GROUPS):
+        start = time.perf_counter()
+        metrics.update(BENCHMARKS[group](options.quick))
+        print("{0}: {1:.1f} s".format(group, time.perf_counter() - start), file=sys.stderr)
+
+    output = options.output
+    if output is None:
+        os.makedirs(os.path.join(HERE, 'results'), exist_ok=True)
+        output = os.path.join(HERE, 'results', datetime.now().strftime('%Y_%m_%dT%H_%M_%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump({'run': describe_run(options.quick), 'metrics': metrics}, f, indent=2, sort_keys=True)
+
+    print(tabulate.tabulate([[name, m['value'], m['unit']] for name, m in sorted(metrics.items())],
+                            headers=['metric', 'value', 'unit'], floatfmt='.4g'))
+    print("wrote {0}".format(output))
+
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline = json.load(f)['metrics']
+        table, num_regressions = compare(baseline, metrics, options.threshold)
+        print(tabulate.tabulate(table[1:], headers=table[0], floatfmt='.4g'))
+        print("{0} regression(s) beyond {1:.0%}".format(num_regressions, options.threshold))
+        return 1 if num_regressions > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+parses raw iperf3 (server-side, text or JSON) and ping logs captured outside this tool into a results file with the
+same datasets as a session's (plus the compressed raw text of every run), so analyze_data.py summarizes them too. logs
+already ingested into the output directory are skipped, so re-running it only adds what is new
+
+    python3 ingest_logs.py logs/                     # every log under logs/, into data/
+    python3 ingest_logs.py logs/ --workers 8 --output archive/
+    python3 ingest_logs.py logs/site1/ping.log.gz --force
+"""
+# standard library includes
+import argparse
+import time
+
+# external library includes
+from tabulate import tabulate
+
+# internal includes
+from py_lossy_network import ingest
+from py_lossy_network import units
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ingests raw iperf3 and ping logs into a results file")
+    parser.add_argument('paths', nargs='+', help="log files or directories (searched recursively); .gz files are "
+                                                 "decompressed on the fly")
+    parser.add_argument('--output', default='data',
+                        help="the directory of the new h5 file and of the index of ingested logs (default: data)")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: # of CPUs)")
+    parser.add_argument('--split-size', type=units.parse_size, default=ingest.DEFAULT_SPLIT_BYTES,
+                        help="parse logs larger than this in ranges of this size, with units, e.g. 16mb (default: 64mb)")
+    parser.add_argument('--force', action='store_true', help="ingest logs the index already has, too")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    h5_path, outcomes, num_skipped, num_bytes = ingest.run(args.paths, args.output, args.workers, int(args.split_size),
+                                                           args.force)
+    elapsed = time.monotonic() - start
+    if h5_path is None:
+        print("nothing new to ingest ({0} log(s) already ingested)".format(num_skipped))
+        return 0
+    print("{0} file(s) read ({1:.1f} MB in {2:.1f} s, {3:.1f} MB/s) into {4}; {5} already ingested".format(
+        len(outcomes), num_bytes / 1e6, elapsed, num_bytes / 1e6 / elapsed, h5_path, num_skipped))
+    print(tabulate(ingest.summary_table(outcomes), headers='firstrow'))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,46 +1,189 @@
 # standard library includes
+import argparse
 import asyncio
+import dataclasses
 import os
+import signal
 import sys
+import time
 from datetime import datetime
-from dataclasses import dataclass
-import re
 
 # external library includes
 import tabulate
-import h5py
 import numpy as np
-from pint import UnitRegistry
 
 # internal includes
 from py_lossy_network import utils
-
-@dataclass
-class NetworkConfig:
-    # ingress parameters
-    avg_ingress_bw: str = None
-    std_dev_ingress_bw: str = None
-    ingress_burst: str = None
-
-    # egress parameters
-    avg_egress_bw: str = None
-    std_dev_egress_bw: str = None
-    egress_burst: str = None
-    egress_latency: str = None
-    avg_egress_loss: str = None
-    std_dev_egress_loss: str = None
-    egress_avg_delay: str = None
-    egress_std_dev_delay: str = None
+from py_lossy_network import tc_backend
+from py_lossy_network import units
+from py_lossy_network import trajectory
+from py_lossy_network import trace
+from py_lossy_network import shaping
+from py_lossy_network import scheduler
+from py_lossy_network import results
+from py_lossy_network import receiver
+from py_lossy_network import probe
+from py_lossy_network import monitor
+from py_lossy_network import scenario
+from py_lossy_network import proxy
+from py_lossy_network import metrics
+from py_lossy_network import qdisc_stats
+from py_lossy_network import control
+from py_lossy_network import peers
+from py_lossy_network.config import NetworkConfig
 
 
 quit = False
 network_interfaces = dict()
-
-
-async def input_loop():
-    global quit
-    global network_interfaces
-
+max_concurrency = 8  # the largest number of interfaces whose rules are updated at the same time
+tolerance = 0.0  # the largest relative change of a sampled parameter that is not worth a `tc` call
+shaper = None  # applies the rules of every interface in `network_interfaces` (created by `main`)
+tick_scheduler = scheduler.TickScheduler()  # decides when each interface in `network_interfaces` gets updated
+results_writer = None  # writes measurements to this session's h5 file (created by `input_loop`)
+reflector = None  # the transport of the UDP probe reflector, while it runs (see the `reflector` command)
+stop_event = None  # set, along with `quit`, when the headless modes should stop (created by `main`)
+scenario_task = None  # the scenario started from the prompt, while it runs (see the `scenario` command)
+stop_scenario = False  # whether the scenario started from the prompt should stop early
+proxy_backend = None  # with --userspace, the backend that applies the rules to userspace proxies instead of `tc`
+qdisc_sampler = None  # with --qdisc-interval, the rates of what the kernel's qdiscs actually sent and dropped
+controller = None  # the agents of the fleet, once connected (see --fleet and the `fleet` command)
+peer_shaper = peers.PeerShaper()  # shapes the traffic to each peer of an interface on its own (see the `peer` command)
+
+
+def is_shapeable_interface(name: str) -> bool:
+    """
+    :param name: the name of a userspace proxy with --userspace, and of a network interface otherwise
+    :return: whether it exists
+    """
+    if proxy_backend is not None:
+        return name in proxy_backend
+    return name in utils.get_interface_inventory()
+
+
+def list_shapeable_interfaces() -> list:
+    """
+    :return: the names of the userspace proxies with --userspace, and the network interfaces of this machine otherwise
+    """
+    if proxy_backend is not None:
+        return proxy_backend.names()
+    return utils.list_available_interfaces()
+
+
+async def agent_apply(name: str, fields: dict) -> dict:
+    """
+    sets some NetworkConfig fields of an interface on behalf of a controller, and applies them right away rather than on
+    the next tick
+    :param name: the name of the network interface (or proxy)
+    :param fields: a dict mapping NetworkConfig field names to values
+    :return: the interface's whole config, for the acknowledgement
+    """
+    if not is_shapeable_interface(name):
+        raise ValueError("there is no network interface \"{0}\" (valid: {1})".format(name, list_shapeable_interfaces()))
+    config = control.update_config(dataclasses.replace(network_interfaces.get(name, NetworkConfig())), fields)
+    if config.model not in trajectory.MODELS:
+        raise ValueError("unknown model \"{0}\" (valid: {1})".format(config.model, list(trajectory.MODELS)))
+    if config.model in trace.TRACE_MODELS:
+        trace.check_params(config.model_params)
+
+    # build the trajectories before installing the config, so a config they can't be built from is turned away here
+    # instead of failing on every tick
+    try:
+        samples = trajectory.interface_trajectories(name, config)
+    except Exception as e:
+        raise ValueError("invalid config: {0}".format(e))
+    network_interfaces[name] = config
+    shaper.invalidate(name, samples)
+    ret = await shaper.submit(name, config)
+    tick_scheduler.wake()
+    if ret.returncode != 0:
+        raise RuntimeError(ret.stderr.decode('utf-8', 'replace').strip())
+    return {'config': control.config_to_dict(config)}
+
+
+async def agent_show(name: str) -> dict:
+    # what `show` prints, for a controller
+    if not is_shapeable_interface(name):
+        raise ValueError("there is no network interface \"{0}\" (valid: {1})".format(name, list_shapeable_interfaces()))
+    answer = {'config': control.config_to_dict(network_interfaces[name]) if name in network_interfaces else None}
+    if proxy_backend is not None:
+        answer['rules'] = str(proxy_backend.proxies()[name].status())
+        return answer
+    proc = await loop.run_in_executor(None, utils.show_tc_rules, name)
+    answer['rules'] = (proc.stdout if proc.returncode == 0 else proc.stderr).decode('utf-8', 'replace')
+    if qdisc_sampler is not None:
+        answer['qdisc_stats'] = qdisc_sampler.latest(name)
+    return answer
+
+
+async def agent_delete(name: str) -> dict:
+    # what `del` does, for a controller
+    if not is_shapeable_interface(name):
+        raise ValueError("there is no network interface \"{0}\" (valid: {1})".format(name, list_shapeable_interfaces()))
+    network_interfaces.pop(name, None)
+    shaper.invalidate(name)
+    peer_shaper.forget(name)
+    proc_root = await loop.run_in_executor(None, utils.del_tc_rules, name, 'root')
+    proc_ingress = await loop.run_in_executor(None, utils.del_tc_rules, name, 'ingress')
+    if proc_root.returncode != 0 and proc_ingress.returncode != 0:
+        raise RuntimeError(proc_root.stderr.decode('utf-8', 'replace').strip())
+    return dict()
+
+
+def print_acknowledgements(answers: dict):
+    table, spread = control.acknowledgements_table(answers)
+    print(tabulate.tabulate(table, headers='firstrow', tablefmt='fancy_grid', floatfmt='.2f'))
+    num_ok = sum(1 for answer in answers.values() if answer.get('ok'))
+    if num_ok > 1:
+        print("{0} of {1} agents done within {2:.2f} ms of each other (by their clocks)".format(num_ok, len(answers), spread * 1e3))
+
+
+async def start_proxy(name: str, protocol: str, listen_port: str, host: str, port: str):
+    """
+    starts a userspace proxy and registers it with `proxy_backend` under a name, which is then shaped like a network
+    interface
+    :param name: the name of the proxy
+    :param protocol: 'udp' or 'tcp'
+    :param listen_port: the port clients connect or send to
+    :param host: the address of the server
+    :param port: the port of the server
+    """
+    if name in proxy_backend:
+        raise ValueError("a proxy named \"{0}\" already exists".format(name))
+    relay = proxy.make_proxy(protocol, int(listen_port), (host, int(port)))
+    await relay.start()
+    proxy_backend.register(name, relay)
+
+
+def report_measurements(records: list, errors: list):
+    """
+    stores the records of a `receiver` cycle in the results file and prints them
+    :param records: a list of records (see `receiver.measure`)
+    :param errors: a list of error messages
+    """
+    for error in errors:
+        print(error)
+    if len(records) == 0:
+        print("no sender was measured")
+        return
+
+    # save data to h5 file, one run per sender (queued; the writer's thread does the actual h5py work)
+    for record in records:
+        results_writer.append(record)
+
+    # tables
+    table = [
+        ['client ip', 'mode', 'avg. bitrate [kbit/s]', 'std. dev. bitrate [kbit/s]', '% udp lost', '% udp reordered', 'avg. delay [ms]', 'std. dev. delay [ms]', '% tcp lost'],
+    ]
+    for record in records:
+        table.append([record['client_ip'], record['mode'], round(np.mean(record['bitrate_kbps']), 2), round(np.std(record['bitrate_kbps']), 2), round(record['percent_lost_udp'], 2), round(record['percent_reordered_udp'], 2), round(np.mean(record['delay_ms']), 2), round(np.std(record['delay_ms']), 2), round(record['percent_lost_tcp'], 2)])
+    print(tabulate.tabulate(table, headers='firstrow', tablefmt='fancy_grid'))
+
+
+def open_results_file() -> results.ResultsWriter:
+    """
+    creates this session's h5 file, named after the current date and time, in the 'data' directory
+    :return: a ResultsWriter with every dataset of a session
+    """
     # get the path to the h5 file and create the directory (if not already in existence)
     path_to_h5 = os.path.join(os.getcwd(), 'data')
     os.makedirs(path_to_h5, exist_ok=True)
@@ -49,60 +192,28 @@ async def input_loop():
     current_datetime = datetime.now()
     h5_file_name = (current_datetime.isoformat()).replace(':', '_').replace('-', '_').replace('.', '_')
 
-    # create the h5 file
-    h5_file = h5py.File(os.path.join(path_to_h5, h5_file_name + '.h5'), 'w')
-
-    # create the datatypes we want to store in the h5 file
-    vlen_str_dt = h5py.special_dtype(vlen=str)  # variable length strings
-    vlen_np_float_dt = h5py.special_dtype(vlen=np.dtype('float64'))  # variable length numpy arrays (dtype=float)
-
-    # create a dataset for client IP data
-    client_ip_dset = h5_file.create_dataset(
-        name='client_ip',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=vlen_str_dt
-    )
-
-    # create a dataset for bitrate data
-    bitrate_dset = h5_file.create_dataset(
-        name='bitrate_kbps',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=vlen_np_float_dt
-    )
-
-    # create a dataset for percent lost (UDP)
-    percent_lost_udp_dset = h5_file.create_dataset(
-        name='percent_lost_udp',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=float
-    )
-
-    # create a dataset for percent reordered (UDP)
-    percent_reordered_udp_dset = h5_file.create_dataset(
-        name='percent_reordered_udp',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=float
-    )
-
-    # create a dataset for percent lost (TCP)
-    percent_lost_tcp_dset = h5_file.create_dataset(
-        name='percent_lost_tcp',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=float
-    )
-
-    # create a dataset for delay in milliseconds
-    delay_dset = h5_file.create_dataset(
-        name='delay_ms',
-        shape=(0,),
-        maxshape=(None,),
-        dtype=vlen_np_float_dt
-    )
+    # create the h5 file; records are buffered and written in blocks by a background thread
+    writer = results.ResultsWriter(os.path.join(path_to_h5, h5_file_name + '.h5'), compression='gzip')
+
+    # create every dataset of a session
+    results.add_session_datasets(writer)
+
+    return writer
+
+
+async def input_loop():
+    global quit
+    global network_interfaces
+    global shaper
+    global tick_scheduler
+    global results_writer
+    global reflector
+    global scenario_task
+    global stop_scenario
+    global controller
+
+    # create this session's h5 file
+    results_writer = open_results_file()
 
     # prompt the user with the "help" menu
     utils.prompt()
@@ -129,26 +240,44 @@ async def input_loop():
                 print("\"show\" command expects 1 argument, the name of the network interface. You provided {0} arguments".format(len(split_user_input) - 1))
                 continue
 
-            # get a list of the available network interfaces on this device
-            network_interface_list = utils.list_available_interfaces()
-
-            # if the user's input doesn't match one of those interfaces, then prompt the user again
-            if not split_user_input[1] in network_interface_list:
-                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], network_interface_list))
+            # if the user's input doesn't match one of the available network interfaces, then prompt the user again
+            if not is_shapeable_interface(split_user_input[1]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], list_shapeable_interfaces()))
                 continue
 
             # if the user's input is inside the network_interfaces object, then print it out
-            if split_user_input[0] in network_interfaces:
-                print(network_interfaces[split_user_input[0]])
+            if split_user_input[1] in network_interfaces:
+                print(network_interfaces[split_user_input[1]])
+
+            # a userspace proxy has no `tc` rules, so show what it is doing instead
+            if proxy_backend is not None:
+                print(proxy_backend.proxies()[split_user_input[1]].status())
+                continue
+
+            # print what the kernel says about the interface
+            print(utils.get_interface_inventory().get(split_user_input[1]))
+
+            # and what its qdiscs actually let through, as of the last snapshot
+            latest = qdisc_sampler.latest(split_user_input[1]) if qdisc_sampler is not None else dict()
+            if len(latest) > 0:
+                table = [['qdisc', 'sent [kbit/s]', 'sent [pkt/s]', 'dropped [pkt/s]', 'overlimits [/s]', 'requeues [/s]', 'backlog [bytes]', 'backlog [pkt]']]
+                for qdisc, rates in latest.items():
+                    table.append([qdisc, rates['sent_bytes'] * 8 / 1e3] + [rates[field] for field in qdisc_stats.FIELDS[1:]])
+                print(tabulate.tabulate(table, headers='firstrow', tablefmt='fancy_grid', floatfmt='.1f'))
 
             # if the user passed in a valid network interface, then we can look up the `tc` filters on that interface
-            proc_tc_show = utils.show_tc_rules(split_user_input[1])
+            proc_tc_show = await loop.run_in_executor(None, utils.show_tc_rules, split_user_input[1])
 
             # if the return code of the call to `tc` is not 0, that means the process failed, so just continue
             if proc_tc_show.returncode != 0:
                 print(proc_tc_show.stderr.decode('utf-8'))
                 continue
 
+            # if someone else changed the rules on this interface, make sure the next update re-applies ours
+            changed = shaper.check(split_user_input[1], proc_tc_show.stdout.decode('utf-8'))
+            if split_user_input[1] in network_interfaces and len(changed) > 0:
+                print("The {0} rules on \"{1}\" were changed outside of this program; they will be re-applied on the next update".format(' and '.join(changed), split_user_input[1]))
+
             # otherwise, print out the stdout
             print(proc_tc_show.stdout.decode('utf-8'))
         elif split_user_input[0] == 'del':
@@ -157,21 +286,20 @@ async def input_loop():
                 print("\"del\" command expects 1 argument, the name of the network interface. You provided {0} arguments".format(len(split_user_input) - 1))
                 continue
 
-            # get a list of the available network interfaces on this device
-            network_interface_list = utils.list_available_interfaces()
-
-            # if the user's input doesn't match one of those interfaces, then prompt the user again
-            if not split_user_input[1] in network_interface_list:
-                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], network_interface_list))
+            # if the user's input doesn't match one of the available network interfaces, then prompt the user again
+            if not is_shapeable_interface(split_user_input[1]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], list_shapeable_interfaces()))
                 continue
 
             # if the user's input is inside the network_interfaces object, then delete it from there
             if split_user_input[1] in network_interfaces:
                 network_interfaces.pop(split_user_input[1])
+            shaper.invalidate(split_user_input[1])
+            peer_shaper.forget(split_user_input[1])
 
             # if the user passed in a valid network interface, then we can look up the `tc` filters on that interface
-            proc_tc_del_root = utils.del_tc_rules(split_user_input[1], 'root')
-            proc_tc_del_ingress = utils.del_tc_rules(split_user_input[1], 'ingress')
+            proc_tc_del_root = await loop.run_in_executor(None, utils.del_tc_rules, split_user_input[1], 'root')
+            proc_tc_del_ingress = await loop.run_in_executor(None, utils.del_tc_rules, split_user_input[1], 'ingress')
 
             # if the return code of the call to `tc` is not 0, that means the process failed, so just continue
             if proc_tc_del_root.returncode != 0 and proc_tc_del_ingress.returncode != 0:
@@ -190,12 +318,9 @@ async def input_loop():
                 print("\"set_egress\" command expects 14 arguments. You provided {0} arguments".format(len(split_user_input) - 1))
                 continue
 
-            # get a list of the available network interfaces on this device
-            network_interface_list = utils.list_available_interfaces()
-
-            # if the user's input doesn't match one of those interfaces, then prompt the user again
-            if not split_user_input[1] in network_interface_list:
-                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], network_interface_list))
+            # if the user's input doesn't match one of the available network interfaces, then prompt the user again
+            if not is_shapeable_interface(split_user_input[1]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], list_shapeable_interfaces()))
                 continue
 
             # extract the bandwidth, egress loss rate, and delay_ms passed in by the user
@@ -253,6 +378,30 @@ async def input_loop():
                     egress_avg_delay = split_user_input[i+1]
                     egress_std_dev_delay = split_user_input[i+2]
 
+            # convert the user's input into numbers once, here, instead of on every tick of the filtering loop
+            try:
+                avg_egress_bw = units.parse_rate(avg_egress_bw)
+                std_dev_egress_bw = units.parse_rate(std_dev_egress_bw)
+                egress_burst = units.parse_size(egress_burst)
+                egress_latency = units.parse_time(egress_latency)
+                avg_egress_loss = units.parse_percent(avg_egress_loss)
+                std_dev_egress_loss = units.parse_percent(std_dev_egress_loss)
+                egress_avg_delay = units.parse_time(egress_avg_delay)
+                egress_std_dev_delay = units.parse_time(egress_std_dev_delay)
+            except (ValueError, TypeError) as e:
+                print("\"set_egress\" could not parse its arguments: {0}".format(e))
+                continue
+
+            # the `tbf` root would replace the `htb` tree of the interface's peers
+            if len(peer_shaper.peers(split_user_input[1])) > 0:
+                print("\"{0}\" is shaped per peer; delete its rules with \"del {0}\" before shaping it as a whole".format(split_user_input[1]))
+                continue
+
+            # `tbf` drops every packet bigger than its burst, so a burst below the MTU silently blackholes full-size packets
+            interface = utils.get_interface_inventory().get(split_user_input[1]) if proxy_backend is None else None
+            if interface is not None and egress_burst < interface.mtu:
+                print("Warning: the burst ({0} bytes) is smaller than the MTU of \"{1}\" ({2} bytes), so full-size packets will be dropped".format(int(egress_burst), interface.mtu, split_user_input[1]))
+
             if split_user_input[1] in network_interfaces:
                 config = network_interfaces[split_user_input[1]]
             else:
@@ -266,6 +415,8 @@ async def input_loop():
             config.egress_avg_delay = egress_avg_delay
             config.egress_std_dev_delay = egress_std_dev_delay
             network_interfaces[split_user_input[1]] = config
+            shaper.invalidate(split_user_input[1])  # rebuilt from the new config on the next tick
+            tick_scheduler.wake()
 
             # add the rules
             # utils.add_tbf_filter(split_user_input[1], 'root', '1:0', egress_bw, egress_burst, egress_latency)
@@ -276,12 +427,9 @@ async def input_loop():
                 print("\"set_ingress\" command expects 6 arguments. You provided {0} arguments".format(len(split_user_input) - 1))
                 continue
 
-            # get a list of the available network interfaces on this device
-            network_interface_list = utils.list_available_interfaces()
-
-            # if the user's input doesn't match one of those interfaces, then prompt the user again
-            if not split_user_input[1] in network_interface_list:
-                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], network_interface_list))
+            # if the user's input doesn't match one of the available network interfaces, then prompt the user again
+            if not is_shapeable_interface(split_user_input[1]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], list_shapeable_interfaces()))
                 continue
 
             # extract the bandwidth, egress loss rate, and delay_ms passed in by the user
@@ -307,6 +455,15 @@ async def input_loop():
 
                     ingress_burst = split_user_input[i+1]
 
+            # convert the user's input into numbers once, here, instead of on every tick of the filtering loop
+            try:
+                avg_ingress_bw = units.parse_rate(avg_ingress_bw)
+                std_dev_ingress_bw = units.parse_rate(std_dev_ingress_bw)
+                ingress_burst = units.parse_size(ingress_burst)
+            except (ValueError, TypeError) as e:
+                print("\"set_ingress\" could not parse its arguments: {0}".format(e))
+                continue
+
             if split_user_input[1] in network_interfaces:
                 config = network_interfaces[split_user_input[1]]
             else:
@@ -315,130 +472,746 @@ async def input_loop():
             config.std_dev_ingress_bw = std_dev_ingress_bw
             config.ingress_burst = ingress_burst
             network_interfaces[split_user_input[1]] = config
+            shaper.invalidate(split_user_input[1])  # rebuilt from the new config on the next tick
+            tick_scheduler.wake()
 
             # add the rules
             # utils.add_egress_rule(split_user_input[1], ingress_bw, ingress_burst)
-        elif split_user_input[0] == 'sender':
+        elif split_user_input[0] == 'set_model':
+            # the expected number of arguments is at least 2: the interface and the model
+            if len(split_user_input) < 3:
+                print("\"set_model\" command expects at least 2 arguments. You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
+
+            # if the user's input doesn't match one of the available network interfaces, then prompt the user again
+            if not is_shapeable_interface(split_user_input[1]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(split_user_input[1], list_shapeable_interfaces()))
+                continue
+
+            # if the user's input doesn't match one of the models, then prompt the user again
+            if not split_user_input[2] in trajectory.MODELS:
+                print("The model you provided, \"{0}\" is invalid. Here is a list of valid models: {1}".format(split_user_input[2], list(trajectory.MODELS)))
+                continue
+
+            try:
+                model_params = trajectory.parse_model_params([token for token in split_user_input[3:] if token != ''])
+                if split_user_input[2] in trace.TRACE_MODELS:
+                    trace.check_params(model_params)
+            except (ValueError, OSError) as e:
+                print("\"set_model\" could not parse its arguments: {0}".format(e))
+                continue
+
+            if split_user_input[1] in network_interfaces:
+                config = network_interfaces[split_user_input[1]]
+            else:
+                config = NetworkConfig()
+            config.model = split_user_input[2]
+            config.model_params = model_params
+            network_interfaces[split_user_input[1]] = config
+            shaper.invalidate(split_user_input[1])  # rebuilt from the new config on the next tick
+            tick_scheduler.wake()
+        elif split_user_input[0] == 'set_period':
+            # the expected number of arguments is 3, so if it is not exactly 3, then prompt the user again
+            if len(split_user_input) != 3:
+                print("\"set_period\" command expects 2 arguments. You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
+
+            # the period only means something for an interface we are already shaping
+            if not split_user_input[1] in network_interfaces:
+                print("The network interface name you provided, \"{0}\" is not being shaped. Here is a list of the shaped network interfaces: {1}".format(split_user_input[1], list(network_interfaces.keys())))
+                continue
+
+            try:
+                update_period = units.parse_time(split_user_input[2])
+            except ValueError as e:
+                print("\"set_period\" could not parse its arguments: {0}".format(e))
+                continue
+            if update_period <= 0:
+                print("\"set_period\" expects a positive period")
+                continue
+
+            network_interfaces[split_user_input[1]].update_period = update_period
+            tick_scheduler.wake()
+        elif split_user_input[0] == 'set_tolerance':
             # the expected number of arguments is 2, so if it is not exactly 2, then prompt the user again
             if len(split_user_input) != 2:
-                print("\"sender\" command expects 1 argument, the ip of the receiver. You provided {0} arguments".format(len(split_user_input) - 1))
+                print("\"set_tolerance\" command expects 1 argument, the tolerance as a percentage. You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
+
+            try:
+                shaper.tolerance = units.parse_percent(split_user_input[1])
+            except ValueError as e:
+                print("\"set_tolerance\" could not parse its arguments: {0}".format(e))
+                continue
+        elif split_user_input[0] == 'schedule':
+            # print the update period and deadline accounting of every shaped interface
+            table = [['interface', 'period [ms]', 'updates', 'missed deadlines', 'last lateness [ms]', 'max lateness [ms]', 'failed updates', 'last error']]
+            for k, state in tick_scheduler.stats().items():
+                table.append([k, round(state.period * 1e3, 2), state.ticks, state.missed, round(state.last_lateness * 1e3, 2), round(state.max_lateness * 1e3, 2), state.failures, state.last_error or ''])
+            print(tabulate.tabulate(table, headers='firstrow', tablefmt='fancy_grid'))
+            print("{0} updates applied, {1} updates skipped (unchanged within {2})".format(shaper.num_applied, shaper.num_skipped, units.format_percent(shaper.tolerance)))
+        elif split_user_input[0] == 'stats':
+            # the expected number of arguments is 0, or 1 to reset the statistics
+            if len(split_user_input) > 2 or (len(split_user_input) == 2 and split_user_input[1] != 'reset'):
+                print("\"stats\" command expects no arguments, or \"reset\". You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
+            if len(split_user_input) == 2:
+                metrics.REGISTRY.reset()
+                print("Statistics reset")
+                continue
+            if not metrics.is_enabled():
+                print("Statistics are not recorded (--no-metrics)")
                 continue
-            proc = await utils.iperf3_client(split_user_input[1])
+
+            # print the latency distribution of every instrumented operation, then every counter (e.g. failures by cause)
+            histograms, counters = metrics.REGISTRY.tables()
+            print(tabulate.tabulate(histograms, headers='firstrow', tablefmt='fancy_grid', floatfmt='.3f'))
+            if len(counters) > 1:
+                print(tabulate.tabulate(counters, headers='firstrow', tablefmt='fancy_grid'))
+        elif split_user_input[0] == 'sender':
+            # the expected number of arguments is 2 or 3, so if it is not, then prompt the user again
+            if len(split_user_input) not in (2, 3):
+                print("\"sender\" command expects 1 or 2 arguments, the ip of the receiver and optionally its port. You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
+            try:
+                port = receiver.parse_ports(split_user_input[2])[0] if len(split_user_input) == 3 else None
+            except ValueError as e:
+                print("\"sender\" could not parse its arguments: {0}".format(e))
+                continue
+            proc = await utils.iperf3_client(split_user_input[1], port)
             if proc.returncode != 0:
                 print(proc.stderr.decode('utf-8'))
                 continue
 
             print("Success!")
         elif split_user_input[0] == 'receiver':
-            # start iperf3 as the server (takes roughly 25 seconds)
-            proc = await utils.iperf3_server()
-            # print(proc.stdout.decode('utf-8'))
-
-            if proc.returncode != 0:
-                print(proc.stderr.decode('utf-8'))
+            # besides the optional ports and timeout, the command takes the keywords 'pipelined' and 'repeat <N>'
+            arguments = [token for token in split_user_input[1:] if token != '']
+            mode = receiver.SEQUENTIAL
+            repeat = 1
+            try:
+                if 'pipelined' in arguments:
+                    arguments.remove('pipelined')
+                    mode = receiver.PIPELINED
+                    if not utils.iperf3_supports_json_stream():
+                        print("This iperf3 has no --json-stream (3.17+), so senders are pinged after their test and recorded as sequential")
+                if 'repeat' in arguments:
+                    i = arguments.index('repeat')
+                    repeat = int(arguments[i + 1]) if i + 1 < len(arguments) else 0
+                    del arguments[i:i + 2]
+                    if repeat < 1:
+                        raise ValueError("\"repeat\" expects a positive number of cycles")
+                if len(arguments) > 2:
+                    raise ValueError("expected at most 2 arguments besides 'pipelined' and 'repeat <N>', the ports and the timeout")
+                ports = receiver.parse_ports(arguments[0]) if len(arguments) > 0 else [None]
+                timeout = units.parse_time(arguments[1]) if len(arguments) > 1 else None
+            except ValueError as e:
+                print("\"receiver\" could not parse its arguments: {0}".format(e))
                 continue
 
-            # extract relevant data from iperf3 output
-            client_ip, bitrate_kbps, percent_lost_udp, percent_reordered_udp = utils.process_iperf3(proc.stdout.decode('utf-8'))
-
-            # compute the delay (RTT egress_latency) & packet egress_loss (over TCP) by using `ping`; takes roughly 30 seconds
-            proc = await utils.ping(client_ip, count=20)
+            # run one iperf3 server per port (a test takes roughly 25 seconds, and the senders run theirs at the same
+            # time), showing each interval's measurements as they arrive; each sender is pinged after its test ends, or
+            # during it in pipelined mode
+            def print_interval(port, data):
+                print("{0}{1:6.2f}-{2:6.2f} s: {3:10.2f} kbit/s, {4}/{5} datagrams lost".format(
+                    "[{0}] ".format(port) if port is not None else "", data['sum']['start'], data['sum']['end'],
+                    data['sum']['bits_per_second'] / 1e3, data['sum'].get('lost_packets', 0), data['sum'].get('packets', 0)))
+
+            # run the cycles back to back; in pipelined mode, the servers of the next cycle are started before the results
+            # of the previous one are stored and printed
+            cycle = asyncio.ensure_future(receiver.receive(ports, timeout, ping_count=20, on_interval=print_interval, mode=mode))
+            for i in range(repeat):
+                records, errors = await cycle
+                if i + 1 < repeat and mode == receiver.PIPELINED:
+                    cycle = asyncio.ensure_future(receiver.receive(ports, timeout, ping_count=20, on_interval=print_interval, mode=mode))
+                    await asyncio.sleep(0)  # let the next cycle's servers start
+                if repeat > 1:
+                    print("cycle {0}/{1}:".format(i + 1, repeat))
+                report_measurements(records, errors)
+                if i + 1 < repeat and mode != receiver.PIPELINED:
+                    cycle = asyncio.ensure_future(receiver.receive(ports, timeout, ping_count=20, on_interval=print_interval, mode=mode))
+
+        elif split_user_input[0] == 'reflector':
+            # the expected number of arguments is at most 1, the port (or 'stop')
+            if len(split_user_input) > 2:
+                print("\"reflector\" command expects at most 1 argument, the port or \"stop\". You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
 
-            # if `ping` crashed, then just continue (don't compute statistics)
-            if proc.returncode != 0:
-                print(proc.stderr.decode('utf-8'))
+            # there is at most one reflector, so stop the current one (if any) either way
+            if reflector is not None:
+                reflector.close()
+                reflector = None
+            if len(split_user_input) == 2 and split_user_input[1] == 'stop':
+                print("Reflector stopped")
                 continue
 
-            # if `ping` did not crash, then extract delay measurements in milliseconds and the % packet egress_loss (over TCP)
-            delay_ms, percent_lost_tcp = utils.process_ping(proc.stdout.decode('utf-8'))
+            try:
+                port = receiver.parse_ports(split_user_input[1])[0] if len(split_user_input) == 2 else probe.DEFAULT_PORT
+                reflector = await probe.start_reflector(port=port)
+            except (ValueError, OSError) as e:
+                print("\"reflector\" could not start: {0}".format(e))
+                continue
+            print("Reflecting UDP probes on port {0}".format(port))
+        elif split_user_input[0] == 'probe':
+            # the expected arguments are the reflector's ip, optionally its port, and the keywords 'count', 'rate', and
+            # 'size' followed by their values
+            arguments = [token for token in split_user_input[1:] if token != '']
+            options = {'count': 200, 'rate': 100.0, 'size': 64}
+            try:
+                if len(arguments) == 0:
+                    raise ValueError("expected the ip of the reflector")
+                for key in options.keys():
+                    if key in arguments:
+                        i = arguments.index(key)
+                        if i + 1 >= len(arguments):
+                            raise ValueError("\"{0}\" expects a value".format(key))
+                        options[key] = type(options[key])(arguments[i + 1])
+                        del arguments[i:i + 2]
+                if len(arguments) > 2:
+                    raise ValueError("unexpected arguments {0}".format(arguments[2:]))
+                port = receiver.parse_ports(arguments[1])[0] if len(arguments) == 2 else probe.DEFAULT_PORT
+                result = await probe.probe(arguments[0], port, count=options['count'], rate=options['rate'], packet_size=options['size'])
+            except (ValueError, OSError) as e:
+                print("\"probe\" failed: {0}".format(e))
+                continue
 
-            # save data to h5 file
-            utils.save(client_ip_dset, client_ip)  # save the client's IP address (might be relevant)
-            utils.save(bitrate_dset, bitrate_kbps)  # save all the bitrate measurements in kbps
-            utils.save(percent_lost_udp_dset, percent_lost_udp)  # save the percent UDP packets lost
-            utils.save(percent_reordered_udp_dset, percent_reordered_udp)  # save the percent UDP packets reordered
-            utils.save(delay_dset, delay_ms)  # save the round-trip delay in milliseconds
-            utils.save(percent_lost_tcp_dset, percent_lost_tcp)  # save the percent TCP packets lost
+            # save data to h5 file (queued; the writer's thread does the actual h5py work)
+            record = result.to_record()
+            record['client_ip'] = arguments[0]
+            record['mode'] = 'probe'
+            results_writer.append(record)
 
-            # print(bitrate_kbps)
             # tables
+            rtt_ms = record['delay_ms']
             table = [
-                ['client ip', 'avg. bitrate [kbit/s]', 'std. dev. bitrate [kbit/s]', '% udp lost', '% udp reordered', 'avg. delay [ms]', 'std. dev. delay [ms]', '% tcp lost'],
-                [client_ip, round(np.mean(bitrate_kbps), 2), round(np.std(bitrate_kbps), 2), round(percent_lost_udp, 2), round(percent_reordered_udp, 2), round(np.mean(delay_ms), 2), round(np.std(delay_ms), 2), round(percent_lost_tcp, 2)]
+                ['reflector ip', 'sent', '% lost', '% lost (forward)', '% reordered', 'duplicates', 'avg. rtt [ms]', 'std. dev. rtt [ms]', 'jitter [ms]'],
+                [arguments[0], result.count, round(result.lost * 100, 2), round(result.lost_forward * 100, 2), round(result.reordered * 100, 2), result.duplicates, round(np.mean(rtt_ms), 3) if len(rtt_ms) > 0 else float('nan'), round(np.std(rtt_ms), 3) if len(rtt_ms) > 0 else float('nan'), round(result.jitter_ms, 3)]
             ]
             print(tabulate.tabulate(table, headers='firstrow', tablefmt='fancy_grid'))
-    return 0
-
 
-async def filtering_loop():
-    global quit
-    global network_interfaces
-    ureg = UnitRegistry()
+        elif split_user_input[0] == 'proxy':
+            # the expected arguments are the name, the protocol, the listening port, and the server's ip and port; or
+            # the name and 'stop'
+            arguments = [token for token in split_user_input[1:] if token != '']
+            if proxy_backend is None:
+                print("\"proxy\" needs the userspace proxies; restart with --userspace")
+                continue
+            if len(arguments) == 2 and arguments[1] == 'stop':
+                if arguments[0] not in proxy_backend:
+                    print("There is no proxy named \"{0}\". The proxies are: {1}".format(arguments[0], proxy_backend.names()))
+                    continue
+                network_interfaces.pop(arguments[0], None)
+                shaper.invalidate(arguments[0])
+                proxy_backend.unregister(arguments[0]).close()
+                print("Proxy \"{0}\" stopped".format(arguments[0]))
+                continue
+            if len(arguments) != 5:
+                print("\"proxy\" command expects 5 arguments, the name, the protocol, the listening port, and the server's ip and port. You provided {0} arguments".format(len(arguments)))
+                continue
+            try:
+                await start_proxy(*arguments)
+            except (ValueError, OSError) as e:
+                print("\"proxy\" could not start: {0}".format(e))
+                continue
+            print("Relaying {0} port {1} to {2}:{3} as \"{4}\"".format(arguments[1], arguments[2], arguments[3], arguments[4], arguments[0]))
+        elif split_user_input[0] == 'fleet':
+            arguments = [token for token in split_user_input[1:] if token != '']
+            if len(arguments) == 0 or arguments[0] not in ('connect', 'apply', 'show', 'del', 'disconnect'):
+                print("\"fleet\" command expects connect, apply, show, del, or disconnect")
+                continue
 
-    regex = re.compile('\d+[a-zA-Z]bit')
+            if arguments[0] == 'connect':
+                if len(arguments) < 2:
+                    print("\"fleet connect\" expects at least 1 argument, the address of an agent")
+                    continue
+                if controller is not None:
+                    controller.close()
+                try:
+                    controller = control.Controller(arguments[1:], token=os.environ.get('PY_LOSSY_NETWORK_TOKEN'))
+                except ValueError as e:
+                    print("\"fleet connect\" could not parse its arguments: {0}".format(e))
+                    controller = None
+                    continue
+                unreachable = await controller.connect()
+                for address, reason in unreachable.items():
+                    print("could not connect to the agent at {0}: {1}".format(address, reason))
+                print("Connected to {0} of {1} agents".format(len(arguments) - 1 - len(unreachable), len(arguments) - 1))
+                continue
+            if arguments[0] == 'disconnect':
+                if controller is not None:
+                    controller.close()
+                    controller = None
+                continue
+            if controller is None:
+                print("No fleet is connected; connect to the agents with \"fleet connect <HOST[:PORT]> ...\"")
+                continue
+            if len(arguments) < 2:
+                print("\"fleet {0}\" expects the name of the network interface".format(arguments[0]))
+                continue
 
-    while not quit:
-        keys = list(network_interfaces.keys())
-        for k in keys:
-            # print("{0}: ({1}, {2}, {3})".format(k, network_interfaces[k].avg_ingress_bw, network_interfaces[k].std_dev_ingress_bw, network_interfaces[k].ingress_burst))
-
-            if network_interfaces[k].avg_ingress_bw is not None and network_interfaces[k].std_dev_ingress_bw is not None:
-                avg_ingress_bw = network_interfaces[k].avg_ingress_bw
-                std_dev_ingress_bw = network_interfaces[k].std_dev_ingress_bw
-                if avg_ingress_bw[-4] == 'm':
-                    avg_ingress_bw = avg_ingress_bw[:-4] + 'M' + avg_ingress_bw[-3:]
-                if std_dev_ingress_bw[-4] == 'm':
-                    std_dev_ingress_bw = std_dev_ingress_bw[:-4] + 'M' + std_dev_ingress_bw[-3:]
-                avg_ingress_bw = ureg(avg_ingress_bw + '/sec').to(ureg.kbit / ureg.s)
-                std_dev_ingress_bw = ureg(std_dev_ingress_bw + '/sec').to(ureg.kbit / ureg.s)
-                instantaneous_ingress_bw = np.random.normal(avg_ingress_bw.m, std_dev_ingress_bw.m)
-                if instantaneous_ingress_bw < 0:
+            if arguments[0] == 'apply':
+                # <FIELD>=<VALUE> sets a NetworkConfig field; with model=<MODEL>, any other <PARAM>=<VALUE> is a parameter of the model
+                try:
+                    at = None
+                    fields = [token for token in arguments[2:] if token.partition('=')[0] in control.FIELD_PARSERS]
+                    others = [token for token in arguments[2:] if token.partition('=')[0] not in control.FIELD_PARSERS]
+                    if any(token.startswith('at=') for token in others):
+                        at = time.time() + units.parse_time([token for token in others if token.startswith('at=')][-1][3:])
+                        others = [token for token in others if not token.startswith('at=')]
+                    config = control.parse_config_args(fields)
+                    if len(others) > 0:
+                        if 'model' not in config:
+                            raise ValueError("unknown fields {0} (model parameters need model=<MODEL>)".format(others))
+                        config['model_params'] = trajectory.parse_model_params(others)
+                except ValueError as e:
+                    print("\"fleet apply\" could not parse its arguments: {0}".format(e))
                     continue
-                instantaneous_ingress_bw_str = "{0}kbit".format(int(round(instantaneous_ingress_bw, 0)))
-                utils.del_tc_rules(k, 'ingress')
-                utils.add_ingress_rule(k, instantaneous_ingress_bw_str, network_interfaces[k].ingress_burst)
+                print_acknowledgements(await controller.apply(arguments[1], config, at))
+            elif arguments[0] == 'show':
+                answers = await controller.show(arguments[1])
+                for address, answer in answers.items():
+                    print("{0} ({1}):".format(address, answer.get('host', '')))
+                    if not answer.get('ok'):
+                        print(answer.get('error'))
+                        continue
+                    print(NetworkConfig(**answer['config']) if answer.get('config') is not None else "not shaped")
+                    print(answer.get('rules', ''))
+            else:
+                print_acknowledgements(await controller.delete(arguments[1]))
+        elif split_user_input[0] == 'peer':
+            # the expected arguments are the interface and set, del, show, or load, followed by their own arguments
+            arguments = [token for token in split_user_input[1:] if token != '']
+            if len(arguments) < 2 or arguments[1] not in ('set', 'del', 'show', 'load'):
+                print("\"peer\" command expects the name of the network interface, then set, del, show, or load")
+                continue
+            if not is_shapeable_interface(arguments[0]):
+                print("The network interface name you provided, \"{0}\" is invalid. Here is a list of valid network interface names: {1}".format(arguments[0], list_shapeable_interfaces()))
+                continue
+            if arguments[1] == 'show':
+                print(tabulate.tabulate(peer_shaper.table(arguments[0]), headers='firstrow', tablefmt='fancy_grid'))
+                continue
+            if proxy_backend is not None:
+                print("\"peer\" needs `tc`, so it is not available with --userspace")
+                continue
+
+            # per-peer classes replace the `tbf` root of set_egress, so an interface is shaped one way or the other
+            config = network_interfaces.get(arguments[0])
+            if config is not None and config.avg_egress_bw is not None:
+                print("\"{0}\" is shaped as a whole by set_egress; delete its rules with \"del {0}\" before shaping it per peer".format(arguments[0]))
+                continue
+
+            # set <MATCH> takes the keywords 'rate', 'burst', 'loss', 'delay', and 'jitter' followed by their values
+            try:
+                if arguments[1] == 'set':
+                    if len(arguments) < 3 or len(arguments) % 2 != 1:
+                        raise ValueError("expected the destinations of the peer, then pairs of <PARAMETER> <VALUE>")
+                    params = dict(zip(arguments[3::2], arguments[4::2]))
+                    if len(params) != len(arguments[3:]) // 2:
+                        raise ValueError("a parameter was given twice")
+                    action = lambda: peer_shaper.set(arguments[0], arguments[2], peers.parse_profile(params))
+                elif arguments[1] == 'del':
+                    if len(arguments) != 3:
+                        raise ValueError("expected the destinations of the peer")
+                    action = lambda: peer_shaper.remove(arguments[0], arguments[2])
+                else:
+                    if len(arguments) != 3:
+                        raise ValueError("expected the path of the peers file")
+                    profiles = peers.load(arguments[2])
+                    action = lambda: peer_shaper.set_many(arguments[0], profiles)
+                proc = await loop.run_in_executor(None, action)
+            except (OSError, ValueError) as e:
+                print("\"peer {0}\" failed: {1}".format(arguments[1], e))
+                continue
+            if proc.returncode != 0:
+                print(proc.stderr.decode('utf-8'))
+                continue
+            print("{0} peer(s) on \"{1}\"".format(len(peer_shaper.peers(arguments[0])), arguments[0]))
+        elif split_user_input[0] == 'scenario':
+            # the expected number of arguments is 1, the path of the scenario file (or 'stop')
+            if len(split_user_input) != 2:
+                print("\"scenario\" command expects 1 argument, the path of the scenario file or \"stop\". You provided {0} arguments".format(len(split_user_input) - 1))
+                continue
 
-            if network_interfaces[k].avg_egress_bw is not None and network_interfaces[k].std_dev_egress_bw is not None and \
-                network_interfaces[k].egress_burst is not None and network_interfaces[k].egress_latency is not None and \
-                    network_interfaces[k].avg_egress_loss is not None and network_interfaces[k].std_dev_egress_loss is not None and \
-                    network_interfaces[k].egress_avg_delay is not None and network_interfaces[k].egress_std_dev_delay is not None:
+            running = scenario_task is not None and not scenario_task.done()
+            if split_user_input[1] == 'stop':
+                stop_scenario = True
+                print("Stopping the scenario" if running else "No scenario is running")
+                continue
+            if running:
+                print("A scenario is already running; stop it with \"scenario stop\"")
+                continue
 
-                avg_egress_bw = network_interfaces[k].avg_egress_bw
-                std_dev_egress_bw = network_interfaces[k].std_dev_egress_bw
-                avg_egress_loss = network_interfaces[k].avg_egress_loss
-                std_dev_egress_loss = network_interfaces[k].std_dev_egress_loss
+            try:
+                compiled = start_scenario(split_user_input[1])
+            except (OSError, ValueError) as e:
+                print("could not load the scenario \"{0}\": {1}".format(split_user_input[1], e))
+                continue
 
-                if avg_egress_bw[-4] == 'm':
-                    avg_egress_bw = avg_egress_bw[:-4] + 'M' + avg_egress_bw[-3:]
-                if std_dev_egress_bw[-4] == 'm':
-                    std_dev_egress_bw = std_dev_egress_bw[:-4] + 'M' + std_dev_egress_bw[-3:]
+            # run the scenario in the background, and report its timing when it's done
+            async def run_scenario(compiled):
+                report = await scenario.run(compiled, shaper, lambda: quit or stop_scenario)
+                print_scenario_report(compiled, report)
+            stop_scenario = False
+            scenario_task = asyncio.ensure_future(run_scenario(compiled))
+            print("running {0} events on {1} over {2:.3f} s".format(len(compiled), ', '.join(compiled.names), compiled.duration))
+
+    # write whatever is still buffered and close the h5 file
+    if scenario_task is not None:
+        await scenario_task
+    results_writer.close()
+    if reflector is not None:
+        reflector.close()
+    return 0
 
-                avg_egress_bw = ureg(avg_egress_bw + '/sec').to(ureg.kbit / ureg.s)
-                std_dev_egress_bw = ureg(std_dev_egress_bw + '/sec').to(ureg.kbit / ureg.s)
-                avg_egress_loss = ureg(avg_egress_loss)
-                std_dev_egress_loss = ureg(std_dev_egress_loss)
 
-                instantaneous_egress_bw = np.random.normal(avg_egress_bw.m, std_dev_egress_bw.m)
-                instantaneous_egress_loss = min(max(np.random.normal(avg_egress_loss.m, std_dev_egress_loss.m), 0.0), 100.0)
+async def daemon_loop(options):
+    global quit
+    global results_writer
+
+    # create this session's h5 file
+    results_writer = open_results_file()
+
+    rolling_stats = monitor.RollingStats()
+    started = time.time()
+    num_cycles = 0
+    num_errors = 0
+
+    def write_status():
+        if options.status_file is None:
+            return
+        try:
+            monitor.write_status(options.status_file, {
+                'started': started, 'updated': time.time(), 'cycles': num_cycles, 'errors': num_errors,
+                'clients': rolling_stats.snapshot()
+            })
+        except OSError as e:
+            print("could not write the status file: {0}".format(e))
+
+    async def status_loop():
+        while not quit:
+            write_status()
+            try:
+                await asyncio.wait_for(stop_event.wait(), options.status_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def measurement_cycle():
+        # every server port and every probe target are measured at the same time
+        records = []
+        errors = []
+
+        async def measure_senders():
+            if len(options.ports) > 0:
+                sender_records, sender_errors = await receiver.receive(options.ports, options.timeout, mode=options.mode)
+                records.extend(sender_records)
+                errors.extend(sender_errors)
+
+        async def measure_reflector(target: str, port: int):
+            try:
+                result = await probe.probe(target, port)
+            except (ValueError, OSError) as e:
+                errors.append("probe {0}: {1}".format(target, e))
+                return
+            record = result.to_record()
+            record['client_ip'] = target
+            record['mode'] = 'probe'
+            records.append(record)
+
+        await asyncio.gather(measure_senders(), *[measure_reflector(target, port) for target, port in options.probe])
+        return records, errors
+
+    status_task = asyncio.ensure_future(status_loop())
+
+    # start cycles on a fixed grid of deadlines; a cycle that overruns its period skips the deadlines it missed
+    first_deadline = time.monotonic()
+    while not quit:
+        cycle = asyncio.ensure_future(measurement_cycle())
+        stopping = asyncio.ensure_future(stop_event.wait())
+        await asyncio.wait([cycle, stopping], return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if quit:
+            cycle.cancel()
+            await asyncio.gather(cycle, return_exceptions=True)
+            break
+
+        records, errors = cycle.result()
+        num_cycles += 1
+        num_errors += len(errors)
+        for error in errors:
+            print(error)
+        for record in records:
+            results_writer.append(record)
+            rolling_stats.add(record['client_ip'], record)
+        print("{0}: cycle {1}, {2} client(s) measured".format(datetime.now().isoformat(), num_cycles, len(records)))
+
+        now = time.monotonic()
+        next_deadline = first_deadline + (int((now - first_deadline) // options.interval) + 1) * options.interval
+        try:
+            await asyncio.wait_for(stop_event.wait(), next_deadline - now)
+        except asyncio.TimeoutError:
+            pass
+
+    await status_task
+    write_status()
+
+    # write whatever is still buffered and close the h5 file
+    results_writer.close()
+    return 0
 
-                instantaneous_egress_bw_str = "{0}kbit".format(int(round(instantaneous_egress_bw, 0)))
-                instantaneous_egress_loss_str = "{0}%".format(int(round(instantaneous_egress_loss, 0)))
-                # print(instantaneous_egress_bw_str)
-                # print(instantaneous_egress_loss_str)
 
-                utils.del_tc_rules(k, 'root')
-                utils.add_tbf_filter(k, 'root', '1:0', instantaneous_egress_bw_str, network_interfaces[k].egress_burst, network_interfaces[k].egress_latency)
-                utils.add_netem_filter(k, 'parent 1:1', '10:0', instantaneous_egress_loss_str, network_interfaces[k].egress_avg_delay, network_interfaces[k].egress_std_dev_delay)
+async def metrics_loop(options):
+    # rewrite the metrics file until we quit, and once more on the way out
+    while True:
+        try:
+            metrics.write_prometheus(options.metrics_file)
+        except OSError as e:
+            print("could not write the metrics file: {0}".format(e))
+        if quit:
+            break
+        try:
+            await asyncio.wait_for(stop_event.wait(), options.status_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def qdisc_loop(options):
+    # snapshot every configured qdisc until we quit, appending the increments to the session's h5 file about once a second
+    def append_rows(rows):
+        if results_writer is not None and not results_writer.closed:
+            results_writer.append_rows(qdisc_stats.TABLE, rows)
+    await qdisc_stats.run(qdisc_sampler, tc_backend.default_tc_command(privileged=False), options.qdisc_interval,
+                          lambda: quit, append_rows)
+
+
+async def agent_loop(options):
+    # answer controllers until we quit
+    agent = control.Agent(agent_apply, agent_show, agent_delete, token=os.environ.get('PY_LOSSY_NETWORK_TOKEN'),
+                          name=options.agent_name)
+    try:
+        await agent.start(*options.agent)
+    except (OSError, ValueError) as e:
+        print("could not listen for controllers on {0}:{1}: {2}".format(options.agent[0], options.agent[1], e))
+        request_stop()
+        return 1
+    print("listening for controllers on {0}:{1} as \"{2}\"".format(options.agent[0], agent.port, agent.name))
+    while not quit:
+        try:
+            await asyncio.wait_for(stop_event.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+    agent.close()
+    return 0
+
 
-        await asyncio.sleep(1)
+def request_stop():
+    global quit
+    quit = True
+    stop_event.set()
+
+
+def start_scenario(path: str):
+    """
+    loads and compiles a scenario file, and takes its interfaces away from the random shaping
+    :param path: the path of the scenario file
+    :return: a CompiledScenario
+    """
+    compiled = scenario.compile_scenario(scenario.load(path))
+    for k in compiled.names:
+        network_interfaces.pop(k, None)
+        shaper.invalidate(k)
+    return compiled
+
+
+def print_scenario_report(compiled, report):
+    print(tabulate.tabulate(report.events_table(compiled), headers='firstrow', tablefmt='fancy_grid'))
+    print(tabulate.tabulate(report.table(), headers='firstrow', tablefmt='fancy_grid'))
+
+
+async def scenario_loop(options):
+    # run the scenario headless, then stop
+    try:
+        compiled = start_scenario(options.scenario)
+    except (OSError, ValueError) as e:
+        print("could not load the scenario \"{0}\": {1}".format(options.scenario, e))
+        request_stop()
+        return 1
+    print("running {0} events on {1} over {2:.3f} s".format(len(compiled), ', '.join(compiled.names), compiled.duration))
+    report = await scenario.run(compiled, shaper, lambda: quit)
+    print_scenario_report(compiled, report)
+    request_stop()
+    return 0
 
 
-async def main():
-    tasks = [input_loop(), filtering_loop()]
-    await asyncio.gather(*tasks)
+async def filtering_loop():
+    global quit
+    global network_interfaces
+    global shaper
+    global tick_scheduler
+
+    # update every interface on its own deadline-based period, concurrently on the shaper's worker threads, so the event
+    # loop stays responsive and time spent applying rules doesn't accumulate as drift
+    await tick_scheduler.run(shaper, network_interfaces, lambda: quit)
+
+
+async def main(options):
+    global shaper
+    global stop_event
+
+    global proxy_backend
+    global qdisc_sampler
+
+    if not options.metrics:
+        metrics.set_enabled(False)
+    metrics_server = None
+    if options.metrics_port is not None:
+        try:
+            metrics_server = await metrics.start_http_server(options.metrics_port)
+        except OSError as e:
+            print("could not serve the metrics on port {0}: {1}".format(options.metrics_port, e))
+            return 1
+
+    if options.userspace:
+        # apply the rules to userspace proxies, named in place of network interfaces; there are no `tc` rules for
+        # anyone else to change, so they are never checked
+        proxy_backend = proxy.ProxyBackend()
+        utils.set_tc_backend(proxy_backend)
+        shaper = shaping.Shaper(max_concurrency, tolerance, verify_interval=None)
+        for spec in options.proxy:
+            try:
+                await start_proxy(*spec)
+            except (ValueError, OSError) as e:
+                print("could not start the proxy \"{0}\": {1}".format(spec[0], e))
+                shaper.close()
+                utils.get_tc_backend().close()
+                return 1
+    else:
+        # with --daemon alone there is no prompt, scenario, or agent to shape anything, so it only measures: neither the
+        # `tc` processes (nor their `sudo`) nor the scheduler are started
+        if not options.daemon or options.scenario is not None or options.agent is not None:
+            # stream `tc` commands to long-lived processes (one per worker) instead of spawning one per rule (falls back
+            # to spawning)
+            utils.set_tc_backend(tc_backend.default_backend(max_concurrency))
+            shaper = shaping.Shaper(max_concurrency, tolerance)
+
+        # re-read the interface inventory as soon as a link comes or goes (e.g. a container's veth)
+        utils.get_interface_inventory().watch(loop)
+    stop_event = asyncio.Event()
+    tasks = [filtering_loop()] if shaper is not None else []
+    if options.daemon:
+        tasks.append(daemon_loop(options))
+    if options.scenario is not None:
+        tasks.append(scenario_loop(options))
+    if options.metrics_file is not None:
+        tasks.append(metrics_loop(options))
+    if options.agent is not None:
+        tasks.append(agent_loop(options))
+    if options.qdisc_interval is not None:
+        # keep about a minute of snapshots in memory
+        qdisc_sampler = qdisc_stats.QdiscSampler(capacity=max(10, int(60.0 / options.qdisc_interval)))
+        tasks.append(qdisc_loop(options))
+    if options.daemon or options.scenario is not None or options.agent is not None:
+        # stop cleanly (finishing the h5 file) on SIGTERM and SIGINT
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, request_stop)
+    else:
+        tasks.append(input_loop())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if results_writer is not None:
+            results_writer.close()
+        if reflector is not None:
+            reflector.close()
+        if shaper is not None:
+            shaper.close()
+        utils.get_tc_backend().close()
+        utils.get_interface_inventory().close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if controller is not None:
+            controller.close()
+
+
+def parse_probe_target(target: str) -> tuple:
+    # "<HOST>" or "<HOST>:<PORT>"
+    host, _, port = target.rpartition(':') if ':' in target else (target, '', '')
+    return host, int(port) if port != '' else probe.DEFAULT_PORT
+
+
+def parse_agent_address(address: str) -> tuple:
+    # "<PORT>" (on loopback) or "<HOST>:<PORT>"
+    return ('127.0.0.1', int(address)) if ':' not in address else control.parse_address(address)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="emulates lossy networks with `tc` and measures them; interactive "
+                                                 "unless --daemon or --scenario is given")
+    parser.add_argument('--daemon', action='store_true',
+                        help="run measurement cycles continuously, without the interactive prompt, until SIGTERM")
+    parser.add_argument('--ports', type=receiver.parse_ports, default=[],
+                        help="measure the senders of one iperf3 server per port in this range (e.g. 5201-5208)")
+    parser.add_argument('--probe', type=parse_probe_target, action='append', default=[], metavar='HOST[:PORT]',
+                        help="measure a host running the UDP probe reflector (may be repeated)")
+    parser.add_argument('--interval', type=units.parse_time, default=60.0,
+                        help="time between the starts of measurement cycles, with units (default: 60s)")
+    parser.add_argument('--timeout', type=units.parse_time, default=None,
+                        help="time to wait for the senders of a cycle, with units (default: the interval)")
+    parser.add_argument('--pipelined', dest='mode', action='store_const', const=receiver.PIPELINED,
+                        default=receiver.SEQUENTIAL, help="ping senders during their iperf3 test (needs iperf3 3.17+ "
+                                                          "for --json-stream; otherwise they are pinged after it, and "
+                                                          "the runs are recorded as sequential)")
+    parser.add_argument('--status-file', default=None,
+                        help="a JSON file rewritten with every client's rolling 1m/10m/1h statistics")
+    parser.add_argument('--scenario', default=None,
+                        help="run the timeline of a scenario file (JSON, TOML, or YAML), without the interactive prompt, "
+                             "and report when each event was planned and applied (with --daemon, measures until the "
+                             "scenario ends)")
+    parser.add_argument('--status-interval', type=units.parse_time, default=5.0,
+                        help="time between rewrites of the status and metrics files, with units (default: 5s)")
+    parser.add_argument('--userspace', action='store_true',
+                        help="shape userspace UDP/TCP proxies (see --proxy and the proxy command) instead of network "
+                             "interfaces, without `tc` or root")
+    parser.add_argument('--proxy', nargs=5, action='append', default=[],
+                        metavar=('NAME', 'PROTOCOL', 'LISTEN_PORT', 'HOST', 'PORT'),
+                        help="relay a udp or tcp port to HOST:PORT through a proxy shaped as NAME (implies --userspace; "
+                             "may be repeated)")
+    parser.add_argument('--agent', type=parse_agent_address, default=None, metavar='[HOST:]PORT',
+                        help="apply, show, and delete the rules of this host on behalf of controllers (see the fleet "
+                             "command) connecting to this port, without the interactive prompt, until SIGTERM. a "
+                             "bare PORT listens on 127.0.0.1; listening on any other address (e.g. 0.0.0.0:5400) needs "
+                             "PY_LOSSY_NETWORK_TOKEN set to a shared secret on the agents and the controller, which "
+                             "turns away anyone else")
+    parser.add_argument('--agent-name', default=None,
+                        help="the name this agent answers controllers with (default: the hostname)")
+    parser.add_argument('--qdisc-interval', type=units.parse_time, default=None,
+                        help="snapshot the statistics (`tc -s qdisc show`: sent, dropped, overlimits, requeues, backlog) "
+                             "of every configured qdisc this often, with units (e.g. 100ms), into the session's h5 file "
+                             "and the show command")
+    parser.add_argument('--metrics-file', default=None,
+                        help="a file rewritten with this program's metrics, in the Prometheus text format, every "
+                             "--status-interval (e.g. for node_exporter's textfile collector)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve this program's metrics, in the Prometheus text format, at "
+                             "http://127.0.0.1:<PORT>/metrics")
+    parser.add_argument('--no-metrics', dest='metrics', action='store_false',
+                        help="don't record the durations and failures of `tc` calls, measurements, parsing, and h5 "
+                             "writes (see the stats command)")
+    options = parser.parse_args()
+    if options.daemon and len(options.ports) == 0 and len(options.probe) == 0:
+        parser.error("--daemon needs --ports and/or --probe")
+    if options.interval <= 0 or options.status_interval <= 0:
+        parser.error("--interval and --status-interval must be positive")
+    if options.timeout is None:
+        options.timeout = options.interval
+    if len(options.proxy) > 0:
+        options.userspace = True
+    if options.qdisc_interval is not None and (options.qdisc_interval <= 0 or options.userspace):
+        parser.error("--qdisc-interval must be positive, and has no qdiscs to sample with --userspace")
+    return options
 
 
 if __name__ == '__main__':
+    options = parse_arguments()
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    loop.run_until_complete(main(options))
     sys.exit(loop.close())
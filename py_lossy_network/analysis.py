@@ -0,0 +1,214 @@
+# standard library includes
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network.results import ResultsReader
+
+# the metrics summarized by default, and the fixed histogram bin edges of each (fixed, so that the histograms of
+# different files can be merged by adding them up). rates and delays span orders of magnitude, so their bins are
+# logarithmic (100 per decade, i.e. ~2.3% wide)
+DEFAULT_BINS = {
+    'bitrate_kbps': np.logspace(-1, 7, 801),
+    'delay_ms': np.logspace(-3, 5, 801),
+    'percent_lost_udp': np.linspace(0.0, 1.0, 1001),
+    'percent_reordered_udp': np.linspace(0.0, 1.0, 1001),
+    'percent_lost_tcp': np.linspace(0.0, 1.0, 1001),
+    'jitter_ms': np.logspace(-3, 5, 801),
+}
+
+
+class RunningStats:
+    """
+    mergeable summary statistics of a stream of samples: count, mean and variance (Welford / Chan et al.), min, max, and
+    a fixed-bin histogram from which quantiles are approximated. memory use doesn't depend on the number of samples
+    """
+
+    def __init__(self, bins: np.ndarray):
+        """
+        :param bins: the histogram's bin edges
+        """
+        self.bins = np.asarray(bins, dtype='float64')
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.num_nan = 0
+        self.histogram = np.zeros((len(self.bins) - 1,), dtype='int64')
+        self.underflow = 0
+        self.overflow = 0
+
+    def update(self, samples: np.ndarray):
+        """
+        adds a block of samples
+        :param samples: a numpy array
+        """
+        samples = np.asarray(samples, dtype='float64').ravel()
+        nan = np.isnan(samples)
+        self.num_nan += int(np.count_nonzero(nan))
+        samples = samples[~nan]
+        if len(samples) == 0:
+            return
+        block = RunningStats(self.bins)
+        block.count = len(samples)
+        block.mean = float(np.mean(samples))
+        block.m2 = float(np.sum((samples - block.mean) ** 2))
+        block.min = float(np.min(samples))
+        block.max = float(np.max(samples))
+        block.histogram = np.histogram(samples, self.bins)[0]
+        block.underflow = int(np.count_nonzero(samples < self.bins[0]))
+        block.overflow = int(np.count_nonzero(samples > self.bins[-1]))
+        self.merge(block)
+
+    def merge(self, other):
+        """
+        adds the samples summarized by another RunningStats (with the same bins)
+        :param other: a RunningStats
+        """
+        assert(np.array_equal(self.bins, other.bins))
+        self.num_nan += other.num_nan
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram += other.histogram
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+    @property
+    def std_dev(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count > 0 else float('nan')
+
+    def quantile(self, q: float) -> float:
+        """
+        approximates a quantile by interpolating linearly within the histogram bin it falls in
+        :param q: the quantile, between 0 and 1
+        :return: the approximate value of the quantile
+        """
+        return float(self.quantiles(np.array([q]))[0])
+
+    def quantiles(self, qs: np.ndarray) -> np.ndarray:
+        """
+        approximates many quantiles at once (i.e. tabulates the inverse CDF), interpolating linearly within histogram bins
+        :param qs: a numpy array of quantiles, between 0 and 1
+        :return: a numpy array of the approximate values of the quantiles
+        """
+        if self.count == 0:
+            return np.full(np.shape(qs), np.nan)
+        counts = np.concatenate(([self.underflow], self.histogram, [self.overflow])).astype('float64')
+        edges = np.concatenate(([min(self.min, self.bins[0])], self.bins, [max(self.max, self.bins[-1])]))
+        cumulative = np.concatenate(([0.0], np.cumsum(counts)))
+        return np.clip(np.interp(np.asarray(qs) * self.count, cumulative, edges), self.min, self.max)
+
+
+def find_results(paths: list) -> list:
+    """
+    expands directories (searched recursively) and glob patterns into a sorted list of h5 files
+    :param paths: a list of files, directories, or glob patterns
+    :return: a list of paths of h5 files
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob.glob(os.path.join(path, '**', '*.h5'), recursive=True))
+        else:
+            files.update(f for f in glob.glob(path) if os.path.isfile(f))
+    return sorted(files)
+
+
+def summarize_file(path: str, bins: dict = None, chunk_runs: int = 4096) -> dict:
+    """
+    summarizes one results file, reading `chunk_runs` runs at a time
+    :param path: the path of the h5 file
+    :param bins: a dict mapping metric names to histogram bin edges (defaults to `DEFAULT_BINS`)
+    :param chunk_runs: the number of runs read at a time
+    :return: a dict mapping the name of every metric present in the file to a RunningStats
+    """
+    bins = DEFAULT_BINS if bins is None else bins
+    stats = dict()
+    with ResultsReader(path) as reader:
+        num_runs = len(reader)
+        for name in bins.keys():
+            if name not in reader.keys():
+                continue
+            stats[name] = RunningStats(bins[name])
+            for start in range(0, num_runs, chunk_runs):
+                stop = min(start + chunk_runs, num_runs)
+                if reader.is_ragged(name):
+                    stats[name].update(reader.samples(name, start, stop)[0])
+                else:
+                    stats[name].update(reader.column(name, start, stop))
+    return stats
+
+
+def summarize(paths: list, bins: dict = None, workers: int = None, chunk_runs: int = 4096) -> (dict, int):
+    """
+    summarizes many results files, one per worker process at a time, and merges their statistics
+    :param paths: a list of paths of h5 files
+    :param bins: a dict mapping metric names to histogram bin edges (defaults to `DEFAULT_BINS`)
+    :param workers: the number of worker processes (defaults to the number of CPUs)
+    :param chunk_runs: the number of runs read at a time
+    :return: a dict mapping metric names to merged RunningStats, and the number of files that could not be read
+    """
+    bins = DEFAULT_BINS if bins is None else bins
+    merged = {name: RunningStats(edges) for name, edges in bins.items()}
+    num_failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(summarize_file, path, bins, chunk_runs) for path in paths]
+        for future in futures:
+            try:
+                stats = future.result()
+            except (OSError, KeyError, ValueError):
+                num_failed += 1
+                continue
+            for name, s in stats.items():
+                merged[name].merge(s)
+    return merged, num_failed
+
+
+def summary_table(stats: dict) -> list:
+    """
+    :param stats: a dict mapping metric names to RunningStats
+    :return: a table (a list of rows, the first being the header) for `tabulate`
+    """
+    table = [['metric', 'count', 'mean', 'std. dev.', 'min', 'p5', 'p50', 'p95', 'max', 'NaN']]
+    for name, s in stats.items():
+        if s.count == 0 and s.num_nan == 0:
+            continue
+        table.append([name, s.count, s.mean, s.std_dev, s.min, s.quantile(0.05), s.quantile(0.5), s.quantile(0.95),
+                      s.max, s.num_nan])
+    return table
+
+
+def plot(stats: dict, labels: dict = None):
+    """
+    plots the histogram of every metric
+    :param stats: a dict mapping metric names to RunningStats
+    :param labels: a dict mapping metric names to (title, x axis label) tuples
+    """
+    import matplotlib.pyplot as plt
+
+    labels = dict() if labels is None else labels
+    for name, s in stats.items():
+        if s.count == 0:
+            continue
+        title, xlabel = labels.get(name, ("histogram of {0}".format(name), name))
+        plt.grid(linestyle='--', linewidth=0.5)
+        plt.stairs(s.histogram, s.bins, fill=True)
+        if s.bins[0] > 0 and s.bins[-1] / s.bins[0] > 1e3:
+            plt.xscale('log')
+        plt.xlim(max(s.min, s.bins[0]), min(s.max, s.bins[-1]) if s.max > s.min else s.bins[-1])
+        plt.title(title)
+        plt.xlabel(xlabel)
+        plt.ylabel("# occurrences")
+        plt.show()
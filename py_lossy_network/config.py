@@ -0,0 +1,27 @@
+# standard library includes
+from dataclasses import dataclass, field
+
+
+@dataclass
+class NetworkConfig:
+    # ingress parameters
+    avg_ingress_bw: float = None  # bits per second
+    std_dev_ingress_bw: float = None  # bits per second
+    ingress_burst: float = None  # bytes
+
+    # egress parameters
+    avg_egress_bw: float = None  # bits per second
+    std_dev_egress_bw: float = None  # bits per second
+    egress_burst: float = None  # bytes
+    egress_latency: float = None  # seconds
+    avg_egress_loss: float = None  # fraction between 0 and 1
+    std_dev_egress_loss: float = None  # fraction between 0 and 1
+    egress_avg_delay: float = None  # seconds
+    egress_std_dev_delay: float = None  # seconds
+
+    # how the time-varying parameters are sampled (see `py_lossy_network.trajectory`)
+    model: str = 'normal'
+    model_params: dict = field(default_factory=dict)
+
+    # seconds between updates of this interface (None means the scheduler's default)
+    update_period: float = None
@@ -0,0 +1,425 @@
+# standard library includes
+import asyncio
+import dataclasses
+import hmac
+import ipaddress
+import itertools
+import json
+import socket
+import time
+
+# internal includes
+from py_lossy_network import trajectory
+from py_lossy_network import units
+from py_lossy_network.config import NetworkConfig
+
+# the TCP port agents listen on by default
+DEFAULT_PORT = 5400
+
+# the longest request or response line, in bytes
+MAX_LINE = 1 << 20
+
+# how each field of a NetworkConfig is written on a command line (see `parse_config_args`)
+FIELD_PARSERS = {
+    'avg_ingress_bw': units.parse_rate,
+    'std_dev_ingress_bw': units.parse_rate,
+    'ingress_burst': units.parse_size,
+    'avg_egress_bw': units.parse_rate,
+    'std_dev_egress_bw': units.parse_rate,
+    'egress_burst': units.parse_size,
+    'egress_latency': units.parse_time,
+    'avg_egress_loss': units.parse_percent,
+    'std_dev_egress_loss': units.parse_percent,
+    'egress_avg_delay': units.parse_time,
+    'egress_std_dev_delay': units.parse_time,
+    'model': str,
+    'update_period': units.parse_time,
+}
+
+# the operations an agent answers
+OPERATIONS = ('hello', 'apply', 'show', 'delete')
+
+
+def parse_address(address: str) -> tuple:
+    """
+    :param address: "<HOST>" or "<HOST>:<PORT>"
+    :return: a tuple of (host, port), with `DEFAULT_PORT` if there was no port
+    """
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+    return host, int(port) if port != '' else DEFAULT_PORT
+
+
+def parse_config_args(args: list) -> dict:
+    """
+    parses NetworkConfig fields written as <FIELD>=<VALUE> with units (e.g. avg_egress_bw=500kbit egress_latency=50ms)
+    :param args: a list of strs
+    :return: a dict mapping field names to values in the NetworkConfig's units
+    """
+    fields = dict()
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if sep == '' or name not in FIELD_PARSERS:
+            raise ValueError("expected <FIELD>=<VALUE> with a FIELD among {0}, got \"{1}\"".format(
+                ', '.join(FIELD_PARSERS), arg))
+        fields[name] = FIELD_PARSERS[name](value)
+    return fields
+
+
+def is_loopback(host: str) -> bool:
+    """
+    :param host: a host name or address
+    :return: whether it can only be reached from this host
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def config_to_dict(config: NetworkConfig) -> dict:
+    """
+    :param config: a NetworkConfig
+    :return: its fields as a JSON-serializable dict
+    """
+    return dataclasses.asdict(config)
+
+
+def update_config(config: NetworkConfig, fields: dict) -> NetworkConfig:
+    """
+    sets some fields of a NetworkConfig, the way `set_egress` and `set_ingress` set theirs
+    :param config: the NetworkConfig to update (modified in place)
+    :param fields: a dict mapping field names to values (e.g. from `parse_config_args`, or from JSON)
+    :return: the NetworkConfig
+    """
+    names = {f.name for f in dataclasses.fields(NetworkConfig)}
+    for name, value in fields.items():
+        if name not in names:
+            raise ValueError("NetworkConfig has no field \"{0}\"".format(name))
+        if name == 'model_params':
+            if not isinstance(value, dict):
+                raise ValueError("model_params must be an object")
+            trajectory.check_params(value)
+        elif name == 'model':
+            if not isinstance(value, str):
+                raise ValueError("model must be a string")
+        elif value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError("{0} must be a number or null".format(name))
+        setattr(config, name, value)
+    return config
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class Agent:
+    """
+    serves the apply/show/delete operations of one host to controllers, over persistent TCP connections carrying one
+    JSON object per line. the requests of a connection are answered in order; connections are served concurrently.
+    every answer carries the request's id, this host's name, and when (this host's wall clock) the request was received
+    and done, so a controller can tell how closely the hosts of a fleet applied the same change
+    """
+
+    def __init__(self, apply, show, delete, token: str = None, name: str = None):
+        """
+        :param apply: a coroutine function called with (interface, dict of NetworkConfig fields) that applies them and
+        returns a dict to include in the answer
+        :param show: a coroutine function called with (interface) that returns a dict to include in the answer
+        :param delete: a coroutine function called with (interface) that returns a dict to include in the answer
+        :param token: a shared secret every connection must open with (None to accept any connection)
+        :param name: the name this host answers with (defaults to its hostname)
+        """
+        self.operations = {'apply': apply, 'show': show, 'delete': delete}
+        self.token = token
+        self.name = name if name is not None else socket.gethostname()
+        self.num_requests = 0
+        self._server = None
+        self._connections = set()
+
+    async def start(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        """
+        :param host: the address to listen on. anyone who can reach the agent can change this host's rules as root, so
+        listening beyond loopback needs a token
+        :param port: the TCP port to listen on
+        """
+        if self.token is None and not is_loopback(host):
+            raise ValueError("listening on {0} would let anyone who can reach it change this host's rules; set "
+                             "PY_LOSSY_NETWORK_TOKEN or listen on 127.0.0.1".format(host))
+        self._server = await asyncio.start_server(self._serve, host, port, limit=MAX_LINE)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _answer(self, request: dict, authenticated: bool) -> (dict, bool):
+        # run one request; returns the answer and whether the connection is (now) authenticated
+        received = time.time()
+        answer = {'id': request.get('id'), 'host': self.name, 'received': received}
+        op = request.get('op')
+        try:
+            if op == 'hello':
+                authenticated = self.token is None or hmac.compare_digest(str(request.get('token', '')), self.token)
+                if not authenticated:
+                    raise PermissionError("wrong token")
+            elif not authenticated:
+                raise PermissionError("the connection must start with a hello carrying the token")
+            elif op in self.operations:
+                if not isinstance(request.get('interface'), str):
+                    raise ValueError("\"{0}\" needs an interface".format(op))
+                at = request.get('at')
+                if at is not None:
+                    # apply at an agreed wall-clock time, so hosts with synchronized clocks change together
+                    await asyncio.sleep(max(0.0, float(at) - time.time()))
+                if op == 'apply':
+                    result = await self.operations[op](request['interface'], request.get('config') or dict())
+                else:
+                    result = await self.operations[op](request['interface'])
+                answer.update(result or dict())
+            else:
+                raise ValueError("unknown operation \"{0}\" (expected one of {1})".format(op, ', '.join(OPERATIONS)))
+            answer['ok'] = True
+        except Exception as e:
+            # whatever went wrong is the answer to this request; the connection stays up for the next one
+            answer['ok'] = False
+            answer['error'] = str(e) or type(e).__name__
+        answer['done'] = time.time()
+        self.num_requests += 1
+        return answer, authenticated
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        authenticated = self.token is None
+        try:
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as e:
+                    writer.write(_encode({'id': None, 'host': self.name, 'ok': False, 'error': str(e)}))
+                    await writer.drain()
+                    continue
+                answer, authenticated = await self._answer(request, authenticated)
+                writer.write(_encode(answer))
+                await writer.drain()
+                if not answer['ok'] and request.get('op') == 'hello':
+                    break
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # the controller went away, or sent a line longer than MAX_LINE
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    def close(self):
+        """
+        stops listening and closes every connection
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in list(self._connections):
+            writer.close()
+
+
+class AgentConnection:
+    """
+    a persistent connection to one agent. requests are pipelined: each gets an id, and a reader task hands every answer
+    to the request with the same id, so a slow request doesn't hold up the connection's other requests on our side. a
+    connection that breaks is re-opened by the next request
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_PORT, token: str = None, timeout: float = 5.0):
+        """
+        :param host: the agent's host name or address
+        :param port: the agent's TCP port
+        :param token: the agent's shared secret, or None
+        :param timeout: seconds to wait for a connection or an answer
+        """
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._waiting = dict()  # id -> future of the answer
+        self._connecting = asyncio.Lock()
+
+    @property
+    def address(self) -> str:
+        return '{0}:{1}'.format(self.host, self.port)
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        """
+        opens the connection (if it isn't open) and says hello with the token
+        """
+        async with self._connecting:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, limit=MAX_LINE), self.timeout)
+            sock = self._writer.get_extra_info('socket')
+            if sock is not None:
+                # small requests and answers: don't wait to coalesce them
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._waiting = dict()
+            self._reader_task = asyncio.ensure_future(self._read(self._reader, self._writer, self._waiting))
+            answer = await self._send({'op': 'hello', 'token': self.token})
+            if not answer.get('ok'):
+                self.close()
+                raise PermissionError(answer.get('error'))
+
+    async def _read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, waiting: dict):
+        # hand every answer of one connection to the request waiting for it, until the connection closes (a connection
+        # opened later has its own reader, writer, and waiting requests)
+        try:
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                answer = json.loads(line)
+                future = waiting.pop(answer.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(answer)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            error = ConnectionError("the connection to {0} closed".format(self.address))
+            for future in waiting.values():
+                if not future.done():
+                    future.set_exception(error)
+            waiting.clear()
+            writer.close()
+
+    async def _send(self, request: dict) -> dict:
+        request['id'] = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        waiting = self._waiting
+        waiting[request['id']] = future
+        try:
+            self._writer.write(_encode(request))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            waiting.pop(request['id'], None)
+
+    async def request(self, op: str, **fields) -> dict:
+        """
+        sends a request and waits for its answer, (re-)connecting first if needed. a request that fails because the
+        connection broke is sent once more on a new connection
+        :param op: one of `OPERATIONS`
+        :param fields: the request's other fields (e.g. interface='eth0', config={...}, at=<TIME>)
+        :return: the agent's answer, plus 'sent' and 'answered' (this host's wall clock)
+        """
+        for attempt in range(2):
+            try:
+                await self.connect()
+                sent = time.time()
+                answer = await self._send(dict(fields, op=op))
+                answer['sent'] = sent
+                answer['answered'] = time.time()
+                return answer
+            except (ConnectionError, BrokenPipeError) as e:
+                self.close()
+                if attempt == 1:
+                    raise e
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+
+class Controller:
+    """
+    sends the same request to every agent of a fleet at once, over one pooled, persistent connection per agent
+    """
+
+    def __init__(self, addresses: list, token: str = None, timeout: float = 5.0):
+        """
+        :param addresses: a list of "<HOST>[:<PORT>]" strs
+        :param token: the agents' shared secret, or None
+        :param timeout: seconds to wait for a connection or an answer
+        """
+        self.connections = [AgentConnection(*parse_address(address), token=token, timeout=timeout)
+                            for address in addresses]
+
+    async def connect(self) -> dict:
+        """
+        opens every connection, concurrently
+        :return: a dict mapping the address of every agent that couldn't be reached to the reason
+        """
+        results = await asyncio.gather(*[connection.connect() for connection in self.connections],
+                                       return_exceptions=True)
+        return {connection.address: str(result) or type(result).__name__
+                for connection, result in zip(self.connections, results) if isinstance(result, Exception)}
+
+    async def broadcast(self, op: str, **fields) -> dict:
+        """
+        sends a request to every agent concurrently
+        :param op: one of `OPERATIONS`
+        :param fields: the request's other fields (e.g. interface='eth0', config={...})
+        :return: a dict mapping the address of every agent to its answer (an answer with 'ok' False and an 'error' if the
+        agent couldn't be reached)
+        """
+        async def one(connection):
+            try:
+                return await connection.request(op, **fields)
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                return {'host': connection.host, 'ok': False, 'error': str(e) or type(e).__name__}
+        answers = await asyncio.gather(*[one(connection) for connection in self.connections])
+        return {connection.address: answer for connection, answer in zip(self.connections, answers)}
+
+    async def apply(self, network_interface: str, config: dict, at: float = None) -> dict:
+        """
+        sets NetworkConfig fields of an interface on every agent (see `broadcast`)
+        :param network_interface: the name of the interface, on every agent
+        :param config: a dict mapping NetworkConfig field names to values
+        :param at: a wall-clock time (seconds since the epoch) the agents wait for before applying, or None for now
+        """
+        return await self.broadcast('apply', interface=network_interface, config=config, at=at)
+
+    async def show(self, network_interface: str) -> dict:
+        return await self.broadcast('show', interface=network_interface)
+
+    async def delete(self, network_interface: str) -> dict:
+        return await self.broadcast('delete', interface=network_interface)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+def acknowledgements_table(answers: dict) -> (list, float):
+    """
+    :param answers: a dict mapping agent addresses to answers (see `Controller.broadcast`)
+    :return: a table (list of rows, header first) of every agent's acknowledgement, and the spread, in seconds, between
+    the first and the last agent to finish applying (NaN if fewer than one succeeded). the spread compares the agents'
+    wall clocks, so it is only as good as their synchronization
+    """
+    done = [answer['done'] for answer in answers.values() if answer.get('ok') and 'done' in answer]
+    first = min(done) if len(done) > 0 else float('nan')
+    table = [['agent', 'host', 'ok', 'done [ms after first]', 'took [ms]', 'round trip [ms]', 'error']]
+    for address, answer in answers.items():
+        ok = answer.get('ok', False)
+        table.append([address, answer.get('host', ''), ok,
+                      (answer['done'] - first) * 1e3 if ok and 'done' in answer else '',
+                      (answer['done'] - answer['received']) * 1e3 if 'done' in answer and 'received' in answer else '',
+                      (answer['answered'] - answer['sent']) * 1e3 if 'answered' in answer else '',
+                      answer.get('error', '')])
+    spread = max(done) - first if len(done) > 0 else float('nan')
+    return table, spread
@@ -0,0 +1,458 @@
+# standard library includes
+import collections
+import email.utils
+import gzip
+import json
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import results
+from py_lossy_network import utils
+
+# the formats of raw logs that can be ingested
+IPERF3 = 'iperf3'  # the server-side text output of iperf3 in udp mode (what `utils.process_iperf3` parses)
+IPERF3_JSON = 'iperf3_json'  # the server-side output of iperf3 with --json or --json-stream
+PING = 'ping'  # the output of `ping` (Linux, busybox, or macOS)
+FORMATS = (IPERF3, IPERF3_JSON, PING)
+
+# the mode of every ingested run: whether the link was idle or loaded while it was pinged isn't in the logs
+MODE = 'ingested'
+
+# the name of the skip-if-already-ingested index, in the output directory
+INDEX_NAME = 'ingested.json'
+
+# the number of bytes at the start of a file that decide its format
+SNIFF_BYTES = 65536
+
+# files larger than this are split into ranges of about this size, parsed by different workers
+DEFAULT_SPLIT_BYTES = 64 * 2**20
+
+# small files are handed to the workers in batches of about this size, so the pool isn't busy passing messages
+BATCH_BYTES = 4 * 2**20
+
+_iperf3_time_regex = re.compile(r'Time: (\w{3}, +\d+ \w{3} \d{4} \d\d:\d\d:\d\d \w+)')  # iperf3 -V
+_iperf3_timestamps_regex = re.compile(r'^(\w{3} \w{3} +\d+ \d\d:\d\d:\d\d \d{4}) ', re.MULTILINE)  # --timestamps
+_ping_ip_regex = re.compile(r'^PING \S+ \(([^)]+)\)', re.MULTILINE)
+_ping_timestamp_regex = re.compile(r'^\[(\d+(?:\.\d+)?)\]', re.MULTILINE)  # ping -D
+_json_stream_start_regex = re.compile(rb'^\{\s*"event"\s*:\s*"start"')
+
+
+def _open(path: str):
+    # gzipped logs are decompressed on the fly (and can't be split, since they can't be seeked cheaply)
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def detect_format(path: str) -> str:
+    """
+    tells the format of a log from its first `SNIFF_BYTES` bytes
+    :param path: the path of the log (gzipped, if it ends in .gz)
+    :return: one of `FORMATS`, or None if it isn't a log we can parse
+    """
+    with _open(path) as f:
+        head = f.read(SNIFF_BYTES)
+    if head.lstrip().startswith(b'{') and (b'"start"' in head or b'"event"' in head):
+        return IPERF3_JSON
+    if b'Server listening on' in head or b'Accepted connection from' in head:
+        return IPERF3
+    if head.startswith(b'PING ') or b'\nPING ' in head:
+        return PING
+    return None
+
+
+def _starts_iperf3_run(line: bytes) -> bool:
+    # the server prints its banner before every test (after a --timestamps prefix, if any)
+    return b'Server listening on' in line
+
+
+def _starts_iperf3_json_run(line: bytes) -> bool:
+    # a --json document opens with a lone brace, a --json-stream run with its 'start' event
+    return line.rstrip() == b'{' or _json_stream_start_regex.match(line) is not None
+
+
+def _starts_ping_run(line: bytes) -> bool:
+    return line.startswith(b'PING ')
+
+
+_starts_run = {IPERF3: _starts_iperf3_run, IPERF3_JSON: _starts_iperf3_json_run, PING: _starts_ping_run}
+
+
+def iter_runs(f, log_format: str, start: int = 0, stop: int = None):
+    """
+    splits (a byte range of) a log into the text of its runs, reading a line at a time, so only one run is in memory at
+    a time. a run belongs to the range its first line starts in: the lines of a range before its first run are left to
+    the range before, and the last run of a range is read past `stop` to its end
+    :param f: the log, opened in binary mode
+    :param log_format: one of `FORMATS`
+    :param start: the offset of the range in the file
+    :param stop: one past the end of the range (None for the end of the file)
+    :return: a generator of (offset of the run in the file, text of the run as bytes) tuples
+    """
+    starts_run = _starts_run[log_format]
+    offset = start
+    if start > 0:
+        # skip the rest of the line that `start` falls in (nothing, if a line starts at `start`)
+        f.seek(start - 1)
+        offset += len(f.readline()) - 1
+    # the lines before the first run of the file are passed on, in case they are a run without a banner
+    owned = start == 0
+    lines = []
+    run_offset = offset
+    for line in f:
+        if starts_run(line):
+            if owned and len(lines) > 0:
+                yield run_offset, b''.join(lines)
+            if stop is not None and offset >= stop:
+                return
+            lines = []
+            run_offset = offset
+            owned = True
+        if owned:
+            lines.append(line)
+        offset += len(line)
+    if owned and len(lines) > 0:
+        yield run_offset, b''.join(lines)
+
+
+def _iperf3_timestamp(output: str) -> float:
+    match = _iperf3_time_regex.search(output)
+    if match is not None:
+        return email.utils.parsedate_to_datetime(match.group(1)).timestamp()
+    match = _iperf3_timestamps_regex.search(output)
+    if match is not None:
+        return time.mktime(time.strptime(match.group(1), '%a %b %d %H:%M:%S %Y'))
+    return None
+
+
+def _iperf3_json_events(output: str):
+    # a --json document's brace is alone on its line; a --json-stream record is a whole line
+    if output.lstrip().partition('\n')[0].rstrip() != '{':
+        return (event for event in map(utils.parse_iperf3_json_stream_line, output.splitlines()) if event is not None)
+    return utils.iperf3_json_records(json.loads(output))
+
+
+def parse_run(log_format: str, text: bytes) -> dict:
+    """
+    parses the text of one run with the same parsers as a live session
+    :param log_format: one of `FORMATS`
+    :param text: the text of the run (see `iter_runs`)
+    :return: a record for `ResultsWriter.append` (without the 'timestamp', if the log doesn't have one), or None if the
+    text isn't a run (e.g. the banner of a server that got no client)
+    :raises ValueError, IndexError, or KeyError: if the run is malformed (e.g. cut short)
+    """
+    output = text.decode('utf-8', errors='replace')
+    if log_format == IPERF3:
+        if 'Accepted connection from' not in output:
+            return None
+        client_ip, bitrate_kbps, percent_lost_udp, percent_reordered_udp = utils.process_iperf3(output)
+        timestamp = _iperf3_timestamp(output)
+    elif log_format == IPERF3_JSON:
+        start, intervals, end = None, [], None
+        for event, data in _iperf3_json_events(output):
+            if event == 'start':
+                start = data
+            elif event == 'interval':
+                intervals.append(data)
+            elif event == 'end':
+                end = data
+            elif event == 'error':
+                raise ValueError("iperf3 failed: {0}".format(data))
+        if start is None:
+            return None
+        if end is None:
+            raise ValueError("the run has no end")
+        client_ip, bitrate_kbps, percent_lost_udp, percent_reordered_udp = utils.process_iperf3_json(start, intervals, end)
+        timestamp = start.get('timestamp', dict()).get('timesecs')
+    elif log_format == PING:
+        match = _ping_ip_regex.search(output)
+        if match is None:
+            return None
+        delay_ms, percent_lost_tcp = utils.process_ping(output)
+        record = {'client_ip': match.group(1), 'delay_ms': delay_ms, 'percent_lost_tcp': percent_lost_tcp,
+                  'mode': MODE}
+        match = _ping_timestamp_regex.search(output)
+        if match is not None:
+            record['timestamp'] = float(match.group(1))
+        return record
+    else:
+        raise ValueError("unknown log format \"{0}\"".format(log_format))
+
+    record = {'client_ip': client_ip, 'bitrate_kbps': bitrate_kbps, 'percent_lost_udp': percent_lost_udp,
+              'percent_reordered_udp': percent_reordered_udp, 'mode': MODE}
+    if timestamp is not None:
+        record['timestamp'] = float(timestamp)
+    return record
+
+
+def ingest_range(path: str, start: int, stop: int, mtime: float) -> tuple:
+    """
+    parses the runs of (a byte range of) a log. runs in a worker process
+    :param path: the path of the log
+    :param start: the offset of the range in the file
+    :param stop: one past the end of the range (None for the end of the file)
+    :param mtime: the modification time of the file, the timestamp of runs whose log doesn't have one
+    :return: the format of the log (None if it isn't one), a list of records (with the compressed text of each run and
+    where it came from), and the number of runs that couldn't be parsed
+    """
+    log_format = detect_format(path)
+    if log_format is None:
+        return None, [], 0
+    records = []
+    num_failed = 0
+    with _open(path) as f:
+        for offset, text in iter_runs(f, log_format, start, stop):
+            try:
+                record = parse_run(log_format, text)
+            except (ValueError, IndexError, KeyError):
+                num_failed += 1
+                continue
+            if record is None:
+                continue
+            record.setdefault('timestamp', mtime)
+            record['raw_text'] = np.frombuffer(zlib.compress(text), dtype=np.uint8)
+            record['source'] = path
+            record['source_offset'] = offset
+            record['source_format'] = log_format
+            records.append(record)
+    return log_format, records, num_failed
+
+
+def _ingest_batch(batch: list) -> list:
+    # the outcome of every range of a batch: one unreadable file doesn't lose the others
+    outcomes = []
+    for path, start, stop, mtime in batch:
+        try:
+            outcomes.append(ingest_range(path, start, stop, mtime))
+        except OSError as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def add_raw_datasets(writer: results.ResultsWriter):
+    """
+    creates the datasets that keep the raw text of every ingested run next to the session datasets (see
+    `results.add_session_datasets`): 'raw_text' (the run's text, zlib-compressed, one ragged array of bytes per run),
+    'source' (the path of its log), 'source_offset' (where it starts in the log), and 'source_format' (one of `FORMATS`)
+    :param writer: the ResultsWriter of a new h5 file
+    """
+    writer.add_ragged_dataset('raw_text', dtype='uint8', compress=False)
+    writer.add_dataset('source', results.vlen_str_dt)
+    writer.add_dataset('source_offset', 'int64')
+    writer.add_dataset('source_format', results.vlen_str_dt)
+
+
+def raw_text(reader: results.ResultsReader, i: int) -> bytes:
+    """
+    :param reader: a ResultsReader of an ingested file
+    :param i: the run
+    :return: the raw text the run was parsed from
+    """
+    return zlib.decompress(reader.run('raw_text', i).tobytes())
+
+
+def reparse(reader: results.ResultsReader, i: int) -> dict:
+    """
+    parses the raw text of an ingested run again (e.g. after a parser was fixed)
+    :param reader: a ResultsReader of an ingested file
+    :param i: the run
+    :return: the record (see `parse_run`)
+    """
+    return parse_run(reader.column('source_format', i, i + 1)[0], raw_text(reader, i))
+
+
+def find_logs(paths: list, exclude: str = None) -> list:
+    """
+    expands directories (searched recursively, skipping hidden files and directories) into a sorted list of files
+    :param paths: a list of files or directories
+    :param exclude: a directory whose files are skipped (e.g. where the h5 files and the index are written)
+    :return: a list of absolute paths of files
+    """
+    exclude = os.path.abspath(exclude) if exclude is not None else None
+    files = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            files.add(path)
+            continue
+        for directory, directories, names in os.walk(path):
+            directories[:] = [d for d in directories if not d.startswith('.')]
+            if directory == exclude:
+                continue
+            files.update(os.path.join(directory, name) for name in names
+                         if not name.startswith('.') and not name.endswith('.h5'))
+    return sorted(files)
+
+
+def load_index(path: str) -> dict:
+    """
+    :param path: the path of the index
+    :return: a dict mapping the absolute path of every ingested log to its size, modification time (ns), the h5 file
+    its runs went to, and its numbers of runs and failed runs (empty if there is no index yet)
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+
+
+def save_index(path: str, index: dict):
+    """
+    replaces the index, atomically
+    :param path: the path of the index
+    :param index: see `load_index`
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def plan(paths: list, index: dict, split_bytes: int = DEFAULT_SPLIT_BYTES, batch_bytes: int = BATCH_BYTES) -> tuple:
+    """
+    decides which logs to ingest, splits the large ones into ranges, and batches the small ones
+    :param paths: the absolute paths of the logs (see `find_logs`)
+    :param index: the index (see `load_index`); logs whose size and modification time it already has are skipped
+    :param split_bytes: the size of a range of a large log
+    :param batch_bytes: the size of a batch of small logs
+    :return: a list of batches (lists of (path, start, stop, mtime) ranges), a dict mapping the path of every log to
+    ingest to its stat result, and the number of logs skipped
+    """
+    batches = []
+    batch = []
+    batch_size = 0
+    stats = dict()
+    num_skipped = 0
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = index.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            num_skipped += 1
+            continue
+        stats[path] = stat
+        if path.endswith('.gz') or stat.st_size <= split_bytes:
+            ranges = [(path, 0, None, stat.st_mtime)]
+        else:
+            ranges = [(path, start, min(start + split_bytes, stat.st_size), stat.st_mtime)
+                      for start in range(0, stat.st_size, split_bytes)]
+        for r in ranges:
+            batch.append(r)
+            batch_size += split_bytes if r[2] is not None else stat.st_size
+            if batch_size >= batch_bytes:
+                batches.append(batch)
+                batch, batch_size = [], 0
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches, stats, num_skipped
+
+
+def ingest(batches: list, writer: results.ResultsWriter, outcomes: dict, workers: int = None):
+    """
+    parses batches of logs in a pool of worker processes and appends their runs to a results file, in order. only a few
+    batches per worker are in flight, so the runs waiting to be written stay few
+    :param batches: see `plan`
+    :param writer: the ResultsWriter of a file with the session and raw datasets (see `add_raw_datasets`)
+    :param outcomes: a dict filled in, as soon as every range of a log is written, with its path mapped to its format
+    (None if it isn't a log), number of runs, and number of failed runs; or to the OSError that kept it from being read.
+    if the ingestion is interrupted, it holds the logs that were completely ingested
+    :param workers: the number of worker processes (defaults to the number of CPUs)
+    """
+    workers = os.cpu_count() if workers is None else workers
+    num_ranges = collections.Counter(r[0] for batch in batches for r in batch)
+    partial = dict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        remaining = iter(batches)
+        while True:
+            for batch in remaining:
+                pending.append((batch, executor.submit(_ingest_batch, batch)))
+                if len(pending) >= 4 * workers:
+                    break
+            if len(pending) == 0:
+                break
+            batch, future = pending.popleft()
+            for (path, _, _, _), outcome in zip(batch, future.result()):
+                previous = partial.get(path)
+                if isinstance(outcome, OSError) or isinstance(previous, OSError):
+                    partial[path] = previous if isinstance(previous, OSError) else outcome
+                else:
+                    log_format, records, num_failed = outcome
+                    for record in records:
+                        writer.append(record)
+                    _, num_runs, previously_failed = previous if previous is not None else (log_format, 0, 0)
+                    partial[path] = (log_format, num_runs + len(records), previously_failed + num_failed)
+                num_ranges[path] -= 1
+                if num_ranges[path] == 0:
+                    outcomes[path] = partial.pop(path)
+
+
+def run(paths: list, output_directory: str, workers: int = None, split_bytes: int = DEFAULT_SPLIT_BYTES,
+        force: bool = False) -> tuple:
+    """
+    ingests every log under `paths` not ingested yet into a new results file in `output_directory`, named after the
+    current date and time like a session's, and records them in the directory's index
+    :param paths: a list of files or directories
+    :param output_directory: where the h5 file and the index go
+    :param workers: the number of worker processes (defaults to the number of CPUs)
+    :param split_bytes: the size of a range of a large log
+    :param force: whether to ingest the logs the index already has, too
+    :return: the path of the new h5 file (None if there was nothing to ingest), the outcomes (see `ingest`), the number
+    of logs skipped, and the number of bytes of the logs read
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    index_path = os.path.join(output_directory, INDEX_NAME)
+    index = load_index(index_path)
+    batches, stats, num_skipped = plan(find_logs(paths, exclude=output_directory), dict() if force else index,
+                                       split_bytes)
+    if len(batches) == 0:
+        return None, dict(), num_skipped, 0
+
+    h5_file_name = 'ingest_' + datetime.now().isoformat().replace(':', '_').replace('-', '_').replace('.', '_')
+    h5_path = os.path.join(output_directory, h5_file_name + '.h5')
+    writer = results.ResultsWriter(h5_path, flush_records=1024, compression='gzip')
+    results.add_session_datasets(writer)
+    add_raw_datasets(writer)
+    outcomes = dict()
+    try:
+        ingest(batches, writer, outcomes, workers)
+    finally:
+        # only logs whose runs are all in the closed file go in the index, so an interrupted run is simply redone
+        writer.close()
+        for path, outcome in outcomes.items():
+            if isinstance(outcome, OSError):
+                continue
+            log_format, num_runs, num_failed = outcome
+            index[path] = {'size': stats[path].st_size, 'mtime_ns': stats[path].st_mtime_ns, 'format': log_format,
+                           'runs': num_runs, 'failed': num_failed, 'h5_file': os.path.basename(h5_path)}
+        save_index(index_path, index)
+    return h5_path, outcomes, num_skipped, sum(stats[path].st_size for path in outcomes)
+
+
+def summary_table(outcomes: dict) -> list:
+    """
+    :param outcomes: see `ingest`
+    :return: a table (list of rows, header first) of the number of logs, runs, and failed runs of every format
+    """
+    table = [['format', 'logs', 'runs', 'failed runs']]
+    rows = collections.OrderedDict((name, [name, 0, 0, 0]) for name in FORMATS + ('not a log', 'unreadable'))
+    for outcome in outcomes.values():
+        if isinstance(outcome, OSError):
+            rows['unreadable'][1] += 1
+            continue
+        log_format, num_runs, num_failed = outcome
+        row = rows[log_format if log_format is not None else 'not a log']
+        row[1] += 1
+        row[2] += num_runs
+        row[3] += num_failed
+    table.extend(row for row in rows.values() if row[1] > 0)
+    return table
@@ -0,0 +1,169 @@
+# standard library includes
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+# where the kernel lists the network interfaces
+SYSFS_ROOT = '/sys/class/net'
+
+# the rtnetlink multicast group of link (i.e. network interface) events (RTMGRP_LINK in <linux/rtnetlink.h>)
+_RTMGRP_LINK = 1
+
+
+@dataclass
+class Interface:
+    name: str
+    ifindex: int
+    mtu: int  # bytes
+    operstate: str  # e.g. 'up', 'down', or 'unknown' (see the kernel's Documentation/networking/operstates.rst)
+    speed: int = None  # megabits per second, or None if the interface doesn't report one (e.g. veths, loopback)
+    address: str = None  # the hardware address
+
+
+def _read(directory: str, name: str) -> str:
+    # read one attribute of an interface, or None if it doesn't have one (or it disappeared)
+    try:
+        with open(os.path.join(directory, name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_interfaces(root: str = SYSFS_ROOT) -> dict:
+    """
+    reads every network interface of this machine from sysfs
+    :param root: the sysfs directory of the network interfaces
+    :return: a dict mapping interface names to Interface objects
+    """
+    found = dict()
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return found
+    for entry in entries:
+        ifindex = _read(entry.path, 'ifindex')
+        mtu = _read(entry.path, 'mtu')
+        if ifindex is None or mtu is None:
+            # removed while we were reading it
+            continue
+        speed = _read(entry.path, 'speed')
+        found[entry.name] = Interface(name=entry.name, ifindex=int(ifindex), mtu=int(mtu),
+                                      operstate=_read(entry.path, 'operstate') or 'unknown',
+                                      speed=int(speed) if speed is not None and speed.isdigit() and int(speed) > 0 else None,
+                                      address=_read(entry.path, 'address'))
+    return found
+
+
+class Inventory:
+    """
+    a cached inventory of the network interfaces of this machine, so that looking one up is a dictionary hit rather
+    than a process spawn. the cache is re-read from sysfs when it is older than `ttl`, when a lookup misses (at most
+    every `miss_interval`, so a name that never exists doesn't turn every lookup into a re-read), and, once `watch` is
+    called, as soon as the kernel announces that a link was added, removed, or changed (over rtnetlink)
+    """
+
+    def __init__(self, ttl: float = 5.0, miss_interval: float = 0.5, root: str = SYSFS_ROOT):
+        """
+        :param ttl: the longest time, in seconds, the cache is trusted without a link event
+        :param miss_interval: the shortest time, in seconds, between re-reads caused by lookups that missed
+        :param root: the sysfs directory of the network interfaces
+        """
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self.root = root
+        self.num_refreshes = 0  # number of times sysfs was read
+        self._interfaces = dict()
+        self._refreshed = None  # when sysfs was last read (time.monotonic), or None if the cache is stale
+        self._lock = threading.Lock()
+        self._netlink = None
+        self._loop = None
+
+    def refresh(self) -> dict:
+        """
+        re-reads every interface from sysfs
+        :return: a dict mapping interface names to Interface objects
+        """
+        interfaces = read_interfaces(self.root)
+        with self._lock:
+            self._interfaces = interfaces
+            self._refreshed = time.monotonic()
+            self.num_refreshes += 1
+        return interfaces
+
+    def _current(self) -> dict:
+        # the cached interfaces, re-read first if the cache is stale or too old
+        refreshed = self._refreshed
+        if refreshed is None or time.monotonic() - refreshed > self.ttl:
+            return self.refresh()
+        return self._interfaces
+
+    def get(self, name: str) -> Interface:
+        """
+        :param name: the name of the network interface
+        :return: its Interface, or None if there is no such interface
+        """
+        interface = self._current().get(name)
+        refreshed = self._refreshed
+        if interface is None and (refreshed is None or time.monotonic() - refreshed > self.miss_interval):
+            # it may have been created since the last read (e.g. a container's veth) without us hearing about it
+            interface = self.refresh().get(name)
+        return interface
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def names(self) -> list:
+        """
+        :return: the names of every network interface, sorted by ifindex
+        """
+        return [interface.name for interface in sorted(self._current().values(), key=lambda i: i.ifindex)]
+
+    def watch(self, loop) -> bool:
+        """
+        marks the cache stale whenever the kernel announces a link event, from an asyncio event loop (the lookups don't
+        need to run on it)
+        :param loop: the asyncio event loop
+        :return: whether the events can be watched here (if not, the cache relies on `ttl` alone)
+        """
+        if self._netlink is not None:
+            return True
+        try:
+            netlink = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        except (AttributeError, OSError):
+            return False
+        try:
+            netlink.setblocking(False)
+            netlink.bind((0, _RTMGRP_LINK))
+            loop.add_reader(netlink.fileno(), self._on_event)
+        except OSError:
+            netlink.close()
+            return False
+        self._netlink = netlink
+        self._loop = loop
+        return True
+
+    def _on_event(self):
+        # drain every pending event; what changed doesn't matter, the next lookup re-reads everything
+        while True:
+            try:
+                if len(self._netlink.recv(65536)) == 0:
+                    break
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # e.g. ENOBUFS when events came faster than we read them, which also means something changed
+                break
+        with self._lock:
+            self._refreshed = None
+
+    def close(self):
+        """
+        stops watching link events. call this from the event loop passed to `watch`
+        """
+        if self._netlink is not None:
+            self._loop.remove_reader(self._netlink.fileno())
+            self._netlink.close()
+            self._netlink = None
+            self._loop = None
@@ -0,0 +1,368 @@
+# standard library includes
+import asyncio
+import bisect
+import functools
+import os
+import threading
+import time
+
+# the prefix of every exported metric name
+PREFIX = 'py_lossy_network_'
+
+# the upper bounds of the latency histogram buckets, in seconds: four per decade from 10 us to 100 s
+DEFAULT_BUCKETS = tuple(float('{0:.3g}'.format(10.0 ** (exponent / 4.0))) for exponent in range(-20, 9))
+
+# whether anything is recorded (see `set_enabled`)
+_enabled = True
+
+
+class Counter:
+    """
+    a count that only goes up (e.g. failures)
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """
+    a fixed-bucket histogram of durations (or any other non-negative values), with their count, sum, and max. recording
+    a value is a binary search and a few additions, so it is cheap enough for every call of a hot path
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """
+        :param buckets: the upper bounds of the buckets, in increasing order (a last, unbounded bucket is implied)
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        estimates a quantile by interpolating linearly within the bucket it falls in (like Prometheus'
+        `histogram_quantile`)
+        :param q: the quantile, between 0 and 1
+        :return: the estimate, or NaN if nothing was recorded
+        """
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.max
+        if count == 0:
+            return float('nan')
+        rank = q * count
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if n > 0 and cumulative + n >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else maximum
+                return min(low + (high - low) * (rank - cumulative) / n, maximum)
+            cumulative += n
+        return maximum
+
+
+class Registry:
+    """
+    every metric of the process, by name and labels. a metric is created the first time it is asked for
+    """
+
+    def __init__(self):
+        self._metrics = dict()  # (name, labels as a sorted tuple of pairs) -> Counter or Histogram
+        self._families = dict()  # name -> (type, help)
+        self._lock = threading.Lock()
+
+    def _get(self, kind: str, factory, name: str, help: str, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    family = self._families.setdefault(name, (kind, help))
+                    if family[0] != kind:
+                        raise ValueError("\"{0}\" is a {1}, not a {2}".format(name, family[0], kind))
+                    metric = factory()
+                    self._metrics[key] = metric
+        return metric
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        """
+        :param name: the name of the metric (without `PREFIX`)
+        :param help: what it counts
+        :param labels: the labels that tell this counter apart from the others of the same name
+        :return: the Counter
+        """
+        return self._get('counter', Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, **labels) -> Histogram:
+        """
+        :param name: the name of the metric (without `PREFIX`)
+        :param help: what it measures
+        :param labels: the labels that tell this histogram apart from the others of the same name
+        :return: the Histogram
+        """
+        return self._get('histogram', Histogram, name, help, labels)
+
+    def reset(self):
+        """
+        zeroes every metric, in place (so the metrics already handed out, e.g. to `timed`, keep being exported)
+        """
+        for _, metric in self._sorted():
+            with metric._lock:
+                if isinstance(metric, Counter):
+                    metric.value = 0
+                else:
+                    metric.counts = [0] * len(metric.counts)
+                    metric.count = 0
+                    metric.sum = 0.0
+                    metric.max = 0.0
+
+    def _sorted(self) -> list:
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def exposition(self) -> str:
+        """
+        :return: every metric in the Prometheus text exposition format
+        """
+        lines = []
+        described = set()
+        for (name, labels), metric in self._sorted():
+            full_name = PREFIX + name
+            if name not in described:
+                kind, help = self._families[name]
+                lines.append('# HELP {0} {1}'.format(full_name, help))
+                lines.append('# TYPE {0} {1}'.format(full_name, kind))
+                described.add(name)
+            if isinstance(metric, Counter):
+                lines.append('{0}{1} {2}'.format(full_name, _format_labels(labels), metric.value))
+                continue
+            with metric._lock:
+                counts, count, total = list(metric.counts), metric.count, metric.sum
+            cumulative = 0
+            for bound, n in zip(metric.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_bucket{1} {2}'.format(full_name, _format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{0}_sum{1} {2!r}'.format(full_name, _format_labels(labels), total))
+            lines.append('{0}_count{1} {2}'.format(full_name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def tables(self) -> (list, list):
+        """
+        :return: a table (list of rows, header first) of every histogram, in milliseconds, and one of every counter
+        """
+        histograms = [['metric', 'labels', 'count', 'mean [ms]', 'p50 [ms]', 'p95 [ms]', 'p99 [ms]', 'max [ms]']]
+        counters = [['metric', 'labels', 'count']]
+        for (name, labels), metric in self._sorted():
+            label_text = ', '.join('{0}={1}'.format(k, v) for k, v in labels)
+            if isinstance(metric, Counter):
+                counters.append([name, label_text, metric.value])
+            elif metric.count > 0:
+                histograms.append([name, label_text, metric.count, metric.sum / metric.count * 1e3,
+                                   metric.quantile(0.5) * 1e3, metric.quantile(0.95) * 1e3,
+                                   metric.quantile(0.99) * 1e3, metric.max * 1e3])
+        return histograms, counters
+
+
+def _format_labels(labels: tuple) -> str:
+    if len(labels) == 0:
+        return ''
+    escaped = ('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+# the metrics of this process
+REGISTRY = Registry()
+
+
+def set_enabled(enabled: bool):
+    """
+    turns recording on or off. while it is off, every instrumented call costs one extra function call and a check
+    :param enabled: whether to record
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def count(name: str, help: str, amount: int = 1, **labels):
+    """
+    increments a counter (if recording is enabled)
+    :param name: the name of the counter (without `PREFIX`)
+    :param help: what it counts
+    :param amount: the increment
+    :param labels: the counter's labels (e.g. cause='timeout')
+    """
+    if _enabled:
+        REGISTRY.counter(name, help, **labels).inc(amount)
+
+
+def observe(name: str, help: str, value: float, **labels):
+    """
+    records a value in a histogram (if recording is enabled)
+    :param name: the name of the histogram (without `PREFIX`)
+    :param help: what it measures
+    :param value: the value, e.g. a duration in seconds
+    :param labels: the histogram's labels
+    """
+    if _enabled:
+        REGISTRY.histogram(name, help, **labels).observe(value)
+
+
+def failure_cause(error: BaseException) -> str:
+    """
+    :param error: an exception
+    :return: a short, label-friendly name for what went wrong (e.g. 'not_found' for a missing executable)
+    """
+    if isinstance(error, FileNotFoundError):
+        return 'not_found'
+    if isinstance(error, PermissionError):
+        return 'permission_denied'
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return 'timeout'
+    if isinstance(error, (BrokenPipeError, ConnectionError)):
+        return 'connection'
+    return type(error).__name__
+
+
+class timer:
+    """
+    a context manager that records how long its block took in a histogram, and counts the exceptions that escape it
+    in `<name>_failures_total` by cause:
+
+        with metrics.timer('tc_seconds', "...", operation='show'):
+            ...
+    """
+
+    __slots__ = ('name', 'help', 'labels', '_start')
+
+    def __init__(self, name: str, help: str, **labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._start = None
+
+    def __enter__(self):
+        if _enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._start is None:
+            return False
+        REGISTRY.histogram(self.name, self.help, **self.labels).observe(time.perf_counter() - self._start)
+        if exc_value is not None and not isinstance(exc_value, (asyncio.CancelledError, GeneratorExit)):
+            count(_failures_name(self.name), "failures of " + self.help, cause=failure_cause(exc_value), **self.labels)
+        return False
+
+
+def _failures_name(name: str) -> str:
+    # tc_seconds -> tc_failures_total
+    return (name[:-len('_seconds')] if name.endswith('_seconds') else name) + '_failures_total'
+
+
+def timed(name: str, help: str, **labels):
+    """
+    a decorator that records the duration of every call of a function (or coroutine function) in a histogram, and
+    counts the exceptions it raises in `<name>_failures_total` by cause. the histogram is looked up once, when the
+    function is decorated
+    :param name: the name of the histogram (without `PREFIX`)
+    :param help: what it measures
+    :param labels: the histogram's labels (e.g. function='process_ping')
+    """
+    def decorator(function):
+        histogram = REGISTRY.histogram(name, help, **labels)
+
+        def failed(error):
+            count(_failures_name(name), "failures of " + help, cause=failure_cause(error), **labels)
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                except Exception as e:
+                    failed(e)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                except Exception as e:
+                    failed(e)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def write_prometheus(path: str):
+    """
+    replaces a file with every metric in the Prometheus text format, atomically (e.g. for node_exporter's textfile
+    collector)
+    :param path: the path of the file
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        f.write(REGISTRY.exposition())
+    os.replace(temporary_path, path)
+
+
+async def start_http_server(port: int, host: str = '127.0.0.1'):
+    """
+    serves every metric in the Prometheus text format at http://<host>:<port>/metrics
+    :param port: the TCP port
+    :param host: the address to listen on (only this machine by default)
+    :return: the asyncio Server (close it to stop)
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5.0)
+            path = request.split(b' ')[1] if request.count(b' ') >= 2 else b''
+            if request.startswith(b'GET ') and path.split(b'?')[0] == b'/metrics':
+                status, body = b'200 OK', REGISTRY.exposition().encode('utf-8')
+            else:
+                status, body = b'404 Not Found', b'only /metrics is served\n'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,158 @@
+# standard library includes
+import collections
+import json
+import os
+import time
+
+# external library includes
+import numpy as np
+
+# the windows of the rolling statistics, in seconds, by name
+DEFAULT_WINDOWS = {'1m': 60.0, '10m': 600.0, '1h': 3600.0}
+
+# the metrics of a record (see `receiver.measure` and `probe.ProbeResult.to_record`) that are tracked
+DEFAULT_METRICS = ('bitrate_kbps', 'delay_ms', 'percent_lost_udp', 'percent_lost_tcp')
+
+
+class RingBuffer:
+    """
+    keeps the most recent timestamped samples in numpy arrays, overwriting the oldest. the arrays start small and double
+    while they are full of samples newer than `horizon` seconds, up to `capacity` samples, so a buffer only takes the
+    memory that its rate of samples needs
+    """
+
+    def __init__(self, capacity: int, horizon: float = None, initial_capacity: int = 64):
+        """
+        :param capacity: the largest number of samples kept
+        :param horizon: the age, in seconds, of the oldest sample worth growing the arrays for (None to grow until
+        `capacity` no matter how old the samples are)
+        :param initial_capacity: the number of samples the arrays start with
+        """
+        self.capacity = capacity
+        self.horizon = horizon
+        self.timestamps = np.zeros((min(capacity, initial_capacity),), dtype='float64')
+        self.values = np.zeros((min(capacity, initial_capacity),), dtype='float64')
+        self.size = 0
+        self._head = 0  # where the next sample goes
+
+    def add(self, timestamp: float, values: np.ndarray):
+        """
+        adds samples that were all taken at the same time
+        :param timestamp: the time of the samples, in seconds since the epoch
+        :param values: a numpy array of samples (NaNs are dropped)
+        """
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)][-self.capacity:]
+        n = len(values)
+        if n == 0:
+            return
+        if self.size + n > len(self.values) and len(self.values) < self.capacity:
+            # the samples about to be overwritten are the oldest ones: grow rather than lose any within the horizon
+            oldest = self.timestamps[self._head] if self.size == len(self.values) else self.timestamps[0]
+            if self.horizon is None or self.size == 0 or oldest >= timestamp - self.horizon:
+                self._grow(min(self.capacity, max(2 * len(self.values), self.size + n)))
+        allocated = len(self.values)
+        values = values[-allocated:]
+        n = len(values)
+        indices = (self._head + np.arange(n)) % allocated
+        self.timestamps[indices] = timestamp
+        self.values[indices] = values
+        self._head = (self._head + n) % allocated
+        self.size = min(self.size + n, allocated)
+
+    def _grow(self, allocated: int):
+        # move the samples, oldest first, to larger arrays
+        order = (self._head - self.size + np.arange(self.size)) % len(self.values)
+        timestamps, values = np.zeros((allocated,), dtype='float64'), np.zeros((allocated,), dtype='float64')
+        timestamps[:self.size] = self.timestamps[order]
+        values[:self.size] = self.values[order]
+        self.timestamps, self.values = timestamps, values
+        self._head = self.size
+
+    def since(self, start: float) -> np.ndarray:
+        """
+        :param start: a time, in seconds since the epoch
+        :return: the samples taken at or after that time (in no particular order)
+        """
+        return self.values[:self.size][self.timestamps[:self.size] >= start]
+
+
+def summarize(values: np.ndarray) -> dict:
+    """
+    :param values: a numpy array of samples
+    :return: a dict of the samples' count, mean, standard deviation, min, median, 95th percentile, and max
+    """
+    if len(values) == 0:
+        return {'count': 0}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {'count': int(len(values)), 'mean': float(np.mean(values)), 'std_dev': float(np.std(values)),
+            'min': float(np.min(values)), 'p50': float(p50), 'p95': float(p95), 'max': float(np.max(values))}
+
+
+class RollingStats:
+    """
+    rolling-window statistics of every client's measurements. each client gets one ring buffer per metric, which grows
+    with the samples of the longest window up to `capacity`, and the least recently measured clients are forgotten
+    beyond `max_clients`, so memory stays bounded no matter how long the monitor runs (at most `max_clients` *
+    len(`metrics`) * `capacity` * 16 bytes). when a buffer fills up within the longest window, that window's statistics
+    only cover the most recent `capacity` samples
+    """
+
+    def __init__(self, windows: dict = None, metrics: tuple = DEFAULT_METRICS, capacity: int = None,
+                 max_clients: int = 256, sample_rate: float = 1.0):
+        """
+        :param windows: a dict mapping window names to their length in seconds (defaults to `DEFAULT_WINDOWS`)
+        :param metrics: the names of the metrics to track
+        :param capacity: the largest number of samples kept per client and metric (defaults to the samples of the
+        longest window at `sample_rate`)
+        :param max_clients: the largest number of clients tracked
+        :param sample_rate: the expected number of samples per second of a client's metric (e.g. one bitrate sample per
+        second of iperf3 intervals)
+        """
+        self.windows = DEFAULT_WINDOWS if windows is None else windows
+        self.metrics = metrics
+        self.horizon = max(self.windows.values())
+        self.capacity = int(np.ceil(self.horizon * sample_rate)) if capacity is None else capacity
+        self.max_clients = max_clients
+        self._clients = collections.OrderedDict()  # client -> metric -> RingBuffer
+
+    def add(self, client: str, record: dict):
+        """
+        adds the measurements of a record
+        :param client: the client (e.g. its IP address)
+        :param record: a dict mapping metric names to a sample or a numpy array of samples, and 'timestamp' to the time of
+        the measurements in seconds since the epoch (defaults to now)
+        """
+        buffers = self._clients.pop(client, None)
+        if buffers is None:
+            buffers = {metric: RingBuffer(self.capacity, self.horizon) for metric in self.metrics}
+        self._clients[client] = buffers
+        if len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+
+        timestamp = record.get('timestamp', time.time())
+        for metric in self.metrics:
+            if metric in record:
+                buffers[metric].add(timestamp, record[metric])
+
+    def snapshot(self, now: float = None) -> dict:
+        """
+        :param now: the end of the windows, in seconds since the epoch (defaults to now)
+        :return: a dict mapping clients to metrics to window names to summaries (see `summarize`)
+        """
+        now = time.time() if now is None else now
+        return {client: {metric: {name: summarize(buffer.since(now - length)) for name, length in self.windows.items()}
+                         for metric, buffer in buffers.items()}
+                for client, buffers in self._clients.items()}
+
+
+def write_status(path: str, status: dict):
+    """
+    replaces a JSON status file atomically, so readers never see a partial file
+    :param path: the path of the status file
+    :param status: a JSON-serializable dict
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(temporary_path, path)
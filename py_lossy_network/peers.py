@@ -0,0 +1,444 @@
+# standard library includes
+import ipaddress
+import subprocess
+import threading
+from dataclasses import dataclass, field
+
+# internal includes
+from py_lossy_network import metrics
+from py_lossy_network import scenario
+from py_lossy_network import units
+from py_lossy_network import utils
+
+# the classes of an interface's `htb` tree (minor ids): traffic that matches no peer goes to the default class, and every
+# peer gets its own class (and a `netem` child whose major id is the same number), from `FIRST_PEER_CLASS` up
+DEFAULT_CLASS = 0x1
+FIRST_PEER_CLASS = 0x10
+MAX_PEER_CLASS = 0xffff
+
+# the rate of the default class, i.e. of the traffic to anyone who isn't a peer (high enough not to shape it)
+DEFAULT_RATE = 10e9
+
+# the largest number of peers in one bucket of a `u32` hash table (the node ids of a bucket are 12 bits)
+MAX_BUCKET_NODE = 0xfff
+
+
+@dataclass
+class PeerProfile:
+    rate: float  # bits per second
+    burst: float = None  # bytes (None lets `htb` pick one from the rate)
+    loss: float = 0.0  # fraction between 0 and 1
+    delay: float = 0.0  # seconds
+    jitter: float = 0.0  # seconds (standard deviation of the delay)
+
+
+@dataclass
+class Peer:
+    network: ipaddress.IPv4Network  # the destinations that are this peer: a host (/32) or a subnet
+    port: int  # the destination port (TCP or UDP), or None for every port
+    class_id: int  # the minor id of its `htb` class, and the major id of its `netem` qdisc
+    node: int  # the id of its filter within its bucket (see `filter_handle`)
+    profile: PeerProfile
+
+
+def parse_match(match: str) -> tuple:
+    """
+    parses the destinations of a peer
+    :param match: "<IP>", "<IP>/<PREFIX>", "<IP>:<PORT>", or "<IP>/<PREFIX>:<PORT>" (IPv4), e.g. "10.0.1.0/24:5201"
+    :return: an ipaddress.IPv4Network and the port (or None)
+    """
+    address, _, port = match.partition(':')
+    try:
+        network = ipaddress.IPv4Network(address, strict=False)
+    except ValueError:
+        raise ValueError("\"{0}\" is not an IPv4 address or subnet".format(address))
+    if port == '':
+        return network, None
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError("\"{0}\" is not a port".format(port))
+    return network, int(port)
+
+
+def format_match(network: ipaddress.IPv4Network, port: int) -> str:
+    """
+    :return: the canonical form of a peer's destinations (see `parse_match`), which identifies the peer
+    """
+    text = str(network.network_address) if network.prefixlen == 32 else str(network)
+    return text if port is None else '{0}:{1}'.format(text, port)
+
+
+def parse_profile(params: dict) -> PeerProfile:
+    """
+    parses a peer's profile
+    :param params: a dict with 'rate' and optionally 'burst', 'loss', 'delay', and 'jitter', each with units (e.g.
+    {'rate': '2mbit', 'loss': '1%', 'delay': '40ms', 'jitter': '5ms'})
+    :return: a PeerProfile
+    """
+    unknown = set(params.keys()) - {'rate', 'burst', 'loss', 'delay', 'jitter'}
+    if len(unknown) > 0:
+        raise ValueError("unknown peer parameters {0}".format(sorted(unknown)))
+    if 'rate' not in params:
+        raise ValueError("a peer needs a rate")
+    profile = PeerProfile(rate=units.parse_rate(str(params['rate'])))
+    if params.get('burst') is not None:
+        profile.burst = units.parse_size(str(params['burst']))
+    if params.get('loss') is not None:
+        profile.loss = units.parse_percent(str(params['loss']))
+    if params.get('delay') is not None:
+        profile.delay = units.parse_time(str(params['delay']))
+    if params.get('jitter') is not None:
+        profile.jitter = units.parse_time(str(params['jitter']))
+    if profile.rate <= 0 or not 0.0 <= profile.loss <= 1.0 or profile.delay < 0 or profile.jitter < 0:
+        raise ValueError("a peer needs a positive rate, a loss between 0% and 100%, and a non-negative delay and jitter")
+    return profile
+
+
+def load(path: str) -> dict:
+    """
+    loads a peers file (JSON, TOML, or YAML, like a scenario's), e.g. {"peers": {"10.0.1.5": {"rate": "2mbit",
+    "loss": "1%"}, "10.0.2.0/24:5201": {"rate": "500kbit", "delay": "80ms", "jitter": "10ms"}}}
+    :param path: the path of the file
+    :return: a dict mapping the destinations of every peer (see `parse_match`) to its PeerProfile
+    """
+    document = scenario.load(path)
+    if not isinstance(document, dict) or not isinstance(document.get('peers'), dict):
+        raise ValueError("a peers file needs a \"peers\" table mapping destinations to profiles")
+    profiles = dict()
+    for match, params in document['peers'].items():
+        if not isinstance(params, dict):
+            raise ValueError("peer \"{0}\": expected a table of parameters".format(match))
+        try:
+            parse_match(match)
+            profiles[match] = parse_profile(params)
+        except ValueError as e:
+            raise ValueError("peer \"{0}\": {1}".format(match, e))
+    return profiles
+
+
+# the filters of the peers with the same prefix length, with or without a port, form a group: a `u32` hash table of
+# their own, at a priority of their own (which is also the id of the table), keyed on the 8 bits of the destination
+# address just above the prefix (e.g. the last byte for hosts, the third for /24s). the more specific groups have the
+# lower priorities, so they are tried first. classifying a packet costs one hash lookup per group in use (at most 66)
+# and a match against the few peers in its bucket, however many peers there are
+
+def filter_priority(prefix_length: int, has_port: bool) -> int:
+    """
+    :return: the priority (and hash table id) of a group of filters
+    """
+    return 2 * (32 - prefix_length) + (1 if has_port else 2)
+
+
+def hash_key(prefix_length: int) -> tuple:
+    """
+    :return: the mask of the destination address bits a group is hashed on, and the number of buckets
+    """
+    if prefix_length >= 8:
+        return (0xff << (32 - prefix_length)) & 0xffffffff, 256
+    return ((1 << prefix_length) - 1) << (32 - prefix_length), 1 << prefix_length
+
+
+def bucket(network: ipaddress.IPv4Network) -> int:
+    """
+    :return: the bucket of a peer in its group's hash table
+    """
+    mask, _ = hash_key(network.prefixlen)
+    return (int(network.network_address) & mask) >> (32 - network.prefixlen)
+
+
+def filter_handle(peer: Peer) -> str:
+    """
+    :return: the `u32` handle of a peer's filter: "<TABLE>:<BUCKET>:<NODE>" (hexadecimal)
+    """
+    return '{0:x}:{1:x}:{2:x}'.format(filter_priority(peer.network.prefixlen, peer.port is not None),
+                                      bucket(peer.network), peer.node)
+
+
+def tree_commands(network_interface: str, default_rate: float = DEFAULT_RATE) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that install the `htb` root and its default class
+    """
+    return [
+        "qdisc add dev {0} root handle 1: htb default {1:x}".format(network_interface, DEFAULT_CLASS),
+        "class add dev {0} parent 1: classid 1:{1:x} htb rate {2}".format(network_interface, DEFAULT_CLASS,
+                                                                         units.format_rate(default_rate)),
+    ]
+
+
+def group_commands(network_interface: str, prefix_length: int, has_port: bool) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that install the hash table of a group of filters, and the
+    filter that hashes every packet into it
+    """
+    prio = filter_priority(prefix_length, has_port)
+    mask, divisor = hash_key(prefix_length)
+    return [
+        "filter add dev {0} parent 1: protocol ip prio {1} handle {1:x}: u32 divisor {2}".format(network_interface, prio, divisor),
+        "filter add dev {0} parent 1: protocol ip prio {1} u32 link {1:x}: hashkey mask 0x{2:08x} at 16 match u32 0 0".format(network_interface, prio, mask),
+    ]
+
+
+def class_commands(network_interface: str, peer: Peer) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that install or update, in place, a peer's `htb` class and its
+    `netem` child. they only name the peer's class, so they cost the same however many peers the interface has
+    """
+    profile = peer.profile
+    rate = units.format_rate(profile.rate)
+    burst = '' if profile.burst is None else ' burst {0}'.format(units.format_size(profile.burst))
+    return [
+        "class replace dev {0} parent 1: classid 1:{1:x} htb rate {2} ceil {2}{3}".format(network_interface, peer.class_id, rate, burst),
+        utils.netem_command(network_interface, 'parent 1:{0:x}'.format(peer.class_id), '{0:x}:'.format(peer.class_id),
+                            units.format_percent(profile.loss), units.format_time(profile.delay),
+                            units.format_time(profile.jitter)),
+    ]
+
+
+def filter_command(network_interface: str, peer: Peer) -> str:
+    """
+    builds the `tc` command (without the leading "tc") that sends a peer's traffic to its class. the port is matched
+    at the usual offset of TCP and UDP ports (packets with IP options don't match)
+    """
+    handle = filter_handle(peer)
+    command = "filter replace dev {0} parent 1: protocol ip prio {1} handle {2} u32 ht {3} match ip dst {4}".format(
+        network_interface, filter_priority(peer.network.prefixlen, peer.port is not None), handle,
+        handle.rpartition(':')[0] + ':', peer.network)
+    if peer.port is not None:
+        command += " match ip dport {0} 0xffff".format(peer.port)
+    return command + " flowid 1:{0:x}".format(peer.class_id)
+
+
+def remove_commands(network_interface: str, peer: Peer) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that remove a peer's filter, then its class (with its `netem`
+    child; `htb` won't delete a class that a filter still points to)
+    """
+    return [
+        "filter del dev {0} parent 1: protocol ip prio {1} handle {2} u32".format(
+            network_interface, filter_priority(peer.network.prefixlen, peer.port is not None), filter_handle(peer)),
+        "class del dev {0} parent 1: classid 1:{1:x}".format(network_interface, peer.class_id),
+    ]
+
+
+@dataclass
+class _InterfacePeers:
+    # what we installed on one interface. changes to it (and their `tc` batches) are serialized by its lock
+    peers: dict = field(default_factory=dict)  # `format_match` of every peer -> Peer
+    groups: set = field(default_factory=set)  # (prefix length, has port) of every installed hash table
+    installed: bool = False  # whether the interface has the tree of these peers (False after a failed batch)
+    free_classes: list = field(default_factory=list)  # the class ids of removed peers, to reuse
+    next_class: int = FIRST_PEER_CLASS  # the lowest class id never used
+    free_nodes: dict = field(default_factory=dict)  # (group, bucket) -> the node ids of removed peers, to reuse
+    next_node: dict = field(default_factory=dict)  # (group, bucket) -> the lowest node id never used
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _slot(peer: Peer) -> tuple:
+    # the hash table bucket a peer's filter is in
+    return (peer.network.prefixlen, peer.port is not None), bucket(peer.network)
+
+
+class PeerShaper:
+    """
+    shapes the traffic to each peer (a destination host, subnet, and/or port) of a network interface with its own rate,
+    loss, and delay: the interface gets an `htb` root, every peer an `htb` class with a `netem` child, and `u32` filters
+    in hash tables send each peer's packets to its class. traffic to anyone else goes through the default class.
+
+    updating a peer only replaces its class and `netem` qdisc, and adding or removing one only touches its class and
+    its filter, with a fixed number of `tc` commands however many peers there are (see `benchmarks/bench_peers.py`).
+    the first peer of an interface also installs the root, and the first of each group its hash table. this replaces
+    the `tbf` root that set_egress installs, so an interface is shaped either per peer or as a whole
+    """
+
+    def __init__(self, default_rate: float = DEFAULT_RATE):
+        """
+        :param default_rate: the rate of the traffic that matches no peer, in bits per second
+        """
+        self.default_rate = default_rate
+        self._interfaces = dict()  # interface -> _InterfacePeers
+        self._lock = threading.Lock()
+
+    def peers(self, network_interface: str) -> dict:
+        """
+        :return: a dict mapping the destinations of every peer of an interface (see `format_match`) to its Peer
+        """
+        with self._lock:
+            state = self._interfaces.get(network_interface)
+            return dict(state.peers) if state is not None else dict()
+
+    def interfaces(self) -> list:
+        """
+        :return: the names of the interfaces shaped per peer
+        """
+        with self._lock:
+            return [k for k, state in self._interfaces.items() if len(state.peers) > 0]
+
+    def forget(self, network_interface: str):
+        """
+        forgets an interface's peers, e.g. once its rules were deleted, so its next peer installs the tree from scratch
+        :param network_interface: the name of the network interface
+        """
+        with self._lock:
+            self._interfaces.pop(network_interface, None)
+
+    def _state(self, network_interface: str) -> _InterfacePeers:
+        with self._lock:
+            return self._interfaces.setdefault(network_interface, _InterfacePeers())
+
+    def _allocate(self, network_interface: str, state: _InterfacePeers, peer: Peer):
+        # gives a new peer a class id, and a node id in its bucket; both are reused once their peer is removed
+        slot = _slot(peer)
+        if len(state.free_nodes.get(slot, [])) > 0:
+            peer.node = state.free_nodes[slot].pop()
+        elif state.next_node.get(slot, 1) <= MAX_BUCKET_NODE:
+            peer.node = state.next_node.get(slot, 1)
+            state.next_node[slot] = peer.node + 1
+        else:
+            raise ValueError("\"{0}\" has too many peers that hash like {1}".format(network_interface, peer.network))
+        if len(state.free_classes) > 0:
+            peer.class_id = state.free_classes.pop()
+        elif state.next_class <= MAX_PEER_CLASS:
+            peer.class_id = state.next_class
+            state.next_class += 1
+        else:
+            state.free_nodes.setdefault(slot, []).append(peer.node)
+            raise ValueError("\"{0}\" already has as many peers as `htb` has classes".format(network_interface))
+
+    def _release(self, state: _InterfacePeers, peer: Peer):
+        state.free_classes.append(peer.class_id)
+        state.free_nodes.setdefault(_slot(peer), []).append(peer.node)
+
+    def _tree_commands(self, network_interface: str, state: _InterfacePeers) -> list:
+        # the commands that install every peer of an interface on an empty root
+        state.groups = {_slot(peer)[0] for peer in state.peers.values()}
+        commands = tree_commands(network_interface, self.default_rate)
+        for group in sorted(state.groups):
+            commands.extend(group_commands(network_interface, *group))
+        for peer in state.peers.values():
+            commands.extend(class_commands(network_interface, peer))
+            commands.append(filter_command(network_interface, peer))
+        return commands
+
+    def _run(self, network_interface: str, state: _InterfacePeers, commands: list) -> subprocess.CompletedProcess:
+        # runs a change's commands, or installs the whole tree again if the last batch failed (we don't know how much
+        # of it made it); whatever the interface had, e.g. the rules of an earlier run, is dropped
+        if not state.installed:
+            utils.del_tc_rules(network_interface, 'root')
+            commands = self._tree_commands(network_interface, state) if len(state.peers) > 0 else []
+        if len(commands) == 0:
+            state.installed = len(state.peers) > 0
+            return subprocess.CompletedProcess(args=[], returncode=0, stdout=b"", stderr=b"")
+        ret = utils.run_tc_batch(commands)
+        state.installed = ret.returncode == 0
+        return ret
+
+    @metrics.timed('peer_set_seconds', "durations of `PeerShaper.set_many`, i.e. of adding or updating peers")
+    def set_many(self, network_interface: str, profiles: dict) -> subprocess.CompletedProcess:
+        """
+        adds peers to an interface, or updates the profiles of the ones it already has in place, as one `tc` batch. if
+        the batch fails, the peers are as they were before. this blocks, so call it from a worker
+        :param network_interface: the name of the network interface
+        :param profiles: a dict mapping the destinations of peers (see `parse_match`) to PeerProfiles
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        # parse every destination before changing anything
+        parsed = dict()
+        for match, profile in profiles.items():
+            network, port = parse_match(match)
+            parsed[format_match(network, port)] = (network, port, profile)
+
+        state = self._state(network_interface)
+        with state.lock:
+            added = []
+            updated = []
+            groups = []
+            commands = []
+
+            def undo():
+                # the peers as they were before, so a failed batch is followed by a fresh install of those
+                for added_key in added:
+                    self._release(state, state.peers.pop(added_key))
+                for updated_peer, old_profile in updated:
+                    updated_peer.profile = old_profile
+                state.groups.difference_update(groups)
+
+            try:
+                for key, (network, port, profile) in parsed.items():
+                    peer = state.peers.get(key)
+                    if peer is not None:
+                        updated.append((peer, peer.profile))
+                        peer.profile = profile
+                        commands.extend(class_commands(network_interface, peer))
+                        continue
+                    peer = Peer(network, port, None, None, profile)
+                    self._allocate(network_interface, state, peer)
+                    state.peers[key] = peer
+                    added.append(key)
+                    group = _slot(peer)[0]
+                    if group not in state.groups:
+                        state.groups.add(group)
+                        groups.append(group)
+                        commands.extend(group_commands(network_interface, *group))
+                    commands.extend(class_commands(network_interface, peer))
+                    commands.append(filter_command(network_interface, peer))
+            except ValueError:
+                undo()
+                raise
+            ret = self._run(network_interface, state, commands)
+            if ret.returncode != 0:
+                undo()
+        return ret
+
+    def set(self, network_interface: str, match: str, profile: PeerProfile) -> subprocess.CompletedProcess:
+        """
+        adds a peer to an interface, or updates its profile in place. this blocks, so call it from a worker
+        :param network_interface: the name of the network interface
+        :param match: the destinations of the peer (see `parse_match`)
+        :param profile: its PeerProfile
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        return self.set_many(network_interface, {match: profile})
+
+    @metrics.timed('peer_remove_seconds', "durations of `PeerShaper.remove`")
+    def remove(self, network_interface: str, match: str) -> subprocess.CompletedProcess:
+        """
+        removes a peer from an interface, so its traffic goes through the default class again. removing the last peer
+        deletes the whole tree. this blocks, so call it from a worker
+        :param network_interface: the name of the network interface
+        :param match: the destinations of the peer (see `parse_match`)
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        key = format_match(*parse_match(match))
+        state = self._state(network_interface)
+        with state.lock:
+            peer = state.peers.get(key)
+            if peer is None:
+                raise ValueError("\"{0}\" has no peer {1}".format(network_interface, key))
+            if len(state.peers) == 1:
+                ret = utils.del_tc_rules(network_interface, 'root')
+                if not state.installed:
+                    # whatever a failed batch left behind is gone either way
+                    ret = subprocess.CompletedProcess(args=[], returncode=0, stdout=b"", stderr=b"")
+                state.installed = False
+                state.groups = set()
+            else:
+                ret = self._run(network_interface, state, remove_commands(network_interface, peer))
+            if ret.returncode == 0 or not state.installed:
+                # a failed batch is followed by a fresh install, which won't have the peer anyway
+                self._release(state, state.peers.pop(key))
+        return ret
+
+    def table(self, network_interface: str) -> list:
+        """
+        :return: a table (with a header row) of the peers of an interface and their profiles, most specific first
+        """
+        rows = [['peer', 'class', 'rate', 'burst', 'loss', 'delay', 'jitter']]
+        peers = sorted(self.peers(network_interface).items(),
+                       key=lambda item: (filter_priority(item[1].network.prefixlen, item[1].port is not None),
+                                         item[1].network, item[1].port or 0))
+        for key, peer in peers:
+            profile = peer.profile
+            rows.append([key, '1:{0:x}'.format(peer.class_id), units.format_rate(profile.rate),
+                         '' if profile.burst is None else units.format_size(profile.burst),
+                         units.format_percent(profile.loss), units.format_time(profile.delay),
+                         units.format_time(profile.jitter)])
+        return rows
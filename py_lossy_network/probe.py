@@ -0,0 +1,210 @@
+# standard library includes
+import asyncio
+import collections
+import os
+import struct
+import time
+from dataclasses import dataclass
+
+# external library includes
+import numpy as np
+
+DEFAULT_PORT = 5301
+
+# the header of every probe datagram (the rest of the datagram is padding): a magic number, the id of the probe run, the
+# sequence number, the sender's monotonic time when sent, and, filled in by the reflector, its monotonic time when
+# received and the number of datagrams of the run it had received so far (all in network byte order)
+_MAGIC = b'PLNP'
+_HEADER = struct.Struct('!4sIIqqI')
+MIN_PACKET_SIZE = _HEADER.size
+
+
+class _ReflectorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, max_runs: int):
+        self.max_runs = max_runs
+        self.transport = None
+        self._received = collections.OrderedDict()  # (address, run id) -> number of datagrams received
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        now = time.monotonic_ns()
+        if len(data) < _HEADER.size:
+            return
+        magic, run_id, seq, sent_ns, _, _ = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            return
+
+        # count the datagrams of each run, forgetting the oldest runs
+        key = (addr, run_id)
+        received = self._received.pop(key, 0) + 1
+        self._received[key] = received
+        if len(self._received) > self.max_runs:
+            self._received.popitem(last=False)
+
+        self.transport.sendto(_HEADER.pack(_MAGIC, run_id, seq, sent_ns, now, received) + data[_HEADER.size:], addr)
+
+
+async def start_reflector(host: str = '0.0.0.0', port: int = DEFAULT_PORT, max_runs: int = 1024):
+    """
+    starts echoing probe datagrams back to their sender, stamped with the time they were received
+    :param host: the address to listen on
+    :param port: the UDP port to listen on
+    :param max_runs: the number of probe runs whose received-datagram counts are remembered
+    :return: the asyncio DatagramTransport of the reflector (close it to stop)
+    """
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: _ReflectorProtocol(max_runs), local_addr=(host, port))
+    return transport
+
+
+@dataclass
+class ProbeResult:
+    sent_ns: np.ndarray  # the sender's time each datagram was sent, by sequence number
+    reflected_ns: np.ndarray  # the reflector's time each datagram was received, by sequence number (-1 if lost)
+    received_ns: np.ndarray  # the sender's time each reply was received, by sequence number (-1 if lost)
+    arrivals: np.ndarray  # the sequence numbers of the replies, in the order they were received (duplicates excluded)
+    duplicates: int  # the number of replies received more than once
+    reflector_received: int  # the largest count of received datagrams reported by the reflector
+
+    @property
+    def count(self) -> int:
+        return len(self.sent_ns)
+
+    @property
+    def received(self) -> np.ndarray:
+        # whether each datagram's reply was received, by sequence number
+        return self.received_ns >= 0
+
+    @property
+    def rtt_ms(self) -> np.ndarray:
+        # the round-trip time of every received reply, in sequence order
+        received = self.received
+        return (self.received_ns[received] - self.sent_ns[received]) / 1e6
+
+    @property
+    def lost(self) -> float:
+        # the fraction of datagrams whose reply never came back
+        return float(1.0 - np.count_nonzero(self.received) / self.count) if self.count > 0 else float('nan')
+
+    @property
+    def lost_forward(self) -> float:
+        # the fraction of datagrams that never reached the reflector (a lower bound, if the last replies were lost too)
+        return float(1.0 - self.reflector_received / self.count) if self.count > 0 else float('nan')
+
+    @property
+    def reordered(self) -> float:
+        # the fraction of replies that arrived after a reply with a higher sequence number
+        if len(self.arrivals) < 2:
+            return 0.0
+        late = np.count_nonzero(self.arrivals[1:] < np.maximum.accumulate(self.arrivals)[:-1])
+        return float(late / len(self.arrivals))
+
+    @property
+    def jitter_ms(self) -> float:
+        # the interarrival jitter of RFC 3550 (section 6.4.1) on the way to the reflector, at the end of the run. the
+        # reflector's and the sender's clocks differ by a constant, which cancels out in the differences of transit times
+        if not np.any(self.received):
+            return float('nan')
+        order = np.argsort(self.reflected_ns[self.received], kind='stable')
+        transit = (self.reflected_ns[self.received] - self.sent_ns[self.received])[order].astype('float64')
+        d = np.abs(np.diff(transit))
+        if len(d) == 0:
+            return 0.0
+
+        # J(i) = J(i-1) + (|D(i-1,i)| - J(i-1))/16 with J(0) = 0, in closed form
+        weights = (15.0 / 16.0) ** np.arange(len(d) - 1, -1, -1) / 16.0
+        return float(np.dot(d, weights) / 1e6)
+
+    def to_record(self) -> dict:
+        """
+        :return: a record for `results.ResultsWriter.append`, in the shape of the `receiver` command's records
+        """
+        return {
+            'timestamp': time.time(),
+            'bitrate_kbps': np.zeros((0,)),  # the probe doesn't measure throughput
+            'percent_lost_udp': self.lost,
+            'percent_reordered_udp': self.reordered,
+            'delay_ms': self.rtt_ms,
+            'percent_lost_tcp': float('nan'),  # nothing was sent over ICMP or TCP
+            'jitter_ms': self.jitter_ms,
+            'duplicates': self.duplicates,
+        }
+
+
+class _SenderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, result: ProbeResult, run_id: int, done: asyncio.Event):
+        self.result = result
+        self.run_id = run_id
+        self.done = done
+        self.num_arrivals = 0
+
+    def datagram_received(self, data: bytes, addr):
+        now = time.monotonic_ns()
+        if len(data) < _HEADER.size:
+            return
+        magic, run_id, seq, _, reflected_ns, reflector_received = _HEADER.unpack_from(data)
+        if magic != _MAGIC or run_id != self.run_id or seq >= self.result.count:
+            return
+        result = self.result
+        if result.received_ns[seq] >= 0:
+            result.duplicates += 1
+            return
+        result.received_ns[seq] = now
+        result.reflected_ns[seq] = reflected_ns
+        result.arrivals[self.num_arrivals] = seq
+        self.num_arrivals += 1
+        result.reflector_received = max(result.reflector_received, reflector_received)
+        if self.num_arrivals == result.count:
+            self.done.set()
+
+
+async def probe(host: str, port: int = DEFAULT_PORT, count: int = 200, rate: float = 100.0,
+                packet_size: int = 64, timeout: float = 1.0) -> ProbeResult:
+    """
+    sends sequence-numbered, timestamped UDP datagrams to a reflector (see `start_reflector`) at a fixed rate, and
+    collects the replies
+    :param host: the address of the reflector
+    :param port: the UDP port of the reflector
+    :param count: the number of datagrams to send
+    :param rate: datagrams per second
+    :param packet_size: the size of each datagram's payload in bytes (at least `MIN_PACKET_SIZE`)
+    :param timeout: seconds to wait for replies after the last datagram was sent
+    :return: a ProbeResult
+    """
+    if packet_size < MIN_PACKET_SIZE:
+        raise ValueError("the packet size must be at least {0} bytes".format(MIN_PACKET_SIZE))
+    if count < 1 or rate <= 0:
+        raise ValueError("the count and the rate must be positive")
+
+    # every array of the run is allocated up front, so receiving a reply never allocates
+    result = ProbeResult(sent_ns=np.full((count,), -1, dtype='int64'), reflected_ns=np.full((count,), -1, dtype='int64'),
+                         received_ns=np.full((count,), -1, dtype='int64'), arrivals=np.zeros((count,), dtype='int64'),
+                         duplicates=0, reflector_received=0)
+    run_id = int.from_bytes(os.urandom(4), 'big')
+    done = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(lambda: _SenderProtocol(result, run_id, done),
+                                                              remote_addr=(host, port))
+    try:
+        datagram = bytearray(packet_size)
+        period = 1.0 / rate
+        start = loop.time()
+        for seq in range(count):
+            # send against a fixed grid of deadlines, so the rate doesn't drift with the time spent sending
+            delay = start + seq * period - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent_ns = time.monotonic_ns()
+            _HEADER.pack_into(datagram, 0, _MAGIC, run_id, seq, sent_ns, 0, 0)
+            result.sent_ns[seq] = sent_ns
+            transport.sendto(datagram)
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        transport.close()
+    result.arrivals = result.arrivals[:protocol.num_arrivals]
+    return result
@@ -0,0 +1,523 @@
+# standard library includes
+import asyncio
+import collections
+import heapq
+import re
+import socket
+import subprocess
+import threading
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import units
+
+PROTOCOLS = ('udp', 'tcp')
+
+# the bytes of Ethernet, IPv4, and UDP headers that `tc` counts against the rate of every datagram on the wire
+UDP_OVERHEAD = 42
+
+
+class Link:
+    """
+    the impairments of one direction of a proxy, with the semantics of the `tc` rules this package installs: a `tbf`
+    token bucket of `rate` and `burst` that queues packets for at most `latency` (see `utils.tbf_command`), followed by
+    `netem` loss and normally distributed delay (see `utils.netem_command`). with `police`, the bucket drops whatever
+    exceeds the rate instead of queueing it, like the ingress policer of `utils.ingress_commands`.
+
+    the bucket is kept as the time at which it will be full again (the "theoretical arrival time" of GCRA), so admitting
+    a packet is a few float operations no matter how many packets are queued
+    """
+
+    def __init__(self, police: bool = False):
+        """
+        :param police: whether packets that exceed the rate are dropped rather than queued
+        """
+        self.police = police
+        self.rate = None  # bits per second, or None for no rate limit
+        self.burst = 0.0  # bytes
+        self.latency = np.inf  # seconds
+        self.loss = 0.0  # fraction between 0 and 1
+        self.delay = 0.0  # seconds
+        self.jitter = 0.0  # seconds
+        self.num_sent = 0  # number of packets let through
+        self.num_dropped_rate = 0  # number of packets dropped by the bucket
+        self.num_dropped_loss = 0  # number of packets dropped at random
+        self._full_at = 0.0
+
+    def configure(self, **params):
+        """
+        changes some of the link's parameters in place; the bucket's state carries over, like `tc qdisc replace`
+        :param params: any of rate, burst, latency, loss, delay, and jitter
+        """
+        for name, value in params.items():
+            if not hasattr(self, name) or name.startswith('_') or name.startswith('num_'):
+                raise ValueError("\"{0}\" is not a link parameter".format(name))
+            setattr(self, name, value)
+
+    def reserve(self, now: float, size: float) -> float:
+        """
+        takes a packet's tokens from the bucket, waiting for them as long as it takes (nothing is dropped)
+        :param now: the time the packet arrived, in seconds (of the event loop's clock)
+        :param size: the size of the packet in bytes
+        :return: the time the packet may leave the bucket
+        """
+        self.num_sent += 1
+        if self.rate is None:
+            return now
+        bytes_per_sec = max(self.rate, 1.0) / 8.0
+        start = max(now, self._full_at - max(self.burst - size, 0.0) / bytes_per_sec)
+        self._full_at = max(start, self._full_at) + size / bytes_per_sec
+        return start
+
+    def sample_delays(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """
+        :param rng: the generator of the random delay
+        :param n: the number of packets
+        :return: the `netem` delay of each packet, in seconds
+        """
+        if self.jitter > 0.0:
+            return np.maximum(rng.normal(self.delay, self.jitter, n), 0.0)
+        return np.full((n,), self.delay)
+
+    def schedule(self, now: float, sizes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        decides the fate of a batch of packets that arrived together
+        :param now: the time the packets arrived, in seconds (of the event loop's clock)
+        :param sizes: the size of each packet in bytes, as counted by the bucket
+        :param rng: the generator of the random loss and delay
+        :return: the time each packet should be sent, or NaN where it is dropped
+        """
+        n = len(sizes)
+        due = np.full((n,), now, dtype='float64')
+        rate = self.rate
+        if rate is not None:
+            bytes_per_sec = max(rate, 1.0) / 8.0
+            burst = self.burst
+            limit = 0.0 if self.police else self.latency
+            full_at = self._full_at
+            for i, size in enumerate(sizes.tolist()):
+                # a packet may leave once the bucket holds `size` bytes of tokens, i.e. once the bucket is at most
+                # `burst - size` bytes short of full
+                start = max(now, full_at - (burst - size) / bytes_per_sec)
+                if size > burst or start - now > limit:
+                    due[i] = np.nan
+                    continue
+                due[i] = start
+                full_at = max(start, full_at) + size / bytes_per_sec
+            self._full_at = full_at
+            self.num_dropped_rate += int(np.count_nonzero(np.isnan(due)))
+
+        if self.loss > 0.0:
+            lost = (rng.random(n) < self.loss) & ~np.isnan(due)
+            due[lost] = np.nan
+            self.num_dropped_loss += int(np.count_nonzero(lost))
+        if self.jitter > 0.0 or self.delay > 0.0:
+            due += self.sample_delays(rng, n)
+        self.num_sent += int(n - np.count_nonzero(np.isnan(due)))
+        return due
+
+    def status(self) -> dict:
+        """
+        :return: a dict of the link's parameters and counters
+        """
+        return {'rate': self.rate, 'burst': self.burst, 'latency': self.latency, 'loss': self.loss, 'delay': self.delay,
+                'jitter': self.jitter, 'sent': self.num_sent, 'dropped_rate': self.num_dropped_rate,
+                'dropped_loss': self.num_dropped_loss}
+
+
+class UdpProxy:
+    """
+    relays UDP datagrams between clients and an upstream server, impairing them in userspace: datagrams from clients go
+    through the `egress` link, replies through the `ingress` link. every client gets its own socket towards the server
+    (like a NAT), so replies find their way back; the least recently active clients are forgotten beyond `max_clients`.
+
+    the sockets are read directly from the event loop, up to `batch_size` datagrams at a time, so the random draws of a
+    batch are vectorized. delayed datagrams wait in a heap ordered by the time they are due, behind a single timer
+    """
+
+    def __init__(self, listen_port: int, upstream: tuple, listen_host: str = '0.0.0.0', batch_size: int = 64,
+                 max_clients: int = 1024, seed: int = None):
+        """
+        :param listen_port: the UDP port clients send to
+        :param upstream: the (host, port) of the server
+        :param listen_host: the address to listen on
+        :param batch_size: the largest number of datagrams read from a socket at a time
+        :param max_clients: the largest number of clients relayed at the same time
+        :param seed: the seed of the random loss and delay (None for a non-reproducible run)
+        """
+        self.listen = (listen_host, listen_port)
+        self.upstream = upstream
+        self.batch_size = batch_size
+        self.max_clients = max_clients
+        self.egress = Link()
+        self.ingress = Link(police=True)
+        self.num_send_errors = 0  # number of datagrams the kernel refused (e.g. a full socket buffer)
+        self._rng = np.random.default_rng(seed)
+        self._loop = None
+        self._socket = None
+        self._clients = collections.OrderedDict()  # client address -> socket connected to the server
+        self._heap = []  # (due, sequence number, socket, datagram, destination or None for a connected socket)
+        self._sequence = 0
+        self._timer = None
+
+    async def start(self):
+        """
+        starts listening. call this from the event loop
+        """
+        self._loop = asyncio.get_running_loop()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.listen)
+        self._loop.add_reader(self._socket.fileno(), self._receive, self._socket, None)
+
+    def _upstream_socket(self, client) -> socket.socket:
+        # the socket that relays a client's datagrams, created on its first datagram
+        sock = self._clients.pop(client, None)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.connect(self.upstream)
+            self._loop.add_reader(sock.fileno(), self._receive, sock, client)
+        self._clients[client] = sock
+        if len(self._clients) > self.max_clients:
+            _, evicted = self._clients.popitem(last=False)
+            self._loop.remove_reader(evicted.fileno())
+            evicted.close()
+        return sock
+
+    def _receive(self, sock: socket.socket, client):
+        # read a batch of datagrams from a client (`client` is None, they come in on the listening socket) or from the
+        # server (on the socket of `client`)
+        datagrams = []
+        for _ in range(self.batch_size):
+            try:
+                datagrams.append(sock.recvfrom(65535))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # e.g. the ICMP port unreachable of an earlier datagram to a server that isn't listening
+                continue
+        if len(datagrams) == 0:
+            return
+
+        link = self.egress if client is None else self.ingress
+        sizes = np.fromiter((len(data) for data, _ in datagrams), dtype='float64', count=len(datagrams)) + UDP_OVERHEAD
+        now = self._loop.time()
+        due = link.schedule(now, sizes, self._rng)
+        for (data, addr), when in zip(datagrams, due.tolist()):
+            if when != when:  # NaN: dropped
+                continue
+            if client is None:
+                destination, out, to = addr, self._upstream_socket(addr), None
+            else:
+                destination, out, to = client, self._socket, client
+            if when <= now and len(self._heap) == 0:
+                self._send(out, data, to)
+            else:
+                heapq.heappush(self._heap, (when, self._sequence, out, data, to))
+                self._sequence += 1
+        self._arm()
+
+    def _send(self, sock: socket.socket, data: bytes, to):
+        try:
+            if to is None:
+                sock.send(data)
+            else:
+                sock.sendto(data, to)
+        except OSError:
+            self.num_send_errors += 1
+
+    def _arm(self):
+        # make sure the timer fires when the earliest datagram is due
+        if len(self._heap) == 0:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None and self._timer.when() <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_at(due, self._flush)
+
+    def _flush(self):
+        # send every datagram that is due
+        self._timer = None
+        now = self._loop.time()
+        heap = self._heap
+        while len(heap) > 0 and heap[0][0] <= now:
+            _, _, sock, data, to = heapq.heappop(heap)
+            self._send(sock, data, to)
+        self._arm()
+
+    def status(self) -> dict:
+        """
+        :return: a dict of the proxy's addresses, clients, queued datagrams, and link status (see `Link.status`)
+        """
+        return {'protocol': 'udp', 'listen': self.listen, 'upstream': self.upstream, 'clients': len(self._clients),
+                'queued': len(self._heap), 'send_errors': self.num_send_errors, 'egress': self.egress.status(),
+                'ingress': self.ingress.status()}
+
+    def close(self):
+        """
+        stops relaying; datagrams still queued are dropped. call this from the event loop
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._heap.clear()
+        for sock in [self._socket] + list(self._clients.values()):
+            if sock is not None:
+                self._loop.remove_reader(sock.fileno())
+                sock.close()
+        self._socket = None
+        self._clients.clear()
+
+
+class TcpProxy:
+    """
+    relays TCP connections to an upstream server, impairing them in userspace: bytes from clients go through the
+    `egress` link, bytes from the server through the `ingress` link, a chunk (of at most `chunk_size` bytes) at a time.
+    TCP delivers every byte in order, so the rate and the delay hold chunks back, in order, but never drop them: the
+    bucket applies back pressure instead, and random loss (which the kernel would turn into retransmissions) is not
+    emulated
+    """
+
+    def __init__(self, listen_port: int, upstream: tuple, listen_host: str = '0.0.0.0', chunk_size: int = 16384,
+                 max_queued: int = 64, seed: int = None):
+        """
+        :param listen_port: the TCP port clients connect to
+        :param upstream: the (host, port) of the server
+        :param listen_host: the address to listen on
+        :param chunk_size: the largest number of bytes read at a time
+        :param max_queued: the largest number of chunks held back per direction before reading stops
+        :param seed: the seed of the random delay (None for a non-reproducible run)
+        """
+        self.listen = (listen_host, listen_port)
+        self.upstream = upstream
+        self.chunk_size = chunk_size
+        self.max_queued = max_queued
+        self.egress = Link()
+        self.ingress = Link()
+        self.num_connections = 0  # number of connections relayed so far
+        self._rng = np.random.default_rng(seed)
+        self._server = None
+        self._tasks = set()
+
+    async def start(self):
+        """
+        starts listening. call this from the event loop
+        """
+        self._server = await asyncio.start_server(self._relay, self.listen[0], self.listen[1])
+
+    async def _relay(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            try:
+                server_reader, server_writer = await asyncio.open_connection(*self.upstream)
+            except OSError:
+                return
+            self.num_connections += 1
+            try:
+                await asyncio.gather(self._pipe(client_reader, server_writer, self.egress),
+                                     self._pipe(server_reader, client_writer, self.ingress))
+            except asyncio.CancelledError:
+                # `close` drops the connection; this task is the connection, so there is nobody to tell
+                pass
+            finally:
+                server_writer.close()
+        finally:
+            client_writer.close()
+            self._tasks.discard(task)
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, link: Link):
+        # read chunks as they come, and write each one out once the bucket has its tokens and its delay has passed
+        # (never before the chunk ahead of it)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.max_queued)
+
+        async def write():
+            while True:
+                due, data = await queue.get()
+                if data is None:
+                    break
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+
+        writing = asyncio.ensure_future(write())
+        try:
+            last_due = 0.0
+            while True:
+                data = await reader.read(self.chunk_size)
+                if len(data) == 0:
+                    break
+                last_due = max(last_due, link.reserve(loop.time(), len(data)) + link.sample_delays(self._rng, 1)[0])
+                await queue.put((last_due, data))
+            await queue.put((0.0, None))
+            await writing
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writing.cancel()
+
+    def status(self) -> dict:
+        """
+        :return: a dict of the proxy's addresses, connections, and link status (see `Link.status`)
+        """
+        return {'protocol': 'tcp', 'listen': self.listen, 'upstream': self.upstream, 'connections': len(self._tasks),
+                'total_connections': self.num_connections, 'egress': self.egress.status(),
+                'ingress': self.ingress.status()}
+
+    def close(self):
+        """
+        stops accepting connections and drops the open ones. call this from the event loop
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+
+
+def make_proxy(protocol: str, listen_port: int, upstream: tuple, **kwargs):
+    """
+    creates a (not yet started) proxy
+    :param protocol: one of `PROTOCOLS`
+    :param listen_port: the port clients connect or send to
+    :param upstream: the (host, port) of the server
+    :param kwargs: the other arguments of `UdpProxy` or `TcpProxy`
+    :return: a UdpProxy or a TcpProxy
+    """
+    if protocol == 'udp':
+        return UdpProxy(listen_port, upstream, **kwargs)
+    elif protocol == 'tcp':
+        return TcpProxy(listen_port, upstream, **kwargs)
+    raise ValueError("\"{0}\" is not a valid protocol. Valid protocols are: {1}".format(protocol, list(PROTOCOLS)))
+
+
+# the `tc` commands this package builds (see `utils`), as understood by `ProxyBackend`
+_VERB = r'(?:add|change|replace)'
+_TBF = re.compile(r'qdisc {0} dev (\S+) root handle \S+ tbf rate (\S+) burst (\S+) latency (\S+)$'.format(_VERB))
+_NETEM = re.compile(r'qdisc {0} dev (\S+) parent \S+ handle \S+ netem loss (\S+) delay (\S+)(?: (\S+))?(?: distribution normal)?$'.format(_VERB))
+_INGRESS = re.compile(r'qdisc {0} dev (\S+) handle ffff: ingress$'.format(_VERB))
+_POLICE = re.compile(r'filter {0} dev (\S+) parent ffff: .*police rate (\S+) burst (\S+)(?: drop)?$'.format(_VERB))
+_DELETE = re.compile(r'qdisc del dev (\S+) (root|ingress)$')
+
+
+class ProxyBackend:
+    """
+    a `tc` backend (see `tc_backend`) that applies the rules to userspace proxies instead of network interfaces, so the
+    shaper, the scheduler, and scenarios work unchanged without `tc` or root. proxies are registered under a name,
+    which stands in for the network interface in every command. like `tc -batch`, a group of commands stops at the
+    first one that fails
+    """
+
+    def __init__(self):
+        self._proxies = dict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, proxy):
+        """
+        :param name: the name the proxy is shaped under
+        :param proxy: a started UdpProxy or TcpProxy
+        """
+        with self._lock:
+            if name in self._proxies:
+                raise ValueError("a proxy named \"{0}\" already exists".format(name))
+            self._proxies[name] = proxy
+
+    def unregister(self, name: str):
+        """
+        :param name: the name of the proxy
+        :return: the proxy (the caller closes it)
+        """
+        with self._lock:
+            return self._proxies.pop(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._proxies
+
+    def names(self) -> list:
+        """
+        :return: the names of every registered proxy
+        """
+        with self._lock:
+            return list(self._proxies.keys())
+
+    def proxies(self) -> dict:
+        """
+        :return: a dict mapping names to proxies
+        """
+        with self._lock:
+            return dict(self._proxies)
+
+    def _apply(self, command: str):
+        # apply one command, raising a ValueError (or KeyError, for an unknown proxy) if it can't be
+        def proxy(name):
+            if name not in self._proxies:
+                raise KeyError(name)
+            return self._proxies[name]
+
+        match = _TBF.match(command)
+        if match is not None:
+            proxy(match.group(1)).egress.configure(rate=units.parse_rate(match.group(2)),
+                                                           burst=units.parse_size(match.group(3)),
+                                                           latency=units.parse_time(match.group(4)))
+            return
+        match = _NETEM.match(command)
+        if match is not None:
+            proxy(match.group(1)).egress.configure(loss=units.parse_percent(match.group(2)),
+                                                           delay=units.parse_time(match.group(3)),
+                                                           jitter=units.parse_time(match.group(4) or '0ms'))
+            return
+        match = _INGRESS.match(command)
+        if match is not None:
+            proxy(match.group(1))
+            return
+        match = _POLICE.match(command)
+        if match is not None:
+            proxy(match.group(1)).ingress.configure(rate=units.parse_rate(match.group(2)),
+                                                            burst=units.parse_size(match.group(3)))
+            return
+        match = _DELETE.match(command)
+        if match is not None:
+            if match.group(2) == 'root':
+                proxy(match.group(1)).egress.configure(rate=None, loss=0.0, delay=0.0, jitter=0.0)
+            else:
+                proxy(match.group(1)).ingress.configure(rate=None)
+            return
+        raise ValueError("not supported by the userspace proxies")
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        """
+        applies a list of `tc` commands (without the leading "tc") to the proxies they name
+        :param commands: a list of `tc` commands represented as strs
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        with self._lock:
+            for command in commands:
+                try:
+                    self._apply(command)
+                except KeyError as e:
+                    return subprocess.CompletedProcess(args=command, returncode=1, stdout=b"",
+                                                       stderr="Cannot find proxy {0}\n".format(e).encode('utf-8'))
+                except ValueError as e:
+                    return subprocess.CompletedProcess(args=command, returncode=1, stdout=b"",
+                                                       stderr="\"{0}\": {1}\n".format(command, e).encode('utf-8'))
+        return subprocess.CompletedProcess(args=commands, returncode=0, stdout=b"", stderr=b"")
+
+    def close(self):
+        """
+        closes every registered proxy. call this from the event loop
+        """
+        with self._lock:
+            proxies = list(self._proxies.values())
+            self._proxies.clear()
+        for proxy in proxies:
+            proxy.close()
@@ -0,0 +1,242 @@
+# standard library includes
+import asyncio
+import re
+import time
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import metrics
+
+# the statistics of a qdisc printed by `tc -s qdisc show`: counters, which only go up while the qdisc exists, and
+# gauges of what is queued right now. drops of the ingress policer are counted by the ingress qdisc
+COUNTERS = ('sent_bytes', 'sent_packets', 'dropped', 'overlimits', 'requeues')
+GAUGES = ('backlog_bytes', 'backlog_packets')
+FIELDS = COUNTERS + GAUGES
+
+# the longest interface name (IFNAMSIZ - 1) and a generous bound on "<KIND> <HANDLE>"
+INTERFACE_LENGTH = 15
+QDISC_LENGTH = 32
+
+# one row per sample of a qdisc in the results file: how much each counter went up since the previous sample (over
+# `interval` seconds), and the gauges
+ROW_DTYPE = np.dtype([('timestamp', 'float64'), ('interface', 'S{0}'.format(INTERFACE_LENGTH)),
+                      ('qdisc', 'S{0}'.format(QDISC_LENGTH)), ('interval', 'float64')] +
+                     [(field, 'int64') for field in FIELDS])
+
+# the name of the table the rows are appended to (see `results.ResultsWriter.append_rows`)
+TABLE = 'qdisc_stats'
+
+# a qdisc header line and its two lines of statistics. `dev <INTERFACE>` is only printed when no interface was asked for
+_QDISC_STATS = re.compile(
+    r'^qdisc (\S+) ([0-9a-f]+:) (?:dev (\S+) )?[^\n]*\n'
+    r' Sent (\d+) bytes (\d+) pkt \(dropped (\d+), overlimits (\d+) requeues (\d+)\)[^\n]*\n'
+    r' backlog (\d+)([KMG]?)b (\d+)p', re.MULTILINE)
+
+# the multipliers of the backlog's size suffixes (`tc` prints sizes that are whole multiples of 1024 bytes with one)
+_SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_qdisc_stats(tc_output: str, network_interface: str = None, include_default: bool = False) -> (list, np.ndarray):
+    """
+    parses the output of `tc -s qdisc show` with a single regular expression and a single numpy conversion, so that it
+    stays cheap enough to run many times a second over dozens of interfaces
+    :param tc_output: the output of `tc -s qdisc show` (every interface) or `tc -s qdisc show dev <INTERFACE>`
+    :param network_interface: the interface of the output, if it came from `tc -s qdisc show dev <INTERFACE>`
+    :param include_default: whether to include the qdiscs the kernel attaches on its own (handle 0:, e.g. noqueue or
+    pfifo_fast), which nobody configured
+    :return: a list of (interface, "<KIND> <HANDLE>") keys, and an int64 array with a row of `FIELDS` per key
+    """
+    matches = _QDISC_STATS.findall(tc_output)
+    if not include_default:
+        matches = [m for m in matches if m[1] != '0:']
+    if len(matches) == 0:
+        return [], np.zeros((0, len(FIELDS)), dtype='int64')
+    keys = [(m[2] or network_interface, m[0] + ' ' + m[1]) for m in matches]
+    # groups 3 to 8 are the counters and the backlog's bytes, 9 its suffix, and 10 its packets. numpy parses one long
+    # string of numbers about twice as fast as a list of tuples of strs
+    values = np.fromstring(' '.join([' '.join(m[3:9] + m[10:11]) for m in matches]), dtype='int64', sep=' ')
+    values = values.reshape((len(matches), len(FIELDS)))
+    suffixes = [m[9] for m in matches]
+    if any(suffixes):
+        values[:, FIELDS.index('backlog_bytes')] *= np.array([_SIZE_SUFFIXES[s] for s in suffixes], dtype='int64')
+    return keys, values
+
+
+class QdiscSampler:
+    """
+    turns successive snapshots of the qdisc statistics into per-sample increments and per-second rates. every qdisc
+    seen gets a column in preallocated numpy ring buffers (grown by doubling when new qdiscs appear), and each snapshot
+    is folded in with a handful of vectorized operations, whatever the number of qdiscs. the rows for the results file
+    are buffered and handed out in batches by `take_rows`
+    """
+
+    def __init__(self, capacity: int = 600, max_series: int = 64):
+        """
+        :param capacity: the number of snapshots kept in the ring buffers (e.g. a minute at 10 Hz)
+        :param max_series: the number of qdiscs the buffers are first allocated for
+        """
+        self.capacity = capacity
+        self.num_samples = 0  # number of snapshots folded in
+        self.num_resets = 0  # number of times a qdisc's counters went backwards (i.e. it was deleted and re-created)
+        self.keys = []  # (interface, qdisc) of every column
+        self._columns = dict()  # (interface, qdisc) -> column
+        self._last = np.zeros((max_series, len(FIELDS)), dtype='int64')  # the latest raw statistics of every qdisc
+        self._last_time = np.full((max_series,), np.nan)  # when each qdisc was last seen
+        self._names = np.zeros((max_series,), dtype=ROW_DTYPE[['interface', 'qdisc']])  # the encoded key of every column
+        self.times = np.full((capacity,), np.nan)  # the time of every snapshot in the ring
+        self.rates = np.full((capacity, max_series, len(FIELDS)), np.nan)  # counters per second and gauges, by snapshot
+        self._head = 0  # where the next snapshot goes
+        self._pending = []  # arrays of `ROW_DTYPE` not yet taken by `take_rows`
+
+    def _columns_of(self, keys: list) -> np.ndarray:
+        # find (or make room for) the column of every key
+        for key in keys:
+            if key not in self._columns:
+                if len(self.keys) == self._last.shape[0]:
+                    grown = 2 * self._last.shape[0]
+                    self._last = np.concatenate((self._last, np.zeros_like(self._last)))
+                    self._last_time = np.concatenate((self._last_time, np.full_like(self._last_time, np.nan)))
+                    self._names = np.concatenate((self._names, np.zeros_like(self._names)))
+                    rates = np.full((self.capacity, grown, len(FIELDS)), np.nan)
+                    rates[:, :self.rates.shape[1]] = self.rates
+                    self.rates = rates
+                self._columns[key] = len(self.keys)
+                self._names[len(self.keys)] = (key[0].encode('utf-8'), key[1].encode('utf-8'))
+                self.keys.append(key)
+        return np.fromiter((self._columns[key] for key in keys), dtype='int64', count=len(keys))
+
+    def add(self, timestamp: float, keys: list, values: np.ndarray):
+        """
+        folds in a snapshot. qdiscs seen for the first time only get a baseline; they have rates from their second
+        snapshot on
+        :param timestamp: when the snapshot was taken, in seconds since the epoch
+        :param keys: the (interface, qdisc) keys of the snapshot (see `parse_qdisc_stats`)
+        :param values: the int64 array of the snapshot, a row of `FIELDS` per key
+        """
+        columns = self._columns_of(keys)
+        last_time = self._last_time[columns]
+        seen = ~np.isnan(last_time)
+        counters = len(COUNTERS)
+
+        deltas = values[:, :counters] - self._last[columns, :counters]
+        # a counter that went backwards belongs to a new qdisc with the same handle; everything it counted is new
+        reset = (deltas < 0).any(axis=1)
+        deltas[reset] = values[reset, :counters]
+        self.num_resets += int(np.count_nonzero(reset & seen))
+        intervals = timestamp - last_time
+
+        self._last[columns] = values
+        self._last_time[columns] = timestamp
+        self.times[self._head] = timestamp
+        self.rates[self._head] = np.nan
+        if seen.any():
+            self.rates[self._head, columns[seen], :counters] = deltas[seen] / intervals[seen, np.newaxis]
+            self.rates[self._head, columns[seen], counters:] = values[seen, counters:]
+            rows = np.zeros((int(np.count_nonzero(seen)),), dtype=ROW_DTYPE)
+            rows['timestamp'] = timestamp
+            names = self._names[columns[seen]]
+            rows['interface'] = names['interface']
+            rows['qdisc'] = names['qdisc']
+            rows['interval'] = intervals[seen]
+            for i, field in enumerate(FIELDS):
+                rows[field] = deltas[seen, i] if i < counters else values[seen, i]
+            self._pending.append(rows)
+        self._head = (self._head + 1) % self.capacity
+        self.num_samples += 1
+
+    def take_rows(self) -> np.ndarray:
+        """
+        :return: the rows (of `ROW_DTYPE`) of every snapshot folded in since the last call, in one array
+        """
+        pending = self._pending
+        self._pending = []
+        return np.concatenate(pending) if len(pending) > 0 else np.zeros((0,), dtype=ROW_DTYPE)
+
+    def history(self, key: tuple) -> (np.ndarray, np.ndarray):
+        """
+        :param key: an (interface, qdisc) key
+        :return: the times of the snapshots in the ring, oldest first, and an array with a row of rates (counters per
+        second, gauges as is; NaN where the qdisc wasn't seen) per time
+        """
+        order = (self._head + np.arange(self.capacity)) % self.capacity
+        order = order[~np.isnan(self.times[order])]
+        column = self._columns.get(key)
+        if column is None:
+            return self.times[order], np.full((len(order), len(FIELDS)), np.nan)
+        return self.times[order], self.rates[order, column]
+
+    def latest(self, network_interface: str) -> dict:
+        """
+        :param network_interface: the name of the network interface
+        :return: a dict mapping each of its qdiscs to a dict of its latest rates (counters per second, gauges as is)
+        """
+        latest = dict()
+        if self.num_samples == 0:
+            return latest
+        head = (self._head - 1) % self.capacity
+        for (interface, qdisc), column in self._columns.items():
+            if interface == network_interface and not np.isnan(self.rates[head, column, 0]):
+                latest[qdisc] = dict(zip(FIELDS, self.rates[head, column].tolist()))
+        return latest
+
+
+async def read_qdisc_stats(tc_command: list) -> str:
+    """
+    reads the statistics of every qdisc of every interface with one `tc` process, without blocking the event loop
+    :param tc_command: the command used to invoke `tc` as a list of strs
+    :return: the output of `tc -s qdisc show`
+    """
+    proc = await asyncio.create_subprocess_exec(*tc_command, '-s', 'qdisc', 'show', stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise OSError("`tc -s qdisc show` failed: {0}".format(stderr.decode('utf-8', 'replace').strip()))
+    return stdout.decode('utf-8', 'replace')
+
+
+async def run(sampler: QdiscSampler, tc_command: list, interval: float, should_stop, on_rows=None,
+              flush_interval: float = 1.0, network_interfaces=None):
+    """
+    snapshots every qdisc on a fixed grid of deadlines, `interval` seconds apart, until `should_stop()` returns True. a
+    snapshot that overruns its deadline skips the deadlines it missed
+    :param sampler: the QdiscSampler to fold the snapshots into
+    :param tc_command: the command used to invoke `tc` as a list of strs
+    :param interval: seconds between snapshots (e.g. 0.1 for 10 Hz)
+    :param should_stop: a function that returns True once sampling should stop
+    :param on_rows: a function called with the rows (see `QdiscSampler.take_rows`) about every `flush_interval` seconds,
+    and once more before returning
+    :param flush_interval: seconds between calls of `on_rows`
+    :param network_interfaces: a function returning the names of the interfaces to keep (None to keep every interface)
+    """
+    first_deadline = time.monotonic()
+    last_flush = first_deadline
+    num_failures = 0
+    while not should_stop():
+        try:
+            with metrics.timer('qdisc_sample_seconds', "durations of qdisc statistics snapshots (`tc -s qdisc show`)"):
+                output = await read_qdisc_stats(tc_command)
+            timestamp = time.time()
+            keys, values = parse_qdisc_stats(output)
+            if network_interfaces is not None:
+                wanted = set(network_interfaces())
+                kept = [i for i, key in enumerate(keys) if key[0] in wanted]
+                keys, values = [keys[i] for i in kept], values[kept]
+            sampler.add(timestamp, keys, values)
+        except OSError as e:
+            # report the first failure of a streak, not one per snapshot
+            num_failures += 1
+            if num_failures == 1:
+                print("could not sample the qdisc statistics: {0}".format(e))
+        else:
+            num_failures = 0
+
+        now = time.monotonic()
+        if on_rows is not None and now - last_flush >= flush_interval:
+            on_rows(sampler.take_rows())
+            last_flush = now
+        next_deadline = first_deadline + (int((now - first_deadline) // interval) + 1) * interval
+        await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
+    if on_rows is not None:
+        on_rows(sampler.take_rows())
@@ -0,0 +1,136 @@
+# standard library includes
+import asyncio
+import time
+
+# internal includes
+from py_lossy_network import metrics
+from py_lossy_network import utils
+
+# the modes of a measurement, recorded with its results: the RTTs of a loaded link and of an idle link differ
+SEQUENTIAL = 'sequential'  # the sender is pinged after its iperf3 test, i.e. over an idle link
+PIPELINED = 'pipelined'  # the sender is pinged during its iperf3 test, i.e. over a loaded link
+
+# what the instrumentation of `measure` records (see `metrics`)
+_PHASE_SECONDS = "durations of the phases of a measurement: waiting for a sender, its iperf3 test, and pinging it"
+_FAILURES = "measurements that produced no record, by cause"
+
+
+def parse_ports(ports: str) -> list:
+    """
+    parses a port or an inclusive range of ports
+    :param ports: e.g. "5201" or "5201-5208"
+    :return: a list of ports
+    """
+    first, _, last = ports.partition('-')
+    first = int(first)
+    last = int(last) if last != '' else first
+    if not 0 < first <= last < 65536:
+        raise ValueError("invalid port range \"{0}\"".format(ports))
+    return list(range(first, last + 1))
+
+
+async def measure(port: int = None, ping_count: int = 20, deadline: float = None, on_interval=None,
+                  mode: str = SEQUENTIAL):
+    """
+    runs a one-off iperf3 server on a port and pings the sender that runs its test against it: after the test in
+    `SEQUENTIAL` mode, or as soon as the sender's IP is known (with `--json-stream`, when it connects) in `PIPELINED` mode
+    :param port: the port the server listens on (defaults to iperf3's default)
+    :param ping_count: the number of pings sent to the sender
+    :param deadline: the monotonic time after which the server stops waiting for a sender (None to wait forever). this
+    only bounds the wait for iperf3's first record: with `--json-stream` that arrives when a sender connects, otherwise
+    only when its test ends
+    :param on_interval: a function called with (port, interval data) as each of iperf3's interval records arrives
+    :param mode: `SEQUENTIAL` or `PIPELINED`. without `--json-stream` (iperf3 before 3.17), the sender's IP is only
+    known once its test has ended, so the sender is pinged over an idle link and the run is recorded as `SEQUENTIAL`
+    :return: a tuple of (a record for `results.ResultsWriter.append`, or None; an error message, or None)
+    """
+    if mode == PIPELINED and not utils.iperf3_supports_json_stream():
+        mode = SEQUENTIAL
+    iperf3_start = None
+    iperf3_intervals = []
+    iperf3_end = None
+    iperf3_error = None
+    ping_task = None
+    phase_start = time.perf_counter()
+    records = utils.iperf3_server(port)
+    try:
+        while True:
+            timeout = None if deadline is None or iperf3_start is not None else max(0.0, deadline - time.monotonic())
+            try:
+                event, data = await asyncio.wait_for(records.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                metrics.count('receiver_failures_total', _FAILURES, cause='no_sender')
+                return None, None  # no sender showed up
+            if event == 'start':
+                iperf3_start = data
+                now = time.perf_counter()
+                metrics.observe('receiver_phase_seconds', _PHASE_SECONDS, now - phase_start, phase='wait')
+                phase_start = now
+                if mode == PIPELINED:
+                    ping_task = asyncio.ensure_future(utils.ping(data['connected'][0]['remote_host'], count=ping_count))
+            elif event == 'interval':
+                iperf3_intervals.append(data)
+                if on_interval is not None:
+                    on_interval(port, data)
+            elif event == 'end':
+                iperf3_end = data
+            elif event == 'error':
+                iperf3_error = data
+    finally:
+        await records.aclose()
+        if ping_task is not None and (iperf3_error is not None or iperf3_end is None):
+            ping_task.cancel()
+
+    if iperf3_error is not None or iperf3_start is None or iperf3_end is None:
+        metrics.count('receiver_failures_total', _FAILURES,
+                      cause='iperf3_error' if iperf3_error is not None else 'iperf3_incomplete')
+        return None, iperf3_error if iperf3_error is not None else "iperf3 exited before the test finished"
+    now = time.perf_counter()
+    metrics.observe('receiver_phase_seconds', _PHASE_SECONDS, now - phase_start, phase='iperf3')
+    phase_start = now
+
+    # extract relevant data from iperf3 output
+    client_ip, bitrate_kbps, percent_lost_udp, percent_reordered_udp = utils.process_iperf3_json(iperf3_start, iperf3_intervals, iperf3_end)
+
+    # compute the delay (RTT) & packet loss (over TCP) by using `ping` (unless it is already running)
+    if ping_task is None:
+        ping_task = asyncio.ensure_future(utils.ping(client_ip, count=ping_count))
+    proc = await ping_task
+    # in `PIPELINED` mode, this is only how much longer than the test the pings took
+    metrics.observe('receiver_phase_seconds', _PHASE_SECONDS, time.perf_counter() - phase_start, phase='ping')
+    if proc.returncode != 0:
+        metrics.count('receiver_failures_total', _FAILURES, cause='ping_failed')
+        return None, "{0}: {1}".format(client_ip, proc.stderr.decode('utf-8'))
+    delay_ms, percent_lost_tcp = utils.process_ping(proc.stdout.decode('utf-8'))
+
+    return {
+        'timestamp': time.time(),  # when the run finished
+        'client_ip': client_ip,
+        'bitrate_kbps': bitrate_kbps,
+        'percent_lost_udp': percent_lost_udp,
+        'percent_reordered_udp': percent_reordered_udp,
+        'delay_ms': delay_ms,
+        'percent_lost_tcp': percent_lost_tcp,
+        'mode': mode,
+    }, None
+
+
+async def receive(ports: list, timeout: float = None, ping_count: int = 20, on_interval=None, mode: str = SEQUENTIAL):
+    """
+    measures several senders at once: one iperf3 server runs on each port, and each sender is pinged on its own (see
+    `measure`), so N senders take about as long as one
+    :param ports: the ports of the servers (None for iperf3's default)
+    :param timeout: seconds to wait for senders (see `measure`); servers without a sender by then are stopped (None to
+    wait for a sender on every port)
+    :param ping_count: the number of pings sent to each sender
+    :param on_interval: a function called with (port, interval data) as each of iperf3's interval records arrives
+    :param mode: `SEQUENTIAL` or `PIPELINED` (see `measure`)
+    :return: a list of records (one per sender, see `measure`) and a list of error messages
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    outcomes = await asyncio.gather(*[measure(port, ping_count, deadline, on_interval, mode) for port in ports])
+    records = [record for record, error in outcomes if record is not None]
+    errors = [error for record, error in outcomes if error is not None]
+    return records, errors
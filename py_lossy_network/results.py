@@ -0,0 +1,520 @@
+# standard library includes
+import threading
+import time
+
+# external library includes
+import h5py
+import numpy as np
+
+# internal includes
+from py_lossy_network import metrics
+
+# the datatypes we store in the h5 file
+vlen_str_dt = h5py.special_dtype(vlen=str)  # variable length strings
+vlen_np_float_dt = h5py.special_dtype(vlen=np.dtype('float64'))  # variable length numpy arrays (dtype=float)
+
+# the layout of the h5 file, stored in its 'format_version' attribute:
+#   1: per-run arrays (e.g. 'bitrate_kbps') are variable-length datasets with one element per run (files without the
+#      attribute are version 1)
+#   2: per-run arrays are one flat float dataset holding every run's samples back to back, plus an '<NAME>_offsets'
+#      dataset whose elements i and i+1 delimit run i's samples; per-run scalars (e.g. 'timestamp') are plain datasets
+FORMAT_VERSION = 2
+
+
+def _placeholder(dset):
+    # the value of a record that has nothing for a dataset
+    if h5py.check_vlen_dtype(dset.dtype) is str:
+        return ''
+    if dset.dtype.kind == 'O':
+        return np.zeros((0,))
+    if dset.dtype.kind == 'f':
+        return np.full(dset.shape[1:], np.nan)
+    return np.zeros(dset.shape[1:], dtype=dset.dtype)
+
+
+class ResultsWriter:
+    """
+    appends records to resizable, chunked datasets of an h5 file (in the `FORMAT_VERSION` layout). records are buffered
+    in memory and written a block at a time by a background thread, either every `flush_interval` seconds or as soon as
+    `flush_records` records are pending, so the caller (i.e. the event loop) never waits on h5py. a record (or a table's
+    block of rows) that doesn't fit its datasets is dropped on its own, and while the file can't be written, at most
+    `max_pending` records and `max_pending_rows` rows are kept
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0, flush_records: int = 64, chunk_records: int = 1024,
+                 chunk_samples: int = 16384, compression: str = None, max_pending: int = 65536,
+                 max_pending_rows: int = 1 << 20):
+        """
+        :param path: the path of the h5 file to create
+        :param flush_interval: the longest time, in seconds, a record is kept in memory before being written
+        :param flush_records: the number of pending records that triggers a write
+        :param chunk_records: the number of records per h5 chunk
+        :param chunk_samples: the number of samples per h5 chunk of a ragged dataset
+        :param compression: the h5 compression filter of the datasets (e.g. 'gzip' or 'lzf'), or None
+        :param max_pending: the most records kept in memory while they can't be written; newer ones are dropped
+        :param max_pending_rows: the most rows (of every table) kept in memory while they can't be written; newer ones
+        are dropped
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.chunk_records = chunk_records
+        self.chunk_samples = chunk_samples
+        self.compression = compression
+        self.max_pending = max_pending
+        self.max_pending_rows = max_pending_rows
+        self.h5_file = h5py.File(path, 'w')
+        self.h5_file.attrs['format_version'] = FORMAT_VERSION
+        self._datasets = dict()
+        self._ragged = dict()
+        self._tables = dict()
+        self._pending = []
+        self._pending_rows = dict()  # table name -> list of arrays of rows
+        self._num_pending_rows = 0
+        self.num_write_failures = 0  # number of writes of the background thread that failed (their batch is kept)
+        self.last_write_error = None  # the exception of the last failed write
+        self.num_rejected_records = 0  # number of records dropped because they don't fit their datasets
+        self.num_rejected_rows = 0  # number of rows dropped because they don't fit their table
+        self.last_reject_error = None  # the exception of the last record or rows that didn't fit
+        self.num_dropped_records = 0  # number of records dropped because `max_pending` were already pending
+        self.num_dropped_rows = 0  # number of rows dropped because `max_pending_rows` were already pending
+        self._overflowing = False  # whether records or rows were dropped since the last successful write
+        self._closed = False
+        # guards `_pending`, `_pending_rows`, `_num_pending_rows`, `_overflowing`, and `_closed`
+        self._condition = threading.Condition()
+        self._io_lock = threading.Lock()  # guards the h5 file
+        self._thread = threading.Thread(target=self._run, name='results-writer', daemon=True)
+        self._thread.start()
+
+    def add_dataset(self, name: str, dtype, shape: tuple = ()):
+        """
+        creates an empty, resizable dataset in which every record gets one element
+        :param name: the name of the dataset
+        :param dtype: the datatype of an element
+        :param shape: the shape of an element (for fixed-size arrays)
+        """
+        with self._io_lock:
+            self._datasets[name] = self.h5_file.create_dataset(
+                name=name,
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                dtype=dtype,
+                chunks=(self.chunk_records,) + shape,
+                compression=self.compression
+            )
+
+    def add_ragged_dataset(self, name: str, dtype='float64', compress: bool = True):
+        """
+        creates an empty, resizable pair of datasets in which every record gets a variable-length array (of floats, by
+        default): the flat dataset `name` holds the samples of every record back to back, and `name`_offsets holds where
+        each record's samples start and end
+        :param name: the name of the dataset
+        :param dtype: the datatype of a sample
+        :param compress: whether the samples get the writer's compression filter (not worth it for data that is already
+        compressed)
+        """
+        with self._io_lock:
+            values = self.h5_file.create_dataset(
+                name=name,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=dtype,
+                chunks=(self.chunk_samples,),
+                compression=self.compression if compress else None
+            )
+            offsets = self.h5_file.create_dataset(
+                name=name + '_offsets',
+                data=np.zeros((1,), dtype='int64'),
+                maxshape=(None,),
+                chunks=(self.chunk_records,),
+                compression=self.compression
+            )
+            self._ragged[name] = [values, offsets, 0]
+
+    def append(self, record: dict):
+        """
+        queues a record for writing. this never blocks on h5py
+        :param record: a dict mapping dataset names to the value of this record in that dataset. datasets missing from
+        the record get a placeholder (NaN, an empty string, or an empty array), so every dataset keeps one element per
+        record
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError("the results writer of {0} is closed".format(self.path))
+            if len(self._pending) >= self.max_pending:
+                self.num_dropped_records += 1
+                self._overflow()
+                return
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_records:
+                self._condition.notify()
+
+    def append_rows(self, name: str, rows: np.ndarray):
+        """
+        queues rows for a table: a resizable dataset of a numpy structured dtype (e.g. `qdisc_stats.ROW_DTYPE`) kept next
+        to the per-run datasets, for data that isn't one element per run (e.g. many samples a second). the table is
+        created with the dtype of its first rows. this never blocks on h5py
+        :param name: the name of the table
+        :param rows: a 1-d numpy array of a structured dtype
+        """
+        if len(rows) == 0:
+            return
+        with self._condition:
+            if self._closed:
+                raise ValueError("the results writer of {0} is closed".format(self.path))
+            if self._num_pending_rows + len(rows) > self.max_pending_rows:
+                self.num_dropped_rows += len(rows)
+                self._overflow()
+                return
+            self._pending_rows.setdefault(name, []).append(rows)
+            self._num_pending_rows += len(rows)
+
+    def _overflow(self):
+        # report the first drop of a streak (the caller holds `_condition`)
+        if not self._overflowing:
+            print("too many results are waiting to be written to {0}; dropping the newest".format(self.path))
+            self._overflowing = True
+        metrics.count('h5_dropped_total', "records and blocks of rows dropped because too many were pending")
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def flush(self):
+        """
+        writes every pending record and row now, from the calling thread. if the write fails, the records and rows stay
+        pending and the exception is raised (records and rows that don't fit their datasets are dropped instead)
+        """
+        self._write_batch(*self._take())
+
+    def _take(self) -> (list, dict):
+        # take every pending record and row
+        with self._condition:
+            records, rows = self._pending, self._pending_rows
+            self._pending, self._pending_rows, self._num_pending_rows = [], dict(), 0
+        return records, rows
+
+    def _write_batch(self, records: list, rows: dict):
+        # write a batch of records and rows; whatever isn't written goes back to the front of the queue, so a failed
+        # write loses nothing. a record or a table's rows that don't fit their datasets (a ValueError or a TypeError
+        # from numpy or h5py) would fail every retry, so they are dropped on their own instead of blocking the queue
+        rows = dict(rows)
+        try:
+            try:
+                self._write(records)
+            except (ValueError, TypeError):
+                # find the records that don't fit by writing them one at a time
+                while len(records) > 0:
+                    try:
+                        self._write(records[:1])
+                    except (ValueError, TypeError) as e:
+                        self._reject(1, e)
+                    records = records[1:]
+            records = []
+            try:
+                self._write_rows(rows)
+            except (ValueError, TypeError):
+                # likewise, a block of rows at a time
+                for name in list(rows):
+                    while len(rows[name]) > 0:
+                        try:
+                            self._write_rows({name: rows[name][:1]})
+                        except (ValueError, TypeError) as e:
+                            self._reject(0, e, num_rows=len(rows[name][0]))
+                        rows[name] = rows[name][1:]
+                    del rows[name]
+        except BaseException:
+            with self._condition:
+                self._pending = records + self._pending
+                for name, blocks in rows.items():
+                    self._pending_rows[name] = blocks + self._pending_rows.get(name, [])
+                    self._num_pending_rows += sum(len(block) for block in blocks)
+            raise
+
+    def _reject(self, num_records: int, e: Exception, num_rows: int = 0):
+        # count records or rows dropped because they don't fit their datasets; report the first ones
+        if self.num_rejected_records + self.num_rejected_rows == 0:
+            print("dropped results that don't fit the datasets of {0}: {1}".format(self.path, e))
+        self.num_rejected_records += num_records
+        self.num_rejected_rows += num_rows
+        self.last_reject_error = e
+        metrics.count('h5_rejected_total', "records and blocks of rows dropped because they don't fit their datasets")
+
+    def _truncate(self, sizes: list):
+        # shrink datasets back to the sizes they had before a write that failed part of the way
+        for dset, size in sizes:
+            if dset.shape[0] != size:
+                dset.resize(size, axis=0)
+
+    def _write_rows(self, rows: dict):
+        # append every table's pending rows in one block
+        if len(rows) == 0:
+            return
+        with self._io_lock, metrics.timer('h5_write_seconds', "durations of h5 writes, by writer", writer='results_writer_rows'):
+            blocks = {name: np.concatenate(blocks) for name, blocks in rows.items()}
+            for name, block in blocks.items():
+                # h5py would only fail (with an OSError, as if the file couldn't be written) after the table grew
+                table = self._tables.get(name)
+                if table is not None and block.dtype != table.dtype:
+                    raise TypeError("rows of {0} don't fit the table {1} of {2}".format(block.dtype, name, table.dtype))
+            sizes = [(table, table.shape[0]) for name, table in self._tables.items() if name in blocks]
+            try:
+                for name, block in blocks.items():
+                    table = self._tables.get(name)
+                    if table is None:
+                        table = self.h5_file.create_dataset(
+                            name=name,
+                            shape=(0,),
+                            maxshape=(None,),
+                            dtype=block.dtype,
+                            chunks=(self.chunk_samples,),
+                            compression=self.compression
+                        )
+                        self._tables[name] = table
+                        sizes.append((table, 0))
+                    start = table.shape[0]
+                    table.resize(start + len(block), axis=0)
+                    table[start:] = block
+                self.h5_file.flush()
+            except BaseException:
+                self._truncate(sizes)
+                raise
+        for name, block in blocks.items():
+            metrics.count('h5_records_total', "records written to h5 files, by writer", len(block), writer='results_writer_rows')
+
+    def _write(self, records: list):
+        # group the records by dataset, and grow each dataset once for the whole batch
+        if len(records) == 0:
+            return
+        with self._io_lock, metrics.timer('h5_write_seconds', "durations of h5 writes, by writer", writer='results_writer'):
+            # convert every value first, so a record that doesn't fit a dataset fails the batch before anything is written
+            blocks = []
+            for name, dset in self._datasets.items():
+                placeholder = _placeholder(dset)  # once per batch: it reads the dataset's dtype and shape from h5py
+                values = [record.get(name, placeholder) for record in records]
+                if dset.dtype.kind == 'O':
+                    # fill element by element, so equally sized arrays aren't broadcast into a 2-d block
+                    block = np.empty((len(values),), dtype=object)
+                    for i, value in enumerate(values):
+                        block[i] = value
+                else:
+                    block = np.asarray(values, dtype=dset.dtype)
+                blocks.append((dset, block))
+            ragged = []
+            for name, (values, offsets, end) in self._ragged.items():
+                arrays = [np.asarray(record.get(name, ()), dtype=values.dtype).ravel() for record in records]
+                ends = end + np.cumsum([len(array) for array in arrays])
+                ragged.append((name, values, offsets, end, np.concatenate(arrays), ends))
+
+            sizes = [(dset, dset.shape[0]) for dset, _ in blocks] + \
+                    [(dset, dset.shape[0]) for _, values, offsets, _, _, _ in ragged for dset in (values, offsets)]
+            try:
+                for dset, block in blocks:
+                    start = dset.shape[0]
+                    dset.resize(start + len(block), axis=0)
+                    dset[start:] = block
+                for name, values, offsets, end, samples, ends in ragged:
+                    values.resize(int(ends[-1]), axis=0)
+                    values[end:] = samples
+                    start = offsets.shape[0]
+                    offsets.resize(start + len(ends), axis=0)
+                    offsets[start:] = ends
+                self.h5_file.flush()
+            except BaseException:
+                self._truncate(sizes)
+                raise
+            for name, _, _, _, _, ends in ragged:
+                self._ragged[name][2] = int(ends[-1])
+        metrics.count('h5_records_total', "records written to h5 files, by writer", len(records), writer='results_writer')
+
+    def _run(self):
+        closed = False
+        failing = False
+        while not closed:
+            with self._condition:
+                # after a failed write, wait out the interval before trying again, however many records are pending
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and (failing or len(self._pending) < self.flush_records) and \
+                        time.monotonic() < deadline:
+                    self._condition.wait(max(0.0, deadline - time.monotonic()))
+                records, rows = self._take()
+                closed = self._closed
+            try:
+                self._write_batch(records, rows)
+            except Exception as e:
+                # the batch is queued again; report the first failure of a streak, not one per attempt (every failure
+                # is also counted in `h5_write_failures_total`, by cause)
+                self.num_write_failures += 1
+                self.last_write_error = e
+                if not failing:
+                    print("could not write the results to {0} (will retry): {1}".format(self.path, e))
+                failing = True
+            else:
+                failing = False
+                with self._condition:
+                    self._overflowing = False
+
+    def close(self):
+        """
+        writes every pending record and closes the file (also when the records can't be written, in which case the
+        exception is raised)
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        try:
+            # this raises if the pending records still can't be written
+            self.flush()
+        finally:
+            with self._io_lock:
+                self.h5_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def add_session_datasets(writer: ResultsWriter):
+    """
+    creates the datasets of a session's results file (see `receiver.measure` for what a record holds)
+    :param writer: the ResultsWriter of a new h5 file
+    """
+    # create a dataset for the time of each run (seconds since the epoch)
+    writer.add_dataset('timestamp', float)
+
+    # create a dataset for client IP data
+    writer.add_dataset('client_ip', vlen_str_dt)
+
+    # create a dataset for bitrate data (every run's measurements back to back, indexed by 'bitrate_kbps_offsets')
+    writer.add_ragged_dataset('bitrate_kbps')
+
+    # create a dataset for percent lost (UDP)
+    writer.add_dataset('percent_lost_udp', float)
+
+    # create a dataset for percent reordered (UDP)
+    writer.add_dataset('percent_reordered_udp', float)
+
+    # create a dataset for percent lost (TCP)
+    writer.add_dataset('percent_lost_tcp', float)
+
+    # create a dataset for delay in milliseconds (every run's measurements back to back, indexed by 'delay_ms_offsets')
+    writer.add_ragged_dataset('delay_ms')
+
+    # create a dataset for the mode of each run ('sequential': pinged over an idle link, 'pipelined': over a loaded one)
+    writer.add_dataset('mode', vlen_str_dt)
+
+    # create datasets for the UDP probe's jitter (RFC 3550) and duplicate replies (NaN for runs of other modes)
+    writer.add_dataset('jitter_ms', float)
+    writer.add_dataset('duplicates', float)
+
+
+class ResultsReader:
+    """
+    reads the per-run scalars and per-run arrays of an h5 results file, in either layout (see `FORMAT_VERSION`). with
+    the flat layout, any range of runs (including all of them) is fetched with one read per dataset
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the path of the h5 file
+        """
+        self.path = path
+        self.h5_file = h5py.File(path, 'r')
+        self.format_version = int(self.h5_file.attrs.get('format_version', 1))
+
+    def __len__(self) -> int:
+        # the number of runs
+        for name in ('client_ip', 'timestamp'):
+            if name in self.h5_file:
+                return self.h5_file[name].shape[0]
+        return 0
+
+    def keys(self) -> list:
+        """
+        :return: the names of the per-run scalars and per-run arrays in the file
+        """
+        return [name for name in self.h5_file.keys()
+                if not name.endswith('_offsets') and self.h5_file[name].dtype.names is None]
+
+    def tables(self) -> list:
+        """
+        :return: the names of the tables in the file (see `ResultsWriter.append_rows`)
+        """
+        return [name for name in self.h5_file.keys() if self.h5_file[name].dtype.names is not None]
+
+    def table(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        reads a range of rows of a table (e.g. 'qdisc_stats')
+        :param name: the name of the table
+        :param start: the first row
+        :param stop: one past the last row (defaults to the number of rows)
+        :return: a numpy structured array
+        """
+        return self.h5_file[name][start:stop]
+
+    def is_ragged(self, name: str) -> bool:
+        """
+        :param name: the name of a dataset
+        :return: whether every run has an array (rather than a scalar) in that dataset
+        """
+        if self.format_version >= 2:
+            return name + '_offsets' in self.h5_file
+        return self.h5_file[name].dtype.kind == 'O' and h5py.check_vlen_dtype(self.h5_file[name].dtype) is not str
+
+    def column(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        reads a per-run scalar (e.g. 'percent_lost_tcp' or 'client_ip') of a range of runs
+        :param name: the name of the dataset
+        :param start: the first run
+        :param stop: one past the last run (defaults to the number of runs)
+        :return: a numpy array with one element per run
+        """
+        dset = self.h5_file[name]
+        if h5py.check_vlen_dtype(dset.dtype) is str:
+            dset = dset.asstr()
+        return np.asarray(dset[start:stop])
+
+    def samples(self, name: str, start: int = 0, stop: int = None) -> (np.ndarray, np.ndarray):
+        """
+        reads a per-run array (e.g. 'bitrate_kbps' or 'delay_ms') of a range of runs
+        :param name: the name of the dataset
+        :param start: the first run
+        :param stop: one past the last run (defaults to the number of runs)
+        :return: the samples of every run in the range back to back, and the offsets (relative to the first array) whose
+        elements i and i+1 delimit the i-th run's samples
+        """
+        if self.format_version >= 2:
+            offsets = self.h5_file[name + '_offsets']
+            stop = offsets.shape[0] - 1 if stop is None else stop
+            offsets = offsets[start:stop + 1]
+            return self.h5_file[name][offsets[0]:offsets[-1]], offsets - offsets[0]
+
+        # the variable-length layout needs one read per run
+        arrays = [np.asarray(array, dtype='float64').ravel() for array in self.h5_file[name][start:stop]]
+        offsets = np.concatenate(([0], np.cumsum([len(array) for array in arrays]))).astype('int64')
+        return (np.concatenate(arrays) if len(arrays) > 0 else np.zeros((0,))), offsets
+
+    def run(self, name: str, i: int) -> np.ndarray:
+        """
+        reads a per-run array (e.g. 'bitrate_kbps') of a single run
+        :param name: the name of the dataset
+        :param i: the run (negative values count from the end)
+        :return: the run's samples
+        """
+        if i < 0:
+            i += len(self)
+        return self.samples(name, i, i + 1)[0]
+
+    def close(self):
+        self.h5_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,293 @@
+# standard library includes
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import units
+from py_lossy_network import utils
+
+# the parameters of each direction, their parser, and their default (None means the parameter is required)
+EGRESS_PARAMS = {
+    'bw': (units.parse_rate, None),  # bits per second
+    'burst': (units.parse_size, 32 * 1024 / 8),  # bytes
+    'latency': (units.parse_time, 0.5),  # seconds
+    'loss': (units.parse_percent, 0.0),  # fraction
+    'delay': (units.parse_time, 0.0),  # seconds
+    'delay_jitter': (units.parse_time, 0.0),  # seconds
+}
+INGRESS_PARAMS = {
+    'bw': (units.parse_rate, None),  # bits per second
+    'burst': (units.parse_size, 32 * 1024 / 8),  # bytes
+}
+DIRECTIONS = {'egress': EGRESS_PARAMS, 'ingress': INGRESS_PARAMS}
+
+# `tc` counts rates in bytes per second and doesn't accept 0, so ramps "to 0" end at this rate (bits per second)
+MIN_RATE = 8.0
+
+
+def load(path: str) -> dict:
+    """
+    loads a scenario file: JSON (.json), TOML (.toml, Python 3.11+), or YAML (.yaml or .yml, needs PyYAML)
+    :param path: the path of the file
+    :return: the scenario as a dict (see `compile_scenario`)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if extension in ('.yaml', '.yml'):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _parse_seconds(value, where: str) -> float:
+    # numbers are seconds; strings have units (e.g. "90s" or "500ms")
+    try:
+        seconds = float(value) if isinstance(value, (int, float)) else units.parse_time(value)
+    except (ValueError, TypeError) as e:
+        raise ValueError("{0}: {1}".format(where, e))
+    if not seconds >= 0:
+        raise ValueError("{0}: expected a non-negative time".format(where))
+    return seconds
+
+
+def _direction_commands(network_interface: str, direction: str, params: dict) -> list:
+    if direction == 'ingress':
+        return utils.ingress_commands(network_interface, units.format_rate(max(params['bw'], MIN_RATE)),
+                                      units.format_size(params['burst']))
+    return utils.egress_commands(network_interface, units.format_rate(max(params['bw'], MIN_RATE)),
+                                 units.format_size(params['burst']), units.format_time(params['latency']),
+                                 units.format_percent(params['loss']), units.format_time(params['delay']),
+                                 units.format_time(params['delay_jitter']))
+
+
+def _clear_commands(network_interface: str, state: dict) -> list:
+    commands = []
+    if 'egress' in state:
+        commands.append("qdisc del dev {0} root".format(network_interface))
+    if 'ingress' in state:
+        commands.append("qdisc del dev {0} ingress".format(network_interface))
+    return commands
+
+
+@dataclass
+class CompiledScenario:
+    times: np.ndarray  # the planned time of every event, in seconds after the start, sorted
+    interfaces: np.ndarray  # the index (in `names`) of every event's interface
+    names: list  # the names of the interfaces
+    commands: list  # the `tc` commands (strs without the leading "tc") of every event
+    labels: list  # a description of every event
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1]) if len(self.times) > 0 else 0.0
+
+
+def compile_scenario(scenario: dict) -> CompiledScenario:
+    """
+    validates a scenario and compiles it into a sorted array of events, each with its `tc` commands already built. a
+    scenario maps interface names to timelines, and each step of a timeline changes some parameters of an interface at
+    a time:
+
+        {"interfaces": {"eth0": [
+            {"at": 0, "egress": {"bw": "25mbit", "burst": "64kbit", "latency": "5s"}},
+            {"at": 60, "egress": {"bw": "500kbit", "loss": "5%"}},
+            {"at": 90, "ramp": "30s", "ramp_step": "1s", "egress": {"bw": "0kbit"}},
+            {"at": 120, "clear": true}
+        ]}}
+
+    steps are in order of time. times are seconds (numbers) or have units (strings); a step without "at" starts when
+    the previous one is done. parameters that a step doesn't mention keep their previous value (or their default, see
+    `EGRESS_PARAMS` and `INGRESS_PARAMS`). a step with "ramp" changes its parameters linearly, one event every
+    "ramp_step" (default 1s), from their previous value at "at" to the given one at "at" + "ramp". a step with "clear"
+    deletes the interface's rules
+    :param scenario: the scenario, e.g. as returned by `load`
+    :return: a CompiledScenario
+    """
+    if not isinstance(scenario, dict) or not isinstance(scenario.get('interfaces'), dict):
+        raise ValueError("a scenario needs an \"interfaces\" table mapping interface names to timelines")
+
+    names = []
+    events = []  # (time, interface index, commands, label)
+    for network_interface, timeline in scenario['interfaces'].items():
+        if not isinstance(timeline, list):
+            raise ValueError("interfaces.{0}: expected a list of steps".format(network_interface))
+        names.append(network_interface)
+        index = len(names) - 1
+        state = dict()  # direction -> the parameters applied so far
+        previous_end = 0.0  # when the previous step (including its ramp) is done
+        for i, step in enumerate(timeline):
+            where = "interfaces.{0}[{1}]".format(network_interface, i)
+            if not isinstance(step, dict):
+                raise ValueError("{0}: expected a table".format(where))
+            unknown = set(step.keys()) - {'at', 'ramp', 'ramp_step', 'clear'} - set(DIRECTIONS.keys())
+            if len(unknown) > 0:
+                raise ValueError("{0}: unknown keys {1}".format(where, sorted(unknown)))
+            at = _parse_seconds(step.get('at', previous_end), where + '.at')
+            if at < previous_end:
+                raise ValueError("{0}.at: steps must be in order, and can't start before the previous ramp "
+                                 "ends".format(where))
+            previous_end = at
+
+            if step.get('clear', False):
+                if any(direction in step for direction in DIRECTIONS):
+                    raise ValueError("{0}: a step can't both clear and set parameters".format(where))
+                events.append((at, index, _clear_commands(network_interface, state), "clear"))
+                state = dict()
+                continue
+
+            # the parameters of every direction before and after this step
+            targets = dict()
+            for direction, params in DIRECTIONS.items():
+                if direction not in step:
+                    continue
+                values = step[direction]
+                if not isinstance(values, dict):
+                    raise ValueError("{0}.{1}: expected a table".format(where, direction))
+                unknown = set(values.keys()) - set(params.keys())
+                if len(unknown) > 0:
+                    raise ValueError("{0}.{1}: unknown parameters {2}".format(where, direction, sorted(unknown)))
+                target = dict(state.get(direction, dict()))
+                for name, (parse, default) in params.items():
+                    if name in values:
+                        try:
+                            target[name] = parse(values[name])
+                        except (ValueError, TypeError) as e:
+                            raise ValueError("{0}.{1}.{2}: {3}".format(where, direction, name, e))
+                    elif name not in target:
+                        if default is None:
+                            raise ValueError("{0}.{1}: \"{2}\" is required the first time".format(where, direction,
+                                                                                                   name))
+                        target[name] = default
+                targets[direction] = target
+            if len(targets) == 0:
+                raise ValueError("{0}: a step needs \"egress\", \"ingress\", or \"clear\"".format(where))
+
+            ramp = _parse_seconds(step.get('ramp', 0), where + '.ramp')
+            if ramp > 0 and any(direction not in state for direction in targets):
+                raise ValueError("{0}: can't ramp parameters that were never set".format(where))
+            ramp_step = _parse_seconds(step.get('ramp_step', 1), where + '.ramp_step')
+            if ramp > 0 and ramp_step <= 0:
+                raise ValueError("{0}.ramp_step: expected a positive time".format(where))
+            num_steps = max(1, math.ceil(ramp / ramp_step)) if ramp > 0 else 1
+            previous_end = at + ramp
+
+            # a ramp is a sequence of events, the last of which reaches the target
+            for k in range(1, num_steps + 1):
+                fraction = k / num_steps
+                t = at + (ramp * fraction if ramp > 0 else 0.0)
+                for direction, target in targets.items():
+                    start = state.get(direction, target)
+                    params = {name: start[name] + (target[name] - start[name]) * fraction for name in target.keys()}
+                    label = "{0} {1}".format(direction, ' '.join("{0}={1:.6g}".format(name, value)
+                                                                 for name, value in params.items()))
+                    events.append((t, index, _direction_commands(network_interface, direction, params), label))
+            state.update(targets)
+
+    # a stable sort keeps the order of an interface's events that share a time
+    order = sorted(range(len(events)), key=lambda i: events[i][0])
+    return CompiledScenario(times=np.array([events[i][0] for i in order], dtype='float64'),
+                            interfaces=np.array([events[i][1] for i in order], dtype='int32'),
+                            names=names,
+                            commands=[events[i][2] for i in order],
+                            labels=[events[i][3] for i in order])
+
+
+@dataclass
+class ScenarioReport:
+    planned: np.ndarray  # the planned time of every event, in seconds after the start
+    started: np.ndarray  # when every event's `tc` batch was submitted, in seconds after the start (NaN if never)
+    finished: np.ndarray  # when every event's `tc` batch completed, in seconds after the start (NaN if never)
+    returncodes: np.ndarray  # the return code of every event's `tc` batch (-1 if never run)
+
+    def lateness(self) -> np.ndarray:
+        # seconds between the planned time of every event that ran and the time its rules were in place
+        done = ~np.isnan(self.finished)
+        return self.finished[done] - self.planned[done]
+
+    def events_table(self, compiled: CompiledScenario) -> list:
+        """
+        :param compiled: the CompiledScenario that was run
+        :return: a table (a list of rows, the first being the header) for `tabulate` of every event's planned and actual
+        times
+        """
+        table = [['interface', 'event', 'planned [s]', 'started [s]', 'applied [s]', 'lateness [ms]', 'return code']]
+        for i in range(len(self.planned)):
+            table.append([compiled.names[compiled.interfaces[i]], compiled.labels[i], round(self.planned[i], 3),
+                          round(self.started[i], 3), round(self.finished[i], 3),
+                          round((self.finished[i] - self.planned[i]) * 1e3, 3), int(self.returncodes[i])])
+        return table
+
+    def table(self) -> list:
+        """
+        :return: a summary table (a list of rows, the first being the header) for `tabulate`
+        """
+        lateness = self.lateness() * 1e3
+        table = [['events', 'applied', 'failed', 'not run', 'mean lateness [ms]', 'p50 [ms]', 'p95 [ms]', 'max [ms]']]
+        row = [len(self.planned), int(np.count_nonzero(self.returncodes == 0)),
+               int(np.count_nonzero(self.returncodes > 0)), int(np.count_nonzero(self.returncodes < 0))]
+        if len(lateness) > 0:
+            row += [round(float(np.mean(lateness)), 3)] + \
+                   [round(float(value), 3) for value in np.percentile(lateness, [50, 95, 100])]
+        else:
+            row += [float('nan')] * 4
+        table.append(row)
+        return table
+
+
+async def run(compiled: CompiledScenario, shaper, should_stop=lambda: False) -> ScenarioReport:
+    """
+    applies every event of a compiled scenario at its planned time (measured on the monotonic clock from the call). an
+    interface's events are applied in order, so an event waits for the previous one on the same interface if it's
+    still running; events on different interfaces run concurrently on the shaper's workers
+    :param compiled: a CompiledScenario
+    :param shaper: a `shaping.Shaper`
+    :param should_stop: a function that returns True once the scenario should stop early
+    :return: a ScenarioReport
+    """
+    n = len(compiled)
+    report = ScenarioReport(planned=compiled.times.copy(), started=np.full((n,), np.nan),
+                            finished=np.full((n,), np.nan), returncodes=np.full((n,), -1, dtype='int32'))
+    start = time.monotonic()
+    previous = dict()  # interface index -> the task of its last event
+
+    async def apply(i: int, after):
+        if after is not None:
+            await asyncio.gather(after, return_exceptions=True)
+        report.started[i] = time.monotonic() - start
+        ret = await shaper.submit_commands(compiled.names[compiled.interfaces[i]], compiled.commands[i])
+        report.finished[i] = time.monotonic() - start
+        report.returncodes[i] = ret.returncode
+        if ret.returncode != 0:
+            print("{0}: {1} failed: {2}".format(compiled.names[compiled.interfaces[i]], compiled.labels[i],
+                                                ret.stderr.decode('utf-8').strip()))
+
+    for i in range(n):
+        # sleep until the event's planned time, waking up at least every second to check `should_stop`
+        while not should_stop():
+            delay = start + compiled.times[i] - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(min(delay, 1.0))
+        if should_stop():
+            break
+        index = int(compiled.interfaces[i])
+        previous[index] = asyncio.ensure_future(apply(i, previous.get(index)))
+
+    if len(previous) > 0:
+        await asyncio.gather(*previous.values(), return_exceptions=True)
+    return report
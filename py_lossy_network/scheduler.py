@@ -0,0 +1,148 @@
+# standard library includes
+import asyncio
+import functools
+import time
+import zlib
+from dataclasses import dataclass
+
+# internal includes
+from py_lossy_network import metrics
+from py_lossy_network import utils
+
+
+@dataclass
+class ScheduleState:
+    period: float  # seconds between updates
+    deadline: float  # monotonic time of the next update
+    ticks: int = 0  # number of updates started
+    missed: int = 0  # number of deadlines skipped because the loop was late or the previous update was still running
+    last_lateness: float = 0.0  # seconds between the last update's deadline and its start
+    max_lateness: float = 0.0  # largest `last_lateness` seen
+    failures: int = 0  # number of updates that raised an exception or whose `tc` call failed
+    last_error: str = None  # the error of the last update, while updates keep failing (None once one succeeds)
+
+
+def _observe_update(network_interface: str, state: ScheduleState, start: float, future: asyncio.Future):
+    # record how long an update took from its submission, including the wait for a free worker
+    metrics.observe('update_seconds', "durations of scheduled updates, from submission to completion",
+                    time.perf_counter() - start)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        cause, text = metrics.failure_cause(error), str(error) or type(error).__name__
+    else:
+        ret = future.result()
+        if ret is None or ret.returncode == 0:
+            state.last_error = None
+            return
+        stderr = ret.stderr.decode('utf-8', 'replace') if isinstance(ret.stderr, bytes) else str(ret.stderr or '')
+        cause, text = utils.tc_failure_cause(ret), stderr.strip() or "`tc` exited with {0}".format(ret.returncode)
+    # count every failure by cause, but report only the first of a streak, not one per tick
+    state.failures += 1
+    metrics.count('update_failures_total', "scheduled updates that raised an exception or whose `tc` call failed, by cause",
+                  cause=cause)
+    if state.last_error is None:
+        print("updating {0} failed: {1}".format(network_interface, text))
+    state.last_error = text
+
+
+class TickScheduler:
+    """
+    updates every interface on its own period, against deadlines on the monotonic clock. deadlines stay on a fixed grid
+    (the next one is always a whole number of periods after the first), so time spent applying rules never accumulates
+    as drift; and when the loop falls behind, the stale deadlines are counted and skipped instead of queued. the first
+    deadline of each interface is offset by a fraction of its period derived from its name, which staggers updates that
+    share a period
+    """
+
+    def __init__(self, default_period: float = 1.0):
+        """
+        :param default_period: the update period, in seconds, of interfaces whose config doesn't set one
+        """
+        self.default_period = default_period
+        self._states = dict()
+        self._in_flight = dict()
+        self._wake = None
+
+    def period(self, config) -> float:
+        return config.update_period if config.update_period is not None else self.default_period
+
+    def wake(self):
+        """
+        wakes the scheduler up early, e.g. after an interface was added or its period changed
+        """
+        if self._wake is not None:
+            self._wake.set()
+
+    def stats(self) -> dict:
+        """
+        :return: a dict mapping interface names to their ScheduleStates
+        """
+        return dict(self._states)
+
+    def _due(self, network_interfaces: dict, now: float) -> list:
+        # forget interfaces that are no longer shaped
+        for k in list(self._states.keys()):
+            if k not in network_interfaces:
+                self._states.pop(k)
+
+        due = []
+        for k, config in list(network_interfaces.items()):
+            period = self.period(config)
+            state = self._states.get(k)
+            if state is None or state.period != period:
+                offset = (zlib.crc32(k.encode('utf-8')) % 1000) / 1000.0 * period
+                state = ScheduleState(period=period, deadline=now + offset) if state is None else state
+                state.period = period
+                state.deadline = min(state.deadline, now + offset)
+                self._states[k] = state
+            if state.deadline > now:
+                continue
+
+            # every whole period that went by since the deadline is a stale tick: count it and skip it
+            lateness = now - state.deadline
+            stale = int(lateness // period)
+            state.deadline += (stale + 1) * period
+            future = self._in_flight.get(k)
+            if future is not None and not future.done():
+                state.missed += stale + 1
+                continue
+            state.missed += stale
+            state.ticks += 1
+            state.last_lateness = lateness - stale * period
+            state.max_lateness = max(state.max_lateness, state.last_lateness)
+            metrics.observe('update_lateness_seconds', "time between an update's deadline and its start",
+                            state.last_lateness)
+            due.append(k)
+        return due
+
+    async def run(self, shaper, network_interfaces: dict, should_stop):
+        """
+        runs until `should_stop()` returns True, submitting each interface's update to the shaper when it is due
+        :param shaper: a `shaping.Shaper`
+        :param network_interfaces: a dict mapping interface names to NetworkConfigs (may change while running)
+        :param should_stop: a function that returns True once the scheduler should stop
+        """
+        self._wake = asyncio.Event()
+        while not should_stop():
+            now = time.monotonic()
+            for k in self._due(network_interfaces, now):
+                self._in_flight[k] = shaper.submit(k, network_interfaces[k])
+                self._in_flight[k].add_done_callback(functools.partial(_observe_update, k, self._states[k],
+                                                                       time.perf_counter()))
+            for k in [k for k, future in self._in_flight.items() if future.done()]:
+                self._in_flight.pop(k)
+
+            # sleep until the earliest deadline (waking up at least every second to check `should_stop`)
+            timeout = 1.0
+            if len(self._states) > 0:
+                timeout = min(timeout, max(0.0, min(state.deadline for state in self._states.values()) - time.monotonic()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+        if len(self._in_flight) > 0:
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
@@ -0,0 +1,237 @@
+# standard library includes
+import asyncio
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# internal includes
+from py_lossy_network import metrics
+from py_lossy_network import trajectory
+from py_lossy_network import units
+from py_lossy_network import utils
+
+
+def interface_commands(network_interface: str, config, samples: dict) -> dict:
+    """
+    draws the next sample of every configured parameter of a network interface and builds the `tc` commands that apply
+    them
+    :param network_interface: the name of the network interface
+    :param config: the interface's NetworkConfig
+    :param samples: the interface's trajectories (see `trajectory.interface_trajectories`)
+    :return: a dict mapping 'ingress' and/or 'egress' to a tuple of (the sampled values as a tuple of floats, a list of
+    `tc` commands without the leading "tc")
+    """
+    commands = dict()
+    if config.avg_ingress_bw is not None and config.std_dev_ingress_bw is not None and config.ingress_burst is not None:
+        bw = samples['ingress_bw'].next()
+        commands['ingress'] = ((bw,), utils.ingress_commands(network_interface, units.format_rate(bw),
+                                                             units.format_size(config.ingress_burst)))
+
+    if config.avg_egress_bw is not None and config.std_dev_egress_bw is not None and \
+        config.egress_burst is not None and config.egress_latency is not None and \
+            config.avg_egress_loss is not None and config.std_dev_egress_loss is not None and \
+            config.egress_avg_delay is not None and config.egress_std_dev_delay is not None:
+        bw = samples['egress_bw'].next()
+        loss = samples['egress_loss'].next()
+        delay = samples['egress_delay'].next()
+        commands['egress'] = ((bw, loss, delay), utils.egress_commands(network_interface, units.format_rate(bw),
+                                                                       units.format_size(config.egress_burst),
+                                                                       units.format_time(config.egress_latency),
+                                                                       units.format_percent(loss), units.format_time(delay),
+                                                                       units.format_time(config.egress_std_dev_delay)))
+    return commands
+
+
+def find_external_changes(tc_qdisc_show_output: str, applied: dict) -> list:
+    """
+    compares the output of `tc qdisc show` on an interface with the rules we believe we applied to it
+    :param tc_qdisc_show_output: the output of `tc qdisc show dev <INTERFACE>`
+    :param applied: a dict mapping 'ingress' and/or 'egress' to the (values, commands) we applied
+    :return: a list of the directions ('ingress' and/or 'egress') whose rules are missing or were changed by someone else
+    """
+    changed = []
+    if 'ingress' in applied and re.search(r'qdisc ingress ffff:', tc_qdisc_show_output) is None:
+        changed.append('ingress')
+    if 'egress' in applied:
+        tbf = re.search(r'qdisc tbf 1: root.* rate (\S+)', tc_qdisc_show_output)
+        netem = re.search(r'qdisc netem 10: parent 1:1', tc_qdisc_show_output)
+        if tbf is None or netem is None:
+            changed.append('egress')
+        else:
+            # compare with the rate we gave `tc`, not the raw sample; `tc` prints it rounded to a few significant digits,
+            # so only a clearly different rate counts as a change
+            try:
+                rate = units.parse_rate(tbf.group(1))
+            except ValueError:
+                rate = None
+            expected = units.parse_rate(units.format_rate(applied['egress'][0][0]))
+            if rate is None or abs(rate - expected) > 0.01 * expected:
+                changed.append('egress')
+    return changed
+
+
+class Shaper:
+    """
+    applies the next sample of every interface's parameters. interfaces are updated concurrently on a bounded pool of
+    worker threads, so neither the sampling nor the `tc` calls ever run on the event loop's thread.
+
+    the shaper remembers the parameters it last applied to each interface and direction, and doesn't call `tc` again
+    until a sample differs from them by more than `tolerance` (relative). the remembered state is dropped by
+    `invalidate`, and by `check` when the rules on the interface no longer look like the ones we applied
+    """
+
+    def __init__(self, max_concurrency: int = 8, tolerance: float = 0.0, verify_interval: float = 30.0):
+        """
+        :param max_concurrency: the largest number of interfaces updated at the same time
+        :param tolerance: the largest relative change of a sampled parameter that is not worth a `tc` call (0 means
+        only skip updates that produce exactly the same `tc` commands)
+        :param verify_interval: seconds between checks (with `tc qdisc show`) that the rules of an interface have not
+        been changed by someone else (None to never check)
+        """
+        self.max_concurrency = max_concurrency
+        self.tolerance = tolerance
+        self.verify_interval = verify_interval
+        self.num_applied = 0  # number of updates that called `tc`
+        self.num_skipped = 0  # number of updates skipped because the interface already had (nearly) those parameters
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='shaper')
+        self._trajectories = dict()
+        self._applied = dict()
+        self._verified = dict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, network_interface: str, trajectories: dict = None):
+        """
+        forgets an interface's trajectories, so they are rebuilt from its (new) config on the next update, and the rules
+        we last applied to it, so the next update is applied no matter what
+        :param network_interface: the name of the network interface
+        :param trajectories: the trajectories of the interface's new config, if the caller already built them (see
+        `trajectory.interface_trajectories`)
+        """
+        with self._lock:
+            stale = self._trajectories.pop(network_interface, None)
+            self._applied.pop(network_interface, None)
+            if trajectories is not None:
+                self._trajectories[network_interface] = trajectories
+        if stale is not None and stale is not trajectories:
+            for series in stale.values():
+                series.close()
+
+    def check(self, network_interface: str, tc_qdisc_show_output: str) -> list:
+        """
+        forgets the rules we last applied to an interface if they are missing from, or differ from, its current rules
+        :param network_interface: the name of the network interface
+        :param tc_qdisc_show_output: the output of `tc qdisc show dev <INTERFACE>`
+        :return: a list of the directions ('ingress' and/or 'egress') that were changed by someone else
+        """
+        with self._lock:
+            applied = self._applied.get(network_interface, dict())
+            changed = find_external_changes(tc_qdisc_show_output, applied)
+            for direction in changed:
+                applied.pop(direction, None)
+            self._verified[network_interface] = time.monotonic()
+        return changed
+
+    def _unchanged(self, new: tuple, old: tuple) -> bool:
+        # whether a new sample is close enough to what is already applied that it isn't worth a `tc` call
+        if new[1] == old[1]:
+            return True
+        return self.tolerance > 0 and all(abs(n - o) <= self.tolerance * abs(o) for n, o in zip(new[0], old[0]))
+
+    @metrics.timed('shaper_apply_seconds', "durations of `Shaper.apply`, including skipped updates")
+    def apply(self, network_interface: str, config) -> subprocess.CompletedProcess:
+        """
+        applies the next sample of an interface's parameters as one `tc` batch, skipping the directions whose parameters
+        are already applied. this blocks, so call it from a worker
+        :param network_interface: the name of the network interface
+        :param config: the interface's NetworkConfig
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        with self._lock:
+            samples = self._trajectories.get(network_interface)
+            if samples is None:
+                samples = trajectory.interface_trajectories(network_interface, config)
+                self._trajectories[network_interface] = samples
+            applied = self._applied.setdefault(network_interface, dict())
+            verified = self._verified.get(network_interface)
+
+        # every so often, make sure nobody else has changed the rules underneath us
+        if self.verify_interval is not None and len(applied) > 0 and \
+                (verified is None or time.monotonic() - verified > self.verify_interval):
+            proc = utils.show_tc_rules(network_interface)
+            if proc.returncode == 0:
+                self.check(network_interface, proc.stdout.decode('utf-8'))
+
+        directions = interface_commands(network_interface, config, samples)
+        stale = {direction: entry for direction, entry in directions.items()
+                 if direction not in applied or not self._unchanged(entry, applied[direction])}
+        if len(stale) == 0:
+            with self._lock:
+                self.num_skipped += 1
+            return subprocess.CompletedProcess(args=[], returncode=0, stdout=b"", stderr=b"")
+
+        with self._lock:
+            self.num_applied += 1
+        ret = utils.run_tc_batch([command for entry in stale.values() for command in entry[1]])
+        with self._lock:
+            if ret.returncode == 0:
+                applied.update(stale)
+            else:
+                # we don't know how much of the batch made it, so don't trust any of it
+                applied.clear()
+        return ret
+
+    def apply_commands(self, network_interface: str, commands: list) -> subprocess.CompletedProcess:
+        """
+        runs prebuilt `tc` commands on an interface (e.g. a scenario's) as one batch, and forgets the rules we last
+        applied to it, since these replace them. this blocks, so call it from a worker
+        :param network_interface: the name of the network interface
+        :param commands: a list of `tc` commands without the leading "tc"
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        with self._lock:
+            self._applied.pop(network_interface, None)
+            self.num_applied += 1
+        return utils.run_tc_batch(commands)
+
+    def submit_commands(self, network_interface: str, commands: list) -> asyncio.Future:
+        """
+        schedules `apply_commands` on a worker thread. call this from the event loop
+        :param network_interface: the name of the network interface
+        :param commands: a list of `tc` commands without the leading "tc"
+        :return: an asyncio Future whose result is a CompletedProcess object
+        """
+        return asyncio.get_running_loop().run_in_executor(self._executor, self.apply_commands, network_interface,
+                                                          commands)
+
+    def submit(self, network_interface: str, config) -> asyncio.Future:
+        """
+        schedules `apply` on a worker thread. call this from the event loop
+        :param network_interface: the name of the network interface
+        :param config: the interface's NetworkConfig
+        :return: an asyncio Future whose result is a CompletedProcess object
+        """
+        return asyncio.get_running_loop().run_in_executor(self._executor, self.apply, network_interface, config)
+
+    async def tick(self, network_interfaces: dict) -> dict:
+        """
+        updates every interface once, concurrently
+        :param network_interfaces: a dict mapping interface names to NetworkConfigs
+        :return: a dict mapping interface names to CompletedProcess objects
+        """
+        keys = list(network_interfaces.keys())
+        with metrics.timer('tick_seconds', "durations of `Shaper.tick`, i.e. of updating every interface once"):
+            results = await asyncio.gather(*[self.submit(k, network_interfaces[k]) for k in keys])
+        return dict(zip(keys, results))
+
+    def close(self):
+        """
+        waits for the updates in flight, stops the worker threads, and closes the trajectories
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            trajectories, self._trajectories = self._trajectories, dict()
+        for samples in trajectories.values():
+            for series in samples.values():
+                series.close()
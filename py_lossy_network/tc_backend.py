@@ -0,0 +1,198 @@
+# standard library includes
+import os
+import queue
+import shlex
+import subprocess
+import threading
+
+# a `tc` command that changes nothing, used to check that a backend works (every Linux network namespace has `lo`)
+PROBE_COMMAND = 'qdisc show dev lo'
+
+
+def default_tc_command(privileged: bool = True) -> list:
+    """
+    gets the command used to invoke `tc`. by default this is "sudo tc" (or just "tc" to only read rules and statistics),
+    but it may be overridden with the PY_LOSSY_NETWORK_TC environment variable (e.g. to point at a stub `tc` for
+    benchmarking)
+    :param privileged: whether the commands change rules, which needs root
+    :return: the command as a list of strs
+    """
+    return shlex.split(os.environ.get('PY_LOSSY_NETWORK_TC', 'sudo tc' if privileged else 'tc'))
+
+
+class SubprocessBackend:
+    """
+    runs every group of `tc` commands in a freshly spawned `tc` process. this is the slow but dependable fallback
+    """
+
+    def __init__(self, tc_command: list = None):
+        """
+        :param tc_command: the command used to invoke `tc` as a list of strs (defaults to `default_tc_command()`)
+        """
+        self.tc_command = tc_command if tc_command is not None else default_tc_command()
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        """
+        runs a list of `tc` commands (without the leading "tc"). a single command is passed on the command line, more
+        than one goes through `tc -batch`, which stops at the first command that fails
+        :param commands: a list of `tc` commands represented as strs
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        try:
+            if len(commands) == 1:
+                ret = subprocess.run(self.tc_command + shlex.split(commands[0]), capture_output=True)
+            else:
+                ret = subprocess.run(self.tc_command + ['-batch', '-'], input='\n'.join(commands).encode('utf-8'), capture_output=True)
+        except (OSError, ValueError) as e:
+            # the `tc` executable is missing or not runnable, or a command isn't valid shell syntax
+            ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=str(e).encode('utf-8'))
+        return ret
+
+    def close(self):
+        pass
+
+
+class BatchBackend:
+    """
+    streams `tc` commands to a single long-lived `tc -OK -force -batch -` process. `tc` prints "OK" on stdout after each
+    successful command and "Command failed" on stderr after each failed one, which gives us a per-command status without
+    paying for a fork/exec (and a `sudo`) per rule
+    """
+
+    def __init__(self, tc_command: list = None, timeout: float = 5.0):
+        """
+        :param tc_command: the command used to invoke `tc` as a list of strs (defaults to `default_tc_command()`)
+        :param timeout: how long to wait, in seconds, for the status of a single command before giving up on the process
+        """
+        self.tc_command = tc_command if tc_command is not None else default_tc_command()
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._proc = subprocess.Popen(self.tc_command + ['-OK', '-force', '-batch', '-'], stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        self._lines = queue.Queue()
+        for name, stream in (('stdout', self._proc.stdout), ('stderr', self._proc.stderr)):
+            threading.Thread(target=self._read, args=(name, stream, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _read(name: str, stream, lines: queue.Queue):
+        # forward every line the `tc` process prints to the queue, tagged with the stream it came from
+        for line in iter(stream.readline, b''):
+            lines.put((name, line))
+        lines.put((name, None))
+
+    def _stop(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._proc.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+        self._proc = None
+
+    def _run_one(self, command: str) -> (bool, bytes):
+        # write the command and wait for the process to either acknowledge it or report its failure
+        self._proc.stdin.write(command.encode('utf-8') + b'\n')
+        stderr = b''
+        while True:
+            name, line = self._lines.get(timeout=self.timeout)
+            if line is None:
+                raise BrokenPipeError("`tc` exited unexpectedly")
+            if name == 'stdout':
+                if line.strip() == b'OK':
+                    return True, stderr
+            elif line.startswith(b'Command failed'):
+                return False, stderr
+            else:
+                stderr += line
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        """
+        runs a list of `tc` commands (without the leading "tc") on the long-lived process, stopping at the first command
+        that fails. if the process has died it is restarted once
+        :param commands: a list of `tc` commands represented as strs
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._proc is None or self._proc.poll() is not None:
+                        self._start()
+                    for command in commands:
+                        ok, stderr = self._run_one(command)
+                        if not ok:
+                            return subprocess.CompletedProcess(args=command, returncode=1, stdout=b"", stderr=stderr)
+                    return subprocess.CompletedProcess(args=commands, returncode=0, stdout=b"", stderr=b"")
+                except (OSError, queue.Empty):
+                    # the process died or hung, so throw it away; the next attempt starts a new one
+                    self._stop()
+        return subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed",
+                                           stderr=b"the `tc` process could not be started, died, or hung")
+
+    def close(self):
+        """
+        closes the long-lived `tc` process
+        """
+        with self._lock:
+            self._stop()
+
+
+class PooledBackend:
+    """
+    spreads `tc` commands over several backends (e.g. several long-lived `tc` processes) so that updates issued from
+    different threads run in parallel instead of queueing behind one another
+    """
+
+    def __init__(self, backends: list):
+        """
+        :param backends: the backend objects in the pool
+        """
+        self.backends = backends
+        self._idle = queue.Queue()
+        for backend in backends:
+            self._idle.put(backend)
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        """
+        runs a list of `tc` commands (without the leading "tc") on whichever backend is idle, waiting for one if necessary
+        :param commands: a list of `tc` commands represented as strs
+        :return: a CompletedProcess object specifying success / failure of process
+        """
+        backend = self._idle.get()
+        try:
+            return backend.run(commands)
+        finally:
+            self._idle.put(backend)
+
+    def close(self):
+        """
+        closes every backend in the pool
+        """
+        for backend in self.backends:
+            backend.close()
+
+
+def default_backend(size: int = 1):
+    """
+    gets the fastest backend that works on this machine: `BatchBackend`s if a `tc` process starts and acknowledges a
+    command that changes nothing (`PROBE_COMMAND`), otherwise a `SubprocessBackend`. a process that merely starts isn't
+    enough: `sudo` may refuse to run `tc`, or `tc` may not know `-OK` and exit at once
+    :param size: the number of `tc` processes to run in parallel (more than 1 gives a `PooledBackend`)
+    :return: a backend object
+    """
+    backends = []
+    for _ in range(size):
+        backend = BatchBackend()
+        backends.append(backend)
+        if backend.run([PROBE_COMMAND]).returncode != 0:
+            for started in backends:
+                started.close()
+            return SubprocessBackend()
+    return backends[0] if size == 1 else PooledBackend(backends)
@@ -0,0 +1,207 @@
+# standard library includes
+import threading
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import analysis
+from py_lossy_network.results import ResultsReader
+
+# the trace-driven sampling models
+TRACE_MODELS = ('replay', 'empirical')
+
+# where the trajectory of each shaped parameter comes from in a results file: the metric, and the factor that converts it
+# to the parameter's units (bits per second, fraction, or seconds). the recorded delays are round-trip times, which
+# `delay_scale` (default 0.5) turns into the one-way delay applied on egress
+TRACE_METRICS = {
+    'ingress_bw': ('bitrate_kbps', 1e3),
+    'egress_bw': ('bitrate_kbps', 1e3),
+    'egress_loss': ('percent_lost_udp', 1.0),
+    'egress_delay': ('delay_ms', 1e-3),
+}
+
+
+class TraceSource:
+    """
+    reads the time series of one metric of a results file, `chunk_runs` runs at a time, so that only one chunk is ever
+    in memory. per-run arrays (e.g. 'bitrate_kbps') are read back to back; per-run scalars (e.g. 'percent_lost_udp') are
+    held for as many samples as the run has 'bitrate_kbps' measurements, so they stay aligned with the bitrate when
+    replayed. NaNs (e.g. the loss of a run that received nothing) are dropped
+    """
+
+    def __init__(self, path: str, metric: str, scale: float = 1.0, client: str = None, chunk_runs: int = 1024):
+        """
+        :param path: the path of the results file
+        :param metric: the name of the metric (e.g. 'bitrate_kbps')
+        :param scale: the factor every sample is multiplied by
+        :param client: only read the runs of this client IP (None for every run)
+        :param chunk_runs: the number of runs read at a time
+        """
+        self.path = path
+        self.metric = metric
+        self.scale = scale
+        self.client = client
+        self.chunk_runs = chunk_runs
+        with ResultsReader(path) as reader:
+            if metric not in reader.keys():
+                raise ValueError("\"{0}\" has no \"{1}\" dataset".format(path, metric))
+            self.num_runs = len(reader)
+
+    def chunks(self, reader: ResultsReader, start: int = 0):
+        """
+        reads the file chunk by chunk
+        :param reader: a ResultsReader of the file
+        :param start: the first run
+        :return: a generator of (the run after the chunk, the chunk's samples as a numpy array) tuples
+        """
+        for first in range(start, self.num_runs, self.chunk_runs):
+            stop = min(first + self.chunk_runs, self.num_runs)
+            if reader.is_ragged(self.metric):
+                values, offsets = reader.samples(self.metric, first, stop)
+                counts = np.diff(offsets)
+            else:
+                values = reader.column(self.metric, first, stop).astype('float64')
+                counts = np.ones((stop - first,), dtype='int64')
+                if 'bitrate_kbps' in reader.keys() and reader.is_ragged('bitrate_kbps'):
+                    held = np.diff(reader.samples('bitrate_kbps', first, stop)[1])
+                    counts = held if np.any(held > 0) else counts
+            if self.client is not None:
+                keep = reader.column('client_ip', first, stop) == self.client
+                values = values[np.repeat(keep, counts)] if reader.is_ragged(self.metric) else values[keep]
+                counts = counts[keep]
+            if not reader.is_ragged(self.metric):
+                values = np.repeat(values, counts)
+            values = values[~np.isnan(values)] * self.scale
+            yield stop, values
+
+
+class Replay:
+    """
+    replays a recorded time series sample by sample, starting over at the end. the series is read from disk a chunk at
+    a time (see `TraceSource`), through a file that stays open until `close`
+    """
+
+    def __init__(self, source: TraceSource, low: float = -np.inf, high: float = np.inf):
+        self.source = source
+        self.low = low
+        self.high = high
+        self._reader = None
+        self._chunks = None
+        self._buffer = np.empty((0,))
+        self._lock = threading.Lock()  # guards the reader, which a worker may be reading while another thread closes it
+
+    def _next_chunk(self) -> np.ndarray:
+        # reads the next non-empty chunk, starting over at the end of the file
+        if self._reader is None:
+            self._reader = ResultsReader(self.source.path)
+        for attempt in range(2):
+            if self._chunks is None:
+                self._chunks = self.source.chunks(self._reader)
+            for _, values in self._chunks:
+                if len(values) > 0:
+                    return values
+            self._chunks = None
+        raise ValueError("\"{0}\" has no \"{1}\" samples{2}".format(
+            self.source.path, self.source.metric, "" if self.source.client is None else " of " + self.source.client))
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        pieces = []
+        filled = 0
+        with self._lock:
+            while filled < n:
+                if len(self._buffer) == 0:
+                    self._buffer = self._next_chunk()
+                piece = self._buffer[:n - filled]
+                self._buffer = self._buffer[len(piece):]
+                pieces.append(piece)
+                filled += len(piece)
+        return np.clip(np.concatenate(pieces), self.low, self.high)
+
+    def close(self):
+        """
+        closes the results file (it is opened again if more samples are needed)
+        """
+        with self._lock:
+            if self._reader is not None:
+                self._chunks = None
+                self._reader.close()
+                self._reader = None
+
+
+class Empirical:
+    """
+    independent samples from the empirical distribution of a recorded time series. the distribution is built in one
+    streaming pass over the file (a fixed-bin histogram, see `analysis.RunningStats`) and tabulated as an inverse CDF of
+    `table_size` points, so every draw costs O(1) and memory doesn't depend on the length of the trace
+    """
+
+    def __init__(self, source: TraceSource, bins: np.ndarray, low: float = -np.inf, high: float = np.inf,
+                 table_size: int = 4096):
+        """
+        :param source: the TraceSource of the series
+        :param bins: the histogram bin edges, in the units of the recorded metric
+        :param low: the smallest value drawn
+        :param high: the largest value drawn
+        :param table_size: the number of points of the inverse CDF table
+        """
+        self.low = low
+        self.high = high
+        stats = analysis.RunningStats(bins)
+        with ResultsReader(source.path) as reader:
+            for _, values in source.chunks(reader):
+                stats.update(values / source.scale)
+        if stats.count == 0:
+            raise ValueError("\"{0}\" has no \"{1}\" samples{2}".format(
+                source.path, source.metric, "" if source.client is None else " of " + source.client))
+        self.table = stats.quantiles(np.linspace(0.0, 1.0, table_size)) * source.scale
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        # look every uniform draw up in the inverse CDF table, interpolating between its points
+        position = rng.random(n) * (len(self.table) - 1)
+        index = np.minimum(position.astype(np.int64), len(self.table) - 2)
+        fraction = position - index
+        values = self.table[index] + fraction * (self.table[index + 1] - self.table[index])
+        return np.clip(values, self.low, self.high)
+
+
+def check_params(params: dict):
+    """
+    checks, without reading any samples, that the parameters of a trace model name a readable results file with at
+    least one of the recorded metrics
+    :param params: the model parameters (see `make_trace_model`)
+    """
+    if 'trace' not in params:
+        raise ValueError("the trace models need trace=<RESULTS_FILE>")
+    if params.get('delay_scale', 0.5) <= 0:
+        raise ValueError("delay_scale must be positive")
+    with ResultsReader(params['trace']) as reader:
+        if not any(metric in reader.keys() for metric, _ in TRACE_METRICS.values()):
+            raise ValueError("\"{0}\" has none of the datasets {1}".format(
+                params['trace'], sorted(set(metric for metric, _ in TRACE_METRICS.values()))))
+
+
+def make_trace_model(name: str, parameter: str, params: dict, low: float, high: float):
+    """
+    creates a trace-driven sampling model of a shaped parameter
+    :param name: one of `TRACE_MODELS`
+    :param parameter: one of the keys of `TRACE_METRICS`
+    :param params: the model parameters: 'trace' (the path of a results file, required), 'client' (only use the runs of
+    this client IP), and 'delay_scale' (the fraction of the recorded round-trip delays applied as egress delay)
+    :param low: the smallest value the parameter may take
+    :param high: the largest value the parameter may take
+    :return: a model object
+    """
+    if 'trace' not in params:
+        raise ValueError("the \"{0}\" model needs trace=<RESULTS_FILE>".format(name))
+    metric, scale = TRACE_METRICS[parameter]
+    if parameter == 'egress_delay':
+        if params.get('delay_scale', 0.5) <= 0:
+            raise ValueError("delay_scale must be positive")
+        scale *= params.get('delay_scale', 0.5)
+    source = TraceSource(params['trace'], metric, scale, params.get('client'))
+    if name == 'replay':
+        return Replay(source, low, high)
+    elif name == 'empirical':
+        return Empirical(source, analysis.DEFAULT_BINS[metric], low, high)
+    raise ValueError("\"{0}\" is not a valid trace model. Valid models are: {1}".format(name, list(TRACE_MODELS)))
@@ -0,0 +1,305 @@
+# standard library includes
+import zlib
+
+# external library includes
+import numpy as np
+
+# internal includes
+from py_lossy_network import trace
+from py_lossy_network import units
+
+# the sampling models understood by `make_model`
+MODELS = ('normal', 'truncated_normal', 'ar1', 'gilbert_elliott') + trace.TRACE_MODELS
+
+# the optional model parameters and how to parse them from the command line (e.g. "correlation=0.9", "bad_bw=100kbit")
+MODEL_PARAMS = {
+    'seed': int,
+    'correlation': float,
+    'p': float,
+    'r': float,
+    'bad_bw': units.parse_rate,
+    'bad_loss': units.parse_percent,
+    'bad_delay': units.parse_time,
+    'trace': str,
+    'client': str,
+    'delay_scale': float,
+}
+
+
+class Normal:
+    """
+    independent, identically distributed normal samples, clipped to [low, high]
+    """
+
+    def __init__(self, mean: float, std_dev: float, low: float = -np.inf, high: float = np.inf):
+        self.mean = mean
+        self.std_dev = std_dev
+        self.low = low
+        self.high = high
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        return np.clip(rng.normal(self.mean, self.std_dev, n), self.low, self.high)
+
+
+class TruncatedNormal(Normal):
+    """
+    independent, identically distributed normal samples, redrawn (rather than clipped) until they fall in [low, high]
+    """
+
+    # after this many redraws, whatever is still out of bounds gets clipped (only happens if the mean is far outside)
+    max_redraws = 32
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        samples = rng.normal(self.mean, self.std_dev, n)
+        for _ in range(self.max_redraws):
+            out_of_bounds = np.flatnonzero((samples < self.low) | (samples > self.high))
+            if len(out_of_bounds) == 0:
+                break
+            samples[out_of_bounds] = rng.normal(self.mean, self.std_dev, len(out_of_bounds))
+        return np.clip(samples, self.low, self.high)
+
+
+class AR1(Normal):
+    """
+    a first-order autoregressive (i.e. sampled Ornstein-Uhlenbeck) process whose stationary distribution is normal with
+    the given mean and standard deviation, and whose correlation between consecutive samples is `correlation`. the state
+    carries over from one block to the next, so consecutive blocks form one continuous trajectory
+    """
+
+    def __init__(self, mean: float, std_dev: float, correlation: float, low: float = -np.inf, high: float = np.inf):
+        super().__init__(mean, std_dev, low, high)
+        if not 0.0 <= correlation < 1.0:
+            raise ValueError("the correlation must be at least 0 and less than 1, not {0}".format(correlation))
+        self.correlation = correlation
+        self._deviation = None  # deviation from the mean of the last sample generated
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        phi = self.correlation
+        innovations = rng.normal(0.0, self.std_dev * np.sqrt(1.0 - phi ** 2), n)
+        if self._deviation is None:
+            self._deviation = rng.normal(0.0, self.std_dev)
+
+        # x[t] = phi^(t+1) x[-1] + sum_k phi^(t-k) e[k], computed in closed form over chunks short enough that phi^-k
+        # stays well within floating point range
+        chunk = n if phi == 0.0 else max(1, int(np.log(1e8) / -np.log(phi)))
+        deviations = np.empty(n)
+        for start in range(0, n, chunk):
+            e = innovations[start:start + chunk]
+            if phi == 0.0:
+                deviations[start:start + len(e)] = e
+            else:
+                powers = phi ** np.arange(1, len(e) + 1)
+                deviations[start:start + len(e)] = powers * (self._deviation + np.cumsum(e / powers))
+            self._deviation = deviations[start + len(e) - 1]
+        return np.clip(self.mean + deviations, self.low, self.high)
+
+
+class GilbertElliott:
+    """
+    a two-state (good/bad) Markov model. every sample moves from the good state to the bad state with probability `p`
+    and from the bad state back to the good state with probability `r`; the value is drawn from the model of whichever
+    state the link is in. the state sequence is drawn from its own generator, so every parameter of an interface built
+    with the same state seed goes bad at the same time
+    """
+
+    def __init__(self, good, bad, p: float, r: float, state_rng: np.random.Generator):
+        if not (0.0 <= p <= 1.0 and 0.0 <= r <= 1.0):
+            raise ValueError("p and r must be probabilities between 0 and 1, not {0} and {1}".format(p, r))
+        self.good = good
+        self.bad = bad
+        self.p = p
+        self.r = r
+        self.state_rng = state_rng
+        # the first run starts in a state drawn from the stationary distribution (bad with probability p / (p + r)).
+        # `states` starts every new run in the state after the current one, so the current (empty) run is the other one
+        first_bad = p + r > 0 and bool(state_rng.random() < p / (p + r))
+        self._bad = not first_bad  # state of the current run
+        self._remaining = 0  # number of samples left in the current run
+
+    def _run_lengths(self, bad: bool, n: int) -> np.ndarray:
+        # the number of samples spent in a state before leaving it is geometrically distributed
+        return self.state_rng.geometric(max(self.r if bad else self.p, 1e-12), n)
+
+    def states(self, n: int) -> np.ndarray:
+        """
+        :param n: the number of samples
+        :return: a boolean array which is True wherever the link is in the bad state
+        """
+        pieces = [np.full(min(self._remaining, n), self._bad)]
+        filled = len(pieces[0])
+        self._remaining -= filled
+        while filled < n:
+            # draw a batch of alternating runs, starting with the state after the current one
+            num_pairs = max(1, int((n - filled) * max(self.p, self.r)))
+            lengths = np.empty(2 * num_pairs, dtype=np.int64)
+            lengths[0::2] = self._run_lengths(not self._bad, num_pairs)
+            lengths[1::2] = self._run_lengths(self._bad, num_pairs)
+            states = np.zeros(2 * num_pairs, dtype=bool)
+            states[0::2] = not self._bad
+            states[1::2] = self._bad
+
+            # keep only as many runs as needed, and carry the unused part of the last one over to the next call
+            ends = np.cumsum(lengths)
+            last = min(int(np.searchsorted(ends, n - filled)), len(lengths) - 1)
+            used = min(int(ends[last]), n - filled)
+            pieces.append(np.repeat(states[:last + 1], lengths[:last + 1])[:used])
+            self._bad = bool(states[last])
+            self._remaining = int(ends[last]) - used
+            filled += used
+        return np.concatenate(pieces)
+
+    def generate(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        return np.where(self.states(n), self.bad.generate(rng, n), self.good.generate(rng, n))
+
+
+class Trajectory:
+    """
+    a buffer of pre-generated samples of one parameter, refilled a block at a time with a single vectorized call
+    """
+
+    def __init__(self, model, rng: np.random.Generator, block_size: int = 4096):
+        self.model = model
+        self.rng = rng
+        self.block_size = block_size
+        self._buffer = np.empty((0,))
+        self._index = 0
+
+    def next(self) -> float:
+        """
+        :return: the next sample of the trajectory
+        """
+        if self._index >= len(self._buffer):
+            self._buffer = self.model.generate(self.rng, self.block_size)
+            self._index = 0
+        value = self._buffer[self._index]
+        self._index += 1
+        return float(value)
+
+    def close(self):
+        """
+        releases what the model holds open (e.g. the results file of a 'replay' trace)
+        """
+        if hasattr(self.model, 'close'):
+            self.model.close()
+
+
+def make_rng(seed, *keys: str) -> np.random.Generator:
+    """
+    creates an independent random number generator for a stream identified by `keys` (e.g. the interface and parameter
+    names), so that every stream is reproducible from the same seed no matter in which order the streams are consumed
+    :param seed: an int, or None for a non-reproducible stream
+    :param keys: strs identifying the stream
+    :return: a numpy Generator
+    """
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed] + [zlib.crc32(key.encode('utf-8')) for key in keys])
+
+
+def check_params(params: dict):
+    """
+    checks the types and ranges of model parameters, e.g. ones that came from a controller as JSON rather than through
+    `parse_model_params` (the trace models' file is checked by `trace.check_params`)
+    :param params: a dict mapping parameter names to values
+    """
+    for name, value in params.items():
+        if name not in MODEL_PARAMS:
+            raise ValueError("\"{0}\" is not a valid model parameter. Valid parameters are: {1}".format(name, list(MODEL_PARAMS.keys())))
+        if MODEL_PARAMS[name] is str:
+            valid = isinstance(value, str)
+        elif MODEL_PARAMS[name] is int:
+            valid = isinstance(value, int) and not isinstance(value, bool)
+        else:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+        if not valid:
+            raise ValueError("\"{0}\" has an invalid value {1!r}".format(name, value))
+    if not 0.0 <= params.get('correlation', 0.0) < 1.0:
+        raise ValueError("correlation must be at least 0 and less than 1")
+    for name in ('p', 'r', 'bad_loss'):
+        if not 0.0 <= params.get(name, 0.0) <= 1.0:
+            raise ValueError("{0} must be between 0 and 1 (or 0% and 100%)".format(name))
+    for name in ('bad_bw', 'bad_delay'):
+        if params.get(name, 0.0) < 0:
+            raise ValueError("{0} must not be negative".format(name))
+    if params.get('delay_scale', 0.5) <= 0:
+        raise ValueError("delay_scale must be positive")
+
+
+def parse_model_params(tokens: list) -> dict:
+    """
+    parses model parameters of the form "<NAME>=<VALUE>", and checks their ranges (see `check_params`)
+    :param tokens: a list of strs
+    :return: a dict mapping parameter names to parsed values
+    """
+    params = dict()
+    for token in tokens:
+        name, _, value = token.partition('=')
+        if name not in MODEL_PARAMS or value == '':
+            raise ValueError("\"{0}\" is not a valid model parameter. Valid parameters are: {1}".format(token, list(MODEL_PARAMS.keys())))
+        params[name] = MODEL_PARAMS[name](value)
+    check_params(params)
+    return params
+
+
+def make_model(name: str, mean: float, std_dev: float, low: float, high: float, params: dict, bad_mean: float = None,
+               state_rng: np.random.Generator = None, parameter: str = None):
+    """
+    creates a sampling model
+    :param name: one of `MODELS`
+    :param mean: the mean of the parameter
+    :param std_dev: the standard deviation of the parameter
+    :param low: the smallest value the parameter may take
+    :param high: the largest value the parameter may take
+    :param params: the optional model parameters (see `MODEL_PARAMS`)
+    :param bad_mean: the mean of the parameter in the bad state of the 'gilbert_elliott' model (defaults to `mean`)
+    :param state_rng: the generator of the state sequence of the 'gilbert_elliott' model
+    :param parameter: the shaped parameter (e.g. 'egress_bw'), which picks the recorded metric of the trace models
+    :return: a model object
+    """
+    if name == 'normal':
+        return Normal(mean, std_dev, low, high)
+    elif name == 'truncated_normal':
+        return TruncatedNormal(mean, std_dev, low, high)
+    elif name == 'ar1':
+        return AR1(mean, std_dev, params.get('correlation', 0.0), low, high)
+    elif name == 'gilbert_elliott':
+        state_model = 'ar1' if 'correlation' in params else 'truncated_normal'
+        good = make_model(state_model, mean, std_dev, low, high, params)
+        bad = make_model(state_model, mean if bad_mean is None else bad_mean, std_dev, low, high, params)
+        return GilbertElliott(good, bad, params.get('p', 0.0), params.get('r', 1.0), state_rng)
+    elif name in trace.TRACE_MODELS:
+        return trace.make_trace_model(name, parameter, params, low, high)
+    raise ValueError("\"{0}\" is not a valid model. Valid models are: {1}".format(name, list(MODELS)))
+
+
+def interface_trajectories(network_interface: str, config, block_size: int = 4096) -> dict:
+    """
+    creates the trajectories of every time-varying parameter configured on a network interface
+    :param network_interface: the name of the network interface
+    :param config: the interface's NetworkConfig
+    :param block_size: the number of samples generated at a time
+    :return: a dict mapping 'ingress_bw', 'egress_bw', 'egress_loss', and 'egress_delay' to Trajectory objects (only
+    those parameters that are configured are present)
+    """
+    # without a seed, pick one at random so that the streams of this interface are still independent of one another and
+    # the 'gilbert_elliott' state sequences still agree
+    seed = config.model_params.get('seed')
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    def trajectory(name, mean, std_dev, low, high, bad_param):
+        model = make_model(config.model, mean, std_dev, low, high, config.model_params,
+                           config.model_params.get(bad_param), make_rng(seed, network_interface, 'state'), name)
+        return Trajectory(model, make_rng(seed, network_interface, name), block_size)
+
+    trajectories = dict()
+    if config.avg_ingress_bw is not None and config.std_dev_ingress_bw is not None:
+        trajectories['ingress_bw'] = trajectory('ingress_bw', config.avg_ingress_bw, config.std_dev_ingress_bw, 1.0, np.inf, 'bad_bw')
+    if config.avg_egress_bw is not None and config.std_dev_egress_bw is not None:
+        trajectories['egress_bw'] = trajectory('egress_bw', config.avg_egress_bw, config.std_dev_egress_bw, 1.0, np.inf, 'bad_bw')
+    if config.avg_egress_loss is not None and config.std_dev_egress_loss is not None:
+        trajectories['egress_loss'] = trajectory('egress_loss', config.avg_egress_loss, config.std_dev_egress_loss, 0.0, 1.0, 'bad_loss')
+    if config.egress_avg_delay is not None:
+        # the per-packet delay jitter is left to netem, so the mean delay only moves in the bad state
+        trajectories['egress_delay'] = trajectory('egress_delay', config.egress_avg_delay, 0.0, 0.0, np.inf, 'bad_delay')
+    return trajectories
@@ -0,0 +1,116 @@
+# standard library includes
+import re
+
+# a number (optionally signed, optionally with a fractional part or exponent) followed by an optional unit
+_quantity_regex = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z%]*)(?:/s(?:ec)?)?\s*$')
+
+# rates, in bits per second. `tc` (and therefore this parser) treats units case-insensitively, which also covers
+# iperf3's "Kbits/sec", "Mbits/sec", etc.
+_rate_units = {
+    '': 1.0, 'bit': 1.0, 'bits': 1.0,
+    'kbit': 1e3, 'kbits': 1e3, 'mbit': 1e6, 'mbits': 1e6, 'gbit': 1e9, 'gbits': 1e9, 'tbit': 1e12, 'tbits': 1e12,
+    'kibit': 1024.0, 'mibit': 1024.0 ** 2, 'gibit': 1024.0 ** 3, 'tibit': 1024.0 ** 4,
+    'bps': 8.0, 'kbps': 8e3, 'mbps': 8e6, 'gbps': 8e9, 'tbps': 8e12,
+    'kibps': 8 * 1024.0, 'mibps': 8 * 1024.0 ** 2, 'gibps': 8 * 1024.0 ** 3, 'tibps': 8 * 1024.0 ** 4,
+}
+
+# sizes, in bytes (`tc` sizes are always powers of 1024)
+_size_units = {
+    '': 1.0, 'b': 1.0,
+    'k': 1024.0, 'kb': 1024.0, 'kbit': 1024.0 / 8,
+    'm': 1024.0 ** 2, 'mb': 1024.0 ** 2, 'mbit': 1024.0 ** 2 / 8,
+    'g': 1024.0 ** 3, 'gb': 1024.0 ** 3, 'gbit': 1024.0 ** 3 / 8,
+}
+
+# times, in seconds (a bare number is in microseconds, as in `tc`)
+_time_units = {
+    '': 1e-6, 'us': 1e-6, 'usec': 1e-6, 'usecs': 1e-6,
+    'ms': 1e-3, 'msec': 1e-3, 'msecs': 1e-3,
+    's': 1.0, 'sec': 1.0, 'secs': 1.0,
+}
+
+
+def _parse(quantity: str, units: dict, kind: str) -> float:
+    match = _quantity_regex.match(quantity)
+    if match is None or match.group(2).lower() not in units:
+        raise ValueError("\"{0}\" is not a valid {1}".format(quantity, kind))
+    return float(match.group(1)) * units[match.group(2).lower()]
+
+
+def parse_rate(rate: str) -> float:
+    """
+    parses a `tc` or iperf3 rate, such as "500kbit", "25mbit", or "94.3 Mbits/sec"
+    :param rate: the rate represented as a str
+    :return: the rate in bits per second
+    """
+    return _parse(rate, _rate_units, 'rate')
+
+
+def parse_size(size: str) -> float:
+    """
+    parses a `tc` size, such as "32kbit", "64kb", or "1500b"
+    :param size: the size represented as a str
+    :return: the size in bytes
+    """
+    return _parse(size, _size_units, 'size')
+
+
+def parse_time(time: str) -> float:
+    """
+    parses a `tc`, iperf3, or `ping` time, such as "250ms", "5s", or "0.045 ms"
+    :param time: the time represented as a str
+    :return: the time in seconds
+    """
+    return _parse(time, _time_units, 'time')
+
+
+def parse_percent(percent: str) -> float:
+    """
+    parses a percentage, such as "5%" or "0.5%"
+    :param percent: the percentage represented as a str
+    :return: the percentage as a fraction between 0 and 1
+    """
+    return _parse(percent, {'': 1e-2, '%': 1e-2}, 'percentage')
+
+
+def format_rate(bits_per_sec: float) -> str:
+    """
+    formats a rate in `tc` syntax, using the largest unit that represents it exactly
+    :param bits_per_sec: the rate in bits per second
+    :return: the rate represented as a str
+    """
+    bits_per_sec = int(round(bits_per_sec))
+    for unit, scale in (('gbit', 10 ** 9), ('mbit', 10 ** 6), ('kbit', 10 ** 3)):
+        if bits_per_sec != 0 and bits_per_sec % scale == 0:
+            return "{0}{1}".format(bits_per_sec // scale, unit)
+    return "{0}bit".format(bits_per_sec)
+
+
+def format_size(num_bytes: float) -> str:
+    """
+    formats a size in `tc` syntax
+    :param num_bytes: the size in bytes
+    :return: the size represented as a str
+    """
+    return "{0}b".format(int(round(num_bytes)))
+
+
+def format_time(seconds: float) -> str:
+    """
+    formats a time in `tc` syntax, using milliseconds when that represents it exactly and microseconds otherwise
+    :param seconds: the time in seconds
+    :return: the time represented as a str
+    """
+    microseconds = int(round(seconds * 1e6))
+    if microseconds % 1000 == 0:
+        return "{0}ms".format(microseconds // 1000)
+    return "{0}us".format(microseconds)
+
+
+def format_percent(fraction: float) -> str:
+    """
+    formats a fraction as a percentage in `tc` syntax
+    :param fraction: the fraction between 0 and 1
+    :return: the percentage represented as a str
+    """
+    return "{0:.6g}%".format(fraction * 100.0)
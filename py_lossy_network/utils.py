@@ -2,10 +2,40 @@
 import subprocess
 import re
 import asyncio
+import functools
+import json
 
 # external library includes
 import numpy as np
-from pint import UnitRegistry
+
+# internal includes
+from py_lossy_network import interfaces
+from py_lossy_network import metrics
+from py_lossy_network import tc_backend
+from py_lossy_network import units
+
+# the backend every `tc` helper below runs its commands on (see `set_tc_backend`)
+_tc_backend = tc_backend.SubprocessBackend()
+
+# the network interfaces of this machine, read from sysfs and cached (see `get_interface_inventory`)
+_interface_inventory = interfaces.Inventory()
+
+# what the instrumentation of the `tc` helpers, the external tools, and the parsers records (see `metrics`)
+_TC_SECONDS = "durations of `tc` calls, by helper"
+_SUBPROCESS_FAILURES = "failures to run or use the output of an external tool, by tool and cause"
+_PARSE_SECONDS = "durations of the output parsers, by function"
+
+# substrings of `tc`'s error messages (and of the backends' own) and the failure cause they point to
+_TC_FAILURE_CAUSES = (
+    ('Operation not permitted', 'permission_denied'),
+    ('Permission denied', 'permission_denied'),
+    ('Cannot find device', 'no_such_device'),
+    ('No such file or directory', 'not_found'),
+    ('File exists', 'exists'),
+    ('Invalid argument', 'invalid_argument'),
+    ('Cannot find proxy', 'no_such_device'),
+    ('`tc` process', 'backend'),
+)
 
 
 def prompt():
@@ -16,7 +46,8 @@ quit:
 help: 
     Description: shows list of commands
 show <INTERFACE>: 
-    Description: shows all `tc` filter rules on network interface <INTERFACE>
+    Description: shows all `tc` filter rules on network interface <INTERFACE>, and with --qdisc-interval, what its 
+    qdiscs actually sent, dropped, and queued as of the last snapshot
     Example: show eth0
 del <INTERFACE>: 
     Description: deletes all `tc` filter rules on network interface <INTERFACE>
@@ -31,26 +62,135 @@ set_ingress <INTERFACE> bw <MEAN_BANDWIDTH> <STD_DEV_BANDWIDTH> burst <BURST>
     Example: set_ingress docker0 bw 500kbit 10kbit burst 32kbit 
     Example: set_ingress docker0 bw 25mbit 0mbit burst 64kbit 
     Example: set_ingress docker0 bw 500kbit 1mbit burst 1mbit 
-"sender <SERVER_IP>": 
+set_model <INTERFACE> <MODEL> [<PARAM>=<VALUE> ...]
+    Description: sets how the bandwidth, loss, and delay of <INTERFACE> vary over time. <MODEL> is one of normal, 
+    truncated_normal, ar1 (params: correlation), gilbert_elliott (params: p, r, bad_bw, bad_loss, bad_delay, 
+    correlation), replay, or empirical. every model accepts seed=<SEED> for a reproducible run 
+    Example: set_model docker0 ar1 correlation=0.9 seed=42
+    Example: set_model docker0 gilbert_elliott p=0.02 r=0.25 bad_bw=100kbit bad_loss=30% bad_delay=500ms
+    the trace models replay (replay) or sample from the distribution of (empirical) the bitrate, UDP loss, and delay 
+    recorded in a results file (params: trace, client, delay_scale: the fraction of the round-trip delay applied, 
+    default 0.5); set_egress/set_ingress still set the burst and latency 
+    Example: set_model docker0 replay trace=data/2023_09_12T14_20_04_943741.h5 client=172.17.0.2
+    Example: set_model docker0 empirical trace=data/2023_09_12T14_20_04_943741.h5
+set_period <INTERFACE> <PERIOD>
+    Description: sets how often the rules on <INTERFACE> are re-sampled and updated (default 1s) 
+    Example: set_period docker0 100ms
+set_tolerance <TOLERANCE>
+    Description: skips rule updates whose sampled bandwidth, loss, and delay are all within <TOLERANCE> (relative) of the 
+    rules already applied (default 0%, i.e. only skip identical updates) 
+    Example: set_tolerance 2%
+schedule
+    Description: shows the update period, number of updates, missed deadlines, and failed updates of every shaped interface
+stats [reset]
+    Description: shows the latency distribution (count, mean, p50, p95, p99, max) of `tc` calls, rule updates, 
+    measurement phases, parsing, and h5 writes, and the failures of each by cause. reset zeroes them 
+    Example: stats
+"sender <SERVER_IP> [<PORT>]": 
     Description: initiates data collection with the host system as the sender of data
     Example: sender 172.17.0.2
-"receiver":
-    Description: initiates data collection with the host system as the receiver of data
+    Example: sender 172.17.0.2 5203
+"receiver [<PORTS>] [<TIMEOUT>] [pipelined] [repeat <N>]":
+    Description: initiates data collection with the host system as the receiver of data. with <PORTS>, runs one iperf3 
+    server per port so several senders are measured at the same time; servers that have no sender after <TIMEOUT> 
+    are stopped. with pipelined, senders are pinged during their iperf3 test (over a loaded link) instead of after it. 
+    with repeat, runs <N> cycles back to back 
     Example: receiver
+    Example: receiver 5201-5208 60s
+    Example: receiver pipelined repeat 10
+"reflector [<PORT> | stop]":
+    Description: echoes the UDP probes of the "probe" command back to their sender (default port 5301) 
+    Example: reflector
+    Example: reflector stop
+"probe <REFLECTOR_IP> [<PORT>] [count <N>] [rate <PACKETS_PER_SECOND>] [size <BYTES>]":
+    Description: measures the round-trip time, loss, reordering, duplicates, and jitter to a host running "reflector", 
+    without iperf3 or ping (defaults: count 200, rate 100, size 64) 
+    Example: probe 172.17.0.2 rate 500 count 2000
+"proxy <NAME> <udp|tcp> <LISTEN_PORT> <SERVER_IP> <SERVER_PORT> | proxy <NAME> stop":
+    Description: with --userspace, relays <LISTEN_PORT> to the server through a userspace proxy that set_egress, 
+    set_ingress, set_model, and scenarios shape under <NAME>, in place of a network interface, without `tc` or root. 
+    egress applies to what clients send, ingress to the replies (TCP is never dropped, only rate limited and delayed) 
+    Example: proxy iperf udp 5211 172.17.0.2 5201
+    Example: proxy iperf stop
+"fleet connect <HOST[:PORT]> ... | fleet apply <INTERFACE> <FIELD>=<VALUE> ... [at=<DELAY>] | fleet show <INTERFACE> | fleet del <INTERFACE>":
+    Description: sets, shows, or deletes the rules of <INTERFACE> on every host running --agent at once, over one 
+    persistent connection per agent, and prints when each agent was done. <FIELD> is a NetworkConfig field (e.g. 
+    avg_egress_bw, egress_burst, egress_latency, avg_egress_loss, egress_avg_delay, model); with model=<MODEL>, 
+    other <PARAM>=<VALUE> are its parameters. with at=<DELAY>, the agents apply <DELAY> from now by their clocks 
+    Example: fleet connect robot1 robot2:5401 192.168.1.12
+    Example: fleet apply wlan0 avg_egress_bw=500kbit std_dev_egress_bw=0kbit egress_burst=32kbit egress_latency=500ms avg_egress_loss=5% std_dev_egress_loss=0% egress_avg_delay=250ms egress_std_dev_delay=10ms
+    Example: fleet apply wlan0 model=ar1 correlation=0.9 at=200ms
+"peer <INTERFACE> set <DESTINATION> rate <RATE> [burst <BURST>] [loss <LOSS>] [delay <DELAY>] [jitter <JITTER>] | peer <INTERFACE> del <DESTINATION> | peer <INTERFACE> show | peer <INTERFACE> load <FILE>":
+    Description: shapes the egress traffic to each peer of <INTERFACE> with its own rate, loss, and delay, and leaves 
+    the traffic to anyone else alone. <DESTINATION> is an IPv4 address or subnet, optionally with a port, e.g. 
+    10.0.1.5, 10.0.2.0/24, or 10.0.1.5:5201; the most specific one matches. set updates a peer in place. load sets 
+    every peer of a file (JSON, TOML, or YAML) like {"peers": {"10.0.1.5": {"rate": "2mbit", "loss": "1%"}}}. an 
+    interface is shaped either per peer or by set_egress 
+    Example: peer eth0 set 10.0.1.5 rate 2mbit loss 1% delay 40ms jitter 5ms
+    Example: peer eth0 set 10.0.2.0/24:5201 rate 500kbit burst 32kb
+    Example: peer eth0 del 10.0.1.5
+    Example: peer eth0 load peers/robots.json
+"scenario <FILE> | stop":
+    Description: runs the timeline of a scenario file (JSON, TOML, or YAML) in the background, taking its interfaces 
+    away from set_egress/set_ingress, and reports when each event was planned and applied once it ends 
+    Example: scenario scenarios/degrade.json
         """
     print(prompt)
 
 
+def set_tc_backend(backend):
+    """
+    sets the backend used by every `tc` helper in this module, closing the previous one
+    :param backend: a backend object from `py_lossy_network.tc_backend`
+    """
+    global _tc_backend
+    _tc_backend.close()
+    _tc_backend = backend
+
+
+def get_tc_backend():
+    """
+    gets the backend used by every `tc` helper in this module
+    :return: a backend object from `py_lossy_network.tc_backend`
+    """
+    return _tc_backend
+
+
+def tc_failure_cause(ret: subprocess.CompletedProcess) -> str:
+    """
+    tells why a `tc` call failed from its error message
+    :param ret: the CompletedProcess of a failed call
+    :return: a short, label-friendly cause (e.g. 'permission_denied'), or 'exit_<CODE>' if the message isn't recognized
+    """
+    stderr = ret.stderr.decode('utf-8', 'replace') if isinstance(ret.stderr, bytes) else str(ret.stderr)
+    for text, cause in _TC_FAILURE_CAUSES:
+        if text in stderr:
+            return cause
+    return 'exit_{0}'.format(ret.returncode)
+
+
+def _run_tc(operation: str, commands: list) -> subprocess.CompletedProcess:
+    # run commands on the current backend, recording how long that took and, if it failed, why
+    with metrics.timer('tc_seconds', _TC_SECONDS, operation=operation):
+        ret = _tc_backend.run(commands)
+    if ret.returncode != 0:
+        metrics.count('tc_failures_total', "failures of " + _TC_SECONDS, operation=operation, cause=tc_failure_cause(ret))
+    return ret
+
+
 def show_tc_rules(network_interface: str) -> subprocess.CompletedProcess:
     """
     displays the filter rules applied by `tc` on a particular network interface
     :param network_interface: the network interface we would like to display filter rules for represented as a str
     :return:  a CompletedProcess object specifying success / failure of process
     """
-    try:
-        ret = subprocess.run(['tc', 'qdisc', 'show', 'dev', network_interface], capture_output=True)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stderr=b"failed", stdout=b"failed")
+    with metrics.timer('tc_seconds', _TC_SECONDS, operation='show_tc_rules'):
+        try:
+            ret = subprocess.run(['tc', 'qdisc', 'show', 'dev', network_interface], capture_output=True)
+        except OSError as e:
+            ret = subprocess.CompletedProcess(args="", returncode=1, stderr=str(e).encode('utf-8'), stdout=b"failed")
+    if ret.returncode != 0:
+        metrics.count('tc_failures_total', "failures of " + _TC_SECONDS, operation='show_tc_rules', cause=tc_failure_cause(ret))
     return ret
 
 
@@ -61,12 +201,7 @@ def del_tc_rules(network_interface: str, qdisc: str) -> subprocess.CompletedProc
     :param qdisc: the queuing discipline being deleted
     :return:  a CompletedProcess object specifying success / failure of process
     """
-    bash_command = "sudo tc qdisc del dev {0} {1}".format(network_interface, qdisc)
-    try:
-        ret = subprocess.run(['bash', '-c', bash_command], capture_output=True)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stderr=b"failed", stdout=b"failed")
-    return ret
+    return _run_tc('del_tc_rules', ["qdisc del dev {0} {1}".format(network_interface, qdisc)])
 
 
 def add_tbf_filter(network_interface: str, parent: str, handle: str, rate: str, burst: str,
@@ -83,12 +218,7 @@ def add_tbf_filter(network_interface: str, parent: str, handle: str, rate: str,
     :param latency: the egress latency limit
     :return: a CompletedProcess object specifying success / failure of process
     """
-    bash_command = "sudo tc qdisc add dev {0} {1} handle {2} tbf rate {3} burst {4} latency {5}".format(network_interface, parent, handle, rate, burst, latency)
-    try:
-        ret = subprocess.run(['bash', '-c', bash_command], capture_output=True)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stderr=b"failed", stdout=b"failed")
-    return ret
+    return _run_tc('add_tbf_filter', [tbf_command(network_interface, parent, handle, rate, burst, latency, verb='add')])
 
 
 def add_netem_filter(network_interface: str, parent: str, handle: str, loss: str, avg_delay: str,
@@ -106,12 +236,7 @@ def add_netem_filter(network_interface: str, parent: str, handle: str, loss: str
     :param std_dev_delay: the egress standard deviation delay
     :return:  a CompletedProcess object specifying success / failure of process
     """
-    bash_command = "sudo tc qdisc add dev {0} {1} handle {2} netem loss {3} delay {4} {5} distribution normal ".format(network_interface, parent, handle, loss, avg_delay, std_dev_delay)
-    try:
-        ret = subprocess.run(['bash', '-c', bash_command], capture_output=True)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stderr=b"failed", stdout=b"failed")
-    return ret
+    return _run_tc('add_netem_filter', [netem_command(network_interface, parent, handle, loss, avg_delay, std_dev_delay, verb='add')])
 
 
 def add_ingress_rule(network_interface: str, bw: str, burst: str) -> subprocess.CompletedProcess:
@@ -122,13 +247,93 @@ def add_ingress_rule(network_interface: str, bw: str, burst: str) -> subprocess.
     :param burst: the ingress burst rate limit
     :return:  a CompletedProcess object specifying success / failure of process
     """
-    bash_command = "sudo tc qdisc add dev {0} handle ffff: ingress && " \
-                   "sudo tc filter add dev {0} parent ffff: u32 match u32 0 0 police rate {1} burst {2}".format(network_interface, bw, burst)
-    try:
-        ret = subprocess.run(['bash', '-c', bash_command], capture_output=True)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=b"failed")
-    return ret
+    return _run_tc('add_ingress_rule', [
+        "qdisc add dev {0} handle ffff: ingress".format(network_interface),
+        "filter add dev {0} parent ffff: u32 match u32 0 0 police rate {1} burst {2}".format(network_interface, bw, burst)
+    ])
+
+
+def tbf_command(network_interface: str, parent: str, handle: str, rate: str, burst: str, latency: str,
+                verb: str = 'replace') -> str:
+    """
+    builds the `tc` command (without the leading "tc") that installs or modifies a `tbf` queuing discipline
+    :param network_interface: the network interface to which we would like to apply the rule
+    :param parent: the name of the parent node to this rule (see `tc` man pages for more information)
+    :param handle: the name of the *this* rule (see `tc` man pages for more information)
+    :param rate: the egress bandwidth limit
+    :param burst: the egress burst limit
+    :param latency: the egress latency limit
+    :param verb: one of 'add', 'change', or 'replace'
+    :return: the command represented as a str
+    """
+    return "qdisc {0} dev {1} {2} handle {3} tbf rate {4} burst {5} latency {6}".format(verb, network_interface, parent, handle, rate, burst, latency)
+
+
+def netem_command(network_interface: str, parent: str, handle: str, loss: str, avg_delay: str, std_dev_delay: str,
+                  verb: str = 'replace') -> str:
+    """
+    builds the `tc` command (without the leading "tc") that installs or modifies a `netem` queuing discipline
+    :param network_interface: the network interface to which we would like to apply the rule
+    :param parent: the name of the parent node to this rule (see `tc` man pages for more information)
+    :param handle: the name of the *this* rule (see `tc` man pages for more information)
+    :param loss: the egress loss rate
+    :param avg_delay: the egress average delay
+    :param std_dev_delay: the egress standard deviation delay
+    :param verb: one of 'add', 'change', or 'replace'
+    :return: the command represented as a str
+    """
+    command = "qdisc {0} dev {1} {2} handle {3} netem loss {4} delay {5}".format(verb, network_interface, parent, handle, loss, avg_delay)
+    # `tc` rejects a distribution unless both the delay and the jitter are nonzero (and a zero jitter means none)
+    if units.parse_time(std_dev_delay) > 0:
+        command += " {0}".format(std_dev_delay)
+        if units.parse_time(avg_delay) > 0:
+            command += " distribution normal"
+    return command
+
+
+def ingress_commands(network_interface: str, bw: str, burst: str) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that install or modify the ingress policer. the filter is given
+    a fixed priority and handle so that `replace` modifies the existing policer instead of stacking a new one
+    :param network_interface: the network interface to which we would like to apply the rule
+    :param bw: the ingress bandwidth limit
+    :param burst: the ingress burst rate limit
+    :return: a list of commands represented as strs
+    """
+    return [
+        "qdisc replace dev {0} handle ffff: ingress".format(network_interface),
+        "filter replace dev {0} parent ffff: protocol all prio 1 handle 800::800 u32 match u32 0 0 police rate {1} burst {2} drop".format(network_interface, bw, burst)
+    ]
+
+
+def egress_commands(network_interface: str, rate: str, burst: str, latency: str, loss: str, avg_delay: str,
+                    std_dev_delay: str) -> list:
+    """
+    builds the `tc` commands (without the leading "tc") that install or modify the `tbf` root and its `netem` child
+    :param network_interface: the network interface to which we would like to apply the rule
+    :param rate: the egress bandwidth limit
+    :param burst: the egress burst limit
+    :param latency: the egress latency limit
+    :param loss: the egress loss rate
+    :param avg_delay: the egress average delay
+    :param std_dev_delay: the egress standard deviation delay
+    :return: a list of commands represented as strs
+    """
+    return [
+        tbf_command(network_interface, 'root', '1:0', rate, burst, latency),
+        netem_command(network_interface, 'parent 1:1', '10:0', loss, avg_delay, std_dev_delay)
+    ]
+
+
+def run_tc_batch(commands: list) -> subprocess.CompletedProcess:
+    """
+    runs a list of `tc` commands as a single unit on the current `tc` backend. the backend stops at the first command
+    that fails and skips the remaining ones, with a nonzero return code; the commands before it stay applied (nothing
+    is rolled back), so the caller should treat the rules as unknown and apply them all again
+    :param commands: a list of `tc` commands (without the leading "tc") represented as strs
+    :return: a CompletedProcess object specifying success / failure of process
+    """
+    return _run_tc('run_tc_batch', commands)
 
 
 async def ping(ip_addr: str, count: int = 10) -> subprocess.CompletedProcess:
@@ -144,61 +349,152 @@ async def ping(ip_addr: str, count: int = 10) -> subprocess.CompletedProcess:
         proc = await asyncio.create_subprocess_shell(bash_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
         stdout, stderr = await proc.communicate()
         ret = subprocess.CompletedProcess(args="", returncode=0, stdout=stdout, stderr=stderr)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=b"failed")
+    except OSError as e:
+        metrics.count('subprocess_failures_total', _SUBPROCESS_FAILURES, command='ping', cause=metrics.failure_cause(e))
+        ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=str(e).encode('utf-8'))
     return ret
 
 
-async def iperf3_server() -> subprocess.CompletedProcess:
+@functools.lru_cache(maxsize=None)
+def iperf3_supports_json_stream() -> bool:
     """
-    this function creates an iperf3 server process for the purpose of measuring the UDP bandwidth, UDP datagram loss
-    rate, and UDP datagram reordering rate
-    :return:  a CompletedProcess object specifying success / failure of process
+    checks whether the installed iperf3 supports line-delimited streaming JSON output (`--json-stream`, iperf3 3.17+)
+    :return: True if it does
     """
     try:
-        bash_command = 'iperf3 -s -1'
-        proc = await asyncio.create_subprocess_shell(bash_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        stdout, stderr = await proc.communicate()
-        ret = subprocess.CompletedProcess(args="", returncode=0, stdout=stdout, stderr=stderr)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=b"failed")
-    return ret
+        version = subprocess.run(['iperf3', '--version'], capture_output=True).stdout.decode('utf-8')
+    except OSError:
+        return False
+    match = re.search(r'iperf (\d+)\.(\d+)', version)
+    return match is not None and (int(match.group(1)), int(match.group(2))) >= (3, 17)
+
+
+def iperf3_json_records(iperf3_json: dict):
+    """
+    splits the (non-streaming) JSON output of iperf3 into the same records `--json-stream` would have produced
+    :param iperf3_json: the parsed output of iperf3 run with `--json`
+    :return: a generator of (event, data) tuples, where event is one of 'start', 'interval', 'end', or 'error'
+    """
+    if 'start' in iperf3_json:
+        yield 'start', iperf3_json['start']
+    for interval in iperf3_json.get('intervals', []):
+        yield 'interval', interval
+    if 'error' in iperf3_json:
+        yield 'error', iperf3_json['error']
+    elif 'end' in iperf3_json:
+        yield 'end', iperf3_json['end']
 
 
-async def iperf3_client(receiver_ip_addr: str) -> subprocess.CompletedProcess:
+def parse_iperf3_json_stream_line(line: bytes):
+    """
+    parses one line of iperf3's `--json-stream` output
+    :param line: the line
+    :return: an (event, data) tuple, where event is one of 'start', 'interval', 'end', or 'error'; or None if the line
+    isn't a record
+    """
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or 'event' not in record:
+        return None
+    return record['event'], record.get('data')
+
+
+async def iperf3_server(port: int = None, json_stream: bool = None):
+    """
+    this function creates a one-off iperf3 server process for the purpose of measuring the UDP bandwidth, UDP datagram
+    loss rate, and UDP datagram reordering rate. iperf3's records are yielded as they arrive when it supports streaming
+    JSON, and all at once when the test ends otherwise
+    :param port: the port the server listens on (defaults to iperf3's default)
+    :param json_stream: whether to use `--json-stream` (defaults to whether the installed iperf3 supports it)
+    :return: an async generator of (event, data) tuples, where event is one of 'start', 'interval', 'end', or 'error'
+    (see `process_iperf3_json`)
+    """
+    if json_stream is None:
+        json_stream = iperf3_supports_json_stream()
+    args = ['iperf3', '-s', '-1', '--json-stream' if json_stream else '--json']
+    if port is not None:
+        args += ['-p', str(port)]
+
+    try:
+        proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except OSError as e:
+        metrics.count('subprocess_failures_total', _SUBPROCESS_FAILURES, command='iperf3_server', cause=metrics.failure_cause(e))
+        yield 'error', str(e)
+        return
+
+    try:
+        if json_stream:
+            async for line in proc.stdout:
+                record = parse_iperf3_json_stream_line(line)
+                if record is not None:
+                    yield record
+        else:
+            stdout = await proc.stdout.read()
+            try:
+                iperf3_json = json.loads(stdout)
+            except ValueError:
+                iperf3_json = {'error': (await proc.stderr.read()).decode('utf-8') or 'iperf3 produced no output'}
+            for record in iperf3_json_records(iperf3_json):
+                yield record
+        await proc.wait()
+    finally:
+        # the caller may stop iterating early, in which case the server is of no more use
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+async def iperf3_client(receiver_ip_addr: str, port: int = None) -> subprocess.CompletedProcess:
     """
     this function creates an iperf3 client process targeted at the given ip address for the purpose of measuring the UDP
     bandwidth, UDP datagram loss rate, and the UDP datagram reordering rate
     :param receiver_ip_addr: the ip address of the iperf3 server
-    :return: a CompletedProcess object specifying success / failure of process
+    :param port: the port the server listens on (defaults to iperf3's default)
+    :return: a CompletedProcess object specifying success / failure of process, whose stdout is iperf3's JSON output and
+    whose stderr holds iperf3's error message (if any)
     """
+    args = ['iperf3', '-c', receiver_ip_addr, '-u', '-b', '95M', '--json']
+    if port is not None:
+        args += ['-p', str(port)]
     try:
-        bash_command = 'iperf3 -c {0} -u -b 95M'.format(receiver_ip_addr)
-        proc = await asyncio.create_subprocess_shell(bash_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
         stdout, stderr = await proc.communicate()
-        ret = subprocess.CompletedProcess(args="", returncode=0, stdout=stdout, stderr=stderr)
-    except:
-        ret = subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=b"failed")
+        ret = subprocess.CompletedProcess(args=args, returncode=proc.returncode, stdout=stdout, stderr=stderr)
+    except OSError as e:
+        metrics.count('subprocess_failures_total', _SUBPROCESS_FAILURES, command='iperf3_client', cause=metrics.failure_cause(e))
+        return subprocess.CompletedProcess(args="", returncode=1, stdout=b"failed", stderr=str(e).encode('utf-8'))
+
+    # with `--json`, iperf3 reports errors inside the JSON document rather than on stderr
+    try:
+        error = json.loads(stdout).get('error')
+    except ValueError:
+        error = None
+    if error is not None:
+        metrics.count('subprocess_failures_total', _SUBPROCESS_FAILURES, command='iperf3_client', cause='iperf3_error')
+        ret.returncode = ret.returncode or 1
+        ret.stderr = error.encode('utf-8')
     return ret
 
 
-def list_available_interfaces() -> list:
+def get_interface_inventory() -> interfaces.Inventory:
     """
-    gets a list of strings denoting the network interfaces of this machine
-    :return:
+    gets the cached inventory of this machine's network interfaces
+    :return: an Inventory object
     """
-    try:
-        proc_ifconfig = subprocess.run(['ifconfig', '-a'], check=True, capture_output=True)
-    except:
-        return []
+    return _interface_inventory
 
-    try:
-        network_interface_list = subprocess.run(['sed', 's/[ \t].*//;/^$/d'], input=proc_ifconfig.stdout,capture_output=True).stdout.decode('utf-8').split(':\n')
-    except:
-        return []
-    return [interface for interface in network_interface_list if interface != '']
+
+def list_available_interfaces() -> list:
+    """
+    gets a list of strings denoting the network interfaces of this machine (from the cached inventory)
+    :return: the names of the network interfaces as a list of strs
+    """
+    return _interface_inventory.names()
 
 
+@metrics.timed('parse_seconds', _PARSE_SECONDS, function='process_iperf3')
 def process_iperf3(iperf3_output: str):
     """
     process the server-side output of iperf3 in udp mode, extracting: the client's IP address, bandwidth measurements,
@@ -207,35 +503,28 @@ def process_iperf3(iperf3_output: str):
     :return: the clients IP as a string, a numpy vector of bandwidth measurements in kbps, percent datagrams lost, and
     the percent datagrams reordered
     """
-    # Instantiate a "pint" (python package) unit registry object for handling iperf's units (which may be variable)
-    ureg = UnitRegistry()
-
     # Use regex to ascertain the client's IP address
-    client_ip_regex = re.compile('Accepted connection from \d+.\d+.\d+.\d+')  # regular expression for getting IP
+    client_ip_regex = re.compile(r'Accepted connection from \d+\.\d+\.\d+\.\d+')  # regular expression for getting IP
     client_ip = client_ip_regex.findall(iperf3_output)[0].split(' ')[-1]  # some processing of the matched string
 
     # Use regex to ascertain all datarate measurements
-    bitrates_regex = re.compile('\d+.\d+ [a-zA-Z]*bits\/sec')
+    bitrates_regex = re.compile(r'\d+(?:\.\d+)? [a-zA-Z]*bits/sec')
     bitrates = bitrates_regex.findall(iperf3_output)[:-1]  # vector of strings containing datarate with unit
 
     # transform the vector of strings into numpy vector with assumed units of kilobits per second
     bitrate_kbps = np.zeros((len(bitrates),))
     for i in range(0, len(bitrates)):
-        # iperf3 outputs kbits as Kbits (which isn't technically correct, it should be 'kbits'). so we check for that
-        # case before handing off to `pint` to transform the units.
-        if bitrates[i][-9] == 'K':
-            bitrates[i] = bitrates[i].lower()
-        bitrates[i] = ureg(bitrates[i]).to(ureg.kbit / ureg.s)  # perform unit conversion
-        bitrate_kbps[i] = bitrates[i].m  # get the value of the "Quantity" object (not the unit)
+        # the parser is case-insensitive, so iperf3's 'Kbits' (which isn't technically correct) is handled as 'kbits'
+        bitrate_kbps[i] = units.parse_rate(bitrates[i]) / 1e3
 
     # get number of lost datagrams and  total number of datagrams
-    datagrams_regex = re.compile('\d+\/\d+')
+    datagrams_regex = re.compile(r'\d+\/\d+')
     datagrams = datagrams_regex.findall(iperf3_output)[-1].split('/')
     lost_datagrams = int(datagrams[0])
     total_datagrams = int(datagrams[1])
 
     # number of out-of-order datagrams
-    reordered_regex = re.compile('\d+ datagrams')
+    reordered_regex = re.compile(r'\d+ datagrams')
     reordered_regex_match = reordered_regex.findall(iperf3_output)
 
     # if nothing gets reordered, it's possible nothing gets printed, and we don't match anything, so check for that
@@ -261,32 +550,56 @@ def process_iperf3(iperf3_output: str):
     return client_ip, bitrate_kbps, lost_datagram_ratio, reordered_datagram_ratio
 
 
+@metrics.timed('parse_seconds', _PARSE_SECONDS, function='process_iperf3_json')
+def process_iperf3_json(start: dict, intervals: list, end: dict):
+    """
+    process the server-side JSON records of iperf3 in udp mode (see `iperf3_server`), extracting: the client's IP
+    address, bandwidth measurements, percent datagrams lost, and the percent datagrams reordered
+    :param start: the data of the 'start' record
+    :param intervals: the data of every 'interval' record
+    :param end: the data of the 'end' record
+    :return: the clients IP as a string, a numpy vector of bandwidth measurements in kbps, percent datagrams lost, and
+    the percent datagrams reordered
+    """
+    client_ip = start['connected'][0]['remote_host']
+    bitrate_kbps = np.array([interval['sum']['bits_per_second'] / 1e3 for interval in intervals
+                             if not interval['sum'].get('omitted', False)])
+
+    # the reordering count is only reported per stream
+    lost_datagrams = end['sum']['lost_packets']
+    total_datagrams = end['sum']['packets']
+    reordered_datagrams = sum(stream.get('udp', dict()).get('out_of_order', 0) for stream in end.get('streams', []))
+
+    # see `process_iperf3` for why no datagrams at all means NaN
+    if total_datagrams == 0:
+        return client_ip, bitrate_kbps, float('nan'), float('nan')
+    return client_ip, bitrate_kbps, float(lost_datagrams / total_datagrams), float(reordered_datagrams / total_datagrams)
+
+
+@metrics.timed('parse_seconds', _PARSE_SECONDS, function='process_ping')
 def process_ping(ping_output: str):
     """
     process the output of 'ping', extracting: delay measurements and the percent packet loss
     :param ping_output: the output of running `ping` represented as a string
     :return: delay measurements as a numpy array with units of milliseconds and the percent packet loss
     """
-    # Instantiate a "pint" (python package) unit registry object for handling iperf's units (which may be variable)
-    ureg = UnitRegistry()
-
-    # use regex to extract all delays (with units) in form of strings
-    delay_regex = re.compile('\d+.\d+ [a-zA-Z]s')
+    # use regex to extract the delay (with units) of every reply in form of strings (not the summary's min/avg/max/mdev)
+    delay_regex = re.compile(r'time[=<](\d+(?:\.\d+)? ?[a-zA-Z]*s)\b')
     delays = delay_regex.findall(ping_output)
 
     # transform the list of strings into a numpy array of floats with assumed units of milliseconds
     delay_ms = np.zeros((len(delays),))
     for i in range(0, len(delays)):
-        delay = ureg(delays[i]).to(ureg.ms)  # perform the unit transformation
-        delay_ms[i] = delay.m  # save the value of the "Quantity" object, not the unit
+        delay_ms[i] = units.parse_time(delays[i].replace(' ', '')) * 1e3  # perform the unit transformation
 
     # find packet loss
-    packet_loss_regex = re.compile('[\d+.\d+]%')
-    percent_packet_loss = float(packet_loss_regex.findall(ping_output)[0][:-1]) / 100.  # divide by 100, since nominally in form: X%
+    packet_loss_regex = re.compile(r'(\d+(?:\.\d+)?)% packet loss')
+    percent_packet_loss = float(packet_loss_regex.findall(ping_output)[0]) / 100.  # divide by 100, since nominally in form: X%
 
     return delay_ms, percent_packet_loss
 
 
+@metrics.timed('h5_write_seconds', "durations of h5 writes, by writer", writer='save')
 def save(dset, data):
     dset.resize(dset.shape[0]+1, axis=0)
     dset[-1] = data
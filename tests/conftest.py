@@ -0,0 +1,6 @@
+# standard library includes
+import os
+import sys
+
+# the tests import the package from this checkout, like the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
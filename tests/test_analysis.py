@@ -0,0 +1,60 @@
+"""
+the running statistics of the analysis engine: exact moments however the samples are split into blocks, and quantiles
+interpolated within the histogram bins (so within a bin's width of the exact ones)
+"""
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import analysis
+
+BINS = np.linspace(0.0, 10.0, 11)
+
+
+def test_quantiles_interpolate_within_bins():
+    stats = analysis.RunningStats(BINS)
+    # one sample in the middle of every bin
+    stats.update(np.arange(10) + 0.5)
+    # 2.5 of the 10 samples lie below 2.5 when each bin's sample is spread over the bin
+    assert stats.quantile(0.25) == pytest.approx(2.5)
+    assert stats.quantile(0.5) == pytest.approx(5.0)
+    assert stats.quantiles(np.array([0.1, 0.9])).tolist() == pytest.approx([1.0, 9.0])
+    # the ends are clipped to the samples seen
+    assert stats.quantile(0.0) == 0.5 and stats.quantile(1.0) == 9.5
+
+
+def test_samples_outside_the_bins():
+    stats = analysis.RunningStats(BINS)
+    stats.update(np.array([-5.0, 1.5, 2.5, 20.0, np.nan]))
+    assert stats.underflow == 1 and stats.overflow == 1 and stats.num_nan == 1 and stats.count == 4
+    assert stats.quantile(0.0) == -5.0 and stats.quantile(1.0) == 20.0
+    # the underflow is spread between the smallest sample and the first edge
+    assert stats.quantile(0.125) == pytest.approx(-2.5)
+
+
+def test_merged_blocks_equal_one_block():
+    rng = np.random.default_rng(1)
+    samples = rng.lognormal(mean=3.0, sigma=1.0, size=10000)
+    whole = analysis.RunningStats(analysis.DEFAULT_BINS['delay_ms'])
+    whole.update(samples)
+    merged = analysis.RunningStats(analysis.DEFAULT_BINS['delay_ms'])
+    for block in np.array_split(samples, 7):
+        part = analysis.RunningStats(analysis.DEFAULT_BINS['delay_ms'])
+        part.update(block)
+        merged.merge(part)
+    assert merged.count == whole.count == 10000
+    assert merged.mean == pytest.approx(np.mean(samples)) and whole.mean == pytest.approx(np.mean(samples))
+    assert merged.std_dev == pytest.approx(np.std(samples)) and whole.std_dev == pytest.approx(np.std(samples))
+    assert merged.min == np.min(samples) and merged.max == np.max(samples)
+    assert np.array_equal(merged.histogram, whole.histogram)
+
+    # the bins are ~2.3% wide, so the quantiles are that close to the exact ones
+    qs = np.array([0.01, 0.25, 0.5, 0.75, 0.95, 0.99])
+    assert merged.quantiles(qs) == pytest.approx(np.quantile(samples, qs), rel=0.025)
+
+
+def test_nothing_recorded():
+    stats = analysis.RunningStats(BINS)
+    stats.update(np.array([np.nan]))
+    assert stats.count == 0 and np.isnan(stats.quantile(0.5)) and np.isnan(stats.std_dev)
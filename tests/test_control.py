@@ -0,0 +1,111 @@
+"""
+the agent/controller protocol: bad requests are answered (not dropped), bad configs are turned away before they are
+installed, and an agent without a token only listens on loopback
+"""
+# standard library includes
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import control
+from py_lossy_network.config import NetworkConfig
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUB_TC = os.path.join(HERE, '..', 'benchmarks', 'stub_tc.py')
+
+EGRESS = {'avg_egress_bw': 500e3, 'std_dev_egress_bw': 0.0, 'egress_burst': 4096.0, 'egress_latency': 0.5,
+          'avg_egress_loss': 0.01, 'std_dev_egress_loss': 0.0, 'egress_avg_delay': 0.01, 'egress_std_dev_delay': 0.0}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_update_config_rejects_out_of_range_model_params():
+    with pytest.raises(ValueError):
+        control.update_config(NetworkConfig(), {'model': 'ar1', 'model_params': {'correlation': 1.0}})
+
+
+def test_agent_refuses_to_listen_beyond_loopback_without_a_token():
+    async def run():
+        async def nothing(*args):
+            return dict()
+        with pytest.raises(ValueError):
+            await control.Agent(nothing, nothing, nothing).start('0.0.0.0', 0)
+        agent = control.Agent(nothing, nothing, nothing, token='secret')
+        await agent.start('0.0.0.0', 0)
+        agent.close()
+    asyncio.run(run())
+
+
+def test_unexpected_exceptions_are_answered():
+    async def run():
+        async def apply(name, fields):
+            raise AssertionError("boom")
+
+        async def show(name):
+            return {'config': None}
+        agent = control.Agent(apply, show, show)
+        await agent.start('127.0.0.1', 0)
+        connection = control.AgentConnection('127.0.0.1', agent.port)
+        try:
+            answer = await connection.request('apply', interface='lo', config=dict())
+            assert not answer['ok'] and 'boom' in answer['error']
+            # the same connection still answers
+            assert (await connection.request('show', interface='lo'))['ok']
+        finally:
+            connection.close()
+            agent.close()
+    asyncio.run(run())
+
+
+def test_agent_turns_away_a_config_it_cannot_build(tmp_path):
+    port = free_port()
+    env = dict(os.environ, PY_LOSSY_NETWORK_TC='{0} {1}'.format(sys.executable, STUB_TC))
+    env.pop('PY_LOSSY_NETWORK_TOKEN', None)
+    agent = subprocess.Popen([sys.executable, os.path.join(HERE, '..', 'lossy_network.py'), '--agent',
+                              '127.0.0.1:{0}'.format(port)], env=env, cwd=tmp_path,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    async def run():
+        connection = control.AgentConnection('127.0.0.1', port)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                await connection.connect()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+        try:
+            # an AR(1) correlation of 1 is rejected by the model, not by the field checks
+            bad = dict(EGRESS, model='ar1', model_params={'correlation': 1.0})
+            answer = await connection.request('apply', interface='lo', config=bad)
+            assert not answer['ok']
+            assert (await connection.request('show', interface='lo'))['config'] is None
+
+            answer = await connection.request('apply', interface='lo', config=dict(EGRESS, model='ar1',
+                                                                                   model_params={'correlation': 0.5}))
+            assert answer['ok'], answer
+            assert (await connection.request('show', interface='lo'))['config']['model'] == 'ar1'
+        finally:
+            connection.close()
+    try:
+        asyncio.run(run())
+    finally:
+        agent.send_signal(signal.SIGTERM)
+        try:
+            agent.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            agent.kill()
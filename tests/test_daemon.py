@@ -0,0 +1,36 @@
+"""
+--daemon on its own only measures, so it never starts the `tc` processes (nor their `sudo`)
+"""
+# standard library includes
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUB_TC = os.path.join(HERE, '..', 'benchmarks', 'stub_tc.py')
+
+
+def test_measuring_alone_runs_no_tc(tmp_path):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    log = tmp_path / 'tc.log'
+    env = dict(os.environ, PY_LOSSY_NETWORK_TC='{0} {1}'.format(sys.executable, STUB_TC), STUB_TC_LOG=str(log))
+    # a probe of a port where no reflector listens: every datagram is lost, which is still a measurement
+    daemon = subprocess.Popen([sys.executable, os.path.join(HERE, '..', 'lossy_network.py'), '--daemon', '--probe',
+                               '127.0.0.1:{0}'.format(port), '--interval', '1s'], env=env, cwd=tmp_path,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        time.sleep(2.0)
+    finally:
+        daemon.send_signal(signal.SIGTERM)
+        try:
+            output, _ = daemon.communicate(timeout=20)
+        except subprocess.TimeoutExpired:
+            daemon.kill()
+            raise
+    assert daemon.returncode == 0, output
+    assert not log.exists(), log.read_text()
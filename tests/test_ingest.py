@@ -0,0 +1,149 @@
+"""
+ingesting raw logs: the format is told from the start of a file, a log split into byte ranges gives the same runs as the
+whole log, the logs the index already has are skipped, and an ingested run's raw text parses again to the same record
+"""
+# standard library includes
+import gzip
+import io
+import os
+import shutil
+
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import ingest
+from py_lossy_network import results
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'data')
+
+
+def read(name: str) -> bytes:
+    with open(os.path.join(DATA, name), 'rb') as f:
+        return f.read()
+
+
+def repeated(name: str, n: int) -> bytes:
+    # the sample log `n` times over, each run from its own client, so the runs can be told apart
+    text = read(name)
+    return b''.join(text.replace(b'172.17.0.2', '10.0.{0}.{1}'.format(i // 250, i % 250 + 1).encode('ascii'))
+                    for i in range(n))
+
+
+@pytest.mark.parametrize('name, log_format', [
+    ('iperf3_server_udp.txt', ingest.IPERF3),
+    ('iperf3_server_udp.json', ingest.IPERF3_JSON),
+    ('iperf3_server_udp.jsonl', ingest.IPERF3_JSON),
+    ('ping.txt', ingest.PING),
+    ('ping_busybox.txt', ingest.PING),
+    ('ping_macos.txt', ingest.PING),
+    ('tc_s_qdisc_show.txt', None),
+    ('README.md', None),
+])
+def test_detect_format(tmp_path, name, log_format):
+    assert ingest.detect_format(os.path.join(DATA, name)) == log_format
+    # gzipped, too
+    path = tmp_path / (name + '.gz')
+    with gzip.open(path, 'wb') as f:
+        f.write(read(name))
+    assert ingest.detect_format(str(path)) == log_format
+
+
+@pytest.mark.parametrize('name, log_format', [
+    ('iperf3_server_udp.txt', ingest.IPERF3),
+    ('iperf3_server_udp.jsonl', ingest.IPERF3_JSON),
+    ('ping.txt', ingest.PING),
+])
+def test_iter_runs_is_the_same_over_any_split(name, log_format):
+    text = repeated(name, 5)
+    whole = list(ingest.iter_runs(io.BytesIO(text), log_format))
+    assert b''.join(run for _, run in whole) == text
+    # (an iperf3 server also prints a banner while no client is connected, which is a run of its own)
+    assert len([run for _, run in whole if ingest.parse_run(log_format, run) is not None]) == 5
+    # ranges split anywhere, even mid-line or right at the start of a run, still give every run once
+    for split_bytes in [1, 7, 100, 1000, len(text) // 5, len(text) // 2]:
+        runs = []
+        for start in range(0, len(text), split_bytes):
+            runs.extend(ingest.iter_runs(io.BytesIO(text), log_format, start, min(start + split_bytes, len(text))))
+        assert runs == whole, split_bytes
+
+
+def test_ingesting_a_split_log_gives_the_same_records(tmp_path):
+    path = tmp_path / 'ping.log'
+    path.write_bytes(repeated('ping.txt', 40))
+    size = path.stat().st_size
+    whole_format, whole, num_failed = ingest.ingest_range(str(path), 0, None, 1000.0)
+    assert whole_format == ingest.PING and len(whole) == 40 and num_failed == 0
+
+    batches, stats, num_skipped = ingest.plan([str(path)], dict(), split_bytes=size // 7 + 1, batch_bytes=size)
+    ranges = [r for batch in batches for r in batch]
+    assert len(ranges) == 7 and num_skipped == 0 and list(stats) == [str(path)]
+    split = [record for _, start, stop, mtime in ranges
+             for record in ingest.ingest_range(str(path), start, stop, mtime)[1]]
+    assert len(split) == len(whole)
+    for a, b in zip(split, whole):
+        assert a.keys() == b.keys()
+        for key in a:
+            if key == 'timestamp':
+                continue  # the file's mtime, from `plan`, rather than the 1000.0 given above
+            assert np.array_equal(a[key], b[key]) if isinstance(a[key], np.ndarray) else a[key] == b[key], key
+
+
+def test_plan_skips_what_the_index_has(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / 'ping{0}.log'.format(i)
+        path.write_bytes(read('ping.txt'))
+        paths.append(str(path))
+    large = tmp_path / 'large.log'
+    large.write_bytes(repeated('ping.txt', 10))
+    packed = tmp_path / 'large.log.gz'
+    with gzip.open(packed, 'wb') as f:
+        f.write(large.read_bytes())
+    paths += [str(large), str(packed)]
+
+    stat = os.stat(paths[0])
+    index = {
+        paths[0]: {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},  # unchanged: skipped
+        paths[1]: {'size': stat.st_size + 1, 'mtime_ns': stat.st_mtime_ns},  # changed since: ingested again
+    }
+    split_bytes = len(read('ping.txt')) * 3
+    batches, stats, num_skipped = ingest.plan(paths, index, split_bytes=split_bytes, batch_bytes=split_bytes * 2)
+    assert num_skipped == 1
+    assert sorted(stats) == sorted(paths[1:])
+    ranges = [r for batch in batches for r in batch]
+    # the large log is split into ranges that cover it; a gzipped log is never split
+    large_ranges = [(start, stop) for path, start, stop, _ in ranges if path == str(large)]
+    assert large_ranges[0][0] == 0 and large_ranges[-1][1] == large.stat().st_size and len(large_ranges) == 4
+    assert [(start, stop) for path, start, stop, _ in ranges if path == str(packed)] == [(0, None)]
+    # and every batch but the last holds at least `batch_bytes`, and no more than one range beyond it
+    for batch in batches[:-1]:
+        sizes = [split_bytes if stop is not None else os.path.getsize(path) for path, _, stop, _ in batch]
+        assert sum(sizes) >= split_bytes * 2 > sum(sizes[:-1])
+
+
+def test_reparse_gives_the_stored_record(tmp_path):
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    (logs / 'ping.log').write_bytes(repeated('ping.txt', 3))
+    shutil.copy(os.path.join(DATA, 'iperf3_server_udp.txt'), logs / 'iperf3.log')
+    h5_path, outcomes, num_skipped, num_bytes = ingest.run([str(logs)], str(tmp_path / 'out'), workers=1)
+    assert outcomes == {str(logs / 'iperf3.log'): (ingest.IPERF3, 1, 0), str(logs / 'ping.log'): (ingest.PING, 3, 0)}
+
+    with results.ResultsReader(h5_path) as reader:
+        assert len(reader) == 4
+        formats = list(reader.column('source_format'))
+        for i in range(len(reader)):
+            record = ingest.reparse(reader, i)
+            assert record['client_ip'] == reader.column('client_ip', i, i + 1)[0]
+            if formats[i] == ingest.PING:
+                assert np.array_equal(record['delay_ms'], reader.run('delay_ms', i))
+                assert record['percent_lost_tcp'] == reader.column('percent_lost_tcp', i, i + 1)[0]
+            else:
+                assert np.array_equal(record['bitrate_kbps'], reader.run('bitrate_kbps', i))
+                assert record['percent_lost_udp'] == reader.column('percent_lost_udp', i, i + 1)[0]
+
+    # a second run finds nothing new
+    h5_path, outcomes, num_skipped, num_bytes = ingest.run([str(logs)], str(tmp_path / 'out'), workers=1)
+    assert h5_path is None and num_skipped == 2
@@ -0,0 +1,81 @@
+"""
+the interface inventory reads sysfs (here, a directory laid out like it), and re-reads it only when the cache is older
+than its ttl, or when a lookup misses and the last read is older than the miss interval
+"""
+# internal includes
+from py_lossy_network import interfaces
+
+
+class Clock:
+    # stands in for the `time` module, with a monotonic clock moved by hand
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def add_interface(root, name: str, **attributes):
+    directory = root / name
+    directory.mkdir()
+    for attribute, value in attributes.items():
+        (directory / attribute).write_text('{0}\n'.format(value))
+
+
+def make_sysfs(root):
+    add_interface(root, 'lo', ifindex=1, mtu=65536, operstate='unknown', address='00:00:00:00:00:00')
+    add_interface(root, 'eth0', ifindex=3, mtu=1500, operstate='up', speed=1000, address='52:54:00:12:34:56')
+    # veths report no speed (reading it fails), some drivers report -1
+    add_interface(root, 'veth0', ifindex=2, mtu=1500, operstate='down', speed=-1)
+    # an interface removed while it was being read
+    add_interface(root, 'gone0', ifindex=9)
+
+
+def test_read_interfaces(tmp_path):
+    make_sysfs(tmp_path)
+    found = interfaces.read_interfaces(str(tmp_path))
+    assert sorted(found) == ['eth0', 'lo', 'veth0']
+    assert found['eth0'] == interfaces.Interface(name='eth0', ifindex=3, mtu=1500, operstate='up', speed=1000,
+                                                 address='52:54:00:12:34:56')
+    assert found['veth0'].speed is None and found['veth0'].address is None
+    assert interfaces.read_interfaces(str(tmp_path / 'nosuchdir')) == dict()
+
+
+def test_the_cache_is_re_read_after_its_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(interfaces, 'time', clock)
+    make_sysfs(tmp_path)
+    inventory = interfaces.Inventory(ttl=5.0, miss_interval=0.5, root=str(tmp_path))
+    assert inventory.names() == ['lo', 'veth0', 'eth0']
+    assert inventory.num_refreshes == 1
+
+    (tmp_path / 'eth0' / 'mtu').write_text('9000\n')
+    clock.now += 4.0
+    assert inventory.get('eth0').mtu == 1500 and inventory.num_refreshes == 1
+    clock.now += 2.0
+    assert inventory.get('eth0').mtu == 9000 and inventory.num_refreshes == 2
+
+
+def test_a_miss_re_reads_at_most_every_miss_interval(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(interfaces, 'time', clock)
+    make_sysfs(tmp_path)
+    inventory = interfaces.Inventory(ttl=60.0, miss_interval=0.5, root=str(tmp_path))
+    assert 'eth0' in inventory and inventory.num_refreshes == 1
+
+    # a name that doesn't exist: right after a read, the miss doesn't re-read
+    for _ in range(10):
+        assert inventory.get('veth9') is None
+    assert inventory.num_refreshes == 1
+    clock.now += 1.0
+    assert inventory.get('veth9') is None and inventory.num_refreshes == 2
+    assert inventory.get('veth9') is None and inventory.num_refreshes == 2
+
+    # an interface created since (e.g. a container's veth) is found by the next miss that may re-read
+    add_interface(tmp_path, 'veth9', ifindex=10, mtu=1500, operstate='up')
+    assert 'veth9' not in inventory
+    clock.now += 1.0
+    assert 'veth9' in inventory and inventory.num_refreshes == 3
+    # and hits never re-read within the ttl
+    clock.now += 30.0
+    assert 'eth0' in inventory and 'veth9' in inventory and inventory.num_refreshes == 3
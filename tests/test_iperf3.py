@@ -0,0 +1,81 @@
+"""
+the iperf3 and ping parsers, on the sample outputs in benchmarks/data: the three iperf3 formats (text, `--json`, and
+`--json-stream`) describe the same test, so they must give the same results
+"""
+# standard library includes
+import json
+import math
+import os
+
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import utils
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'data')
+
+BITRATE_KBPS = [94100., 94900., 95000., 95000., 95000., 94800., 4060., 3990., 500., 95000., 90900.]
+
+
+def read(name: str, mode: str = 'r'):
+    with open(os.path.join(DATA, name), mode) as f:
+        return f.read()
+
+
+def process_records(records: list):
+    # what `receiver` does with the records of one test
+    start = [data for event, data in records if event == 'start'][0]
+    end = [data for event, data in records if event == 'end'][0]
+    return utils.process_iperf3_json(start, [data for event, data in records if event == 'interval'], end)
+
+
+def check_results(results):
+    client_ip, bitrate_kbps, lost, reordered = results
+    assert client_ip == '172.17.0.2'
+    np.testing.assert_allclose(bitrate_kbps, BITRATE_KBPS)
+    assert lost == pytest.approx(22 / 58112)
+    assert reordered == pytest.approx(4 / 58112)
+
+
+def test_json_stream_lines():
+    records = [utils.parse_iperf3_json_stream_line(line) for line in read('iperf3_server_udp.jsonl', 'rb').splitlines()]
+    assert [event for event, _ in records] == ['start'] + ['interval'] * 11 + ['end']
+    check_results(process_records(records))
+
+
+@pytest.mark.parametrize('line', [b'', b'iperf3: interrupt - the server has terminated', b'[1, 2]', b'{"data": 1}'])
+def test_json_stream_skips_what_isnt_a_record(line):
+    assert utils.parse_iperf3_json_stream_line(line) is None
+
+
+def test_json_document_matches_the_stream():
+    records = list(utils.iperf3_json_records(json.loads(read('iperf3_server_udp.json'))))
+    assert [event for event, _ in records] == ['start'] + ['interval'] * 11 + ['end']
+    check_results(process_records(records))
+
+
+def test_json_document_with_an_error():
+    document = json.loads(read('iperf3_server_udp.json'))
+    document['error'] = 'the client has unexpectedly closed the connection'
+    assert list(utils.iperf3_json_records(document))[-1] == ('error', document['error'])
+
+
+def test_no_datagrams_is_nan():
+    document = json.loads(read('iperf3_server_udp.json'))
+    document['end']['sum'].update(packets=0, lost_packets=0)
+    _, _, lost, reordered = process_records(list(utils.iperf3_json_records(document)))
+    assert math.isnan(lost) and math.isnan(reordered)
+
+
+def test_text_matches_json():
+    check_results(utils.process_iperf3(read('iperf3_server_udp.txt')))
+
+
+@pytest.mark.parametrize('name, num_replies, loss', [('ping.txt', 9, 0.1), ('ping_busybox.txt', 5, 0.0),
+                                                     ('ping_macos.txt', 5, 0.167)])
+def test_ping(name, num_replies, loss):
+    delay_ms, packet_loss = utils.process_ping(read(name))
+    assert len(delay_ms) == num_replies and np.all(delay_ms > 0)
+    assert packet_loss == pytest.approx(loss)
@@ -0,0 +1,141 @@
+"""
+counters and histograms are kept apart by their labels, histograms put values in the right buckets, failures are
+counted by cause, the Prometheus text lists all of it, and nothing is recorded while recording is disabled
+"""
+# standard library includes
+import asyncio
+import math
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import metrics
+
+
+@pytest.fixture
+def enabled():
+    # restore whether recording is enabled, whatever the test does
+    previous = metrics.is_enabled()
+    metrics.set_enabled(True)
+    yield
+    metrics.set_enabled(previous)
+
+
+def test_counters_are_kept_apart_by_their_labels():
+    registry = metrics.Registry()
+    registry.counter('requests_total', "requests", cause='timeout').inc()
+    registry.counter('requests_total', "requests", cause='timeout').inc(2)
+    registry.counter('requests_total', "requests", cause='not_found').inc()
+    # the order of the labels doesn't matter
+    registry.counter('moves_total', "moves", a='1', b='2').inc()
+    registry.counter('moves_total', "moves", b='2', a='1').inc()
+    assert registry.counter('requests_total', "requests", cause='timeout').value == 3
+    assert registry.counter('requests_total', "requests", cause='not_found').value == 1
+    assert registry.counter('moves_total', "moves", a='1', b='2').value == 2
+    # a name is either a counter or a histogram
+    with pytest.raises(ValueError):
+        registry.histogram('requests_total', "requests")
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = metrics.Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in [0.5, 1.0, 1.5, 3.0, 3.0, 10.0]:
+        histogram.observe(value)
+    # a value on a bound goes in that bound's bucket; beyond the last bound, in the unbounded one
+    assert histogram.counts == [2, 1, 2, 1]
+    assert histogram.count == 6 and histogram.sum == pytest.approx(19.0) and histogram.max == 10.0
+    # the median is the 3rd of 6 values: the whole of the (1, 2] bucket, i.e. its upper bound
+    assert histogram.quantile(0.5) == pytest.approx(2.0)
+    # the 4th of 6 values is half-way through the (2, 4] bucket
+    assert histogram.quantile(4 / 6) == pytest.approx(3.0)
+    # the last bucket ends at the largest value seen
+    assert histogram.quantile(1.0) == pytest.approx(10.0)
+    assert math.isnan(metrics.Histogram().quantile(0.5))
+
+
+def test_default_buckets():
+    assert metrics.DEFAULT_BUCKETS[0] == 1e-5 and metrics.DEFAULT_BUCKETS[-1] == 100.0
+    assert metrics.DEFAULT_BUCKETS[:5] == (1e-5, 1.78e-5, 3.16e-5, 5.62e-5, 1e-4)
+    assert list(metrics.DEFAULT_BUCKETS) == sorted(metrics.DEFAULT_BUCKETS)
+
+
+@pytest.mark.parametrize('error, cause', [
+    (FileNotFoundError(2, "No such file or directory: 'tc'"), 'not_found'),
+    (PermissionError(13, "Permission denied"), 'permission_denied'),
+    (asyncio.TimeoutError(), 'timeout'),
+    (TimeoutError(), 'timeout'),
+    (ConnectionRefusedError(111, "Connection refused"), 'connection'),
+    (BrokenPipeError(32, "Broken pipe"), 'connection'),
+    (ValueError("bad"), 'ValueError'),
+])
+def test_failure_cause(error, cause):
+    assert metrics.failure_cause(error) == cause
+
+
+def test_prometheus_text():
+    registry = metrics.Registry()
+    registry.counter('tc_failures_total', "failures of tc calls", cause='a "quoted"\nvalue').inc(3)
+    histogram = registry.histogram('tc_seconds', "durations of tc calls", operation='show')
+    histogram.observe(0.001)
+    histogram.observe(0.5)
+    lines = registry.exposition().splitlines()
+    assert lines[:3] == ['# HELP py_lossy_network_tc_failures_total failures of tc calls',
+                         '# TYPE py_lossy_network_tc_failures_total counter',
+                         'py_lossy_network_tc_failures_total{cause="a \\"quoted\\"\\nvalue"} 3']
+    assert lines[3:5] == ['# HELP py_lossy_network_tc_seconds durations of tc calls',
+                          '# TYPE py_lossy_network_tc_seconds histogram']
+    # the buckets are cumulative, and end with +Inf
+    assert 'py_lossy_network_tc_seconds_bucket{operation="show",le="0.000562"} 0' in lines
+    assert 'py_lossy_network_tc_seconds_bucket{operation="show",le="0.001"} 1' in lines
+    assert 'py_lossy_network_tc_seconds_bucket{operation="show",le="0.562"} 2' in lines
+    assert 'py_lossy_network_tc_seconds_bucket{operation="show",le="+Inf"} 2' in lines
+    assert lines[-2:] == ['py_lossy_network_tc_seconds_sum{operation="show"} 0.501',
+                          'py_lossy_network_tc_seconds_count{operation="show"} 2']
+    assert len(lines) == 5 + len(metrics.DEFAULT_BUCKETS) + 1 + 2
+
+
+def test_timer_and_timed_count_failures_by_cause(enabled):
+    with pytest.raises(FileNotFoundError):
+        with metrics.timer('test_timer_seconds', "a timed block", operation='x'):
+            raise FileNotFoundError(2, "No such file or directory")
+
+    @metrics.timed('test_timed_seconds', "a timed function")
+    def function(fail: bool):
+        if fail:
+            raise PermissionError(13, "Permission denied")
+
+    function(False)
+    with pytest.raises(PermissionError):
+        function(True)
+    assert metrics.REGISTRY.histogram('test_timer_seconds', "a timed block", operation='x').count == 1
+    assert metrics.REGISTRY.counter('test_timer_failures_total', "failures of a timed block", cause='not_found',
+                                    operation='x').value == 1
+    assert metrics.REGISTRY.histogram('test_timed_seconds', "a timed function").count == 2
+    assert metrics.REGISTRY.counter('test_timed_failures_total', "failures of a timed function",
+                                    cause='permission_denied').value == 1
+
+
+def test_nothing_is_recorded_while_disabled(enabled):
+    @metrics.timed('test_disabled_timed_seconds', "a timed function")
+    def function():
+        return 1
+
+    metrics.set_enabled(False)
+    assert not metrics.is_enabled()
+    metrics.count('test_disabled_total', "a counter")
+    metrics.observe('test_disabled_seconds', "a histogram", 1.0)
+    with metrics.timer('test_disabled_timer_seconds', "a timed block"):
+        pass
+    assert function() == 1
+    text = metrics.REGISTRY.exposition()
+    for name in ['test_disabled_total', 'test_disabled_seconds', 'test_disabled_timer_seconds']:
+        assert name not in text
+    # `timed` creates its histogram when it decorates, but never records in it
+    assert metrics.REGISTRY.histogram('test_disabled_timed_seconds', "a timed function").count == 0
+
+    metrics.set_enabled(True)
+    metrics.count('test_disabled_total', "a counter")
+    assert function() == 1
+    assert metrics.REGISTRY.counter('test_disabled_total', "a counter").value == 1
+    assert metrics.REGISTRY.histogram('test_disabled_timed_seconds', "a timed function").count == 1
@@ -0,0 +1,63 @@
+"""
+the rolling statistics forget the least recently measured clients beyond `max_clients`, summarize each window's samples,
+and only grow a client's buffers for the samples of the longest window
+"""
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import monitor
+
+
+def test_clients_beyond_max_clients_are_evicted():
+    stats = monitor.RollingStats(windows={'1m': 60.0}, max_clients=3)
+    for i, client in enumerate(['a', 'b', 'c']):
+        stats.add(client, {'timestamp': 1000.0 + i, 'delay_ms': np.array([1.0, 2.0])})
+    # measuring 'a' again makes 'b' the least recently measured
+    stats.add('a', {'timestamp': 1003.0, 'delay_ms': 3.0})
+    stats.add('d', {'timestamp': 1004.0, 'delay_ms': 4.0})
+    assert list(stats.snapshot(now=1010.0)) == ['c', 'a', 'd']
+    stats.add('e', {'timestamp': 1005.0, 'delay_ms': 5.0})
+    assert list(stats.snapshot(now=1010.0)) == ['a', 'd', 'e']
+
+
+def test_snapshot_summarizes_each_window():
+    stats = monitor.RollingStats(windows={'1m': 60.0, '10m': 600.0}, metrics=('delay_ms', 'percent_lost_udp'))
+    stats.add('a', {'timestamp': 1000.0, 'delay_ms': np.array([10.0, 20.0, np.nan]), 'percent_lost_udp': 0.5})
+    stats.add('a', {'timestamp': 1500.0, 'delay_ms': np.array([30.0, 40.0])})
+    snapshot = stats.snapshot(now=1530.0)['a']
+    assert snapshot['delay_ms']['1m'] == {'count': 2, 'mean': 35.0, 'std_dev': 5.0, 'min': 30.0, 'p50': 35.0,
+                                          'p95': pytest.approx(39.5), 'max': 40.0}
+    assert snapshot['delay_ms']['10m']['count'] == 4 and snapshot['delay_ms']['10m']['mean'] == 25.0
+    assert snapshot['percent_lost_udp']['1m'] == {'count': 0}
+    assert snapshot['percent_lost_udp']['10m']['mean'] == 0.5
+
+
+def test_buffers_grow_only_for_the_longest_window():
+    stats = monitor.RollingStats(windows={'1m': 60.0}, metrics=('delay_ms',), sample_rate=10.0)
+    assert stats.capacity == 600
+    # 10 samples a second, for 10 minutes: the buffer keeps the last minute's 600 samples, and no more
+    for t in range(600):
+        stats.add('a', {'timestamp': 1000.0 + t, 'delay_ms': np.full((10,), float(t))})
+    buffer = stats._clients['a']['delay_ms']
+    assert len(buffer.values) == 600
+    assert stats.snapshot(now=1599.0)['a']['delay_ms']['1m']['min'] == 540.0
+
+    # 1 sample every 10 seconds fills only a few slots more than it needs, and older samples are overwritten
+    stats.add('b', {'timestamp': 0.0, 'delay_ms': 0.0})
+    for t in range(1, 1000):
+        stats.add('b', {'timestamp': 10.0 * t, 'delay_ms': float(t)})
+    buffer = stats._clients['b']['delay_ms']
+    assert len(buffer.values) == 64
+    summary = stats.snapshot(now=9990.0)['b']['delay_ms']['1m']
+    assert summary['count'] == 7 and summary['min'] == 993.0 and summary['max'] == 999.0
+
+
+def test_ring_buffer_keeps_the_newest_samples_across_growth():
+    buffer = monitor.RingBuffer(capacity=8, initial_capacity=2)
+    for t in range(5):
+        buffer.add(float(t), [float(t)])
+    buffer.add(5.0, [5.0, 6.0, 7.0, 8.0])
+    assert len(buffer.values) == 8 and buffer.size == 8
+    assert sorted(buffer.since(0.0)) == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
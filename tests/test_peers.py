@@ -0,0 +1,95 @@
+"""
+the per-peer rules are valid `tc` commands: the qdisc and class commands go through the real `tc` parser (against a
+missing device, which it only looks up after parsing), and the whole sequence, filters included, is run on the loopback
+interface of a fresh network namespace when this machine allows one
+"""
+# standard library includes
+import json
+import shutil
+import subprocess
+import sys
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import peers
+from py_lossy_network import utils
+
+# run each command given on stdin (a JSON list) in this process's network namespace, and print their outcomes
+RUN_COMMANDS = """
+import json, subprocess, sys
+subprocess.run(['ip', 'link', 'set', 'lo', 'up'], check=True)
+outcomes = []
+for command in json.load(sys.stdin):
+    ret = subprocess.run(['tc'] + command.split(' '), capture_output=True)
+    outcomes.append((command, ret.returncode, ret.stderr.decode('utf-8', 'replace')))
+json.dump(outcomes, sys.stdout)
+"""
+
+
+class RecordingBackend:
+    # accepts every batch, and keeps them
+    def __init__(self):
+        self.batches = []
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        self.batches.append(list(commands))
+        return subprocess.CompletedProcess(args=commands, returncode=0, stdout=b"", stderr=b"")
+
+    def close(self):
+        pass
+
+
+def peer_commands(network_interface: str) -> list:
+    # the batches of adding peers of every kind, updating one in place, and removing one
+    backend = RecordingBackend()
+    previous = utils.get_tc_backend()
+    utils.set_tc_backend(backend)
+    try:
+        shaper = peers.PeerShaper()
+        profiles = {
+            '10.0.0.2': peers.PeerProfile(rate=1e6, loss=0.0, delay=0.0, jitter=0.0),
+            '10.0.1.0/24:5201': peers.PeerProfile(rate=2e6, loss=0.01, delay=0.05, jitter=0.005),
+            '10.0.0.3': peers.PeerProfile(rate=2e6, loss=0.01, delay=0.0, jitter=0.005),
+            '10.0.0.4:5201': peers.PeerProfile(rate=500e3, loss=0.02, delay=0.1, jitter=0.0, burst=16e3),
+        }
+        for match, profile in profiles.items():
+            assert shaper.set(network_interface, match, profile).returncode == 0
+        assert shaper.set(network_interface, '10.0.0.2', peers.PeerProfile(rate=4e6, loss=0.05, delay=0.02,
+                                                                           jitter=0.002)).returncode == 0
+        assert shaper.remove(network_interface, '10.0.0.3').returncode == 0
+    finally:
+        utils.set_tc_backend(previous)
+    # the first batch drops whatever the interface had
+    assert backend.batches[0] == ['qdisc del dev {0} root'.format(network_interface)]
+    return [command for batch in backend.batches[1:] for command in batch]
+
+
+@pytest.mark.skipif(shutil.which('tc') is None, reason="needs `tc`")
+def test_qdisc_and_class_commands_parse():
+    commands = [command for command in peer_commands('lossy0nosuchdev') if not command.startswith('filter ')]
+    assert any(' netem ' in command for command in commands)
+    for command in commands:
+        ret = subprocess.run(['tc'] + command.split(' '), capture_output=True)
+        assert b'Cannot find device' in ret.stderr, (command, ret.stderr)
+
+
+def namespace_available() -> bool:
+    if shutil.which('tc') is None or shutil.which('unshare') is None or shutil.which('ip') is None:
+        return False
+    ret = subprocess.run(['unshare', '-n', 'tc', 'qdisc', 'add', 'dev', 'lo', 'root', 'handle', '1:', 'htb'],
+                         capture_output=True)
+    return ret.returncode == 0
+
+
+@pytest.mark.skipif(not namespace_available(), reason="needs `tc` with `htb`, and a network namespace (root)")
+def test_commands_run_on_loopback():
+    commands = peer_commands('lo')
+    ret = subprocess.run(['unshare', '-n', sys.executable, '-c', RUN_COMMANDS], input=json.dumps(commands).encode('utf-8'),
+                         capture_output=True, check=True)
+    for command, returncode, stderr in json.loads(ret.stdout):
+        # the kernel may lack `netem`; `tc` has parsed the command by the time the kernel says so
+        if ' netem ' in command and 'qdisc kind is unknown' in stderr:
+            continue
+        assert returncode == 0, (command, stderr)
@@ -0,0 +1,94 @@
+"""
+the probe measures a loopback reflector without loss or reordering, and its statistics (the RFC 3550 interarrival jitter,
+the reordered fraction, and the duplicates) come out as worked out by hand
+"""
+# standard library includes
+import asyncio
+import socket
+
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import probe
+
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_loopback():
+    port = free_udp_port()
+
+    async def run():
+        reflector = await probe.start_reflector('127.0.0.1', port)
+        try:
+            return await probe.probe('127.0.0.1', port, count=200, rate=1000, timeout=1.0)
+        finally:
+            reflector.close()
+
+    result = asyncio.run(run())
+    assert result.count == 200
+    assert result.lost == 0.0 and result.lost_forward == 0.0 and result.reflector_received == 200
+    assert result.reordered == 0.0 and result.duplicates == 0
+    assert list(result.arrivals) == list(range(200))
+    assert np.all(result.rtt_ms > 0)
+    assert result.jitter_ms >= 0.0
+
+
+def hand_built(transit_ms: list, arrivals: list) -> probe.ProbeResult:
+    # datagrams sent every 10 ms, reaching a reflector whose clock is 1000 s ahead after `transit_ms` (None if lost)
+    ms = 1000000
+    count = len(transit_ms)
+    sent_ns = np.arange(count, dtype='int64') * 10 * ms
+    reflected_ns = np.array([-1 if t is None else 1000000 * ms + sent_ns[i] + t * ms for i, t in enumerate(transit_ms)],
+                            dtype='int64')
+    received_ns = np.array([-1 if t is None else sent_ns[i] + 2 * t * ms for i, t in enumerate(transit_ms)],
+                           dtype='int64')
+    return probe.ProbeResult(sent_ns=sent_ns, reflected_ns=reflected_ns, received_ns=received_ns,
+                             arrivals=np.array(arrivals, dtype='int64'), duplicates=0,
+                             reflector_received=count - transit_ms.count(None))
+
+
+def test_jitter_follows_the_rfc_3550_recurrence():
+    # the transit times 5, 7, 6, 6, 10 ms differ by |D| = 2, 1, 0, 4 ms, and J += (|D| - J) / 16 from J = 0 gives
+    # 0.125, 0.1796875, 0.16845703125, then 0.407928466796875 ms
+    result = hand_built([5, 7, 6, 6, 10], [0, 1, 2, 3, 4])
+    assert result.jitter_ms == pytest.approx(0.407928466796875)
+    # a lost datagram is skipped: 5, 6, 6, 10 ms give |D| = 1, 0, 4 and J = 0.0625, 0.05859375, 0.3049316406 ms
+    result = hand_built([5, None, 6, 6, 10], [0, 2, 3, 4])
+    assert result.jitter_ms == pytest.approx(0.30493164062)
+    assert result.lost == pytest.approx(0.2) and result.lost_forward == pytest.approx(0.2)
+    # a constant transit time has no jitter
+    assert hand_built([5, 5, 5], [0, 1, 2]).jitter_ms == 0.0
+
+
+def test_reordered():
+    # 1 arrives after 2, and 4 after 5: 2 late replies out of 6
+    result = hand_built([5] * 6, [0, 2, 1, 3, 5, 4])
+    assert result.reordered == pytest.approx(2 / 6)
+    # a reply that is late after several others counts once
+    assert hand_built([5] * 4, [1, 2, 3, 0]).reordered == pytest.approx(1 / 4)
+    assert hand_built([5] * 4, [0, 1, 2, 3]).reordered == 0.0
+
+
+def test_duplicates():
+    count = 3
+    result = probe.ProbeResult(sent_ns=np.zeros((count,), dtype='int64'),
+                               reflected_ns=np.full((count,), -1, dtype='int64'),
+                               received_ns=np.full((count,), -1, dtype='int64'),
+                               arrivals=np.zeros((count,), dtype='int64'), duplicates=0, reflector_received=0)
+    protocol = probe._SenderProtocol(result, run_id=7, done=asyncio.Event())
+
+    def reply(seq: int, run_id: int = 7) -> bytes:
+        return probe._HEADER.pack(probe._MAGIC, run_id, seq, 0, 1000 + seq, seq + 1)
+
+    for seq in [0, 1, 1, 0, 2]:
+        protocol.datagram_received(reply(seq), ('127.0.0.1', 5301))
+    protocol.datagram_received(reply(2, run_id=8), ('127.0.0.1', 5301))  # another run's
+    assert result.duplicates == 2
+    assert list(result.arrivals[:protocol.num_arrivals]) == [0, 1, 2]
+    assert result.reflector_received == 3 and protocol.done.is_set()
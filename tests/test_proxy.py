@@ -0,0 +1,143 @@
+"""
+the userspace proxies on loopback (as benchmarks/bench_proxy.py runs them, with smaller runs): a rate-limited UDP proxy
+delivers its rate, a lossy, delayed one drops and delays what it is told to, and `ProxyBackend` turns the `tc` commands of
+the shaper into those parameters
+"""
+# standard library includes
+import asyncio
+import socket
+import time
+
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import probe
+from py_lossy_network import proxy
+from py_lossy_network import shaping
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+PAYLOAD = 1200
+
+
+def free_udp_ports(n: int) -> list:
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(n)]
+    try:
+        for s in sockets:
+            s.bind(('127.0.0.1', 0))
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+class Sink(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.arrivals = []
+
+    def datagram_received(self, data, addr):
+        self.arrivals.append(time.perf_counter())
+
+
+async def blast(port: int, count: int, rate: float):
+    # send `count` datagrams to the proxy at `rate` datagrams per second
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    start = loop.time()
+    for i in range(count):
+        delay = start + i / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sock.sendto(bytes(PAYLOAD), ('127.0.0.1', port))
+    sock.close()
+
+
+@pytest.mark.parametrize('rate', [1e6, 4e6])
+def test_rate(rate):
+    proxy_port, sink_port = free_udp_ports(2)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        sink = Sink()
+        transport, _ = await loop.create_datagram_endpoint(lambda: sink, local_addr=('127.0.0.1', sink_port))
+        relay = proxy.UdpProxy(proxy_port, ('127.0.0.1', sink_port), '127.0.0.1', seed=1)
+        await relay.start()
+        try:
+            # offer 20% more than the rate for about a second, with a bucket of 10 ms at that rate
+            bits_per_datagram = (PAYLOAD + proxy.UDP_OVERHEAD) * 8
+            offered = 1.2 * rate / bits_per_datagram
+            relay.egress.configure(rate=rate, burst=max(rate / 8 * 0.01, 2 * PAYLOAD), latency=0.05)
+            await blast(proxy_port, int(offered), offered)
+            await asyncio.sleep(0.2)
+        finally:
+            relay.close()
+            transport.close()
+        return sink.arrivals, relay.egress.num_dropped_rate, bits_per_datagram
+
+    arrivals, dropped, bits_per_datagram = asyncio.run(run())
+    delivered = (len(arrivals) - 1) * bits_per_datagram / (arrivals[-1] - arrivals[0])
+    assert delivered == pytest.approx(rate, rel=0.05)
+    # the bucket drops the sixth of the offered load it can't queue within its latency
+    assert dropped > 0
+
+
+@pytest.mark.parametrize('loss, delay, jitter', [(0.0, 0.02, 0.0), (0.2, 0.05, 0.005)])
+def test_loss_and_delay(loss, delay, jitter):
+    proxy_port, reflector_port = free_udp_ports(2)
+
+    async def run():
+        reflector = await probe.start_reflector('127.0.0.1', reflector_port)
+        relay = proxy.UdpProxy(proxy_port, ('127.0.0.1', reflector_port), '127.0.0.1', seed=1)
+        await relay.start()
+        try:
+            relay.egress.configure(loss=loss, delay=delay, jitter=jitter)
+            return await probe.probe('127.0.0.1', proxy_port, count=500, rate=500, timeout=0.5)
+        finally:
+            relay.close()
+            reflector.close()
+
+    result = asyncio.run(run())
+    # the replies come back unimpaired, so the loss and the delay are the egress link's alone
+    assert result.lost == pytest.approx(loss, abs=0.06)
+    rtt_ms = result.rtt_ms
+    assert np.mean(rtt_ms) == pytest.approx(delay * 1e3, abs=max(5.0, jitter * 1e3))
+    assert np.min(rtt_ms) >= 0.0
+    if jitter > 0:
+        assert np.std(rtt_ms) == pytest.approx(jitter * 1e3, rel=0.5)
+
+
+def test_backend_applies_the_shapers_commands():
+    relay = proxy.UdpProxy(0, ('127.0.0.1', 9), '127.0.0.1')
+    backend = proxy.ProxyBackend()
+    backend.register('proxy0', relay)
+    previous = utils.get_tc_backend()
+    utils.set_tc_backend(backend)
+    try:
+        config = NetworkConfig(avg_egress_bw=units.parse_rate('2mbit'), std_dev_egress_bw=0.0,
+                               egress_burst=units.parse_size('32kbit'), egress_latency=units.parse_time('100ms'),
+                               avg_egress_loss=units.parse_percent('3%'), std_dev_egress_loss=0.0,
+                               egress_avg_delay=units.parse_time('40ms'), egress_std_dev_delay=units.parse_time('4ms'),
+                               avg_ingress_bw=units.parse_rate('1mbit'), std_dev_ingress_bw=0.0,
+                               ingress_burst=units.parse_size('16kbit'))
+        shaper = shaping.Shaper(verify_interval=None)
+        try:
+            assert shaper.apply('proxy0', config).returncode == 0
+        finally:
+            shaper.close()
+        assert relay.egress.rate == pytest.approx(2e6, rel=0.01)
+        assert relay.egress.latency == pytest.approx(0.1)
+        assert relay.egress.loss == pytest.approx(0.03, rel=0.01)
+        assert relay.egress.delay == pytest.approx(0.04, rel=0.01)
+        assert relay.egress.jitter == pytest.approx(0.004, rel=0.01)
+        assert relay.ingress.rate == pytest.approx(1e6, rel=0.01)
+
+        assert utils.del_tc_rules('proxy0', 'root').returncode == 0
+        assert relay.egress.rate is None and relay.egress.loss == 0.0 and relay.egress.delay == 0.0
+        assert utils.del_tc_rules('nosuchproxy', 'root').returncode != 0
+        assert utils.run_tc_batch(["qdisc replace dev proxy0 root handle 1:0 htb"]).returncode != 0
+    finally:
+        utils.set_tc_backend(previous)
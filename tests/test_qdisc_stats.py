@@ -0,0 +1,162 @@
+"""
+the qdisc statistics parser reads what `tc -s qdisc show` prints, and the sampler turns successive snapshots into
+increments and rates, across a qdisc being re-created, more qdiscs than it first made room for, and its ring wrapping
+around. the outputs below were captured from iproute2 6.1, in a fresh network namespace whose loopback interface got an
+htb root with a pfifo leaf (and an ingress qdisc) and was sent UDP datagrams faster than the htb class's 100kbit
+"""
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import qdisc_stats
+
+# `tc -s qdisc show`: every interface, so every qdisc names its device; veth0 and veth1 only have their default qdisc
+SHOW_ALL = """qdisc htb 1: dev lo root refcnt 2 r2q 10 default 0x10 direct_packets_stat 0 direct_qlen 1000
+ Sent 65536 bytes 1 pkt (dropped 3, overlimits 1 requeues 0) 
+ backlog 1Mb 16p requeues 0
+qdisc pfifo 10: dev lo parent 1:10 limit 16p
+ Sent 65536 bytes 1 pkt (dropped 3, overlimits 0 requeues 0) 
+ backlog 1Mb 16p requeues 0
+qdisc ingress ffff: dev lo parent ffff:fff1 ---------------- 
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 0b 0p requeues 0
+qdisc noqueue 0: dev veth1 root refcnt 2 
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 0b 0p requeues 0
+qdisc noqueue 0: dev veth0 root refcnt 2 
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 0b 0p requeues 0
+"""
+
+# `tc -s qdisc show dev lo`, with the same qdiscs: no device on the lines
+SHOW_DEV = """qdisc htb 1: root refcnt 2 r2q 10 default 0x10 direct_packets_stat 0 direct_qlen 1000
+ Sent 65536 bytes 1 pkt (dropped 3, overlimits 1 requeues 0) 
+ backlog 1Mb 16p requeues 0
+qdisc pfifo 10: parent 1:10 limit 16p
+ Sent 65536 bytes 1 pkt (dropped 3, overlimits 0 requeues 0) 
+ backlog 1Mb 16p requeues 0
+qdisc ingress ffff: parent ffff:fff1 ---------------- 
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 0b 0p requeues 0
+"""
+
+# `tc -s qdisc show dev lo` right after a burst, a second later, and after the qdiscs were deleted and re-created
+SNAPSHOTS = ["""qdisc htb 1: root refcnt 2 r2q 10 default 0x10 direct_packets_stat 0 direct_qlen 1000
+ Sent 2048 bytes 2 pkt (dropped 0, overlimits 1 requeues 0) 
+ backlog 118Kb 118p requeues 0
+qdisc pfifo 10: parent 1:10 limit 10000p
+ Sent 2048 bytes 2 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 118Kb 118p requeues 0
+""", """qdisc htb 1: root refcnt 2 r2q 10 default 0x10 direct_packets_stat 0 direct_qlen 1000
+ Sent 14336 bytes 14 pkt (dropped 0, overlimits 13 requeues 0) 
+ backlog 115624b 118p requeues 0
+qdisc pfifo 10: parent 1:10 limit 10000p
+ Sent 14336 bytes 14 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 115624b 118p requeues 0
+""", """qdisc htb 1: root refcnt 2 r2q 10 default 0x10 direct_packets_stat 0 direct_qlen 1000
+ Sent 2048 bytes 2 pkt (dropped 0, overlimits 1 requeues 0) 
+ backlog 1Kb 1p requeues 0
+qdisc pfifo 10: parent 1:10 limit 10000p
+ Sent 2048 bytes 2 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 1Kb 1p requeues 0
+"""]
+
+HTB = ('lo', 'htb 1:')
+PFIFO = ('lo', 'pfifo 10:')
+
+
+def test_parse_every_interface():
+    keys, values = qdisc_stats.parse_qdisc_stats(SHOW_ALL)
+    # the default qdiscs (handle 0:) are left out
+    assert keys == [HTB, PFIFO, ('lo', 'ingress ffff:')]
+    assert values.dtype == np.int64
+    # sent bytes and packets, dropped, overlimits, requeues, backlog bytes ("1Mb") and packets
+    assert values.tolist() == [[65536, 1, 3, 1, 0, 1024 ** 2, 16], [65536, 1, 3, 0, 0, 1024 ** 2, 16], [0] * 7]
+
+    keys, values = qdisc_stats.parse_qdisc_stats(SHOW_ALL, include_default=True)
+    assert keys[3:] == [('veth1', 'noqueue 0:'), ('veth0', 'noqueue 0:')]
+    assert values.shape == (5, len(qdisc_stats.FIELDS))
+
+
+def test_parse_one_interface():
+    keys, values = qdisc_stats.parse_qdisc_stats(SHOW_DEV, 'lo')
+    expected_keys, expected_values = qdisc_stats.parse_qdisc_stats(SHOW_ALL)
+    assert keys == expected_keys
+    assert np.array_equal(values, expected_values)
+
+
+def test_parse_backlog_suffixes():
+    backlog_bytes = qdisc_stats.FIELDS.index('backlog_bytes')
+    assert qdisc_stats.parse_qdisc_stats(SNAPSHOTS[0], 'lo')[1][:, backlog_bytes].tolist() == [118 * 1024] * 2
+    assert qdisc_stats.parse_qdisc_stats(SNAPSHOTS[1], 'lo')[1][:, backlog_bytes].tolist() == [115624] * 2
+    assert qdisc_stats.parse_qdisc_stats(SNAPSHOTS[2], 'lo')[1][:, backlog_bytes].tolist() == [1024] * 2
+
+
+def test_parse_nothing():
+    keys, values = qdisc_stats.parse_qdisc_stats('')
+    assert keys == [] and values.shape == (0, len(qdisc_stats.FIELDS))
+
+
+def add(sampler: qdisc_stats.QdiscSampler, timestamp: float, tc_output: str, include_default: bool = False):
+    sampler.add(timestamp, *qdisc_stats.parse_qdisc_stats(tc_output, 'lo', include_default=include_default))
+
+
+def test_rates_and_a_counter_reset():
+    sampler = qdisc_stats.QdiscSampler()
+    add(sampler, 100.0, SNAPSHOTS[0])
+    # the first snapshot is only a baseline
+    assert len(sampler.take_rows()) == 0 and sampler.latest('lo') == dict()
+
+    add(sampler, 102.0, SNAPSHOTS[1])
+    rows = sampler.take_rows()
+    assert [(row['interface'], row['qdisc']) for row in rows] == [(b'lo', b'htb 1:'), (b'lo', b'pfifo 10:')]
+    assert rows['interval'].tolist() == [2.0, 2.0]
+    assert rows['sent_bytes'].tolist() == [12288, 12288] and rows['overlimits'].tolist() == [12, 0]
+    assert rows['backlog_bytes'].tolist() == [115624, 115624]  # a gauge, as is
+    latest = sampler.latest('lo')
+    assert latest['htb 1:']['sent_bytes'] == 6144.0 and latest['htb 1:']['sent_packets'] == 6.0
+    assert latest['htb 1:']['backlog_packets'] == 118.0
+
+    # the qdiscs were re-created: their counters went backwards, and all they counted is new
+    add(sampler, 103.0, SNAPSHOTS[2])
+    assert sampler.num_resets == 2
+    rows = sampler.take_rows()
+    assert rows['sent_bytes'].tolist() == [2048, 2048] and rows['sent_packets'].tolist() == [2, 2]
+    assert rows['overlimits'].tolist() == [1, 0]
+
+
+def test_growing_past_max_series():
+    sampler = qdisc_stats.QdiscSampler(max_series=2)
+    add(sampler, 100.0, SNAPSHOTS[0])
+    add(sampler, 101.0, SNAPSHOTS[1])
+    # the ingress qdisc and the two default ones don't fit in the 2 columns first allocated
+    sampler.add(102.0, *qdisc_stats.parse_qdisc_stats(SHOW_ALL, include_default=True))
+    sampler.add(103.0, *qdisc_stats.parse_qdisc_stats(SHOW_ALL, include_default=True))
+    assert len(sampler.keys) == 5 and sampler.rates.shape[1] >= 5
+    # what was sampled before the columns grew is still there
+    times, rates = sampler.history(HTB)
+    assert times.tolist() == [100.0, 101.0, 102.0, 103.0]
+    sent_bytes = qdisc_stats.FIELDS.index('sent_bytes')
+    # (SHOW_ALL comes from another namespace, so its packet counts went backwards: a reset)
+    assert np.isnan(rates[0, sent_bytes]) and rates[1:, sent_bytes].tolist() == [12288.0, 65536.0, 0.0]
+    times, rates = sampler.history(('veth0', 'noqueue 0:'))
+    assert np.isnan(rates[:3]).all() and rates[3].tolist() == [0.0] * len(qdisc_stats.FIELDS)
+    assert len(sampler.take_rows()) == 2 + 2 + 5
+
+
+def test_the_ring_wraps_around():
+    sampler = qdisc_stats.QdiscSampler(capacity=3)
+    sent_bytes = 0
+    for t in range(5):
+        # every second, 1000 more bytes sent
+        sent_bytes += 1000
+        sampler.add(float(t), [HTB], np.array([[sent_bytes, t, 0, 0, 0, 0, 0]], dtype='int64'))
+    times, rates = sampler.history(HTB)
+    # the oldest snapshots were overwritten, and the rest come out oldest first
+    assert times.tolist() == [2.0, 3.0, 4.0]
+    assert rates[:, 0].tolist() == [1000.0] * 3
+    assert sampler.latest('lo')['htb 1:']['sent_bytes'] == 1000.0
+    assert sampler.num_samples == 5
+    times, rates = sampler.history(('lo', 'nosuch 1:'))
+    assert times.tolist() == [2.0, 3.0, 4.0] and np.isnan(rates).all()
@@ -0,0 +1,85 @@
+"""
+the receiver against the stand-in `iperf3` and `ping` in benchmarks/stub_bin, on loopback: several senders are measured
+at once, each from its own server
+"""
+# standard library includes
+import asyncio
+import os
+import socket
+import time
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import receiver
+from py_lossy_network import utils
+
+STUB_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'stub_bin')
+
+# the sample test has 10.01 intervals, so a sender's test takes about 10 * INTERVAL seconds
+INTERVAL = 0.1
+PING_INTERVAL = 0.05
+
+
+@pytest.fixture
+def stub_bin(monkeypatch):
+    monkeypatch.setenv('PATH', STUB_BIN + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('STUB_IPERF3_INTERVAL', str(INTERVAL))
+    monkeypatch.setenv('STUB_PING_INTERVAL', str(PING_INTERVAL))
+    monkeypatch.delenv('STUB_IPERF3_VERSION', raising=False)
+    utils.iperf3_supports_json_stream.cache_clear()
+    yield monkeypatch
+    utils.iperf3_supports_json_stream.cache_clear()
+
+
+def free_ports(n: int) -> list:
+    sockets = [socket.socket() for _ in range(n)]
+    try:
+        for s in sockets:
+            s.bind(('127.0.0.1', 0))
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+async def cycle(ports: list, **kwargs) -> (list, list, float):
+    # what bench_multi_client.py does: servers on every port, then one sender per port
+    start = time.monotonic()
+    servers = asyncio.ensure_future(receiver.receive(ports, timeout=10.0, ping_count=3, **kwargs))
+    await asyncio.sleep(0.5)  # let the servers start listening
+    senders = await asyncio.gather(*[utils.iperf3_client('127.0.0.1', port) for port in ports])
+    records, errors = await servers
+    assert all(proc.returncode == 0 for proc in senders), [proc.stderr for proc in senders]
+    return records, errors, time.monotonic() - start
+
+
+def test_several_senders_at_once(stub_bin):
+    ports = free_ports(4)
+    records, errors, seconds = asyncio.run(cycle(ports))
+    assert errors == []
+    assert len(records) == len(ports)
+    for record in records:
+        assert record['client_ip'] == '127.0.0.1'
+        assert len(record['bitrate_kbps']) == 11
+        assert record['percent_lost_udp'] == pytest.approx(22 / 58112)
+        assert len(record['delay_ms']) == 3 and record['percent_lost_tcp'] == 0.0
+        assert record['mode'] == receiver.SEQUENTIAL
+    # one after the other, the senders would take at least 4 * (10 * INTERVAL + 2 * PING_INTERVAL) = 4.4 s
+    assert seconds < 3.5
+
+
+def test_a_port_without_a_sender_times_out(stub_bin):
+    async def run():
+        return await receiver.receive(free_ports(1), timeout=0.5, ping_count=1)
+    assert asyncio.run(run()) == ([], [])
+
+
+@pytest.mark.parametrize('version, mode', [('3.17.1', receiver.PIPELINED), ('3.16', receiver.SEQUENTIAL)])
+def test_pipelined_runs_need_json_stream(stub_bin, version, mode):
+    # without `--json-stream`, the sender is only known after its test, so it can't be pinged during it
+    stub_bin.setenv('STUB_IPERF3_VERSION', version)
+    records, errors, _ = asyncio.run(cycle(free_ports(1), mode=receiver.PIPELINED))
+    assert errors == [] and len(records) == 1
+    assert records[0]['mode'] == mode
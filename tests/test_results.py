@@ -0,0 +1,141 @@
+"""
+the results writer keeps its batch when a write fails: the background thread reports the failure, keeps running, and
+writes the batch once it can, and a write that fails part of the way leaves no partial records behind. a record that
+doesn't fit its datasets is dropped on its own, and only so many results wait in memory. the reader reads the same runs
+out of the flat (version 2) layout and the variable-length (version 1) one
+"""
+# standard library includes
+import time
+
+# external library includes
+import h5py
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import results
+
+
+def test_a_failed_write_is_retried(tmp_path, capsys):
+    writer = results.ResultsWriter(str(tmp_path / 'results.h5'), flush_interval=0.05, flush_records=1)
+    writer.add_dataset('timestamp', float)
+    writer.add_ragged_dataset('delay_ms')
+    write = writer._write
+    failures = []
+
+    def flaky(records):
+        if len(records) > 0 and len(failures) < 2:
+            failures.append(records)
+            raise OSError(28, "No space left on device")
+        write(records)
+    writer._write = flaky
+
+    writer.append({'timestamp': 1.0, 'delay_ms': np.array([1.0, 2.0])})
+    deadline = time.monotonic() + 10
+    while writer.num_write_failures < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.append({'timestamp': 2.0, 'delay_ms': np.array([3.0])})
+    writer.close()
+
+    assert writer.num_write_failures == 2 and isinstance(writer.last_write_error, OSError)
+    # one report for the streak, not one per attempt
+    assert capsys.readouterr().out.count("could not write the results") == 1
+    reader = results.ResultsReader(str(tmp_path / 'results.h5'))
+    try:
+        assert list(reader.h5_file['timestamp'][:]) == [1.0, 2.0]
+        assert list(reader.h5_file['delay_ms'][:]) == [1.0, 2.0, 3.0]
+        assert list(reader.h5_file['delay_ms_offsets'][:]) == [0, 2, 3]
+    finally:
+        reader.h5_file.close()
+
+
+def test_a_record_that_does_not_fit_is_dropped_alone(tmp_path, capsys):
+    writer = results.ResultsWriter(str(tmp_path / 'results.h5'), flush_interval=0.05, flush_records=16)
+    writer.add_dataset('timestamp', float)
+    writer.add_dataset('percent_lost_udp', float)
+    writer.append({'timestamp': 0.0, 'percent_lost_udp': 'not a number'})
+    for i in range(100):
+        writer.append({'timestamp': float(i + 1), 'percent_lost_udp': 0.0})
+    writer.append_rows('stats', np.zeros((2,), dtype=[('a', 'f8')]))
+    writer.append_rows('stats', np.zeros((3,), dtype=[('a', 'S4'), ('b', 'f8')]))  # doesn't fit the table
+    writer.close()
+
+    assert writer.num_rejected_records == 1 and writer.num_rejected_rows == 3
+    assert writer.num_write_failures == 0
+    assert capsys.readouterr().out.count("dropped results that don't fit") == 1
+    reader = results.ResultsReader(str(tmp_path / 'results.h5'))
+    try:
+        assert list(reader.h5_file['timestamp'][:]) == [float(i + 1) for i in range(100)]
+        assert reader.h5_file['percent_lost_udp'].shape[0] == 100
+        assert reader.h5_file['stats'].shape[0] == 2
+    finally:
+        reader.h5_file.close()
+
+
+def test_pending_results_are_bounded(tmp_path, capsys):
+    writer = results.ResultsWriter(str(tmp_path / 'results.h5'), flush_interval=60.0, flush_records=1000,
+                                   max_pending=10, max_pending_rows=4)
+    writer.add_dataset('timestamp', float)
+    for i in range(15):
+        writer.append({'timestamp': float(i)})
+    for _ in range(3):
+        writer.append_rows('stats', np.zeros((2,), dtype=[('a', 'f8')]))
+    assert writer.num_dropped_records == 5 and writer.num_dropped_rows == 2
+    assert capsys.readouterr().out.count("too many results") == 1
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.append({'timestamp': 15.0})
+    reader = results.ResultsReader(str(tmp_path / 'results.h5'))
+    try:
+        # the oldest are kept
+        assert list(reader.h5_file['timestamp'][:]) == [float(i) for i in range(10)]
+        assert reader.h5_file['stats'].shape[0] == 4
+    finally:
+        reader.h5_file.close()
+
+
+# the runs of the reader tests: a client, its loss, and its bitrate samples (the second run has none)
+RUNS = [('10.0.0.1', 0.5, [1.0, 2.0, 3.0]), ('10.0.0.2', 0.0, []), ('10.0.0.3', 1.5, [4.0, 5.0])]
+
+
+def write_v2(path: str):
+    with results.ResultsWriter(path) as writer:
+        writer.add_dataset('client_ip', results.vlen_str_dt)
+        writer.add_dataset('percent_lost_udp', float)
+        writer.add_ragged_dataset('bitrate_kbps')
+        for client_ip, lost, bitrate in RUNS:
+            writer.append({'client_ip': client_ip, 'percent_lost_udp': lost, 'bitrate_kbps': np.array(bitrate)})
+
+
+def write_v1(path: str):
+    # as sessions wrote them before `FORMAT_VERSION` 2: a variable-length dataset per per-run array, and no attribute
+    with h5py.File(path, 'w') as h5_file:
+        h5_file.create_dataset('client_ip', data=[client_ip for client_ip, _, _ in RUNS], dtype=results.vlen_str_dt)
+        h5_file.create_dataset('percent_lost_udp', data=[lost for _, lost, _ in RUNS])
+        bitrate = h5_file.create_dataset('bitrate_kbps', shape=(len(RUNS),), dtype=results.vlen_np_float_dt)
+        for i, (_, _, samples) in enumerate(RUNS):
+            bitrate[i] = np.array(samples)
+
+
+@pytest.mark.parametrize('write, version', [(write_v1, 1), (write_v2, 2)])
+def test_reader_reads_both_layouts(tmp_path, write, version):
+    path = str(tmp_path / 'results.h5')
+    write(path)
+    with results.ResultsReader(path) as reader:
+        assert reader.format_version == version
+        assert len(reader) == 3
+        assert sorted(reader.keys()) == ['bitrate_kbps', 'client_ip', 'percent_lost_udp']
+        assert reader.is_ragged('bitrate_kbps')
+        assert not reader.is_ragged('client_ip') and not reader.is_ragged('percent_lost_udp')
+
+        assert list(reader.column('client_ip')) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+        assert list(reader.column('percent_lost_udp', 1)) == [0.0, 1.5]
+
+        samples, offsets = reader.samples('bitrate_kbps')
+        assert samples.tolist() == [1.0, 2.0, 3.0, 4.0, 5.0] and offsets.tolist() == [0, 3, 3, 5]
+        # a range's offsets start at its first run
+        samples, offsets = reader.samples('bitrate_kbps', 1, 3)
+        assert samples.tolist() == [4.0, 5.0] and offsets.tolist() == [0, 0, 2]
+        assert reader.run('bitrate_kbps', 0).tolist() == [1.0, 2.0, 3.0]
+        assert reader.run('bitrate_kbps', 1).tolist() == []
+        assert reader.run('bitrate_kbps', -1).tolist() == [4.0, 5.0]
@@ -0,0 +1,31 @@
+"""
+the scenarios shipped in scenarios/ compile, and every `tc` command they produce is accepted by the real `tc` parser
+"""
+# standard library includes
+import glob
+import os
+import shutil
+import subprocess
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import scenario
+
+SCENARIOS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenarios', '*')))
+
+
+@pytest.mark.parametrize('path', SCENARIOS, ids=os.path.basename)
+def test_shipped_scenario_commands_parse(path):
+    if shutil.which('tc') is None:
+        pytest.skip("needs `tc`")
+    compiled = scenario.compile_scenario(scenario.load(path))
+    assert len(compiled) > 0
+    for i, commands in enumerate(compiled.commands):
+        network_interface = compiled.names[compiled.interfaces[i]]
+        for command in commands:
+            # the real `tc` parses the whole command before it looks the device up, so a missing device means it was valid
+            args = ['lossy0nosuchdev' if arg == network_interface else arg for arg in command.split(' ')]
+            ret = subprocess.run(['tc'] + args, capture_output=True)
+            assert b'Cannot find device' in ret.stderr, (command, ret.stderr)
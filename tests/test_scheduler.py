@@ -0,0 +1,58 @@
+"""
+the tick scheduler retrieves the exception of every failed update (and treats a failed `tc` call as one): it is counted
+on the interface's state, and reported once per streak of failures
+"""
+# standard library includes
+import asyncio
+import gc
+import subprocess
+import time
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import scheduler
+from py_lossy_network.config import NetworkConfig
+
+
+class FailingShaper:
+    # a shaper whose first `num_failures` updates raise (or, with `returncode`, whose `tc` call fails)
+    def __init__(self, num_failures: int, returncode: int = 0):
+        self.num_failures = num_failures
+        self.returncode = returncode
+        self.num_updates = 0
+
+    def submit(self, network_interface: str, config) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.num_updates += 1
+        if self.num_updates > self.num_failures:
+            future.set_result(subprocess.CompletedProcess(args=[], returncode=0, stdout=b"", stderr=b""))
+        elif self.returncode != 0:
+            future.set_result(subprocess.CompletedProcess(args=[], returncode=self.returncode, stdout=b"",
+                                                          stderr=b"RTNETLINK answers: Operation not permitted\n"))
+        else:
+            future.set_exception(OSError(2, "No such file or directory: 'tc'"))
+        return future
+
+
+@pytest.mark.parametrize('returncode', [0, 2])
+def test_failed_updates_are_counted_and_reported_once(returncode, capsys, caplog):
+    shaper = FailingShaper(num_failures=3, returncode=returncode)
+    tick_scheduler = scheduler.TickScheduler(default_period=0.01)
+    deadline = time.monotonic() + 10
+
+    async def run():
+        await tick_scheduler.run(shaper, {'veth0': NetworkConfig()},
+                                 lambda: shaper.num_updates >= 5 or time.monotonic() > deadline)
+    asyncio.run(run())
+    gc.collect()
+
+    state = tick_scheduler.stats()['veth0']
+    assert state.failures == 3
+    assert state.last_error is None  # the later updates succeeded
+    output = capsys.readouterr().out
+    assert output.count("updating veth0 failed") == 1
+    assert ("Operation not permitted" if returncode != 0 else "No such file") in output
+    # nothing was left for asyncio to complain about
+    assert "exception was never retrieved" not in caplog.text
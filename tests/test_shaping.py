@@ -0,0 +1,117 @@
+"""
+the shaper skips a `tc` call when the interface already has (nearly) the sampled parameters, and forgets what it applied
+when the interface's rules are deleted or changed by someone else
+"""
+# standard library includes
+import subprocess
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import shaping
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+
+class RecordingBackend:
+    # accepts every batch, and keeps them
+    def __init__(self):
+        self.batches = []
+
+    def run(self, commands: list) -> subprocess.CompletedProcess:
+        self.batches.append(list(commands))
+        return subprocess.CompletedProcess(args=commands, returncode=0, stdout=b"", stderr=b"")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def backend():
+    backend = RecordingBackend()
+    previous = utils.get_tc_backend()
+    utils.set_tc_backend(backend)
+    yield backend
+    utils.set_tc_backend(previous)
+
+
+def egress_config(std_dev_bw: float = 0.0) -> NetworkConfig:
+    return NetworkConfig(avg_egress_bw=units.parse_rate('2mbit'), std_dev_egress_bw=std_dev_bw,
+                         egress_burst=units.parse_size('32kbit'), egress_latency=units.parse_time('100ms'),
+                         avg_egress_loss=units.parse_percent('1%'), std_dev_egress_loss=0.0,
+                         egress_avg_delay=units.parse_time('40ms'), egress_std_dev_delay=units.parse_time('4ms'),
+                         model_params={'seed': 1})
+
+
+# what `tc qdisc show` prints after the rules of `egress_config` are applied
+TC_SHOW = """qdisc tbf 1: root refcnt 2 rate 2Mbit burst 4Kb lat 100ms
+qdisc netem 10: parent 1:1 limit 1000 delay 40ms  4ms loss 1%
+"""
+
+
+def test_an_identical_sample_is_skipped(backend):
+    shaper = shaping.Shaper(verify_interval=None)
+    try:
+        for _ in range(3):
+            assert shaper.apply('veth0', egress_config()).returncode == 0
+    finally:
+        shaper.close()
+    assert len(backend.batches) == 1
+    assert shaper.num_applied == 1 and shaper.num_skipped == 2
+
+
+def test_a_sample_within_the_tolerance_is_skipped(backend):
+    # a rate that moves by about 0.1% each time: every sample is a new `tc` command, but not worth one at 5%
+    config = egress_config(std_dev_bw=units.parse_rate('2kbit'))
+    strict = shaping.Shaper(verify_interval=None)
+    tolerant = shaping.Shaper(tolerance=0.05, verify_interval=None)
+    try:
+        for _ in range(5):
+            strict.apply('veth0', config)
+            tolerant.apply('veth1', config)
+    finally:
+        strict.close()
+        tolerant.close()
+    assert strict.num_applied == 5 and strict.num_skipped == 0
+    assert tolerant.num_applied == 1 and tolerant.num_skipped == 4
+
+
+def test_deleting_the_rules_forgets_them(backend):
+    shaper = shaping.Shaper(verify_interval=None)
+    try:
+        shaper.apply('veth0', egress_config())
+        # as `del` does
+        shaper.invalidate('veth0')
+        shaper.apply('veth0', egress_config())
+    finally:
+        shaper.close()
+    assert len(backend.batches) == 2 and backend.batches[0] == backend.batches[1]
+
+
+def test_an_external_change_forgets_the_rules(backend):
+    shaper = shaping.Shaper(verify_interval=None)
+    try:
+        shaper.apply('veth0', egress_config())
+        # `tc` shows what we applied: nothing changed, and the next sample is still skipped
+        assert shaper.check('veth0', TC_SHOW) == []
+        shaper.apply('veth0', egress_config())
+        assert len(backend.batches) == 1
+        # someone else changed the rate
+        assert shaper.check('veth0', TC_SHOW.replace('2Mbit', '5Mbit')) == ['egress']
+        shaper.apply('veth0', egress_config())
+        assert len(backend.batches) == 2
+        # or removed the rules
+        assert shaper.check('veth0', "qdisc noqueue 0: root refcnt 2\n") == ['egress']
+        shaper.apply('veth0', egress_config())
+        assert len(backend.batches) == 3
+    finally:
+        shaper.close()
+
+
+@pytest.mark.parametrize('sample, shown', [(1234567.4, '1.23457Mbit'), (2e6, '2Mbit'), (999.6, '1Kbit')])
+def test_rates_compare_as_tc_shows_them(sample, shown):
+    applied = {'egress': ((sample, 0.01, 0.04), [])}
+    assert shaping.find_external_changes(TC_SHOW.replace('2Mbit', shown), applied) == []
+    assert shaping.find_external_changes(TC_SHOW.replace('2Mbit', '3Mbit'), applied) == ['egress']
@@ -0,0 +1,44 @@
+"""
+`default_backend` only picks the long-lived `tc` processes once one has acknowledged a command, and falls back to a
+process per command otherwise
+"""
+# standard library includes
+import os
+import shlex
+import sys
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import tc_backend
+
+STUB_TC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'stub_tc.py')
+
+
+@pytest.mark.parametrize('size, expected', [(1, tc_backend.BatchBackend), (3, tc_backend.PooledBackend)])
+def test_a_working_tc_gets_batch_backends(monkeypatch, tmp_path, size, expected):
+    log = tmp_path / 'tc.log'
+    monkeypatch.setenv('PY_LOSSY_NETWORK_TC', '{0} {1}'.format(shlex.quote(sys.executable), shlex.quote(STUB_TC)))
+    monkeypatch.setenv('STUB_TC_LOG', str(log))
+    backend = tc_backend.default_backend(size)
+    try:
+        assert isinstance(backend, expected)
+        assert log.read_text().splitlines() == [tc_backend.PROBE_COMMAND] * size
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize('tc_command', [
+    # starts, but exits at once, like a `tc` that doesn't know `-OK` or a `sudo` that won't run it
+    '{0} -c "import sys; sys.exit(255)"'.format(shlex.quote(sys.executable)),
+    # can't be started at all
+    '/nonexistent/tc',
+])
+def test_a_broken_tc_gets_a_subprocess_backend(monkeypatch, tc_command):
+    monkeypatch.setenv('PY_LOSSY_NETWORK_TC', tc_command)
+    backend = tc_backend.default_backend(2)
+    try:
+        assert isinstance(backend, tc_backend.SubprocessBackend)
+    finally:
+        backend.close()
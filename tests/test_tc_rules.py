@@ -0,0 +1,71 @@
+"""
+the egress and ingress rules are updated in place: driven by the shaper through several ticks against a recorded fake
+`tc` (benchmarks/stub_tc.py), the qdisc tree is never deleted, and every tick's commands go out as one batch
+"""
+# standard library includes
+import os
+import shutil
+import subprocess
+import sys
+
+# external library includes
+import pytest
+
+# internal includes
+from py_lossy_network import shaping
+from py_lossy_network import tc_backend
+from py_lossy_network import units
+from py_lossy_network import utils
+from py_lossy_network.config import NetworkConfig
+
+STUB_TC = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'stub_tc.py')]
+
+
+@pytest.fixture
+def tc_log(tmp_path, monkeypatch):
+    # every command the fake `tc` receives, one per line
+    log = tmp_path / 'tc.log'
+    monkeypatch.setenv('STUB_TC_LOG', str(log))
+    monkeypatch.delenv('STUB_TC_DELAY', raising=False)
+    utils.set_tc_backend(tc_backend.SubprocessBackend(STUB_TC))
+    yield log
+    utils.set_tc_backend(tc_backend.SubprocessBackend())
+
+
+def make_config() -> NetworkConfig:
+    return NetworkConfig(avg_egress_bw=units.parse_rate('500kbit'), std_dev_egress_bw=units.parse_rate('25kbit'),
+                         egress_burst=units.parse_size('32kbit'), egress_latency=units.parse_time('500ms'),
+                         avg_egress_loss=units.parse_percent('5%'), std_dev_egress_loss=units.parse_percent('1%'),
+                         egress_avg_delay=units.parse_time('250ms'), egress_std_dev_delay=units.parse_time('10ms'),
+                         avg_ingress_bw=units.parse_rate('1mbit'), std_dev_ingress_bw=units.parse_rate('10kbit'),
+                         ingress_burst=units.parse_size('32kbit'), model_params={'seed': 0})
+
+
+def test_updates_never_delete_the_tree(tc_log):
+    shaper = shaping.Shaper(verify_interval=None)
+    try:
+        for _ in range(5):
+            assert shaper.apply('veth0', make_config()).returncode == 0
+    finally:
+        shaper.close()
+    commands = tc_log.read_text().splitlines()
+    assert len(commands) == 5 * 4
+    assert not any(' del ' in ' {0} '.format(command) for command in commands)
+    assert all(command.split(' ')[1] == 'replace' for command in commands)
+
+
+def test_batch_stops_at_the_first_failure(tc_log):
+    ret = utils.run_tc_batch(["qdisc replace dev veth0 root handle 1:0 tbf rate 1mbit burst 32kbit latency 1s",
+                              "fail", "qdisc replace dev veth0 parent 1:1 handle 10:0 netem loss 1% delay 1ms"])
+    assert ret.returncode != 0
+    assert tc_log.read_text().splitlines() == ["qdisc replace dev veth0 root handle 1:0 tbf rate 1mbit burst 32kbit latency 1s", "fail"]
+
+
+@pytest.mark.parametrize('delay, jitter', [('0ms', '0ms'), ('0ms', '5ms'), ('40ms', '0ms'), ('40ms', '5ms')])
+def test_netem_command_parses(delay, jitter):
+    # the real `tc` parses the whole command before it looks the device up, so a missing device means it was valid
+    if shutil.which('tc') is None:
+        pytest.skip("needs `tc`")
+    command = utils.netem_command('lossy0nosuchdev', 'parent 1:1', '10:0', '1%', delay, jitter)
+    ret = subprocess.run(['tc'] + command.split(' '), capture_output=True)
+    assert b'Cannot find device' in ret.stderr, ret.stderr
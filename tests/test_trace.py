@@ -0,0 +1,51 @@
+"""
+the trace-driven models: the delay scale must be positive, and a replayed trace's results file is closed when the
+interface's trajectories are replaced
+"""
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import results
+from py_lossy_network import shaping
+from py_lossy_network import trace
+from py_lossy_network import trajectory
+from py_lossy_network.config import NetworkConfig
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = str(tmp_path / 'trace.h5')
+    with results.ResultsWriter(path) as writer:
+        results.add_session_datasets(writer)
+        for i in range(4):
+            writer.append({'timestamp': float(i), 'client_ip': '10.0.0.2', 'bitrate_kbps': np.full((5,), 1000.0 + i),
+                           'percent_lost_udp': 0.01, 'delay_ms': np.full((3,), 80.0 + i)})
+    return path
+
+
+@pytest.mark.parametrize('model', trace.TRACE_MODELS)
+def test_delay_scale_must_be_positive(trace_file, model):
+    params = {'trace': trace_file, 'delay_scale': 0.0}
+    with pytest.raises(ValueError):
+        trace.check_params(params)
+    with pytest.raises(ValueError):
+        trace.make_trace_model(model, 'egress_delay', params, 0.0, np.inf)
+
+
+def test_replaced_replay_closes_its_file(trace_file):
+    config = NetworkConfig(egress_avg_delay=0.05, model='replay', model_params={'trace': trace_file, 'seed': 0})
+    samples = trajectory.interface_trajectories('veth0', config)
+    replay = samples['egress_delay'].model
+    assert samples['egress_delay'].next() == pytest.approx(0.04)  # half of the first round-trip time
+    reader = replay._reader
+    assert reader is not None and reader.h5_file.id.valid
+
+    shaper = shaping.Shaper(verify_interval=None)
+    try:
+        shaper.invalidate('veth0', samples)
+        shaper.invalidate('veth0')
+        assert replay._reader is None and not reader.h5_file.id.valid
+    finally:
+        shaper.close()
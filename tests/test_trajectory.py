@@ -0,0 +1,43 @@
+"""
+the sampling models: where the Gilbert-Elliott state sequence starts, and the ranges of the model parameters
+"""
+# external library includes
+import numpy as np
+import pytest
+
+# internal includes
+from py_lossy_network import trajectory
+
+
+def test_gilbert_elliott_starts_in_the_stationary_distribution():
+    p, r = 0.02, 0.25
+    first = [trajectory.make_model('gilbert_elliott', 1.0, 0.0, 0.0, 10.0, {'p': p, 'r': r}, 5.0,
+                                   np.random.default_rng(seed)).states(1)[0] for seed in range(2000)]
+    assert abs(np.mean(first) - p / (p + r)) < 0.03
+
+
+def test_gilbert_elliott_long_run_bad_fraction():
+    p, r = 0.05, 0.2
+    model = trajectory.make_model('gilbert_elliott', 1.0, 0.0, 0.0, 10.0, {'p': p, 'r': r}, 5.0,
+                                  np.random.default_rng(0))
+    assert abs(np.mean(model.states(200000)) - p / (p + r)) < 0.02
+
+
+@pytest.mark.parametrize('tokens', [['correlation=1.0'], ['correlation=-0.1'], ['p=1.5'], ['r=-1'], ['bad_loss=150%'],
+                                    ['bad_delay=-5ms'], ['delay_scale=0'], ['nonsense=1']])
+def test_parse_model_params_rejects_out_of_range(tokens):
+    with pytest.raises(ValueError):
+        trajectory.parse_model_params(tokens)
+
+
+def test_check_params_rejects_wrong_types():
+    with pytest.raises(ValueError):
+        trajectory.check_params({'correlation': '0.9'})
+    with pytest.raises(ValueError):
+        trajectory.check_params({'seed': 1.5})
+    trajectory.check_params({'correlation': 0.9, 'seed': 4, 'p': 0.1, 'trace': 'x.h5'})
+
+
+def test_ar1_rejects_a_correlation_of_one():
+    with pytest.raises(ValueError):
+        trajectory.AR1(0.0, 1.0, 1.0)